@@ -0,0 +1,14 @@
+from flask import Blueprint, Response
+from app.services.metrics import registry
+
+metrics_bp = Blueprint(
+    "metrics",
+    __name__,
+    url_prefix="/api/metrics"
+)
+
+
+@metrics_bp.route("", methods=["GET"])
+def get_metrics():
+    """Every worker's metrics in Prometheus text format"""
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
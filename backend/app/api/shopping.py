@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify
 from app.services.shopping_service import shopping_service
+from app.services.wardrobe_service import wardrobe_service
 
 shopping_bp = Blueprint(
     "shopping",
@@ -7,6 +8,9 @@ shopping_bp = Blueprint(
     url_prefix="/api/shopping"
 )
 
+# Items plus missing pieces per batch request
+BATCH_MAX_SIZE = 200
+
 @shopping_bp.route("/recommendations", methods=["POST"])
 def get_shopping_recommendations():
     data = request.get_json()
@@ -27,3 +31,46 @@ def get_shopping_recommendations():
         "search_query": search_query,
         "recommendations": recommendations
     }), 200
+
+
+@shopping_bp.route("/recommendations/batch", methods=["POST"])
+def get_batch_recommendations():
+    """Links for many wardrobe items (``itemIds``) and/or missing pieces
+    (``missingPieces``) in one request"""
+    data = request.get_json(silent=True) or {}
+    item_ids = data.get("itemIds") or []
+    pieces = data.get("missingPieces") or []
+
+    if not isinstance(item_ids, list) or not isinstance(pieces, list):
+        return jsonify({"success": False, "error": "itemIds and missingPieces must be lists"}), 400
+    if not item_ids and not pieces:
+        return jsonify({"success": False, "error": "itemIds or missingPieces required"}), 400
+    if len(item_ids) + len(pieces) > BATCH_MAX_SIZE:
+        return jsonify({"success": False, "error": f"At most {BATCH_MAX_SIZE} items per batch"}), 400
+    if not all(isinstance(piece, str) for piece in pieces):
+        return jsonify({"success": False, "error": "missingPieces must be strings"}), 400
+    try:
+        item_ids = [int(item_id) for item_id in item_ids]
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "itemIds must be integers"}), 400
+
+    user_id = data.get("userId")
+    if item_ids and not user_id:
+        return jsonify({"success": False, "error": "User ID required"}), 401
+
+    items = wardrobe_service.get_items(user_id, item_ids) if item_ids else {}
+    by_item = shopping_service.links_for_items(items.values())
+    return jsonify({
+        "success": True,
+        "items": {str(item_id): by_item[item_id] for item_id in item_ids if item_id in by_item},
+        "missingPieces": shopping_service.links_for_pieces(pieces)
+    }), 200
+
+
+@shopping_bp.route("/stores", methods=["GET"])
+def get_stores():
+    return jsonify({
+        "success": True,
+        "data": shopping_service.registry.to_dict(),
+        "cache": shopping_service.stats()
+    }), 200
@@ -1,7 +1,21 @@
-from flask import Blueprint, request, jsonify
+import json
+import os
+import threading
+import time
+from urllib.parse import quote
+
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from app.api.wardrobe import _parse_int, with_image_url
+from app.services.analysis_cache import analysis_cache
+from app.services.analysis_jobs import FINISHED_STATUSES, job_queue
+from app.services.blob_store import blob_store
+from app.services.gemini_resilience import GeminiUnavailableError
+from app.services.gemini_service import gemini_service
+from app.services.image_processing import sniff_mime_type
+from app.services.outfit_service import outfit_service
 from app.services.style_analysis_service import style_analysis_service
+from app.services.tracing import traced
 from app.services.wardrobe_service import wardrobe_service
-import base64
 
 style_analysis_bp = Blueprint(
     "style",
@@ -9,48 +23,240 @@ style_analysis_bp = Blueprint(
     url_prefix="/api/style"
 )
 
+# An SSE connection holds a gunicorn thread, so streams are short (clients
+# reconnect after JOB_EVENTS_RETRY) and few per process; past the cap,
+# clients are told to poll the job instead
+JOB_EVENTS_TIMEOUT = float(os.getenv("ANALYSIS_JOB_EVENTS_TIMEOUT", "10"))
+JOB_EVENTS_MAX_STREAMS = int(os.getenv("ANALYSIS_JOB_EVENTS_MAX_STREAMS", "2"))
+JOB_EVENTS_POLL_INTERVAL = 0.5
+JOB_EVENTS_RETRY = 1
+# Seconds a client should wait before polling an unfinished job again
+JOB_POLL_AFTER = int(os.getenv("ANALYSIS_JOB_POLL_AFTER", "2"))
+
+_event_streams = threading.BoundedSemaphore(JOB_EVENTS_MAX_STREAMS)
+
+
+def _reset_event_streams():
+    # Streams are per process; a semaphore held at fork time is not ours
+    global _event_streams
+    _event_streams = threading.BoundedSemaphore(JOB_EVENTS_MAX_STREAMS)
+
+
+os.register_at_fork(after_in_child=_reset_event_streams)
+
+BATCH_MAX_IMAGES = int(os.getenv("ANALYZE_BATCH_MAX_IMAGES", "50"))
+BATCH_MAX_CONTENT_LENGTH = int(os.getenv("ANALYZE_BATCH_MAX_BYTES", str(200 * 1024 * 1024)))
+
+SIMILAR_MAX_LIMIT = 50
+OUTFITS_MAX_LIMIT = 10
+
+@style_analysis_bp.errorhandler(GeminiUnavailableError)
+def gemini_unavailable(e):
+    # Out of quota or Gemini down: the client may try again later
+    response = jsonify({"success": False, "error": str(e)})
+    response.headers["Retry-After"] = str(max(1, round(e.retry_in or JOB_POLL_AFTER)))
+    return response, 503
+
+
 @style_analysis_bp.route("/analyze", methods=["POST"])
 def analyze_image():
     if "image" not in request.files:
         return jsonify({"success": False, "error": "No image provided"}), 400
 
     file = request.files["image"]
-    image_data = file.read()
-    mime_type = file.content_type
 
     user_id = request.form.get("userId")
     if not user_id:
         return jsonify({"success": False, "error": "User ID required"}), 401
 
-    image_info = {
-        "filename": file.filename,
-        "size": len(image_data),
-        "mimetype": mime_type,
-        "data": f"data:{mime_type};base64," +
-                base64.b64encode(image_data).decode()
-    }
+    try:
+        image_info = _store_upload(file)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    mime_type = image_info["mimetype"]
 
-    result = style_analysis_service.analyze_image(
-        image_data,
-        mime_type,
-        image_info
-    )
+    if _wants_async():
+        job = job_queue.submit(user_id, image_info, mime_type)
+        response = jsonify({"success": True, "data": _job_response(job)})
+        response.headers["Location"] = _job_url(job["id"], user_id)
+        response.headers["Retry-After"] = str(JOB_POLL_AFTER)
+        return response, 202
 
-    wardrobe_item = wardrobe_service.add_item(
-        user_id,
-        image_info,
-        result["analysis"]
-    )
+    image_path = blob_store.path(image_info["blob"])
+    result = style_analysis_service.analyze_and_store(user_id, image_path, mime_type, image_info)
 
     return jsonify({
         "success": True,
         "data": {
             "analysis": result["analysis"],
-            "wardrobeItem": wardrobe_item
+            "duplicateOf": result.get("duplicateOf"),
+            "wardrobeItem": with_image_url(result["wardrobeItem"])
+        }
+    }), 200
+
+
+@style_analysis_bp.route("/analyze/batch", methods=["POST"])
+def analyze_batch():
+    # The app-wide 10MB limit is per photo; a batch carries dozens of them
+    request.max_content_length = BATCH_MAX_CONTENT_LENGTH
+    files = request.files.getlist("images")
+    if not files:
+        return jsonify({"success": False, "error": "No images provided"}), 400
+
+    user_id = request.form.get("userId")
+    if not user_id:
+        return jsonify({"success": False, "error": "User ID required"}), 401
+
+    if len(files) > BATCH_MAX_IMAGES:
+        return jsonify({
+            "success": False,
+            "error": f"At most {BATCH_MAX_IMAGES} images per batch"
+        }), 400
+
+    uploads, failed = [], {}
+    for index, file in enumerate(files):
+        try:
+            image_info = _store_upload(file)
+        except ValueError as e:
+            failed[index] = {"error": str(e)}
+            continue
+        uploads.append((blob_store.path(image_info["blob"]), image_info["mimetype"], image_info))
+
+    analysed = iter(style_analysis_service.analyze_batch(user_id, uploads))
+    results = [failed[index] if index in failed else next(analysed) for index in range(len(files))]
+
+    items = []
+    for index, (file, result) in enumerate(zip(files, results)):
+        entry = {"index": index, "filename": file.filename, "success": "error" not in result}
+        if entry["success"]:
+            entry["analysis"] = result["analysis"]
+            entry["duplicateOf"] = result.get("duplicateOf")
+            entry["wardrobeItem"] = with_image_url(result["wardrobeItem"])
+        else:
+            entry["error"] = result["error"]
+        items.append(entry)
+
+    succeeded = sum(1 for entry in items if entry["success"])
+    return jsonify({
+        "success": True,
+        "data": {
+            "items": items,
+            "succeeded": succeeded,
+            "failed": len(items) - succeeded
         }
     }), 200
 
 
+@traced("upload")
+def _store_upload(file):
+    """Stream an uploaded file into the blob store and describe it.
+
+    Werkzeug spools uploads to a temp file past 500KB; copying that to the
+    blob store in chunks keeps the whole photo out of memory. Returns the
+    image info with its ``blob`` id. Raises ValueError, before anything is
+    stored, for an empty upload or one that isn't a supported image.
+    """
+    head = file.stream.read(16)
+    if not head:
+        raise ValueError("Empty image")
+    # The bytes decide, not the browser's guess (often octet-stream)
+    mime_type = sniff_mime_type(head)
+    if mime_type is None:
+        raise ValueError("Unsupported image type: upload a JPEG, PNG, WebP, HEIC, GIF or BMP")
+    file.stream.seek(0)
+    digest = blob_store.put(file.stream)
+    return {
+        "filename": file.filename,
+        "size": blob_store.size(digest),
+        "mimetype": mime_type,
+        "blob": digest
+    }
+
+
+def _wants_async():
+    flag = request.args.get("async") or request.form.get("async") or ""
+    prefer = request.headers.get("Prefer", "")
+    return flag.lower() in ("1", "true", "yes") or "respond-async" in prefer.lower()
+
+
+def _job_url(job_id, user_id, events=False):
+    path = f"/api/style/jobs/{job_id}{'/events' if events else ''}?userId={quote(user_id, safe='')}"
+    return request.host_url.rstrip("/") + path
+
+
+def _job_response(job):
+    body = {key: job[key] for key in ("id", "status", "attempts", "error", "createdAt", "updatedAt")}
+    body["statusUrl"] = _job_url(job["id"], job["userId"])
+    body["eventsUrl"] = _job_url(job["id"], job["userId"], events=True)
+    result = job["result"]
+    if result:
+        body["result"] = dict(result, wardrobeItem=with_image_url(result["wardrobeItem"]))
+    return body
+
+
+@style_analysis_bp.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    user_id = request.args.get("userId")
+    if not user_id:
+        return jsonify({"success": False, "error": "User ID required"}), 401
+    job = job_queue.get(job_id, user_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    response = jsonify({"success": True, "data": _job_response(job)})
+    if job["status"] not in FINISHED_STATUSES:
+        # No-op once running; covers ANALYSIS_JOB_AUTOSTART=false
+        job_queue.start()
+        response.headers["Retry-After"] = str(JOB_POLL_AFTER)
+    return response, 200
+
+
+@style_analysis_bp.route("/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id):
+    """Server-Sent Events: a ``status`` event per change, closed once finished.
+
+    Streams end after ``JOB_EVENTS_TIMEOUT`` seconds; EventSource clients
+    reconnect by themselves. 503 with Retry-After when this process already
+    serves ``JOB_EVENTS_MAX_STREAMS`` streams.
+    """
+    user_id = request.args.get("userId")
+    if not user_id:
+        return jsonify({"success": False, "error": "User ID required"}), 401
+    if job_queue.get(job_id, user_id) is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    job_queue.start()
+    streams = _event_streams
+    if not streams.acquire(blocking=False):
+        response = jsonify({"success": False, "error": "Too many event streams; poll the job instead",
+                            "statusUrl": _job_url(job_id, user_id)})
+        response.headers["Retry-After"] = str(JOB_POLL_AFTER)
+        return response, 503
+
+    @stream_with_context
+    def stream():
+        deadline = time.monotonic() + JOB_EVENTS_TIMEOUT
+        last_seen = None
+        yield f"retry: {JOB_EVENTS_RETRY * 1000}\n\n"
+        while time.monotonic() < deadline:
+            job = job_queue.get(job_id, user_id)
+            if job is None:
+                return
+            state = (job["status"], job["updatedAt"])
+            if state != last_seen:
+                last_seen = state
+                yield f"event: status\ndata: {json.dumps(_job_response(job))}\n\n"
+                if job["status"] in FINISHED_STATUSES:
+                    return
+            time.sleep(JOB_EVENTS_POLL_INTERVAL)
+        yield "event: timeout\ndata: {}\n\n"
+
+    response = Response(stream(), mimetype="text/event-stream")
+    # Runs however the stream ends, including a client that never reads it
+    response.call_on_close(streams.release)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
 @style_analysis_bp.route("/profile", methods=["POST"])
 def generate_profile():
     data = request.get_json()
@@ -59,14 +265,100 @@ def generate_profile():
     if not user_id:
         return jsonify({"success": False, "error": "User ID required"}), 401
 
+    # "enrich": false skips Gemini and returns the local profile only;
+    # "refresh": true bypasses the profile cache
+    enrich = data.get("enrich")
     try:
-        result = style_analysis_service.generate_style_profile(user_id)
-        return jsonify({
+        result = style_analysis_service.generate_style_profile(
+            user_id, enrich=None if enrich is None else bool(enrich), refresh=bool(data.get("refresh"))
+        )
+        response = jsonify({
             "success": True,
             "data": result
-        }), 200
+        })
+        response.headers["Age"] = str(int(result["cache"]["ageSeconds"]))
+        return response, 200
     except Exception as e:
         return jsonify({
             "success": False,
             "error": str(e)
         }), 400
+
+
+@style_analysis_bp.route("/items/<int:item_id>/similar", methods=["GET"])
+def similar_items(item_id):
+    """Items from the same wardrobe that go well with ``item_id``, best first"""
+    user_id = request.args.get("userId")
+    if not user_id:
+        return jsonify({"success": False, "error": "User ID required"}), 401
+    try:
+        limit = _parse_int(request.args.get("limit", "5"), "limit")
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    if not 1 <= limit <= SIMILAR_MAX_LIMIT:
+        return jsonify({"success": False, "error": f"limit must be between 1 and {SIMILAR_MAX_LIMIT}"}), 400
+    if wardrobe_service.get_item_by_id(user_id, item_id) is None:
+        return jsonify({"success": False, "error": "Item not found"}), 404
+
+    recommendations = style_analysis_service.get_recommendations(user_id, item_id, limit)
+    return jsonify({"success": True, "data": recommendations}), 200
+
+
+def _parse_float(value, name):
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+
+
+@style_analysis_bp.route("/outfits", methods=["GET"])
+def suggest_outfits():
+    """Outfits for today: ``temperature`` (Celsius), ``weather`` and ``occasion`` are optional"""
+    user_id = request.args.get("userId")
+    if not user_id:
+        return jsonify({"success": False, "error": "User ID required"}), 401
+    try:
+        limit = _parse_int(request.args.get("limit", "3"), "limit")
+        temperature = _parse_float(request.args.get("temperature") or None, "temperature")
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    if not 1 <= limit <= OUTFITS_MAX_LIMIT:
+        return jsonify({"success": False, "error": f"limit must be between 1 and {OUTFITS_MAX_LIMIT}"}), 400
+
+    outfits = outfit_service.suggest_outfits(
+        user_id,
+        temperature=temperature,
+        weather=request.args.get("weather") or None,
+        occasion=request.args.get("occasion") or None,
+        limit=limit
+    )
+    for outfit in outfits:
+        outfit["items"] = [with_image_url(item) for item in outfit["items"]]
+    return jsonify({"success": True, "data": outfits}), 200
+
+
+@style_analysis_bp.route("/outfits/stats", methods=["GET"])
+def outfit_index_stats():
+    return jsonify({"success": True, "data": outfit_service.index.stats()}), 200
+
+
+@style_analysis_bp.route("/cache/stats", methods=["GET"])
+def analysis_cache_stats():
+    return jsonify({"success": True, "data": analysis_cache.stats()}), 200
+
+
+@style_analysis_bp.route("/jobs/stats", methods=["GET"])
+def analysis_job_stats():
+    return jsonify({"success": True, "data": job_queue.stats()}), 200
+
+
+@style_analysis_bp.route("/gemini/stats", methods=["GET"])
+def gemini_connection_stats():
+    return jsonify({"success": True, "data": gemini_service.connection_stats()}), 200
+
+
+@style_analysis_bp.route("/gemini/keys", methods=["GET"])
+def gemini_key_stats():
+    return jsonify({"success": True, "data": gemini_service.key_stats()}), 200
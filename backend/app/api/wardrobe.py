@@ -1,4 +1,6 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, send_file
+from app.services.blob_store import blob_store
+from app.services.shopping_service import shopping_service
 from app.services.wardrobe_service import wardrobe_service
 
 wardrobe_bp = Blueprint(
@@ -7,14 +9,82 @@ wardrobe_bp = Blueprint(
     url_prefix="/api/wardrobe"
 )
 
+# Blobs are content-addressed, so a given image URL never changes content
+IMAGE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+# imageInfo keys referencing stored blobs; only the server may set them
+SERVER_IMAGE_KEYS = ("blob", "thumbnail")
+
+
+def with_image_url(item):
+    """Resolve the service's relative image URLs against this server's root"""
+    if not item:
+        return item
+    for key in ("imageUrl", "thumbnailUrl"):
+        if isinstance(item.get(key), str) and item[key].startswith("/"):
+            item[key] = request.host_url.rstrip("/") + item[key]
+    return item
+
+
+def _parse_int(value, name):
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+
+
+def _parse_bool(value):
+    if value is None:
+        return None
+    lowered = value.lower()
+    if lowered in ("1", "true", "yes"):
+        return True
+    if lowered in ("0", "false", "no"):
+        return False
+    raise ValueError(f"Invalid boolean: {value}")
+
+
 @wardrobe_bp.route("/", methods=["GET"])
 def get_all_items():
     user_id = request.args.get("userId")
     if not user_id:
         return jsonify({"success": False, "error": "User ID required"}), 401
 
-    items = wardrobe_service.get_all_items(user_id)
-    return jsonify({"success": True, "data": items})
+    try:
+        limit = _parse_int(request.args.get("limit"), "limit")
+        fields = [f.strip() for f in request.args.get("fields", "").split(",") if f.strip()]
+        shopping = _parse_bool(request.args.get("shopping"))
+        # Links are built from the analysis, so fetch it even if not asked for
+        drop_analysis = bool(shopping and fields and "analysis" not in fields)
+        if drop_analysis:
+            fields.append("analysis")
+        items, next_cursor = wardrobe_service.list_items(
+            user_id,
+            limit=limit,
+            cursor=request.args.get("cursor") or None,
+            order=request.args.get("order", "asc"),
+            fields=fields or None,
+            item_type=request.args.get("type") or None,
+            favorite=_parse_bool(request.args.get("favorite")),
+            season=request.args.get("season") or None,
+            style=request.args.get("style") or None,
+            occasion=request.args.get("occasion") or None,
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    if shopping:
+        for item in items:
+            item["shoppingLinks"] = shopping_service.generate_shopping_links(item.get("analysis"))
+            if drop_analysis:
+                item.pop("analysis", None)
+    return jsonify({
+        "success": True,
+        "data": [with_image_url(i) for i in items],
+        "nextCursor": next_cursor
+    })
 
 
 @wardrobe_bp.route("/", methods=["POST"])
@@ -25,9 +95,11 @@ def add_item():
         return jsonify({"success": False, "error": "User ID required"}), 401
 
     image_info = data.get("imageInfo") or {}
+    if isinstance(image_info, dict):
+        image_info = {k: v for k, v in image_info.items() if k not in SERVER_IMAGE_KEYS}
     analysis = data.get("analysis") or {}
     item = wardrobe_service.add_item(user_id, image_info, analysis)
-    return jsonify({"success": True, "data": item}), 201
+    return jsonify({"success": True, "data": with_image_url(item)}), 201
 
 
 @wardrobe_bp.route("/", methods=["DELETE"])
@@ -52,4 +124,39 @@ def toggle_favorite(item_id):
     if not item:
         return jsonify({"success": False, "error": "Item not found"}), 404
 
-    return jsonify({"success": True, "data": item})
+    return jsonify({"success": True, "data": with_image_url(item)})
+
+
+def _send_image(item_id, variant):
+    user_id = request.args.get("userId")
+    if not user_id:
+        return jsonify({"success": False, "error": "User ID required"}), 401
+
+    image = wardrobe_service.get_image(user_id, item_id, variant)
+    if not image:
+        return jsonify({"success": False, "error": "Image not found"}), 404
+
+    blob_id, mimetype = image
+    try:
+        # conditional=True answers If-None-Match with 304 and Range with 206,
+        # and streams the file instead of loading it into memory
+        response = send_file(
+            blob_store.path(blob_id),
+            mimetype=mimetype,
+            conditional=True,
+            etag=blob_id,
+        )
+    except FileNotFoundError:
+        return jsonify({"success": False, "error": "Image not found"}), 404
+    response.headers["Cache-Control"] = IMAGE_CACHE_CONTROL
+    return response
+
+
+@wardrobe_bp.route("/<int:item_id>/image", methods=["GET"])
+def get_item_image(item_id):
+    return _send_image(item_id, "original")
+
+
+@wardrobe_bp.route("/<int:item_id>/thumbnail", methods=["GET"])
+def get_item_thumbnail(item_id):
+    return _send_image(item_id, "thumbnail")
@@ -2,28 +2,32 @@
 AI Style Finder - Flask Backend
 Main application entry point
 """
+import logging
 import os
-import sys
 from flask import Flask
 from flask_cors import CORS
 from dotenv import load_dotenv
 
-# Load environment variables
+# Load environment variables before any service module reads them
 load_dotenv()
 
-# Debug: Check if .env is loaded
-def debug_print(*args, **kwargs):
-    print(*args, **kwargs)
-    sys.stdout.flush()
+from app.services.gemini_keys import load_api_keys  # noqa: E402
+from app.services.logging_config import configure_logging, logging_setup  # noqa: E402
+
+logger = logging.getLogger(__name__)
 
-api_key = os.getenv('GEMINI_API_KEY')
-if api_key:
-    debug_print(f"✅ .env loaded successfully. API Key starts with: {api_key[:8]}...")
-else:
-    debug_print("❌ WARNING: GEMINI_API_KEY not found in environment!")
 
 def create_app():
-    """Create and configure the Flask application"""
+    """Create and configure the Flask application.
+
+    The one place an app is built: ``app.wsgi`` calls it once per process
+    (once in total with gunicorn's ``preload_app``). Services are not built
+    here but on first use, see ``app.services.lazy``.
+    """
+    if logging_setup.handler is None:
+        configure_logging()
+    if not load_api_keys():
+        logger.warning("No Gemini API key found in the environment (GEMINI_API_KEY or GEMINI_API_KEYS)")
     app = Flask(__name__)
     app.config['DEBUG'] = True
     # Configure CORS: allow API access from the frontend during local development
@@ -37,23 +41,48 @@ def create_app():
     from app.api.style_analysis import style_analysis_bp
     from app.api.wardrobe import wardrobe_bp
     from app.api.shopping import shopping_bp
+    from app.api.metrics import metrics_bp
+    from app.services import metrics, profiler, tracing
+    metrics.instrument_app(app)
+    # Before tracing: after_request hooks run in reverse, so the profiler sees X-Request-ID
+    profiler.instrument_app(app)
+    tracing.instrument_app(app)
     app.register_blueprint(style_analysis_bp, url_prefix='/api/style')
     app.register_blueprint(wardrobe_bp, url_prefix='/api/wardrobe')
     app.register_blueprint(shopping_bp, url_prefix='/api/shopping')
+    app.register_blueprint(metrics_bp, url_prefix='/api/metrics')
+    # Resume analysis jobs persisted before a restart. gunicorn.conf.py turns
+    # this off and starts them in each worker's post_fork instead, so a
+    # preloading master runs none itself
+    default_autostart = 'false' if os.getenv('NODE_ENV') == 'test' else 'true'
+    if os.getenv('ANALYSIS_JOB_AUTOSTART', default_autostart).lower() not in ('0', 'false', 'no'):
+        from app.services.analysis_jobs import job_queue
+        job_queue.start()
     # Health check endpoint
     @app.route('/api/health')
     def health_check():
-        debug_print("Health check called")
-        return {'status': 'ok', 'message': 'Server is running'}
+        from app.services.gemini_service import gemini_service
+        # Still "ok" while Gemini is down: the server itself is healthy, and a
+        # failing healthcheck would make Docker restart it for nothing
+        return {
+            'status': 'ok',
+            'message': 'Server is running',
+            'gemini': gemini_service.resilience_stats()
+        }
     return app
 
 
-# הפוך את app לגלובלי לייבוא בבדיקות
-app = create_app()
+def __getattr__(name):
+    # `from app.app import app` gets the WSGI app rather than building another
+    if name == "app":
+        from app.wsgi import app as wsgi_app
+        return wsgi_app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == '__main__':
+    app = create_app()
     port = int(os.getenv('PORT', 5001))
     debug = os.getenv('NODE_ENV', 'development') == 'development'
-    debug_print(f'🚀 Server is running on port {port}')
-    debug_print(f'📊 Environment: {os.getenv("NODE_ENV", "development")}')
+    logger.info("Server is running on port %d (%s)", port, os.getenv("NODE_ENV", "development"))
     app.run(host='0.0.0.0', port=port, debug=debug)
@@ -0,0 +1,203 @@
+"""
+Persistent cache of Gemini analysis results
+Keyed by the SHA-256 of the image bytes plus the prompt and model, so
+re-uploads of the same image skip the API call entirely
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from app.services.lazy import LazyService
+from app.services.wardrobe_service import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "db", "analysis_cache.sqlite3")
+)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+CACHE_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS analysis_cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_analysis_cache_accessed ON analysis_cache(accessed_at);
+"""
+
+
+def _ensure_cache_schema(conn):
+    conn.executescript(CACHE_SCHEMA_SQL)
+    conn.commit()
+
+
+class AnalysisCache:
+    """SQLite-backed LRU cache with a TTL and entry/byte caps.
+
+    Cache failures are never fatal: a broken cache behaves like a miss.
+    Hit/miss counters are per process. A hit only writes its access time
+    back once it is ``touch_seconds`` stale, so LRU order is that coarse and
+    most hits are read-only.
+    """
+
+    def __init__(self, path=None, max_entries=None, max_bytes=None, ttl_seconds=None, enabled=None,
+                 touch_seconds=None):
+        self.path = path or os.getenv("ANALYSIS_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.max_entries = int(max_entries if max_entries is not None
+                               else os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "10000"))
+        self.max_bytes = int(max_bytes if max_bytes is not None
+                             else os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+        self.ttl_seconds = float(ttl_seconds if ttl_seconds is not None
+                                 else os.getenv("ANALYSIS_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+        self.touch_seconds = float(touch_seconds if touch_seconds is not None
+                                   else os.getenv("ANALYSIS_CACHE_TOUCH_SECONDS", "60"))
+        if enabled is None:
+            enabled = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._pool = None
+
+    @staticmethod
+    def make_key(image_data, *parts):
+        """SHA-256 of the image, then of each part (mime type, model, prompt...)
+
+        ``image_data`` may also be a file path; the file is hashed in chunks
+        and gives the same key as its bytes would.
+        """
+        if isinstance(image_data, (bytes, bytearray, memoryview)):
+            image_digest = hashlib.sha256(image_data).digest()
+        else:
+            image_hash = hashlib.sha256()
+            with open(image_data, "rb") as f:
+                for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                    image_hash.update(chunk)
+            image_digest = image_hash.digest()
+        digest = hashlib.sha256()
+        digest.update(image_digest)
+        for part in parts:
+            digest.update(b"\0")
+            digest.update(str(part).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _get_pool(self):
+        pool = self._pool
+        if pool is not None and pool.db_path == self.path and pool.pid == os.getpid():
+            return pool
+        with self._lock:
+            if self._pool is None or self._pool.db_path != self.path or self._pool.pid != os.getpid():
+                self._pool = ConnectionPool(self.path, max_size=2, schema=_ensure_cache_schema)
+            return self._pool
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        now = time.time()
+        try:
+            with self._get_pool().connection() as conn:
+                row = conn.execute(
+                    "SELECT value, created_at, accessed_at FROM analysis_cache WHERE key=?", (key,)
+                ).fetchone()
+                if row is not None and self.ttl_seconds and now - row["created_at"] > self.ttl_seconds:
+                    conn.execute("DELETE FROM analysis_cache WHERE key=?", (key,))
+                    conn.commit()
+                    self._count("evictions")
+                    row = None
+                if row is None:
+                    self._count("misses")
+                    return None
+                if now - row["accessed_at"] >= self.touch_seconds:
+                    conn.execute("UPDATE analysis_cache SET accessed_at=? WHERE key=?", (now, key))
+                    conn.commit()
+            value = json.loads(row["value"])
+        except (sqlite3.Error, ValueError) as e:
+            self._count("errors")
+            logger.warning("Analysis cache read failed: %s", e)
+            return None
+        self._count("hits")
+        return value
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+        payload = json.dumps(value)
+        now = time.time()
+        try:
+            with self._get_pool().connection() as conn:
+                conn.execute(
+                    """INSERT OR REPLACE INTO analysis_cache (key, value, size, created_at, accessed_at)
+                       VALUES (?, ?, ?, ?, ?)""",
+                    (key, payload, len(payload), now, now)
+                )
+                self._evict(conn, now)
+                conn.commit()
+        except sqlite3.Error as e:
+            self._count("errors")
+            logger.warning("Analysis cache write failed: %s", e)
+
+    def _evict(self, conn, now):
+        evicted = 0
+        if self.ttl_seconds:
+            evicted += conn.execute(
+                "DELETE FROM analysis_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+            ).rowcount
+        entries, total = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM analysis_cache"
+        ).fetchone()
+        if entries > self.max_entries or total > self.max_bytes:
+            victims = []
+            for row in conn.execute("SELECT key, size FROM analysis_cache ORDER BY accessed_at"):
+                if entries <= self.max_entries and total <= self.max_bytes:
+                    break
+                victims.append((row["key"],))
+                entries -= 1
+                total -= row["size"]
+            conn.executemany("DELETE FROM analysis_cache WHERE key=?", victims)
+            evicted += len(victims)
+        if evicted:
+            self._count("evictions", evicted)
+
+    def clear(self):
+        with self._get_pool().connection() as conn:
+            conn.execute("DELETE FROM analysis_cache")
+            conn.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        entries = total = None
+        if self.enabled:
+            try:
+                with self._get_pool().connection() as conn:
+                    entries, total = conn.execute(
+                        "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM analysis_cache"
+                    ).fetchone()
+            except sqlite3.Error:
+                pass
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "errors": self.errors,
+            "entries": entries,
+            "bytes": total,
+        }
+
+
+analysis_cache = LazyService(AnalysisCache)
@@ -0,0 +1,300 @@
+"""
+Background analysis jobs
+Lets POST /api/style/analyze answer immediately: the upload is stored, a job
+row is queued and worker threads run the Gemini analysis and add the item
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from app.services.blob_store import blob_store
+from app.services.gemini_resilience import GeminiUnavailableError
+from app.services.lazy import LazyService
+from app.services.style_analysis_service import style_analysis_service
+from app.services.tracing import end_trace, start_trace
+from app.services.wardrobe_service import ConnectionPool, wardrobe_service
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOBS_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "db", "analysis_jobs.sqlite3")
+)
+
+FINISHED_STATUSES = ("done", "failed")
+
+JOBS_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS analysis_jobs (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    mime_type TEXT,
+    image_info TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS idx_analysis_jobs_status ON analysis_jobs(status, created_at);
+"""
+
+
+def _ensure_jobs_schema(conn):
+    conn.executescript(JOBS_SCHEMA_SQL)
+    conn.commit()
+
+
+class AnalysisJobQueue:
+    """SQLite-backed job queue drained by a per-process pool of threads.
+
+    Jobs live in their own database file, so they survive restarts and
+    every gunicorn worker can pick up jobs submitted by the others. A
+    claimed job holds a lease; if its worker dies the job is claimed again
+    once the lease runs out, up to ``max_attempts`` times. A job that fails
+    because Gemini is unavailable is queued again after ``retry_delay``
+    (doubling per attempt), within the same ``max_attempts``.
+    """
+
+    def __init__(self, path=None, workers=None, lease_seconds=None, max_attempts=None,
+                 retention_seconds=None, poll_interval=None, retry_delay=None, prune_interval=None):
+        self.path = path or os.getenv("ANALYSIS_JOBS_PATH", DEFAULT_JOBS_PATH)
+        self.workers = int(workers if workers is not None else os.getenv("ANALYSIS_JOB_WORKERS", "2"))
+        self.lease_seconds = float(lease_seconds if lease_seconds is not None
+                                   else os.getenv("ANALYSIS_JOB_LEASE_SECONDS", "600"))
+        self.max_attempts = int(max_attempts if max_attempts is not None
+                                else os.getenv("ANALYSIS_JOB_MAX_ATTEMPTS", "3"))
+        self.retention_seconds = float(retention_seconds if retention_seconds is not None
+                                       else os.getenv("ANALYSIS_JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+        # Also how quickly jobs submitted by other processes are noticed
+        self.poll_interval = float(poll_interval if poll_interval is not None
+                                   else os.getenv("ANALYSIS_JOB_POLL_INTERVAL", "1"))
+        self.retry_delay = float(retry_delay if retry_delay is not None
+                                 else os.getenv("ANALYSIS_JOB_RETRY_DELAY", "30"))
+        self.prune_interval = float(prune_interval if prune_interval is not None
+                                    else os.getenv("ANALYSIS_JOB_PRUNE_INTERVAL", "3600"))
+        self._pruned_at = None
+        self._lock = threading.Lock()
+        self._pool = None
+        self._threads = []
+        self._threads_pid = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+    def _get_pool(self):
+        pool = self._pool
+        if pool is not None and pool.db_path == self.path and pool.pid == os.getpid():
+            return pool
+        with self._lock:
+            if self._pool is None or self._pool.db_path != self.path or self._pool.pid != os.getpid():
+                self._pool = ConnectionPool(self.path, max_size=2, schema=_ensure_jobs_schema)
+            return self._pool
+
+    def _to_dict(self, row):
+        return {
+            "id": row["id"],
+            "userId": row["user_id"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "error": row["error"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "createdAt": row["created_at"],
+            "updatedAt": row["updated_at"],
+        }
+
+    def submit(self, user_id, image_info, mime_type):
+        """Queue an analysis of the stored blob ``image_info["blob"]``"""
+        if not image_info.get("blob"):
+            raise ValueError("Job image must be stored before it is queued")
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._get_pool().connection() as conn:
+            conn.execute(
+                """INSERT INTO analysis_jobs (id, user_id, status, mime_type, image_info, created_at, updated_at)
+                   VALUES (?, ?, 'queued', ?, ?, ?, ?)""",
+                (job_id, user_id, mime_type, json.dumps(image_info), now, now)
+            )
+            conn.commit()
+        self.start()
+        self._wakeup.set()
+        return self.get(job_id)
+
+    def get(self, job_id, user_id=None):
+        with self._get_pool().connection() as conn:
+            row = conn.execute("SELECT * FROM analysis_jobs WHERE id=?", (job_id,)).fetchone()
+        if row is None or (user_id is not None and row["user_id"] != user_id):
+            return None
+        return self._to_dict(row)
+
+    def claim(self):
+        """Mark the oldest runnable job as running and return it, or None.
+
+        A queued job's ``lease_until``, when set, is when it may run again.
+        """
+        now = time.time()
+        with self._get_pool().connection() as conn:
+            if conn.in_transaction:
+                conn.commit()
+            # IMMEDIATE: take the write lock before choosing, so two processes
+            # can never claim the same row
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    """UPDATE analysis_jobs
+                       SET status='failed', error='Worker stopped before finishing', updated_at=?,
+                           lease_until=NULL
+                       WHERE status='running' AND lease_until < ? AND attempts >= ?""",
+                    (now, now, self.max_attempts)
+                )
+                row = conn.execute(
+                    """UPDATE analysis_jobs
+                       SET status='running', attempts=attempts+1, lease_until=?, updated_at=?
+                       WHERE id = (SELECT id FROM analysis_jobs
+                                   WHERE (status='queued' AND (lease_until IS NULL OR lease_until <= ?))
+                                      OR (status='running' AND lease_until < ?)
+                                   ORDER BY created_at LIMIT 1)
+                       RETURNING *""",
+                    (now + self.lease_seconds, now, now, now)
+                ).fetchone()
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        return dict(row) if row else None
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._get_pool().connection() as conn:
+            conn.execute(
+                """UPDATE analysis_jobs SET status=?, result=?, error=?, updated_at=?, lease_until=NULL
+                   WHERE id=?""",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+            )
+            conn.commit()
+
+    def _requeue(self, job_id, delay, error):
+        with self._get_pool().connection() as conn:
+            conn.execute(
+                """UPDATE analysis_jobs SET status='queued', error=?, updated_at=?, lease_until=?
+                   WHERE id=?""",
+                (error, time.time(), time.time() + delay, job_id)
+            )
+            conn.commit()
+
+    def _run(self, job):
+        # A previous attempt may have added the item and then died before
+        # marking the job done
+        item = wardrobe_service.get_item_by_source_job(job["user_id"], job["id"])
+        if item is not None:
+            return {"analysis": item["analysis"], "duplicateOf": None, "wardrobeItem": item}
+        image_info = json.loads(job["image_info"])
+        # The upload is read from the blob store as needed, not loaded whole
+        image_path = blob_store.path(image_info["blob"])
+        return style_analysis_service.analyze_and_store(
+            job["user_id"], image_path, job["mime_type"], image_info, source_job=job["id"]
+        )
+
+    def run_next(self):
+        """Claim and run one job; returns False when nothing was runnable"""
+        job = self.claim()
+        if job is None:
+            return False
+        trace = start_trace("analysis job", request_id=f"job-{job['id']}")
+        try:
+            result = self._run(job)
+        except GeminiUnavailableError as e:
+            if job["attempts"] >= self.max_attempts:
+                logger.warning("Analysis job %s failed: %s", job["id"], e)
+                self._finish(job["id"], "failed", error=str(e))
+            else:
+                delay = max(self.retry_delay * 2 ** (job["attempts"] - 1), e.retry_in or 0)
+                logger.info("Analysis job %s will be retried in %.0fs: %s", job["id"], delay, e)
+                self._requeue(job["id"], delay, str(e))
+        except Exception as e:
+            logger.warning("Analysis job %s failed: %s", job["id"], e)
+            self._finish(job["id"], "failed", error=str(e))
+        else:
+            self._finish(job["id"], "done", result=result)
+        finally:
+            end_trace(*trace)
+        return True
+
+    def _worker(self):
+        while not self._stopping.is_set():
+            try:
+                if self.run_next():
+                    continue
+                self.maybe_prune()
+            except Exception:
+                # Logged and retried on the next poll; the thread must not die
+                logger.exception("Analysis job queue error")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def start(self):
+        """Start this process's worker threads (no-op if running or workers=0)"""
+        pid = os.getpid()
+        if self.workers <= 0 or (self._threads_pid == pid and self._threads):
+            return
+        with self._lock:
+            if self._threads_pid == pid and self._threads:
+                return
+            self._stopping.clear()
+            self._threads = [
+                threading.Thread(target=self._worker, name=f"analysis-job-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            self._threads_pid = pid
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._threads_pid == os.getpid():
+            for thread in self._threads:
+                thread.join(timeout)
+        self._threads = []
+
+    def maybe_prune(self):
+        """``prune`` at most once per ``prune_interval`` in this process"""
+        with self._lock:
+            now = time.monotonic()
+            if self._pruned_at is not None and now - self._pruned_at < self.prune_interval:
+                return 0
+            self._pruned_at = now
+        return self.prune()
+
+    def prune(self):
+        if self.retention_seconds <= 0:
+            return 0
+        with self._get_pool().connection() as conn:
+            removed = conn.execute(
+                "DELETE FROM analysis_jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                (time.time() - self.retention_seconds,)
+            ).rowcount
+            conn.commit()
+        return removed
+
+    def referenced_blobs(self):
+        """Ids of the uploads that queued or running jobs still need"""
+        with self._get_pool().connection() as conn:
+            rows = conn.execute(
+                "SELECT image_info FROM analysis_jobs WHERE status IN ('queued', 'running')"
+            ).fetchall()
+        return {json.loads(row["image_info"]).get("blob") for row in rows} - {None}
+
+    def stats(self):
+        with self._get_pool().connection() as conn:
+            counts = dict(conn.execute(
+                "SELECT status, COUNT(*) FROM analysis_jobs GROUP BY status"
+            ).fetchall())
+        return {
+            "workers": len(self._threads) if self._threads_pid == os.getpid() else 0,
+            **{status: counts.get(status, 0) for status in ("queued", "running", "done", "failed")},
+        }
+
+
+job_queue = LazyService(AnalysisJobQueue)
@@ -0,0 +1,121 @@
+"""
+Content-addressed blob store
+Keeps image bytes on disk, keyed by their SHA-256, instead of in wardrobe rows
+"""
+import hashlib
+import os
+import re
+import tempfile
+import time
+
+from app.services.lazy import LazyService
+
+DEFAULT_BLOB_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "db", "blobs")
+)
+
+CHUNK_SIZE = 64 * 1024
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class BlobStore:
+    """Files sharded by hash prefix (``ab/cd/abcd...``) and written atomically.
+
+    Identical content is stored once; writing it again is a no-op.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.getenv("WARDROBE_BLOB_DIR", DEFAULT_BLOB_DIR)
+
+    def path(self, digest):
+        if not isinstance(digest, str) or not _DIGEST_RE.match(digest):
+            raise ValueError(f"Invalid blob id: {digest!r}")
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest):
+        try:
+            return os.path.isfile(self.path(digest))
+        except ValueError:
+            return False
+
+    def size(self, digest):
+        return os.path.getsize(self.path(digest))
+
+    def put(self, source):
+        """Store ``source`` (bytes or a binary file object) and return its digest.
+
+        The content is hashed while it is copied into a temp file in the
+        blob directory, then renamed into place so readers never see a
+        partially written blob.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=self.root)
+        hasher = hashlib.sha256()
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                if isinstance(source, (bytes, bytearray, memoryview)):
+                    hasher.update(source)
+                    tmp.write(source)
+                else:
+                    for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                        hasher.update(chunk)
+                        tmp.write(chunk)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            digest = hasher.hexdigest()
+            final_path = self.path(digest)
+            try:
+                # Already stored: mark it as just written, so a sweep doesn't
+                # take it before the caller has saved its reference
+                os.utime(final_path)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(tmp_path, final_path)
+            else:
+                os.unlink(tmp_path)
+            return digest
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def open(self, digest):
+        return open(self.path(digest), "rb")
+
+    def read(self, digest):
+        with self.open(digest) as f:
+            return f.read()
+
+    def delete(self, digest):
+        try:
+            os.unlink(self.path(digest))
+            return True
+        except (FileNotFoundError, ValueError):
+            return False
+
+    def sweep(self, referenced, min_age=24 * 3600):
+        """Delete blobs not in ``referenced``, and temp files left by
+        interrupted writes, last written over ``min_age`` seconds ago.
+
+        Uploads are stored before the row referencing them exists, and stay
+        behind if analysis or the insert fails; ``min_age`` keeps the sweep
+        away from requests still in progress. Returns the number removed.
+        """
+        cutoff = time.time() - min_age
+        removed = 0
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                orphan = _DIGEST_RE.match(name) and name not in referenced
+                if not (orphan or name.startswith(".tmp-")):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.unlink(path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+
+blob_store = LazyService(BlobStore)
@@ -0,0 +1,34 @@
+"""
+Garment taxonomy shared by the style profile and the item feature vectors
+One definition of garment categories and neutral colors, so the profile's
+gap analysis and the similarity/outfit scoring agree on what an item is.
+Order matters: the feature vectors (see item_features) are laid out from
+these tuples.
+"""
+
+# Garment type -> category
+TYPE_CATEGORIES = {
+    "tops": ("shirt", "t-shirt", "tshirt", "blouse", "top", "sweater", "hoodie", "polo", "tank",
+             "cardigan", "sweatshirt", "jumper", "tee"),
+    "bottoms": ("pants", "jeans", "trousers", "skirt", "shorts", "leggings", "chinos"),
+    "footwear": ("shoes", "sneakers", "boots", "sandals", "heels", "loafers", "flats", "trainers"),
+    "outerwear": ("jacket", "coat", "blazer", "parka", "vest", "raincoat", "trench"),
+    "one-piece": ("dress", "jumpsuit", "romper", "overalls"),
+    "accessories": ("accessory", "bag", "hat", "scarf", "belt", "jewelry", "watch", "sunglasses"),
+}
+TYPE_CATEGORY = {name: category for category, names in TYPE_CATEGORIES.items() for name in names}
+
+NEUTRAL_COLORS = ("black", "white", "grey", "navy", "beige", "brown", "cream", "khaki")
+# Other names for the same colors
+COLOR_ALIASES = {"gray": "grey", "tan": "beige", "ivory": "cream", "charcoal": "grey", "denim": "blue"}
+
+# Secondary colors count for less than an item's main color
+SECONDARY_COLOR_WEIGHT = 0.5
+
+
+def canonical_color(name):
+    return COLOR_ALIASES.get(name, name)
+
+
+def is_neutral(name):
+    return canonical_color(name) in NEUTRAL_COLORS
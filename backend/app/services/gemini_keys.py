@@ -0,0 +1,258 @@
+"""
+Quota-aware Gemini API key scheduler
+Tracks per-key request/token budgets and 429 cooldowns and hands out the
+key with the most headroom, instead of rotating blindly.
+
+Budgets are kept in memory, per process. With several server processes
+(``GEMINI_KEY_PROCESSES``, set by gunicorn.conf.py to the worker count)
+each one gets an equal share of every key's quota, so together they stay
+within it; a process can't borrow the share another one leaves unused.
+"""
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+# Gemini's per-day quotas reset at midnight Pacific time
+QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+
+# Rough prompt cost used until the response reports real usage: Gemini
+# bills ~258 tokens per 768px image tile, and images are at most 1024px
+# (two tiles per side) after preprocessing
+IMAGE_TOKEN_ESTIMATE = 4 * 258
+CHARS_PER_TOKEN = 4
+
+_DURATION_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)s\s*$")
+
+
+def load_api_keys():
+    """Keys from ``GEMINI_API_KEYS`` (comma separated) and the legacy
+    ``GEMINI_API_KEY``, ``_2`` and ``_3`` variables, without duplicates."""
+    keys = [k.strip() for k in os.getenv("GEMINI_API_KEYS", "").split(",")]
+    keys += [os.getenv(name) for name in ("GEMINI_API_KEY", "GEMINI_API_KEY_2", "GEMINI_API_KEY_3")]
+    return list(dict.fromkeys(k for k in keys if k))
+
+
+def estimate_tokens(texts=(), images=0):
+    return sum(len(t) for t in texts) // CHARS_PER_TOKEN + images * IMAGE_TOKEN_ESTIMATE
+
+
+def parse_retry_after(headers, body):
+    """Return ``(seconds, per_day)`` from a 429 response.
+
+    ``seconds`` comes from the ``Retry-After`` header or the
+    ``google.rpc.RetryInfo`` detail (None if neither is present);
+    ``per_day`` is set when a ``QuotaFailure`` names a per-day quota.
+    """
+    seconds = None
+    per_day = False
+    header = (headers or {}).get("Retry-After")
+    if header:
+        try:
+            seconds = float(header)
+        except ValueError:
+            pass
+    details = []
+    if isinstance(body, dict) and isinstance(body.get("error"), dict):
+        details = body["error"].get("details") or []
+    for detail in details:
+        if not isinstance(detail, dict):
+            continue
+        delay = detail.get("retryDelay")
+        if seconds is None and isinstance(delay, str):
+            match = _DURATION_RE.match(delay)
+            if match:
+                seconds = float(match.group(1))
+        for violation in detail.get("violations") or []:
+            if "PerDay" in str(violation.get("quotaId", "")):
+                per_day = True
+    return seconds, per_day
+
+
+class _KeyState:
+    def __init__(self, key, rpm, tpm, now):
+        self.key = key
+        self.request_tokens = float(rpm)
+        self.token_tokens = float(tpm)
+        self.refilled_at = now
+        self.day = None
+        self.day_requests = 0
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.last_used = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+
+
+class KeyScheduler:
+    """Token buckets per key for requests/minute and tokens/minute, plus a
+    requests/day counter, 429 cooldowns and in-flight counts.
+
+    A limit of 0 disables that bucket. Buckets start full and refill
+    continuously. ``acquire`` charges a request up front; ``release``
+    settles it with the real token usage and the outcome.
+
+    ``rpm``, ``tpm`` and ``rpd`` are each key's quotas; this scheduler
+    enforces ``1 / processes`` of them.
+    """
+
+    def __init__(self, keys, rpm=None, tpm=None, rpd=None, default_cooldown=None, processes=None,
+                 clock=time.monotonic, wall_clock=time.time):
+        self.processes = max(1, int(processes if processes is not None
+                                    else os.getenv("GEMINI_KEY_PROCESSES", "1")))
+        self.rpm = int(rpm if rpm is not None else os.getenv("GEMINI_KEY_RPM", "10")) / self.processes
+        self.tpm = int(tpm if tpm is not None else os.getenv("GEMINI_KEY_TPM", "250000")) / self.processes
+        self.rpd = int(rpd if rpd is not None else os.getenv("GEMINI_KEY_RPD", "250")) / self.processes
+        self.default_cooldown = float(default_cooldown if default_cooldown is not None
+                                      else os.getenv("GEMINI_KEY_COOLDOWN_SECONDS", "60"))
+        self._clock = clock
+        self._wall_clock = wall_clock
+        self._lock = threading.Lock()
+        now = clock()
+        self._states = {key: _KeyState(key, self.rpm, self.tpm, now) for key in dict.fromkeys(keys)}
+        self._labels = {key: str(index) for index, key in enumerate(self._states, 1)}
+
+    @property
+    def keys(self):
+        return list(self._states)
+
+    def label(self, key):
+        """The key's 1-based position in the key list: how logs, metrics,
+        stats and traces name it, so no part of the key leaves the process"""
+        return self._labels.get(key, "unknown")
+
+    def _today(self):
+        return datetime.fromtimestamp(self._wall_clock(), QUOTA_TIMEZONE).date()
+
+    def seconds_until_daily_reset(self):
+        now = datetime.fromtimestamp(self._wall_clock(), QUOTA_TIMEZONE)
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), QUOTA_TIMEZONE)
+        return (midnight - now).total_seconds()
+
+    def _refill(self, state, now):
+        elapsed = now - state.refilled_at
+        state.refilled_at = now
+        if self.rpm:
+            state.request_tokens = min(self.rpm, state.request_tokens + elapsed * self.rpm / 60)
+        if self.tpm:
+            state.token_tokens = min(self.tpm, state.token_tokens + elapsed * self.tpm / 60)
+        today = self._today()
+        if state.day != today:
+            state.day = today
+            state.day_requests = 0
+
+    def _headroom(self, state, tokens, now):
+        """Fraction of the tightest budget left, or None if the key can't be used now"""
+        if state.cooldown_until > now:
+            return None
+        fractions = [1.0]
+        if self.rpm:
+            if state.request_tokens < 1:
+                return None
+            fractions.append(state.request_tokens / self.rpm)
+        if self.tpm:
+            if state.token_tokens < min(tokens, self.tpm):
+                return None
+            fractions.append(state.token_tokens / self.tpm)
+        if self.rpd:
+            if state.day_requests >= self.rpd:
+                return None
+            fractions.append(1 - state.day_requests / self.rpd)
+        return min(fractions) / (1 + state.in_flight)
+
+    def acquire(self, tokens=0, exclude=()):
+        """Reserve the key with the most headroom, or return None if every key is exhausted"""
+        with self._lock:
+            now = self._clock()
+            best = None
+            best_rank = None
+            for state in self._states.values():
+                if state.key in exclude:
+                    continue
+                self._refill(state, now)
+                headroom = self._headroom(state, tokens, now)
+                if headroom is None:
+                    continue
+                # Ties go to the least recently used key
+                rank = (headroom, -state.last_used)
+                if best_rank is None or rank > best_rank:
+                    best, best_rank = state, rank
+            if best is None:
+                return None
+            if self.rpm:
+                best.request_tokens -= 1
+            if self.tpm:
+                best.token_tokens -= tokens
+            best.day_requests += 1
+            best.in_flight += 1
+            best.requests += 1
+            best.last_used = now
+            return best.key
+
+    def release(self, key, status=None, retry_after=None, per_day=False, estimated_tokens=0,
+                used_tokens=None):
+        """Settle a reservation made by ``acquire``.
+
+        A 429 puts the key on cooldown for ``retry_after`` seconds (the
+        default cooldown if unknown, or until the daily reset for per-day
+        quotas). Actual ``used_tokens`` replace the estimate in the
+        tokens/minute bucket.
+        """
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                return
+            now = self._clock()
+            state.in_flight = max(0, state.in_flight - 1)
+            if used_tokens is not None and self.tpm:
+                state.token_tokens = max(-self.tpm, state.token_tokens + estimated_tokens - used_tokens)
+            if status == 429:
+                state.throttled += 1
+                if per_day:
+                    wait = self.seconds_until_daily_reset()
+                    if self.rpd:
+                        state.day_requests = self.rpd
+                else:
+                    wait = retry_after if retry_after is not None else self.default_cooldown
+                state.cooldown_until = max(state.cooldown_until, now + wait)
+            elif status is None or status >= 400:
+                state.errors += 1
+
+    def next_available_in(self, tokens=0):
+        """Seconds until some key can take a request of ``tokens`` (0 if one can now)"""
+        with self._lock:
+            now = self._clock()
+            waits = []
+            for state in self._states.values():
+                self._refill(state, now)
+                wait = max(0.0, state.cooldown_until - now)
+                if self.rpm and state.request_tokens < 1:
+                    wait = max(wait, (1 - state.request_tokens) * 60 / self.rpm)
+                if self.tpm and state.token_tokens < min(tokens, self.tpm):
+                    wait = max(wait, (min(tokens, self.tpm) - state.token_tokens) * 60 / self.tpm)
+                if self.rpd and state.day_requests >= self.rpd:
+                    wait = max(wait, self.seconds_until_daily_reset())
+                waits.append(wait)
+            return min(waits) if waits else None
+
+    def stats(self):
+        with self._lock:
+            now = self._clock()
+            result = []
+            for state in self._states.values():
+                self._refill(state, now)
+                result.append({
+                    "key": self._labels[state.key],
+                    "inFlight": state.in_flight,
+                    "requests": state.requests,
+                    "throttled": state.throttled,
+                    "errors": state.errors,
+                    "cooldownSeconds": round(max(0.0, state.cooldown_until - now), 3),
+                    "rpmUtilization": 1 - max(state.request_tokens, 0) / self.rpm if self.rpm else None,
+                    "tpmUtilization": 1 - max(state.token_tokens, 0) / self.tpm if self.tpm else None,
+                    "rpdUtilization": state.day_requests / self.rpd if self.rpd else None,
+                })
+            return result
@@ -0,0 +1,110 @@
+"""
+Streaming Gemini request bodies
+Uploads stored on disk are base64-encoded while the request is sent instead
+of being read, encoded and JSON-serialised in memory first
+"""
+import base64
+import json
+import os
+import uuid
+
+# A multiple of 3, so the base64 of each chunk concatenates without padding
+ENCODE_CHUNK_SIZE = 3 * 16 * 1024
+
+
+class Base64File:
+    """Stands in for the base64 string of a file inside a request payload"""
+
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+
+    def __len__(self):
+        return 4 * ((self.size + 2) // 3)
+
+    def chunks(self):
+        with open(self.path, "rb") as f:
+            for chunk in iter(lambda: f.read(ENCODE_CHUNK_SIZE), b""):
+                yield base64.b64encode(chunk)
+
+
+def encode_image(image):
+    """The ``inline_data.data`` value for image bytes or a file path"""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return base64.b64encode(image).decode("utf-8")
+    return Base64File(image)
+
+
+class JSONStream:
+    """A JSON request body, readable in chunks, with ``Base64File`` values
+    streamed from disk.
+
+    ``len()`` is the exact encoded size, so requests sends a Content-Length
+    rather than chunked encoding. Each instance can be read once; build a
+    new one per attempt.
+    """
+
+    def __init__(self, payload):
+        marker = uuid.uuid4().hex
+        files = []
+
+        def replace(value):
+            if isinstance(value, Base64File):
+                files.append(value)
+                return f"{marker}{len(files) - 1}{marker}"
+            if isinstance(value, dict):
+                return {key: replace(item) for key, item in value.items()}
+            if isinstance(value, list):
+                return [replace(item) for item in value]
+            return value
+
+        # Markers are plain hex, so they survive json.dumps unescaped and
+        # split the text into JSON pieces and file indexes
+        pieces = json.dumps(replace(payload)).split(marker)
+        self._parts = []
+        for position, piece in enumerate(pieces):
+            self._parts.append(files[int(piece)] if position % 2 else piece.encode("utf-8"))
+        self._length = sum(len(part) for part in self._parts)
+        self._chunks = self._generate()
+        self._buffer = bytearray()
+
+    @staticmethod
+    def needed(payload):
+        """True if ``payload`` holds any ``Base64File``"""
+        if isinstance(payload, Base64File):
+            return True
+        if isinstance(payload, dict):
+            return any(JSONStream.needed(value) for value in payload.values())
+        if isinstance(payload, list):
+            return any(JSONStream.needed(value) for value in payload)
+        return False
+
+    def _generate(self):
+        for part in self._parts:
+            if isinstance(part, Base64File):
+                yield from part.chunks()
+            elif part:
+                yield part
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        if self._buffer:
+            yield bytes(self._buffer)
+            self._buffer.clear()
+        yield from self._chunks
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data = bytes(self._buffer) + b"".join(self._chunks)
+            self._buffer.clear()
+            return data
+        while len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
@@ -0,0 +1,148 @@
+"""
+Retry policy and circuit breaker for Gemini calls
+Jittered exponential backoff, a total deadline per logical request and a
+breaker that fails fast while the API is down
+"""
+import os
+import random
+import threading
+import time
+
+
+class GeminiUnavailableError(ValueError):
+    """Gemini is down or every key is over quota: the same request may
+    succeed later. ``retry_in`` is how long to wait, when known."""
+
+    def __init__(self, message, retry_in=None):
+        super().__init__(message)
+        self.retry_in = retry_in
+
+
+class CircuitOpenError(GeminiUnavailableError):
+    """Raised instead of calling Gemini while the breaker is open"""
+
+    def __init__(self, retry_in):
+        super().__init__(f'Gemini circuit breaker is open; retry in {retry_in:.0f}s', retry_in)
+
+
+class RetryPolicy:
+    """How often and how long to retry one logical Gemini request.
+
+    ``deadline`` bounds the whole request, retries and backoff included;
+    every attempt's timeout is cut to what is left of it. Backoff uses
+    "full jitter": a uniform delay up to ``base * 2**retry``, capped.
+    A ``hedge_delay`` above 0 sends a second copy of an attempt (with
+    another key) when the first is still running after that many seconds.
+    """
+
+    def __init__(self, max_attempts=None, deadline=None, attempt_timeout=None, backoff_base=None,
+                 backoff_cap=None, hedge_delay=None, rng=None):
+        self.max_attempts = int(max_attempts if max_attempts is not None
+                                else os.getenv("GEMINI_MAX_ATTEMPTS", "4"))
+        self.deadline = float(deadline if deadline is not None
+                              else os.getenv("GEMINI_REQUEST_DEADLINE", "90"))
+        self.attempt_timeout = float(attempt_timeout if attempt_timeout is not None
+                                     else os.getenv("GEMINI_ATTEMPT_TIMEOUT", "60"))
+        self.backoff_base = float(backoff_base if backoff_base is not None
+                                  else os.getenv("GEMINI_BACKOFF_BASE", "0.5"))
+        self.backoff_cap = float(backoff_cap if backoff_cap is not None
+                                 else os.getenv("GEMINI_BACKOFF_CAP", "8"))
+        # Off by default: every hedge spends request quota
+        self.hedge_delay = float(hedge_delay if hedge_delay is not None
+                                 else os.getenv("GEMINI_HEDGE_DELAY", "0"))
+        self._rng = rng or random.Random()
+
+    def backoff(self, retry):
+        return self._rng.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** retry))
+
+
+class CircuitBreaker:
+    """Closed → open after ``failure_threshold`` consecutive failures.
+
+    While open every call fails immediately. After ``reset_timeout`` one
+    probe call is let through (half-open); its success closes the breaker,
+    its failure opens it again. Only outages count as failures (timeouts,
+    connection errors, 5xx); any other response, 429 included, shows the
+    API is up and counts as a success.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=None, reset_timeout=None, clock=time.monotonic):
+        self.failure_threshold = int(failure_threshold if failure_threshold is not None
+                                     else os.getenv("GEMINI_BREAKER_THRESHOLD", "5"))
+        self.reset_timeout = float(reset_timeout if reset_timeout is not None
+                                   else os.getenv("GEMINI_BREAKER_RESET_SECONDS", "30"))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go out now.
+
+        Returns True when the call is the half-open probe; the caller must
+        then ``release_probe`` once it is over, however it ended.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return False
+            if state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            retry_in = max(0.0, self.reset_timeout - (self._clock() - self._opened_at))
+        raise CircuitOpenError(retry_in)
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.opened += 1
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+                self._probe_in_flight = False
+
+    def release_probe(self):
+        """Let another call probe if this one ended without recording an
+        outcome, e.g. because it raised"""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probe_in_flight = False
+
+    def stats(self):
+        with self._lock:
+            state = self._current_state()
+            return {
+                "state": state,
+                "consecutiveFailures": self._failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+                "retryInSeconds": (round(max(0.0, self.reset_timeout - (self._clock() - self._opened_at)), 3)
+                                   if state == self.OPEN else 0.0),
+            }
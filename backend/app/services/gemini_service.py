@@ -11,70 +11,39 @@ os.environ.pop("https_proxy", None)
 Gemini AI Service
 Handles all interactions with Google's Gemini API
 """
-import base64
 import json
-from typing import Dict, List, Any
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 import requests
 import urllib3
+from requests.adapters import HTTPAdapter
 
-# Disable SSL warnings for development
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from app.services.analysis_cache import analysis_cache
+from app.services.gemini_keys import (
+    KeyScheduler, estimate_tokens, load_api_keys, parse_retry_after
+)
+from app.services.gemini_payload import JSONStream, encode_image
+from app.services.gemini_resilience import CircuitBreaker, GeminiUnavailableError, RetryPolicy
+from app.services.image_processing import source_size
+from app.services.lazy import LazyService
+from app.services.metrics import registry
+from app.services.tracing import bind, span
 
-class GeminiService:
-    """Service for interacting with Gemini AI API"""
-    
-    def __init__(self):
-        """Initialize Gemini service with multiple API keys for rotation"""
-        # Load all available API keys
-        self.api_keys = []
-        
-        key1 = os.getenv('GEMINI_API_KEY')
-        key2 = os.getenv('GEMINI_API_KEY_2')
-        key3 = os.getenv('GEMINI_API_KEY_3')
-        
-        if key1:
-            self.api_keys.append(key1)
-        if key2:
-            self.api_keys.append(key2)
-        if key3:
-            self.api_keys.append(key3)
-        
-        if not self.api_keys and os.getenv('NODE_ENV') != 'test':
-            raise ValueError('No GEMINI_API_KEY configured')
-        
-        self.current_key_index = 0
-        
-        # Debug: Print number of keys loaded
-        print(f"🔑 Loaded {len(self.api_keys)} API key(s)")
-        for i, key in enumerate(self.api_keys, 1):
-            masked_key = f"{key[:8]}...{key[-4:]}"
-            print(f"   Key {i}: {masked_key}")  # Consider replacing with logger.debug in production
-        
-        self.api_url = 'https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent'
-    
-    def _get_next_api_key(self) -> str:
-        """Get the next API key in rotation"""
-        if not self.api_keys:
-            raise ValueError('No API keys available')
-        
-        key = self.api_keys[self.current_key_index]
-        self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
-        return key
-    
-    def analyze_clothing_image(self, image_data: bytes, mime_type: str) -> Dict[str, Any]:
-        """
-        Analyze clothing item from image
-        
-        Args:
-            image_data: Image binary data
-            mime_type: Image MIME type
-            
-        Returns:
-            Dict containing analysis results
-        """
-        try:
-                        # Prepare the prompt
-            prompt = """
+GEMINI_REQUESTS = registry.histogram(
+    "gemini_request_duration_seconds", "Gemini HTTP request latency by method, key number and status",
+    ("method", "key", "status")
+)
+GEMINI_CALLS = registry.histogram(
+    "gemini_call_duration_seconds", "Gemini call latency including retries, by method and outcome",
+    ("method", "outcome")
+)
+
+logger = logging.getLogger(__name__)
+
+# Part of the analysis cache key: editing the prompt invalidates cached results
+CLOTHING_ANALYSIS_PROMPT = """
 Analyze this clothing item and provide a JSON response with the following structure:
 {
     "type": "shirt/pants/dress/shoes/accessory/jacket/skirt/etc (REQUIRED, one word only)",
@@ -91,296 +60,620 @@ IMPORTANT: The "type" field is REQUIRED and must be a single word describing the
 Provide accurate and specific information based on what you see in the image.
 """
 
+# Several garments per request; entries are matched back by "index"
+BATCH_ANALYSIS_PROMPT = """
+Analyze each of the clothing images below. The images are numbered from 0, in the order given.
+Return a JSON object {"items": [...]} with exactly one entry per image. Each entry has an "index"
+field with the image number plus these fields:
+{
+    "type": "shirt/pants/dress/shoes/accessory/jacket/skirt/etc (REQUIRED, one word only)",
+    "colors": ["primary color", "secondary color"],
+    "pattern": "solid/striped/floral/checkered/etc",
+    "style": "casual/formal/sporty/elegant/etc",
+    "fabric": "cotton/denim/leather/silk/etc",
+    "season": "summer/winter/spring/fall/all-season",
+    "occasion": "daily/work/party/sport/etc"
+}
 
-            # Log image size only, do not print image data
-            print(f"[DEBUG] image size: {len(image_data)} chars")
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
-            
-            # Prepare request payload
-            payload = {
-                "contents": [{
-                    "parts": [
-                        {"text": prompt},
-                        {
-                            "inline_data": {
-                                "mime_type": mime_type,
-                                "data": image_base64
-                            }
-                        }
-                    ]
-                }]
-            }
-            
-            # Make API request with longer timeout for image processing
-            # Try each API key until one works
-            last_error = None
-            
-            for attempt in range(len(self.api_keys)):
-                try:
-                    current_key = self._get_next_api_key()
-                    print(f"🔄 Trying API key {self.current_key_index}/{len(self.api_keys)}")
-                    
-                    response = requests.post(
-                        f'{self.api_url}?key={current_key}',
-                        json=payload,
-                        headers={'Content-Type': 'application/json'},
-                        timeout=60,
-                        verify=False,
-                        proxies={}  # 🚫 NO PROXY EVER
-                    )
-                    
-                    if response.status_code == 200:
-                        print(f"✅ Success with key {self.current_key_index}")
-                        break
-                    elif response.status_code == 429:
-                        print(f"⚠️ Key {self.current_key_index} quota exceeded, trying next key...")
-                        last_error = f'API request failed with status {response.status_code}: {response.text}'
-                        continue
-                    else:
-                        raise ValueError(f'API request failed with status {response.status_code}: {response.text}')
-                        
-                except requests.exceptions.RequestException as e:
-                    last_error = str(e)
-                    print(f"❌ Request failed with key {self.current_key_index}: {e}")
-                    continue
-            else:
-                # All keys failed
-                raise ValueError(f'All API keys exhausted. Last error: {last_error}')
-            
-            if response.status_code != 200:
-                raise ValueError(f'API request failed with status {response.status_code}: {response.text}')
-            
-            # Parse response
-            result_data = response.json()
-            result_text = result_data['candidates'][0]['content']['parts'][0]['text'].strip()
-            
-            # Remove markdown code blocks if present
-            if result_text.startswith('```json'):
-                result_text = result_text[7:]
-            if result_text.startswith('```'):
-                result_text = result_text[3:]
-            if result_text.endswith('```'):
-                result_text = result_text[:-3]
-            
-            result = json.loads(result_text.strip())
-            # Ensure 'type' is present and mapped to 'clothing_type' for consistency
-            if 'type' in result:
-                result['clothing_type'] = result['type']
-            elif 'clothing_type' not in result:
-                raise ValueError('Gemini response missing required "type" field')
-            return result
-            
-        except json.JSONDecodeError as e:
-            raise ValueError(f'Failed to parse Gemini response as JSON: {str(e)}')
-        except Exception as e:
-            print(f'Error analyzing image with Gemini: {str(e)}')
-            raise ValueError(f'Image analysis failed: {str(e)}')
-    
-    def generate_style_profile(self, wardrobe_items: List[Dict]) -> Dict[str, Any]:
-        """
-        Generate a style profile based on wardrobe items
-        
-        Args:
-            wardrobe_items: List of wardrobe items with their analysis
-            
-        Returns:
-            Dict containing style profile
-        """
-        try:
-            # Create a summary of the wardrobe
-            wardrobe_summary = []
-            for item in wardrobe_items:
-                analysis = item.get('analysis', {})
-                # If analysis was stored as a JSON string, try to parse it
-                if isinstance(analysis, str):
-                    try:
-                        analysis = json.loads(analysis)
-                    except Exception:
-                        analysis = {"type": analysis}
-
-                wardrobe_summary.append({
-                    'type': analysis.get('type', 'unknown'),
-                    'colors': analysis.get('colors', []),
-                    'style': analysis.get('style', 'unknown'),
-                    'pattern': analysis.get('pattern', 'unknown')
-                })
-            
-            prompt = f"""Based on this wardrobe collection, create a comprehensive style profile.
+IMPORTANT: The "type" field is REQUIRED and must be a single word describing the clothing item. Do NOT leave it empty. If you are unsure, make your best guess.
+"""
+
+# Dominant style, palette and gaps are computed locally (see style_profile);
+# Gemini only writes the free text
+STYLE_NARRATIVE_PROMPT = """Here is a summary of someone's wardrobe, computed from their items:
 
-Wardrobe items: {json.dumps(wardrobe_summary, indent=2)}
+{summary}
 
-Provide a JSON response with this structure:
+Write a JSON response with this structure:
 {{
-  "dominantStyle": "casual/formal/sporty/elegant/etc",
-  "colorPalette": ["color1", "color2", "color3"],
   "stylePersonality": "A 2-3 sentence description of their style",
   "recommendations": [
     "Specific recommendation 1",
     "Specific recommendation 2",
     "Specific recommendation 3"
-  ],
-  "missingPieces": ["item type 1", "item type 2"]
+  ]
 }}
 
-Be specific and personalized based on the actual wardrobe items."""
+Be specific and personalized, and stay consistent with the dominant style, colors and missing pieces given."""
 
-            # Prepare request payload
-            payload = {
-                "contents": [{
-                    "parts": [{"text": prompt}]
-                }]
+_STRING = {"type": "STRING"}
+BATCH_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "items": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "index": {"type": "INTEGER"},
+                    "type": _STRING,
+                    "colors": {"type": "ARRAY", "items": _STRING},
+                    "pattern": _STRING,
+                    "style": _STRING,
+                    "fabric": _STRING,
+                    "season": _STRING,
+                    "occasion": _STRING
+                },
+                "required": ["index", "type"]
             }
-            
-            # Make API request with key rotation
-            last_error = None
-            
-            for attempt in range(len(self.api_keys)):
-                try:
-                    current_key = self._get_next_api_key()
-                    
-                    response = requests.post(
-                        f'{self.api_url}?key={current_key}',
-                        json=payload,
-                        headers={'Content-Type': 'application/json'},
-                        timeout=60,
-                        verify=False
-                    )
-                    
-                    if response.status_code == 200:
-                        break
-                    elif response.status_code == 429:
-                        last_error = f'API request failed with status {response.status_code}: {response.text}'
-                        continue
-                    else:
-                        raise ValueError(f'API request failed with status {response.status_code}: {response.text}')
-                        
-                except requests.exceptions.RequestException as e:
-                    last_error = str(e)
-                    continue
-            else:
-                raise ValueError(f'All API keys exhausted. Last error: {last_error}')
-            
-            if response.status_code != 200:
-                raise ValueError(f'API request failed with status {response.status_code}: {response.text}')
-            
-            # Parse response
+        }
+    },
+    "required": ["items"]
+}
+
+
+class GeminiService:
+    """Service for interacting with Gemini AI API"""
+    
+    def __init__(self):
+        """Initialize Gemini service with multiple API keys for rotation"""
+        # GEMINI_API_KEYS plus the legacy GEMINI_API_KEY, _2 and _3
+        self.api_keys = load_api_keys()
+
+        if not self.api_keys and os.getenv('NODE_ENV') != 'test':
+            raise ValueError('No GEMINI_API_KEY configured')
+
+        # Disable SSL warnings for development
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+        logger.info("Loaded %d Gemini API key(s)", len(self.api_keys))
+
+        self.api_url = 'https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent'
+
+        # Keep-alive connections per process; match gunicorn's --threads
+        self.pool_size = int(os.getenv('GEMINI_HTTP_POOL_SIZE', '4'))
+        self._session = None
+        self._session_pid = None
+        self._hedge_pool = None
+        self._hedge_pool_pid = None
+        self._batch_pool = None
+        self._batch_pool_pid = None
+        self.hedges = 0
+
+        # Images per multi-image request, and batch requests run at once
+        self.batch_size = int(os.getenv('GEMINI_BATCH_SIZE', '8'))
+        self.batch_concurrency = int(os.getenv('GEMINI_BATCH_CONCURRENCY', '3'))
+
+        self.retry_policy = RetryPolicy()
+        self.circuit_breaker = CircuitBreaker()
+        self._sleep = time.sleep
+
+    def _new_session(self) -> requests.Session:
+        session = requests.Session()
+        # 🚫 NO PROXY EVER: ignore proxy variables from the environment
+        session.trust_env = False
+        session.verify = False
+        session.headers['Content-Type'] = 'application/json'
+        # One pool per host (there is only Gemini); retries stay with the callers
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    @property
+    def session(self) -> requests.Session:
+        """Pooled session, recreated after a fork so workers never share sockets"""
+        if self._session is None or self._session_pid != os.getpid():
+            self._session = self._new_session()
+            self._session_pid = os.getpid()
+        return self._session
+
+    def close(self):
+        if self._session is not None and self._session_pid == os.getpid():
+            self._session.close()
+        if self._hedge_pool is not None and self._hedge_pool_pid == os.getpid():
+            self._hedge_pool.shutdown(wait=False)
+        if self._batch_pool is not None and self._batch_pool_pid == os.getpid():
+            self._batch_pool.shutdown(wait=False)
+        self._session = None
+        self._hedge_pool = None
+        self._batch_pool = None
+
+    def connection_stats(self) -> Dict[str, Any]:
+        """Requests sent vs TCP/TLS connections opened by this process"""
+        sent = opened = 0
+        if self._session is not None and self._session_pid == os.getpid():
+            pools = self._session.get_adapter(self.api_url).poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    sent += pool.num_requests
+                    opened += pool.num_connections
+        return {
+            'poolSize': self.pool_size,
+            'requests': sent,
+            'connections': opened,
+            'reused': max(sent - opened, 0),
+            'reuseRatio': (sent - opened) / sent if sent else 0.0
+        }
+    
+    @property
+    def api_keys(self) -> List[str]:
+        return self.key_scheduler.keys
+
+    @api_keys.setter
+    def api_keys(self, keys: List[str]):
+        self.key_scheduler = KeyScheduler(keys)
+
+    def _get_next_api_key(self, tokens: int = 0, exclude=()) -> str:
+        """Reserve the key with the most quota headroom (None if all are exhausted)"""
+        if not self.api_keys:
+            raise ValueError('No API keys available')
+        return self.key_scheduler.acquire(tokens, exclude)
+
+    def _attempt(self, key: str, payload: Dict[str, Any], estimated_tokens: int,
+                 timeout: float, method: str = 'generate') -> Tuple[str, Any]:
+        """Send one request with ``key`` and classify the outcome.
+
+        Returns ``(kind, value)``: ``ok`` with the decoded body, ``throttled``
+        or ``retry`` with an error message, ``fatal`` with a message for
+        errors that retrying can't fix, or ``error`` with an exception.
+        """
+        # In a header, not the URL: requests puts the URL in its exception
+        # messages, and those end up in logs, job rows and API errors
+        headers = {'x-goog-api-key': key}
+        if JSONStream.needed(payload):
+            # Images on disk are encoded while sending, never held in full
+            body = {'data': JSONStream(payload)}
+            headers['Content-Type'] = 'application/json'
+        else:
+            body = {'json': payload}
+        label = self.key_scheduler.label(key)
+        start = time.perf_counter()
+        try:
+            with span('gemini.attempt', key=label) as attempt:
+                response = self.session.post(
+                    self.api_url,
+                    headers=headers,
+                    timeout=timeout,
+                    **body
+                )
+                if attempt is not None:
+                    attempt.set(status=response.status_code)
+        except requests.exceptions.RequestException as e:
+            GEMINI_REQUESTS.observe(time.perf_counter() - start, method, label, 'error')
+            self.key_scheduler.release(key)
+            self.circuit_breaker.record_failure()
+            logger.warning("Gemini request failed", extra={"key": label, "error": str(e)})
+            return 'retry', str(e)
+
+        status = response.status_code
+        GEMINI_REQUESTS.observe(time.perf_counter() - start, method, label, status)
+        if status >= 500:
+            self.key_scheduler.release(key, status)
+            self.circuit_breaker.record_failure()
+            return 'retry', f'API request failed with status {status}: {response.text}'
+        self.circuit_breaker.record_success()
+
+        if status == 429:
+            logger.info("Gemini key over quota, trying the next one", extra={"key": label})
+            try:
+                error_body = response.json()
+            except ValueError:
+                error_body = None
+            retry_after, per_day = parse_retry_after(response.headers, error_body)
+            self.key_scheduler.release(key, status, retry_after=retry_after, per_day=per_day)
+            return 'throttled', f'API request failed with status {status}: {response.text}'
+        if status != 200:
+            self.key_scheduler.release(key, status)
+            return 'fatal', f'API request failed with status {status}: {response.text}'
+
+        try:
             result_data = response.json()
-            result_text = result_data['candidates'][0]['content']['parts'][0]['text'].strip()
-            
-            # Remove markdown code blocks if present
-            if result_text.startswith('```json'):
-                result_text = result_text[7:]
-            if result_text.startswith('```'):
-                result_text = result_text[3:]
-            if result_text.endswith('```'):
-                result_text = result_text[:-3]
-            
-            result = json.loads(result_text.strip())
+        except ValueError as e:
+            self.key_scheduler.release(key, status)
+            return 'error', e
+        usage = result_data.get('usageMetadata') if isinstance(result_data, dict) else None
+        self.key_scheduler.release(
+            key, status, estimated_tokens=estimated_tokens,
+            used_tokens=(usage or {}).get('totalTokenCount')
+        )
+        return 'ok', result_data
+
+    @property
+    def hedge_pool(self) -> ThreadPoolExecutor:
+        if self._hedge_pool is None or self._hedge_pool_pid != os.getpid():
+            self._hedge_pool = ThreadPoolExecutor(max_workers=2 * self.pool_size,
+                                                  thread_name_prefix='gemini-hedge')
+            self._hedge_pool_pid = os.getpid()
+        return self._hedge_pool
+
+    @property
+    def batch_pool(self) -> ThreadPoolExecutor:
+        """Runs batch chunks; shared by every batch in this process, so
+        ``batch_concurrency`` caps them all together"""
+        if self._batch_pool is None or self._batch_pool_pid != os.getpid():
+            self._batch_pool = ThreadPoolExecutor(max_workers=max(1, self.batch_concurrency),
+                                                  thread_name_prefix='gemini-batch')
+            self._batch_pool_pid = os.getpid()
+        return self._batch_pool
+
+    def _attempt_hedged(self, key: str, payload: Dict[str, Any], estimated_tokens: int,
+                        timeout: float, exclude, method: str = 'generate') -> Tuple[str, Any]:
+        """Like ``_attempt``, plus a second copy on another key if the first is slow.
+
+        The first successful copy wins; the loser finishes in the background
+        and settles its own key.
+        """
+        hedge_delay = self.retry_policy.hedge_delay
+        if hedge_delay <= 0 or timeout <= hedge_delay or self.circuit_breaker.state != CircuitBreaker.CLOSED:
+            return self._attempt(key, payload, estimated_tokens, timeout, method)
+
+        first = self.hedge_pool.submit(bind(self._attempt), key, payload, estimated_tokens, timeout, method)
+        try:
+            return first.result(timeout=hedge_delay)
+        except FutureTimeout:
+            pass
+        hedge_key = self._get_next_api_key(estimated_tokens, set(exclude) | {key})
+        if hedge_key is None:
+            return first.result()
+        self.hedges += 1
+        pending = {first, self.hedge_pool.submit(
+            bind(self._attempt), hedge_key, payload, estimated_tokens, timeout - hedge_delay, method
+        )}
+        outcome = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                outcome = future.result()
+                if outcome[0] == 'ok':
+                    return outcome
+        return outcome
+
+    def _send(self, payload: Dict[str, Any], estimated_tokens: int = 0, method: str = 'generate') -> Dict[str, Any]:
+        """POST ``payload`` to Gemini and return the decoded response body.
+
+        Keys are chosen by the scheduler; a 429 moves on to the next best
+        key straight away, while timeouts and 5xx errors are retried with
+        jittered backoff. Everything, backoff included, has to fit in the
+        retry policy's deadline, and the circuit breaker stops calls
+        altogether while Gemini is down. When no key has quota left it
+        raises GeminiUnavailableError with ``retry_in`` rather than waiting.
+        """
+        policy = self.retry_policy
+        deadline = time.monotonic() + policy.deadline
+        tried = set()
+        last_error = None
+        only_throttled = True
+        retries = 0
+
+        for attempt in range(max(policy.max_attempts, len(self.api_keys))):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                last_error = f'request deadline of {policy.deadline:g}s exceeded ({last_error})'
+                only_throttled = False
+                break
+
+            current_key = self._get_next_api_key(estimated_tokens, tried)
+            if current_key is None:
+                # Never wait for quota here: that would hold a request thread.
+                # Callers that can wait (the job queue) retry after retry_in
+                retry_in = self.key_scheduler.next_available_in(estimated_tokens)
+                if last_error is None:
+                    raise GeminiUnavailableError(
+                        f'All API keys exhausted: every key is over quota, next one free in {retry_in or 0:.0f}s',
+                        retry_in
+                    )
+                break
+
+            try:
+                probe = self.circuit_breaker.before_call()
+            except ValueError:
+                self.key_scheduler.release(current_key)
+                raise
+
+            try:
+                kind, value = self._attempt_hedged(
+                    current_key, payload, estimated_tokens, min(policy.attempt_timeout, remaining), tried, method
+                )
+            finally:
+                if probe:
+                    self.circuit_breaker.release_probe()
+            if kind == 'ok':
+                return value
+            if kind == 'error':
+                raise value
+            if kind == 'fatal':
+                raise ValueError(value)
+            last_error = value
+            if kind == 'throttled':
+                tried.add(current_key)
+                continue
+
+            only_throttled = False
+            delay = min(policy.backoff(retries), max(0.0, deadline - time.monotonic()))
+            retries += 1
+            with span('gemini.backoff'):
+                self._sleep(delay)
+
+        if only_throttled:
+            raise GeminiUnavailableError(f'All API keys exhausted. Last error: {last_error}',
+                                         self.key_scheduler.next_available_in(estimated_tokens))
+        raise GeminiUnavailableError(f'Gemini request failed: {last_error}')
+
+    def resilience_stats(self) -> Dict[str, Any]:
+        return {
+            'circuit': self.circuit_breaker.stats(),
+            'hedges': self.hedges,
+            'deadlineSeconds': self.retry_policy.deadline,
+            'maxAttempts': self.retry_policy.max_attempts
+        }
+
+    def key_stats(self) -> List[Dict[str, Any]]:
+        return self.key_scheduler.stats()
+
+    @staticmethod
+    def _extract_json(result_data: Dict[str, Any]) -> Any:
+        """Decode the JSON answer in the first candidate, minus any markdown fences"""
+        result_text = result_data['candidates'][0]['content']['parts'][0]['text'].strip()
+
+        # Remove markdown code blocks if present
+        if result_text.startswith('```json'):
+            result_text = result_text[7:]
+        if result_text.startswith('```'):
+            result_text = result_text[3:]
+        if result_text.endswith('```'):
+            result_text = result_text[:-3]
+
+        return json.loads(result_text.strip())
+
+    def _generate(self, parts: List[Dict[str, Any]], error_message: str,
+                  validate: Optional[Callable[[Any], Any]] = None, cache_key: Optional[str] = None,
+                  generation_config: Optional[Dict[str, Any]] = None, method: str = 'generate') -> Any:
+        """The request pipeline every prompt goes through.
+
+        Build the payload, send it (key scheduling, retries, deadline and
+        circuit breaker live in ``_send``), parse the JSON answer and
+        validate it. With a ``cache_key`` the validated result is read from
+        and written to the analysis cache. Failures surface as ValueError
+        prefixed with ``error_message``. ``method`` labels the call's metrics.
+        """
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            if cache_key is not None:
+                with span('gemini.cache'):
+                    cached = analysis_cache.get(cache_key)
+                if cached is not None:
+                    logger.debug("Gemini answer served from cache", extra={"method": method})
+                    outcome = 'cached'
+                    return cached
+
+            payload = {"contents": [{"parts": parts}]}
+            if generation_config:
+                payload["generationConfig"] = generation_config
+            texts = [part['text'] for part in parts if 'text' in part]
+            images = sum(1 for part in parts if 'inline_data' in part)
+            with span('gemini.send', method=method):
+                result_data = self._send(payload, estimate_tokens(texts, images), method)
+
+            with span('gemini.parse'):
+                result = self._extract_json(result_data)
+                if validate is not None:
+                    result = validate(result)
+
+            if cache_key is not None:
+                analysis_cache.set(cache_key, result)
+            outcome = 'ok'
             return result
-            
+
         except json.JSONDecodeError as e:
             raise ValueError(f'Failed to parse Gemini response as JSON: {str(e)}')
+        except GeminiUnavailableError as e:
+            # Kept retryable for callers that can wait, like the job queue
+            logger.warning("%s: %s", error_message, e)
+            raise GeminiUnavailableError(f'{error_message}: {str(e)}', e.retry_in)
         except Exception as e:
-            print(f'Error generating style profile: {str(e)}')
-            raise ValueError(f'Profile generation failed: {str(e)}')
-    
-    def find_similar_items(self, item: Dict, wardrobe_items: List[Dict]) -> List[Dict]:
+            logger.warning("%s: %s", error_message, e)
+            raise ValueError(f'{error_message}: {str(e)}')
+        finally:
+            GEMINI_CALLS.observe(time.perf_counter() - start, method, outcome)
+
+    @staticmethod
+    def _parse_analysis(analysis: Any) -> Dict[str, Any]:
+        # Analyses stored as a JSON string, or just a type name
+        if isinstance(analysis, str):
+            try:
+                analysis = json.loads(analysis)
+            except Exception:
+                analysis = {"type": analysis}
+        return analysis if isinstance(analysis, dict) else {}
+
+    @staticmethod
+    def _validate_clothing(result: Any) -> Dict[str, Any]:
+        if not isinstance(result, dict):
+            raise ValueError('Gemini response is not a JSON object')
+        # Ensure 'type' is present and mapped to 'clothing_type' for consistency
+        if 'type' in result:
+            result['clothing_type'] = result['type']
+        elif 'clothing_type' not in result:
+            raise ValueError('Gemini response missing required "type" field')
+        return result
+
+    @staticmethod
+    def _validate_object(result: Any) -> Dict[str, Any]:
+        if not isinstance(result, dict):
+            raise ValueError('Gemini response is not a JSON object')
+        return result
+
+    def analyze_clothing_image(self, image_data: Union[bytes, str], mime_type: str) -> Dict[str, Any]:
         """
-        Find items similar to the given item
+        Analyze clothing item from image
         
         Args:
-            item: The reference item
-            wardrobe_items: List of wardrobe items to compare against
+            image_data: Image binary data, or the path of an image file
+            mime_type: Image MIME type
             
         Returns:
-            List of recommendations
+            Dict containing analysis results
         """
-        try:
-            item_analysis = item.get('analysis', {})
-            if isinstance(item_analysis, str):
+        # Log image size only, do not print image data
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Analyzing image of %d bytes", source_size(image_data))
+        with span('gemini.encode'):
+            parts = [
+                {"text": CLOTHING_ANALYSIS_PROMPT},
+                {
+                    "inline_data": {
+                        "mime_type": mime_type,
+                        "data": encode_image(image_data)
+                    }
+                }
+            ]
+        return self._generate(
+            parts,
+            'Image analysis failed',
+            validate=self._validate_clothing,
+            cache_key=self._analysis_cache_key(image_data, mime_type),
+            method='analyze_image'
+        )
+    
+    def _analysis_cache_key(self, image_data: Union[bytes, str], mime_type: str) -> str:
+        return analysis_cache.make_key(image_data, mime_type, self.api_url, CLOTHING_ANALYSIS_PROMPT)
+
+    def _analyze_chunk(self, images: List[Tuple[Union[bytes, str], str]]) -> List[Optional[Dict[str, Any]]]:
+        """One multi-image request; None for images missing from the answer"""
+        parts = [{"text": BATCH_ANALYSIS_PROMPT}]
+        with span('gemini.encode'):
+            for position, (image_data, mime_type) in enumerate(images):
+                parts.append({"text": f"Image {position}:"})
+                parts.append({
+                    "inline_data": {
+                        "mime_type": mime_type,
+                        "data": encode_image(image_data)
+                    }
+                })
+
+        def validate(result: Any) -> List[Optional[Dict[str, Any]]]:
+            entries = self._validate_object(result).get('items')
+            if not isinstance(entries, list):
+                raise ValueError('"items" is not a list')
+            by_position = [None] * len(images)
+            for entry in entries:
+                if not isinstance(entry, dict):
+                    continue
+                position = entry.pop('index', None)
+                if isinstance(position, int) and 0 <= position < len(images) and by_position[position] is None:
+                    try:
+                        by_position[position] = self._validate_clothing(entry)
+                    except ValueError:
+                        pass
+            return by_position
+
+        return self._generate(
+            parts,
+            'Batch image analysis failed',
+            validate=validate,
+            generation_config={"responseMimeType": "application/json", "responseSchema": BATCH_RESPONSE_SCHEMA},
+            method='analyze_batch'
+        )
+
+    def analyze_clothing_images(self, images: List[Tuple[Union[bytes, str], str]]) -> List[Any]:
+        """
+        Analyze several clothing images, up to ``batch_size`` per request
+
+        Args:
+            images: ``(image_data, mime_type)`` pairs
+
+        Returns:
+            One entry per image, in order: its analysis, or the ValueError it failed with
+        """
+        results: List[Any] = [None] * len(images)
+        cache_keys = [self._analysis_cache_key(data, mime) for data, mime in images]
+        pending = []
+        for index, cache_key in enumerate(cache_keys):
+            cached = analysis_cache.get(cache_key)
+            if cached is not None:
+                results[index] = cached
+            else:
+                pending.append(index)
+
+        chunks = [pending[i:i + self.batch_size] for i in range(0, len(pending), max(1, self.batch_size))]
+
+        def run(chunk):
+            analyses = [None] * len(chunk)
+            if len(chunk) > 1:
                 try:
-                    item_analysis = json.loads(item_analysis)
-                except Exception:
-                    item_analysis = {"type": item_analysis}
-            
-            wardrobe_summary = []
-            for wardrobe_item in wardrobe_items:
-                if wardrobe_item['id'] != item['id']:
-                    analysis = wardrobe_item.get('analysis', {})
-                    if isinstance(analysis, str):
-                        try:
-                            analysis = json.loads(analysis)
-                        except Exception:
-                            analysis = {"type": analysis}
-
-                    wardrobe_summary.append({
-                        'id': wardrobe_item['id'],
-                        'type': analysis.get('type', 'unknown'),
-                        'colors': analysis.get('colors', []),
-                        'style': analysis.get('style', 'unknown')
-                    })
-            
-            prompt = f"""Based on this clothing item, suggest matching items from the wardrobe.
+                    analyses = self._analyze_chunk([images[i] for i in chunk])
+                except GeminiUnavailableError as e:
+                    # One request per image would only spend more quota
+                    return chunk, [e] * len(chunk)
+                except ValueError as e:
+                    logger.warning("Batch of %d images failed, analyzing them one by one: %s", len(chunk), e)
+            unavailable = None
+            for position, index in enumerate(chunk):
+                if analyses[position] is not None:
+                    analysis_cache.set(cache_keys[index], analyses[position])
+                    continue
+                if unavailable is not None:
+                    analyses[position] = unavailable
+                    continue
+                # Single images, and images a malformed or partial batch answer left out
+                try:
+                    analyses[position] = self.analyze_clothing_image(*images[index])
+                except GeminiUnavailableError as e:
+                    analyses[position] = unavailable = e
+                except ValueError as e:
+                    analyses[position] = e
+            return chunk, analyses
 
-Reference item:
-{json.dumps(item_analysis, indent=2)}
+        # Chunks run side by side; the key scheduler keeps them within quota.
+        # One context copy per chunk: a context can't run in two threads at once
+        futures = [self.batch_pool.submit(bind(run), chunk) for chunk in chunks]
+        for future in futures:
+            chunk, analyses = future.result()
+            for index, analysis in zip(chunk, analyses):
+                results[index] = analysis
+        return results
 
-Available wardrobe items:
-{json.dumps(wardrobe_summary, indent=2)}
+    def generate_style_narrative(self, summary: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Describe a locally computed style profile in words
 
-Provide a JSON response with this structure:
-{{
-  "recommendations": [
-    {{
-      "itemId": "id from wardrobe",
-      "matchScore": 0-100,
-      "reason": "Why this item matches well"
-    }}
-  ]
-}}
+        Args:
+            summary: Aggregates from ``StyleProfileEngine.summary``
 
-Suggest 3-5 best matching items."""
+        Returns:
+            Dict with ``stylePersonality`` and ``recommendations``
+        """
+        summary_json = json.dumps(summary, sort_keys=True)
+        prompt = STYLE_NARRATIVE_PROMPT.format(summary=summary_json)
 
-            # Prepare request payload
-            payload = {
-                "contents": [{
-                    "parts": [{"text": prompt}]
-                }]
+        def validate(result: Any) -> Dict[str, Any]:
+            result = self._validate_object(result)
+            personality = result.get('stylePersonality')
+            recommendations = result.get('recommendations')
+            if not isinstance(personality, str) or not isinstance(recommendations, list):
+                raise ValueError('Gemini response is missing stylePersonality or recommendations')
+            return {
+                'stylePersonality': personality,
+                'recommendations': [str(r) for r in recommendations if r]
             }
-            
-            # Make API request
-            response = requests.post(
-                f'{self.api_url}?key={self.api_key}',
-                json=payload,
-                headers={'Content-Type': 'application/json'},
-                timeout=60,
-                verify=False,
-                proxies={}  # 🚫 NO PROXY EVER
-            )
-            
-            if response.status_code != 200:
-                raise ValueError(f'API request failed with status {response.status_code}: {response.text}')
-            
-            # Parse response
-            result_data = response.json()
-            result_text = result_data['candidates'][0]['content']['parts'][0]['text'].strip()
-            
-            # Remove markdown code blocks if present
-            if result_text.startswith('```json'):
-                result_text = result_text[7:]
-            if result_text.startswith('```'):
-                result_text = result_text[3:]
-            if result_text.endswith('```'):
-                result_text = result_text[:-3]
-            
-            result = json.loads(result_text.strip())
-            return result.get('recommendations', [])
-            
-        except json.JSONDecodeError as e:
-            raise ValueError(f'Failed to parse Gemini response as JSON: {str(e)}')
-        except Exception as e:
-            print(f'Error finding similar items: {str(e)}')
-            raise ValueError(f'Recommendation generation failed: {str(e)}')
 
-# Create singleton instance
-gemini_service = GeminiService()
+        # Same aggregates, same narrative: cached like image analyses
+        cache_key = analysis_cache.make_key(summary_json.encode('utf-8'), self.api_url, STYLE_NARRATIVE_PROMPT)
+        return self._generate([{"text": prompt}], 'Profile generation failed',
+                              validate=validate, cache_key=cache_key, method='style_narrative')
+
+# Built on first use, in the worker that uses it
+gemini_service = LazyService(GeminiService)
@@ -0,0 +1,234 @@
+"""
+Perceptual image hashing and near-duplicate lookup
+Lets re-uploads of the same garment (re-shot, cropped, recompressed) reuse
+an earlier analysis instead of calling Gemini again. The hash is computed
+on grayscale, so a coarse color signature is kept next to it: the same cut
+in another color must not inherit the other item's analysis.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageOps
+
+from app.services.image_processing import image_source
+from app.services.lazy import LazyService
+from app.services.wardrobe_service import get_pool
+
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+# Mean RGB of each cell of a COLOR_GRID x COLOR_GRID grid
+COLOR_GRID = 2
+
+
+def dhash(image_data, hash_size=HASH_SIZE):
+    """Difference hash: compares neighbouring pixels of a tiny grayscale copy.
+
+    Returns a ``hash_size**2``-bit int, or None if the bytes (or file) aren't an image.
+    """
+    try:
+        with Image.open(image_source(image_data)) as img:
+            # Let the JPEG decoder downscale while decoding
+            img.draft("L", (hash_size * 8, hash_size * 8))
+            img = ImageOps.exif_transpose(img)
+            small = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    pixels = small.tobytes()
+    width = hash_size + 1
+    value = 0
+    for row in range(hash_size):
+        offset = row * width
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def color_signature(image_data, grid=COLOR_GRID):
+    """Mean color of each cell of a ``grid`` x ``grid`` grid, as hex RGB
+    triples, or None if the bytes (or file) aren't an image"""
+    try:
+        with Image.open(image_source(image_data)) as img:
+            img.draft("RGB", (grid * 16, grid * 16))
+            img = ImageOps.exif_transpose(img)
+            small = img.convert("RGB").resize((grid, grid), Image.Resampling.BOX)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    return small.tobytes().hex()
+
+
+def color_distance(a, b):
+    """Mean absolute difference per channel (0-255) between two signatures"""
+    a, b = bytes.fromhex(a), bytes.fromhex(b)
+    if len(a) != len(b) or not a:
+        return None
+    return sum(abs(x - y) for x, y in zip(a, b)) / len(a)
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """Burkhard-Keller tree over hamming distance.
+
+    A radius search only descends into children whose edge distance is
+    within ``radius`` of the query's distance to the node, so most of the
+    tree is skipped for small radii.
+    """
+
+    def __init__(self):
+        self._root = None
+        self._values = {}
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        self._values[item] = value
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def remove(self, item):
+        """Forget ``item``; its node stays in place to route searches"""
+        value = self._values.pop(item, None)
+        node = self._root
+        while value is not None and node is not None:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].remove(item)
+                self.size -= 1
+                return True
+            node = node[2].get(distance)
+        return False
+
+    def search(self, value, radius):
+        """Return ``(distance, item)`` pairs within ``radius``, closest first"""
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                found.extend((distance, item) for item in node[1])
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+
+class DuplicateIndex:
+    """Per-user BK-trees of wardrobe image hashes.
+
+    Trees are built from the ``phash`` stored in each item's image info and
+    topped up incrementally (rows with a higher id than last seen), so items
+    added by other gunicorn workers are found too. Matches are checked
+    against the table and deleted items dropped from the tree. The lock only
+    guards the in-memory trees; queries run outside it.
+    """
+
+    def __init__(self, max_distance=None, max_users=None, max_color_distance=None):
+        if max_distance is None:
+            max_distance = os.getenv("PHASH_MAX_DISTANCE", "6")
+        if max_users is None:
+            max_users = os.getenv("PHASH_INDEX_MAX_USERS", "1000")
+        if max_color_distance is None:
+            max_color_distance = os.getenv("PHASH_MAX_COLOR_DISTANCE", "20")
+        # Negative disables near-duplicate detection
+        self.max_distance = int(max_distance)
+        self.max_users = int(max_users)
+        self.max_color_distance = float(max_color_distance)
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_distance >= 0
+
+    def same_colors(self, a, b):
+        """Whether two color signatures are close enough to share an analysis.
+
+        Items stored without a signature never match: their colors can't be
+        checked.
+        """
+        if not a or not b:
+            return False
+        distance = color_distance(a, b)
+        return distance is not None and distance <= self.max_color_distance
+
+    def similarity(self, distance):
+        return 1 - distance / HASH_BITS
+
+    def _last_id(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            return entry[1] if entry else 0
+
+    def _merge(self, user_id, rows):
+        """Add rows to the user's tree; call with the lock held"""
+        tree, last_id = self._users.pop(user_id, (None, 0))
+        if tree is None:
+            tree = BKTree()
+        for row in rows:
+            # Another thread may have merged the same rows meanwhile
+            if row["id"] <= last_id:
+                continue
+            last_id = row["id"]
+            try:
+                tree.add(int(json.loads(row["image_info"])["phash"], 16), row["id"])
+            except (ValueError, KeyError, TypeError):
+                continue
+        self._users[user_id] = (tree, last_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return tree
+
+    def find(self, user_id, value):
+        """Return ``(distance, item_id)`` of this user's items within range"""
+        if not self.enabled:
+            return []
+        with get_pool().connection() as conn:
+            rows = conn.execute(
+                """SELECT id, image_info FROM wardrobe
+                   WHERE user_id=? AND id>? AND image_info LIKE '%"phash"%'
+                   ORDER BY id""",
+                (user_id, self._last_id(user_id))
+            ).fetchall()
+        with self._lock:
+            found = self._merge(user_id, rows).search(value, self.max_distance)
+        if not found:
+            return found
+        ids = [item_id for _, item_id in found]
+        with get_pool().connection() as conn:
+            live = {row["id"] for row in conn.execute(
+                f"SELECT id FROM wardrobe WHERE id IN ({','.join('?' * len(ids))})", ids
+            )}
+        if len(live) < len(ids):
+            with self._lock:
+                tree = self._users.get(user_id, (None,))[0]
+                for item_id in set(ids) - live:
+                    if tree is not None:
+                        tree.remove(item_id)
+        return [(distance, item_id) for distance, item_id in found if item_id in live]
+
+    def reset(self):
+        with self._lock:
+            self._users.clear()
+
+
+duplicate_index = LazyService(DuplicateIndex)
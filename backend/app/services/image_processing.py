@@ -0,0 +1,119 @@
+"""
+Image preprocessing before analysis
+Decodes an upload once and produces a downsized, EXIF-free JPEG for Gemini
+plus a small thumbnail for wardrobe listings
+"""
+import io
+import os
+
+from PIL import Image, ImageOps
+
+from app.services.lazy import LazyService
+
+OUTPUT_MIME_TYPE = "image/jpeg"
+
+# Leading bytes of the formats browsers and phones upload
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+)
+
+
+def sniff_mime_type(head):
+    """MIME type from an image's first bytes, or None if unrecognised"""
+    for signature, mime_type in _SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"heic", b"heix", b"mif1", b"msf1"):
+        return "image/heic"
+    return None
+
+
+def image_source(image):
+    """Something Pillow can open: image bytes, or a file path / binary file as is"""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return io.BytesIO(image)
+    return image
+
+
+def source_size(image):
+    """Size in bytes of image bytes or of the file at a path"""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return len(image)
+    return os.path.getsize(image)
+
+
+def _env_flag(name, default):
+    return os.getenv(name, default).lower() not in ("0", "false", "no")
+
+
+class ImagePreprocessor:
+    """Auto-orients, strips metadata, downsizes and re-encodes images.
+
+    Garment classification does not need a 12-megapixel photo; a 1024px
+    JPEG is a fraction of the upload and of the base64 request body.
+    """
+
+    def __init__(self, max_edge=None, quality=None, thumbnail_edge=None, thumbnail_quality=None,
+                 enabled=None):
+        self.max_edge = int(max_edge or os.getenv("IMAGE_MAX_EDGE", "1024"))
+        self.quality = int(quality or os.getenv("IMAGE_JPEG_QUALITY", "85"))
+        self.thumbnail_edge = int(thumbnail_edge or os.getenv("IMAGE_THUMBNAIL_EDGE", "256"))
+        self.thumbnail_quality = int(thumbnail_quality or os.getenv("IMAGE_THUMBNAIL_QUALITY", "75"))
+        self.enabled = _env_flag("IMAGE_PREPROCESS_ENABLED", "true") if enabled is None else enabled
+
+    def _to_rgb(self, img):
+        if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+            rgba = img.convert("RGBA")
+            background = Image.new("RGB", rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            return background
+        return img.convert("RGB")
+
+    def _encode(self, img, quality):
+        buf = io.BytesIO()
+        # No exif= argument: metadata (GPS, camera serials...) is dropped
+        img.save(buf, "JPEG", quality=quality, optimize=True)
+        return buf.getvalue()
+
+    def process(self, image_data):
+        """Return the analysis image and thumbnail, or None if undecodable.
+
+        ``image_data`` is the upload's bytes or the path of a stored upload;
+        a path is decoded straight from disk.
+
+        Result keys: ``data``, ``mimeType``, ``width``, ``height``,
+        ``thumbnail``, ``originalBytes`` and ``bytes``.
+        """
+        if not self.enabled:
+            return None
+        try:
+            with Image.open(image_source(image_data)) as img:
+                # JPEG decoders can downscale by 1/2..1/8 while decoding
+                img.draft("RGB", (self.max_edge, self.max_edge))
+                img = ImageOps.exif_transpose(img)
+                img = self._to_rgb(img)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            return None
+
+        img.thumbnail((self.max_edge, self.max_edge), Image.Resampling.LANCZOS)
+        data = self._encode(img, self.quality)
+        thumb = img.copy()
+        thumb.thumbnail((self.thumbnail_edge, self.thumbnail_edge), Image.Resampling.LANCZOS)
+        return {
+            "data": data,
+            "mimeType": OUTPUT_MIME_TYPE,
+            "width": img.width,
+            "height": img.height,
+            "thumbnail": self._encode(thumb, self.thumbnail_quality),
+            "originalBytes": source_size(image_data),
+            "bytes": len(data),
+        }
+
+
+image_preprocessor = LazyService(ImagePreprocessor)
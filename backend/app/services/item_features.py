@@ -0,0 +1,134 @@
+"""
+Fixed-width feature vectors for wardrobe items
+Encodes an item's analysis (type, colors, style, pattern, fabric, season,
+occasion) as float32 blocks stored with the item and compared with numpy
+"""
+import json
+
+import numpy as np
+
+from app.services.garment_taxonomy import (
+    NEUTRAL_COLORS, SECONDARY_COLOR_WEIGHT, TYPE_CATEGORIES, TYPE_CATEGORY, canonical_color
+)
+
+OTHER = "other"
+
+# The category block drives outfit compatibility
+CATEGORIES = tuple(TYPE_CATEGORIES) + (OTHER,)
+
+# Stored vectors are only re-encoded when their width no longer matches,
+# so keep value order stable when extending a block
+VOCABULARY = {
+    "category": CATEGORIES,
+    "type": tuple(name for names in TYPE_CATEGORIES.values() for name in names) + (OTHER,),
+    "color": NEUTRAL_COLORS + ("red", "blue", "green", "yellow", "orange", "pink", "purple",
+                               "burgundy", "gold", "silver", OTHER),
+    "style": ("casual", "formal", "sporty", "elegant", "business", "bohemian", "streetwear",
+              "vintage", "classic", "minimalist", OTHER),
+    "pattern": ("solid", "striped", "floral", "checkered", "plaid", "polka-dot", "graphic", "print",
+                "animal", OTHER),
+    "fabric": ("cotton", "denim", "leather", "silk", "wool", "linen", "polyester", "knit", "suede",
+               "synthetic", OTHER),
+    "season": ("spring", "summer", "fall", "winter"),
+    "occasion": ("daily", "work", "party", "sport", "formal", "casual", "outdoor", OTHER),
+}
+SEASON_ALIASES = {"autumn": ("fall",), "all-season": ("spring", "summer", "fall", "winter"),
+                  "all": ("spring", "summer", "fall", "winter")}
+
+
+class FeatureLayout:
+    """Where each attribute's block sits in the vector"""
+
+    def __init__(self, vocabulary=VOCABULARY):
+        self.vocabulary = vocabulary
+        self.slices = {}
+        self.index = {}
+        offset = 0
+        for name, values in vocabulary.items():
+            self.slices[name] = slice(offset, offset + len(values))
+            self.index[name] = {value: i for i, value in enumerate(values)}
+            offset += len(values)
+        self.width = offset
+        self.neutral_mask = np.zeros(len(vocabulary["color"]), dtype=np.float32)
+        for color in NEUTRAL_COLORS:
+            self.neutral_mask[self.index["color"][color]] = 1
+
+
+LAYOUT = FeatureLayout()
+
+
+def _text(value):
+    return value.strip().lower() if isinstance(value, str) else ""
+
+
+def parse_analysis(analysis):
+    """Analysis dict from a dict, its JSON text or a bare type name"""
+    if isinstance(analysis, dict):
+        return analysis
+    if isinstance(analysis, str):
+        try:
+            parsed = json.loads(analysis)
+        except ValueError:
+            return {"type": analysis}
+        if isinstance(parsed, dict):
+            return parsed
+        if isinstance(parsed, str):
+            return parse_analysis(parsed)
+    return {}
+
+
+def encode(analysis, layout=LAYOUT):
+    """The item's feature vector: one L2-normalised block per attribute.
+
+    Blocks are normalised separately, so the dot product of two items'
+    blocks is the cosine similarity of that attribute. Missing attributes
+    leave their block at zero.
+    """
+    analysis = parse_analysis(analysis)
+    vector = np.zeros(layout.width, dtype=np.float32)
+
+    def put(block, value, weight=1.0):
+        position = layout.index[block].get(value)
+        if position is None:
+            position = layout.index[block].get(OTHER)
+        if position is not None:
+            vector[layout.slices[block].start + position] += weight
+
+    item_type = _text(analysis.get("type") or analysis.get("clothing_type"))
+    if item_type:
+        put("type", item_type)
+        put("category", TYPE_CATEGORY.get(item_type, OTHER))
+
+    colors = analysis.get("colors")
+    if isinstance(colors, str):
+        colors = [colors]
+    if isinstance(colors, list):
+        named = [_text(c) for c in colors if _text(c)]
+        for position, color in enumerate(named):
+            put("color", canonical_color(color), 1.0 if position == 0 else SECONDARY_COLOR_WEIGHT)
+
+    for block in ("style", "pattern", "fabric", "occasion"):
+        value = _text(analysis.get(block))
+        if value:
+            put(block, value)
+
+    season = _text(analysis.get("season"))
+    for name in SEASON_ALIASES.get(season, (season,) if season else ()):
+        put("season", name)
+
+    for block in layout.slices.values():
+        norm = float(np.linalg.norm(vector[block]))
+        if norm:
+            vector[block] /= norm
+    return vector
+
+
+def to_blob(vector):
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def from_blob(blob, layout=LAYOUT):
+    """The stored vector, or None if missing or encoded with another layout"""
+    if not blob or len(blob) != layout.width * 4:
+        return None
+    return np.frombuffer(blob, dtype=np.float32)
@@ -0,0 +1,235 @@
+"""
+Local matching-item search
+Scores wardrobe items against each other from their stored feature vectors
+(see item_features) instead of sending the wardrobe to Gemini
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from app.services.item_features import CATEGORIES, LAYOUT, OTHER, encode, from_blob
+from app.services.lazy import LazyService
+from app.services.wardrobe_service import get_pool, wardrobe_service
+
+# Attribute weights of the match score; they sum to 1
+WEIGHTS = {"style": 0.3, "color": 0.25, "season": 0.15, "occasion": 0.15, "pattern": 0.15}
+# Score of an attribute that one of the two items lacks
+UNKNOWN_SCORE = 0.5
+
+# Multiplier of the match score by the two items' categories: pieces that
+# complete an outfit rank above more of the same
+COMPLEMENTARY = 1.0
+SAME_CATEGORY = 0.4
+UNRELATED = 0.7
+COMPLEMENTARY_PAIRS = {
+    ("tops", "bottoms"), ("tops", "footwear"), ("tops", "outerwear"),
+    ("bottoms", "footwear"), ("bottoms", "outerwear"), ("footwear", "outerwear"),
+    ("one-piece", "footwear"), ("one-piece", "outerwear"),
+}
+# A dress over trousers is no better than a second dress
+CLASHING_PAIRS = {("one-piece", "tops"), ("one-piece", "bottoms")}
+
+
+def _category_matrix():
+    size = len(CATEGORIES)
+    matrix = np.full((size, size), UNRELATED, dtype=np.float32)
+    for i, first in enumerate(CATEGORIES):
+        for j, second in enumerate(CATEGORIES):
+            if OTHER in (first, second):
+                continue
+            pair = {(first, second), (second, first)}
+            if first == second or pair & CLASHING_PAIRS:
+                matrix[i, j] = SAME_CATEGORY
+            elif pair & COMPLEMENTARY_PAIRS or "accessories" in (first, second):
+                matrix[i, j] = COMPLEMENTARY
+    return matrix
+
+
+CATEGORY_MATRIX = _category_matrix()
+
+
+def load_features(user_id, item_ids=None, layout=LAYOUT):
+    """``(ids, vectors)`` of the user's items, or of ``item_ids`` only, in id order.
+
+    Rows stored without a vector, or with one from another layout, are
+    encoded from their analysis.
+    """
+    sql = """SELECT id, features,
+                    CASE WHEN features IS NULL OR length(features) != ? THEN analysis END AS analysis
+             FROM wardrobe WHERE user_id=?"""
+    params = [layout.width * 4, user_id]
+    if item_ids is not None:
+        sql += f" AND id IN ({', '.join('?' * len(item_ids))})"
+        params.extend(int(item_id) for item_id in item_ids)
+    with get_pool().connection() as conn:
+        rows = conn.execute(sql + " ORDER BY id", params).fetchall()
+    vectors = np.empty((len(rows), layout.width), dtype=np.float32)
+    for i, (_, features, analysis) in enumerate(rows):
+        vector = from_blob(features, layout)
+        vectors[i] = encode(analysis, layout) if vector is None else vector
+    return [row[0] for row in rows], vectors
+
+
+class FeatureMatrix:
+    """Feature vectors of a set of items plus the per-item terms the scores need.
+
+    Everything that depends on one item only (which attributes are known,
+    the share of neutral colors, whether it is solid, its category) is
+    computed once here, so scoring an item against all the others is a
+    handful of vectorised operations.
+    """
+
+    def __init__(self, ids, vectors, layout=LAYOUT):
+        self.layout = layout
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.vectors = np.asarray(vectors, dtype=np.float32).reshape(len(self.ids), layout.width)
+        self.position = {int(item_id): i for i, item_id in enumerate(self.ids)}
+        # Contiguous copies: products on strided column slices take about twice as long
+        self.blocks = {name: np.ascontiguousarray(self.vectors[:, layout.slices[name]]) for name in layout.slices}
+        self.known = {name: block.any(axis=1) for name, block in self.blocks.items()}
+        # Blocks are unit length, so squares are each value's share of the block
+        self.neutral = (self.blocks["color"] ** 2) @ layout.neutral_mask
+        self.solid = self.blocks["pattern"][:, layout.index["pattern"]["solid"]] ** 2
+        category = self.blocks["category"].argmax(axis=1)
+        category[~self.known["category"]] = layout.index["category"][OTHER]
+        self.category = category
+
+    def __len__(self):
+        return len(self.ids)
+
+    def attribute_scores(self, rows, others=slice(None)):
+        """Per-attribute scores in [0, 1] of ``rows`` against ``others`` (default all).
+
+        A single row gives a score per item of ``others``; an array of rows
+        gives a ``(len(rows), len(others))`` matrix.
+        """
+        single = np.ndim(rows) == 0
+        rows = np.atleast_1d(rows)
+        scores = {}
+        for name in WEIGHTS:
+            block = self.blocks[name]
+            similarity = block[rows] @ block[others].T
+            if name == "color":
+                # Neutrals go with anything
+                similarity = np.maximum(similarity, np.maximum.outer(self.neutral[rows], self.neutral[others]))
+            elif name == "pattern":
+                # As does a solid piece, whatever the other's pattern
+                similarity = np.maximum(similarity, np.maximum.outer(self.solid[rows], self.solid[others]))
+            known = np.logical_and.outer(self.known[name][rows], self.known[name][others])
+            score = np.where(known, np.clip(similarity, 0, 1), UNKNOWN_SCORE)
+            scores[name] = score[0] if single else score
+        return scores
+
+    def compatibility(self, rows, others=slice(None)):
+        """Weighted attribute agreement of ``rows`` with ``others``, whatever their categories"""
+        return sum(WEIGHTS[name] * score for name, score in self.attribute_scores(rows, others).items())
+
+    def scores(self, row, others=slice(None)):
+        """Match scores in [0, 1] of item ``row`` against ``others`` (default all)"""
+        return self.compatibility(row, others) * CATEGORY_MATRIX[self.category[row], self.category[others]]
+
+    def label(self, row, block):
+        """Strongest value of ``block`` for item ``row``, or None if unknown"""
+        if not self.known[block][row]:
+            return None
+        value = self.layout.vocabulary[block][int(self.blocks[block][row].argmax())]
+        return None if value == OTHER else value
+
+    def reason(self, row, other):
+        """Short explanation of why two items go together"""
+        attribute_scores = {name: float(score) for name, score in self.attribute_scores(row, other).items()}
+        parts = []
+        item_type, other_type = self.label(row, "type"), self.label(other, "type")
+        if CATEGORY_MATRIX[self.category[row], self.category[other]] == COMPLEMENTARY and item_type and other_type:
+            parts.append(f"{other_type} completes an outfit with the {item_type}")
+        style = self.label(other, "style")
+        if style and attribute_scores["style"] >= 0.99:
+            parts.append(f"same {style} style")
+        if attribute_scores["color"] >= 0.99 and self.label(row, "color") == self.label(other, "color"):
+            parts.append(f"matching {self.label(other, 'color')} tones")
+        elif self.known["color"][other] and max(self.neutral[row], self.neutral[other]) >= 0.5:
+            parts.append("neutral colors go with anything")
+        occasion = self.label(other, "occasion")
+        if occasion and attribute_scores["occasion"] >= 0.99:
+            parts.append(f"both suit {occasion} wear")
+        if self.known["season"][row] and attribute_scores["season"] >= 0.5:
+            shared = self.blocks["season"][row] * self.blocks["season"][other]
+            parts.append(f"both work in {self.layout.vocabulary['season'][int(shared.argmax())]}")
+        if not parts:
+            return "A versatile addition to this piece"
+        text = "; ".join(parts)
+        return text[0].upper() + text[1:]
+
+    def top_k(self, item_id, k):
+        """The ``k`` best matches for ``item_id`` as ``(item_id, score, row)``"""
+        row = self.position.get(int(item_id))
+        if row is None or k <= 0 or len(self) < 2:
+            return []
+        scores = self.scores(row)
+        scores[row] = -1
+        k = min(k, len(self) - 1)
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        # Highest score first, then oldest item, so results are stable
+        candidates = candidates[np.lexsort((self.ids[candidates], -scores[candidates]))]
+        return [(int(self.ids[i]), float(scores[i]), int(i)) for i in candidates]
+
+
+class SimilarityIndex:
+    """Per-process LRU of each user's FeatureMatrix.
+
+    A matrix is reloaded when the wardrobe's ``itemVersion`` changes (items
+    added, removed or re-analysed), which is read from the counters the
+    wardrobe triggers keep, so changes from other gunicorn workers are seen.
+    """
+
+    def __init__(self, max_users=None, layout=LAYOUT):
+        self.max_users = int(max_users or os.getenv("SIMILARITY_INDEX_MAX_USERS", "1000"))
+        self.layout = layout
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self, user_id):
+        ids, vectors = load_features(user_id, layout=self.layout)
+        return FeatureMatrix(ids, vectors, self.layout)
+
+    def matrix(self, user_id):
+        item_version = wardrobe_service.get_statistics(user_id)["itemVersion"]
+        with self._lock:
+            cached = self._users.get(user_id)
+            if cached is not None and cached[0] == item_version:
+                self._users.move_to_end(user_id)
+                return cached[1]
+        # Built outside the lock; two threads may both load, the last one wins
+        matrix = self._load(user_id)
+        with self._lock:
+            self._users[user_id] = (item_version, matrix)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return matrix
+
+    def top_k(self, user_id, item_id, k=5):
+        """Best matches for one of the user's items, best first.
+
+        Returns ``[{"itemId", "matchScore", "reason"}]`` with scores from 0
+        to 100, or an empty list if the item is not in the wardrobe.
+        """
+        matrix = self.matrix(user_id)
+        row = matrix.position.get(int(item_id))
+        return [
+            {"itemId": match_id, "matchScore": int(round(score * 100)), "reason": matrix.reason(row, other)}
+            for match_id, score, other in matrix.top_k(item_id, k)
+        ]
+
+    def reset(self):
+        with self._lock:
+            self._users.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"users": len(self._users), "items": sum(len(m) for _, m in self._users.values())}
+
+
+similarity_index = LazyService(SimilarityIndex)
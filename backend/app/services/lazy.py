@@ -0,0 +1,62 @@
+"""
+Lazily built service singletons
+``LazyService(factory)`` stands in for a module-level singleton and builds it
+on first attribute access, so importing a service module doesn't read
+configuration, log or open anything. Under gunicorn's ``preload_app`` the
+master imports everything and the singletons are built in each worker, after
+the fork, on the first request that uses them.
+"""
+import os
+import threading
+
+
+class LazyService:
+    """Proxy that builds ``factory()`` once, on first use, and forwards to it"""
+
+    def __init__(self, factory):
+        object.__setattr__(self, "_lazy_factory", factory)
+        object.__setattr__(self, "_lazy_instance", None)
+        object.__setattr__(self, "_lazy_lock", threading.Lock())
+        os.register_at_fork(after_in_child=self._lazy_after_fork)
+
+    def _lazy_get(self):
+        instance = self._lazy_instance
+        if instance is None:
+            with self._lazy_lock:
+                instance = self._lazy_instance
+                if instance is None:
+                    instance = self._lazy_factory()
+                    object.__setattr__(self, "_lazy_instance", instance)
+        return instance
+
+    def _lazy_after_fork(self):
+        # A lock held by another thread at fork time would never be released
+        object.__setattr__(self, "_lazy_lock", threading.Lock())
+
+    @property
+    def built(self):
+        return self._lazy_instance is not None
+
+    def __getattr__(self, name):
+        return getattr(self._lazy_get(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._lazy_get(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._lazy_get(), name)
+
+    def __iter__(self):
+        return iter(self._lazy_get())
+
+    def __len__(self):
+        return len(self._lazy_get())
+
+    def __bool__(self):
+        # Without this, truth tests would go through __len__
+        return bool(self._lazy_get())
+
+    def __repr__(self):
+        if self._lazy_instance is None:
+            return f"<LazyService {getattr(self._lazy_factory, '__qualname__', self._lazy_factory)} (not built)>"
+        return repr(self._lazy_instance)
@@ -0,0 +1,343 @@
+"""
+Structured logging
+A logging call only checks the level and queues its arguments; one
+background thread builds, filters, formats, masks and writes the records in
+batches, so request threads never do that work or wait on the
+stdout/stderr lock. Output is one JSON object per line
+(``LOG_FORMAT=text`` for local development), tagged with the current
+request id and with API keys and tokens masked.
+
+- ``LOG_LEVEL``: root level (INFO).
+- ``LOG_LEVELS``: per-logger levels, e.g.
+  ``app.services.gemini_service=DEBUG,werkzeug=WARNING``.
+- ``LOG_DEBUG_RATE``: DEBUG records per second allowed per message (10);
+  the rest are dropped and counted in the next record's ``suppressed``.
+- ``LOG_DEBUG_SAMPLE``: keep one DEBUG record in N per message (1).
+- ``LOG_QUEUE_SIZE``: records waiting to be written before new ones are
+  dropped (10000).
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from app.services.tracing import current_span
+
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Records formatted, masked and written per write() call
+WRITE_BATCH_SIZE = 512
+
+# Attributes every LogRecord has; anything else was passed in ``extra``
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+SECRET_PATTERNS = [
+    # Google API keys, also inside URLs (?key=...) and error messages
+    r"AIza[0-9A-Za-z_\-]{35}",
+    r"(?<=[?&]key=)[^&\s\"']+",
+    r"(?<=Bearer )[A-Za-z0-9._\-]+",
+]
+MASK = "***"
+
+
+class SecretMasker:
+    """Masks key-shaped strings and the configured secrets themselves, in a
+    single pass over the text"""
+
+    def __init__(self, secrets=()):
+        # Longest first, so a key is never left half-masked by its own prefix
+        literal = sorted({s for s in secrets if s and len(s) >= 6}, key=len, reverse=True)
+        self.pattern = re.compile("|".join([re.escape(s) for s in literal] + SECRET_PATTERNS))
+
+    @classmethod
+    def from_env(cls):
+        from app.services.gemini_keys import load_api_keys
+        return cls(load_api_keys() + [os.getenv("PROFILER_TOKEN", "")])
+
+    def mask(self, text):
+        return self.pattern.sub(MASK, text)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRIBUTES and value is not None:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+
+class DebugRateLimiter(logging.Filter):
+    """Thins out DEBUG records per message: one in ``sample_every``, and at
+    most ``rate`` per second"""
+
+    def __init__(self, rate=None, sample_every=None):
+        super().__init__()
+        self.rate = float(rate if rate is not None else os.getenv("LOG_DEBUG_RATE", "10"))
+        self.sample_every = max(1, int(sample_every if sample_every is not None
+                                       else os.getenv("LOG_DEBUG_SAMPLE", "1")))
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        # Logger and message template stand in for the call site, which
+        # isn't looked up (see LoggingSetup.configure)
+        site = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            state = self._sites.get(site)
+            if state is None:
+                # [tokens, last refill, records seen, records suppressed]
+                state = self._sites[site] = [self.rate, now, 0, 0]
+            state[2] += 1
+            if self.rate > 0:
+                state[0] = min(self.rate, state[0] + (now - state[1]) * self.rate)
+            state[1] = now
+            if (state[2] - 1) % self.sample_every or (self.rate > 0 and state[0] < 1):
+                state[3] += 1
+                return False
+            if self.rate > 0:
+                state[0] -= 1
+            if state[3]:
+                record.suppressed = state[3]
+                state[3] = 0
+        return True
+
+
+class NonBlockingQueueHandler(logging.Handler):
+    """Queues records, as they are, for the writer thread to filter and
+    format, dropping them once the writer is ``max_size`` behind rather than
+    blocking the caller"""
+
+    def __init__(self, max_size=LOG_QUEUE_SIZE):
+        super().__init__()
+        # SimpleQueue.put is one C call with no condition variables; the
+        # bound is checked separately and only approximately
+        self.queue = queue.SimpleQueue()
+        self.max_size = max_size
+        self.dropped = 0
+
+    def handle(self, record):
+        # No lock and no filters here: the writer thread applies them
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+            return False
+        self.queue.put((record, current_span()))
+        return True
+
+    def put_call(self, name, level, msg, args, exc_info, extra):
+        """Queue a logging call whose LogRecord the writer thread will build"""
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+            return
+        self.queue.put((name, level, msg, args, exc_info, extra, time.time(), current_span()))
+
+    def emit(self, record):
+        self.handle(record)
+
+
+class QueueLogger(logging.Logger):
+    """Logger that skips building a LogRecord when the queue handler is the
+    only place the record could go, and queues the call's arguments instead.
+
+    Arguments are formatted later, on the writer thread: log values, not
+    objects the caller goes on to mutate.
+    """
+
+    queue_handler = None
+
+    def _log(self, level, msg, args, exc_info=None, extra=None, stack_info=False, stacklevel=1):
+        handler = QueueLogger.queue_handler
+        if handler is not None and not stack_info:
+            logger = self
+            while logger.parent is not None and logger.propagate and not (logger.handlers or logger.filters
+                                                                          or logger.disabled):
+                logger = logger.parent
+            handlers = logger.handlers
+            if logger.parent is None and len(handlers) == 1 and handlers[0] is handler and not logger.filters:
+                if exc_info:
+                    # sys.exc_info() is per thread, so it has to be read here
+                    if isinstance(exc_info, BaseException):
+                        exc_info = (type(exc_info), exc_info, exc_info.__traceback__)
+                    elif not isinstance(exc_info, tuple):
+                        exc_info = sys.exc_info()
+                handler.put_call(self.name, level, msg, args, exc_info, extra)
+                return
+        super()._log(level, msg, args, exc_info, extra, stack_info, stacklevel)
+
+
+def build_record(name, level, msg, args, exc_info, extra, created):
+    """The LogRecord ``Logger.makeRecord`` would have built at ``created``"""
+    record = logging.getLogRecordFactory()(name, level, "(unknown file)", 0, msg, args, exc_info)
+    record.created = created
+    record.msecs = (created - int(created)) * 1000
+    for key, value in (extra or {}).items():
+        if key not in ("message", "asctime") and key not in record.__dict__:
+            record.__dict__[key] = value
+    return record
+
+
+class QueueWriter:
+    """Background thread turning queued calls and records into output: it
+    applies the handler's filters, adds request ids, formats, masks once per
+    batch and writes and flushes once per batch"""
+
+    _sentinel = None
+
+    def __init__(self, handler, formatter, masker, stream=None):
+        self.handler = handler
+        self.queue = handler.queue
+        self.formatter = formatter
+        self.masker = masker
+        # None: whatever sys.stderr is at the time, as pytest swaps it
+        self.stream = stream
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def _batch(self):
+        batch = [self.queue.get()]
+        while len(batch) < WRITE_BATCH_SIZE:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _format(self, item):
+        if len(item) == 2:
+            record, span = item
+        else:
+            record, span = build_record(*item[:7]), item[7]
+        if span is not None:
+            record.request_id = span.trace.request_id
+        if not self.handler.filter(record):
+            return None
+        return self.formatter.format(record)
+
+    def _run(self):
+        running = True
+        while running:
+            lines = []
+            for item in self._batch():
+                if item is self._sentinel:
+                    running = False
+                    continue
+                try:
+                    line = self._format(item)
+                except Exception:
+                    # Skipped rather than ending the writer thread
+                    continue
+                if line is not None:
+                    lines.append(line)
+            if lines:
+                self.write(self.masker.mask("\n".join(lines)) + "\n")
+
+    def write(self, text):
+        stream = self.stream if self.stream is not None else sys.stderr
+        try:
+            stream.write(text)
+            stream.flush()
+        except (OSError, ValueError):
+            pass
+
+    def stop(self):
+        """Write out everything queued so far and end the thread"""
+        self.queue.put(self._sentinel)
+        self._thread.join()
+
+
+def parse_levels(spec):
+    """``{logger: level}`` from ``name=LEVEL,name=LEVEL``"""
+    levels = {}
+    for entry in (spec or "").split(","):
+        name, _, level = entry.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+class LoggingSetup:
+    def __init__(self):
+        self.handler = None
+        self.writer = None
+        self.stream = None
+        self.formatter = None
+        self.masker = None
+
+    def configure(self, level=None, levels=None, fmt=None, stream=None, masker=None, queue_size=LOG_QUEUE_SIZE):
+        """Route the root logger through the queue; safe to call again"""
+        self.stop()
+        self.stream = stream
+        fmt = (fmt or os.getenv("LOG_FORMAT", "json")).lower()
+        self.formatter = TextFormatter() if fmt == "text" else JsonFormatter()
+        self.masker = masker or SecretMasker.from_env()
+        # None of the output uses the caller's file, line, thread or process,
+        # and walking the stack for them is most of a record's cost
+        logging._srcfile = None
+        logging.logThreads = logging.logProcesses = logging.logMultiprocessing = False
+
+        root = logging.getLogger()
+        if self.handler is not None:
+            root.removeHandler(self.handler)
+        self.handler = NonBlockingQueueHandler(queue_size)
+        self.handler.addFilter(DebugRateLimiter())
+        root.addHandler(self.handler)
+        # Module loggers created before this point are switched over too
+        logging.setLoggerClass(QueueLogger)
+        for logger in list(logging.root.manager.loggerDict.values()):
+            if type(logger) is logging.Logger:
+                logger.__class__ = QueueLogger
+        QueueLogger.queue_handler = self.handler
+        root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+        for name, logger_level in parse_levels(os.getenv("LOG_LEVELS") if levels is None else levels).items():
+            logging.getLogger(name).setLevel(logger_level)
+        self.start()
+        return self.handler
+
+    def start(self):
+        self.writer = QueueWriter(self.handler, self.formatter, self.masker, self.stream)
+
+    def stop(self):
+        """Write out everything queued so far and stop the writer thread"""
+        if self.writer is not None:
+            self.writer.stop()
+            self.writer = None
+
+    def flush(self):
+        if self.writer is not None:
+            self.stop()
+            self.start()
+
+    def _after_fork(self):
+        # The writer thread is gone in the child; records queued before the
+        # fork were the parent's to write
+        if self.handler is not None:
+            self.handler.queue = queue.SimpleQueue()
+            self.start()
+
+
+logging_setup = LoggingSetup()
+configure_logging = logging_setup.configure
+os.register_at_fork(after_in_child=logging_setup._after_fork)
+atexit.register(logging_setup.stop)
@@ -0,0 +1,385 @@
+"""
+In-process metrics: counters, gauges and histograms in Prometheus text format
+
+Each process records into memory. With ``METRICS_DIR`` set (one directory
+per deployment, emptied before the workers start), every process also
+writes a snapshot there every ``METRICS_FLUSH_INTERVAL`` seconds and at
+exit, and a scrape merges the snapshots of all gunicorn workers: counters
+and histograms are summed, gauges are summed over live processes only.
+"""
+import atexit
+import glob
+import inspect
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Upper bounds (seconds) of the exported histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Log-linear sub-buckets per power of two: recorded values keep about 3%
+# relative precision whatever their magnitude, as in an HDR histogram
+SUB_BUCKETS = 16
+# Values at or below this share the lowest bucket
+MIN_VALUE = 1e-9
+
+
+def bucket_index(value):
+    mantissa, exponent = math.frexp(max(value, MIN_VALUE))
+    return exponent * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+
+
+def bucket_value(index):
+    """Midpoint of a bucket"""
+    exponent, sub = divmod(index, SUB_BUCKETS)
+    return math.ldexp(0.5 + (sub + 0.5) / (2 * SUB_BUCKETS), exponent)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _check(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}")
+        return tuple(str(label) for label in labels)
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def value(self, *labels):
+        """This process's value for ``labels`` (a histogram's count)"""
+        value = self._values.get(tuple(str(label) for label in labels), 0)
+        return value[0] if isinstance(value, list) else value
+
+    def snapshot(self):
+        with self._lock:
+            samples = [[list(labels), self._export(value)] for labels, value in self._values.items()]
+        return {"type": self.type, "help": self.documentation, "labels": list(self.labelnames), "samples": samples}
+
+    def _export(self, value):
+        return value
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        labels = self._check(labels)
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+        registry.recorded()
+
+
+class Gauge(Metric):
+    """A value that goes up and down; across processes, the live ones are summed"""
+    type = "gauge"
+
+    def set(self, value, *labels):
+        labels = self._check(labels)
+        with self._lock:
+            self._values[labels] = value
+        registry.recorded()
+
+    def inc(self, *labels, amount=1):
+        labels = self._check(labels)
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+        registry.recorded()
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    """Observations in log-linear buckets, exported as Prometheus buckets
+    (``LATENCY_BUCKETS`` by default) plus p50/p95/p99 gauges"""
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        labels = self._check(labels)
+        index = bucket_index(value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0, 0.0, {}]
+            state[0] += 1
+            state[1] += value
+            state[2][index] = state[2].get(index, 0) + 1
+        registry.recorded()
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def _export(self, value):
+        count, total, buckets = value
+        return {"count": count, "sum": total, "buckets": {str(i): n for i, n in buckets.items()}}
+
+    def snapshot(self):
+        snapshot = super().snapshot()
+        snapshot["bounds"] = list(self.buckets)
+        return snapshot
+
+
+def quantile(buckets, count, q):
+    """Approximate ``q`` quantile of fine-grained ``{index: count}`` buckets"""
+    rank = q * count
+    seen = 0
+    for index in sorted(buckets):
+        seen += buckets[index]
+        if seen >= rank:
+            return bucket_value(index)
+    return 0.0
+
+
+def merge(snapshots):
+    """Combine per-process snapshots ``[(alive, {name: metric})]`` into one"""
+    merged = {}
+    for alive, metrics in snapshots:
+        for name, metric in metrics.items():
+            if metric["type"] == "gauge" and not alive:
+                continue
+            target = merged.setdefault(name, {**metric, "samples": {}})
+            samples = target["samples"]
+            for labels, value in metric["samples"]:
+                key = tuple(labels)
+                if metric["type"] != "histogram":
+                    samples[key] = samples.get(key, 0) + value
+                    continue
+                state = samples.setdefault(key, {"count": 0, "sum": 0.0, "buckets": {}})
+                state["count"] += value["count"]
+                state["sum"] += value["sum"]
+                for index, n in value["buckets"].items():
+                    state["buckets"][int(index)] = state["buckets"].get(int(index), 0) + n
+    return merged
+
+
+def render(merged):
+    """Prometheus text exposition format (version 0.0.4)"""
+    lines = []
+    for name in sorted(merged):
+        metric = merged[name]
+        names = metric["labels"]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        samples = sorted(metric["samples"].items())
+        if metric["type"] != "histogram":
+            lines.extend(f"{name}{_labels(names, labels)} {_number(value)}" for labels, value in samples)
+            continue
+        for labels, state in samples:
+            ordered = sorted(state["buckets"].items())
+            position = cumulative = 0
+            for bound in list(metric["bounds"]) + [math.inf]:
+                while position < len(ordered) and bucket_value(ordered[position][0]) <= bound:
+                    cumulative += ordered[position][1]
+                    position += 1
+                lines.append(f"{name}_bucket{_labels(names, labels, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, labels)} {_number(state['sum'])}")
+            lines.append(f"{name}_count{_labels(names, labels)} {state['count']}")
+        lines.append(f"# HELP {name}_quantile {metric['help']} (approximate quantiles)")
+        lines.append(f"# TYPE {name}_quantile gauge")
+        for labels, state in samples:
+            for q in QUANTILES:
+                value = quantile(state["buckets"], state["count"], q)
+                lines.append(f"{name}_quantile{_labels(names, labels, [('quantile', q)])} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Registry:
+    def __init__(self, directory=None, flush_interval=None):
+        self.directory = directory if directory is not None else os.getenv("METRICS_DIR") or None
+        self.flush_interval = float(flush_interval if flush_interval is not None
+                                    else os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            atexit.register(self.flush)
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} is already registered differently")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def reset(self):
+        """Forget every recorded value, e.g. in a freshly forked worker"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            self._flusher = None
+        for metric in metrics:
+            metric.reset()
+
+    def recorded(self):
+        if self.directory and self._flusher is None:
+            with self._lock:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+                    self._flusher.start()
+
+    def _flush_loop(self):
+        me = threading.current_thread()
+        while self._flusher is me:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f"metrics-{pid}.json")
+
+    def flush(self):
+        if not self.directory:
+            return
+        path = self._path(os.getpid())
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"pid": os.getpid(), "metrics": self.snapshot()}, f)
+        os.replace(tmp, path)
+
+    def collect(self):
+        """Metrics of every process sharing ``directory`` (just this one without)"""
+        own = (True, self.snapshot())
+        if not self.directory:
+            return merge([own])
+        snapshots = [own]
+        for path in glob.glob(os.path.join(self.directory, "metrics-*.json")):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if data.get("pid") != os.getpid():
+                snapshots.append((_alive(data.get("pid", 0)), data.get("metrics", {})))
+        return merge(snapshots)
+
+    def render(self):
+        return render(self.collect())
+
+
+registry = Registry()
+# A forked worker starts from zero and runs its own flush thread
+os.register_at_fork(after_in_child=registry.reset)
+
+
+def timed_methods(histogram):
+    """Class decorator timing every public method into ``histogram``,
+    labelled with the method name and ``ok`` or ``error``"""
+    def decorate(cls):
+        for name, method in list(vars(cls).items()):
+            if name.startswith("_") or not inspect.isfunction(method):
+                continue
+            setattr(cls, name, _timed(method, histogram, name))
+        return cls
+    return decorate
+
+
+def _timed(method, histogram, name):
+    @wraps(method)
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        status = "error"
+        try:
+            result = method(*args, **kwargs)
+            status = "ok"
+            return result
+        finally:
+            histogram.observe(time.perf_counter() - start, name, status)
+    return timed
+
+
+HTTP_REQUESTS = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+)
+HTTP_IN_PROGRESS = registry.gauge("http_requests_in_progress", "HTTP requests being served", ("method",))
+
+
+def instrument_app(app):
+    """Time every request of ``app`` by method, route template and status"""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+        HTTP_IN_PROGRESS.inc(request.method)
+
+    @app.after_request
+    def _record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _record_request(exc):
+        start = g.pop("metrics_start", None)
+        if start is None:
+            return
+        HTTP_IN_PROGRESS.dec(request.method)
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        status = g.pop("metrics_status", 500)
+        HTTP_REQUESTS.observe(time.perf_counter() - start, request.method, route, status)
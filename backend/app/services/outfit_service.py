@@ -0,0 +1,360 @@
+"""
+Outfit generator
+Keeps a per-user pairwise compatibility matrix of wardrobe items and
+assembles outfits (top + bottom or one-piece, shoes, outerwear) from it with
+a beam search under weather and occasion constraints
+"""
+import os
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from app.services.item_features import LAYOUT
+from app.services.item_similarity import FeatureMatrix, load_features
+from app.services.lazy import LazyService
+from app.services.wardrobe_service import get_pool, wardrobe_service
+
+# Scores are stored as uint8: a 1000-item wardrobe takes 1 MB
+SCORE_SCALE = 255
+# Rows of the matrix computed per numpy call when building it
+BUILD_CHUNK_ROWS = 512
+# Spare room allocated when a matrix grows, so adding items rarely copies it
+GROWTH_FACTOR = 1.25
+
+# Outfit skeletons, one category per slot. Without essential pieces there is
+# no outfit; other slots are left out when the wardrobe has nothing for them
+PLANS = (("tops", "bottoms", "footwear", "outerwear"), ("one-piece", "footwear", "outerwear"))
+ESSENTIAL = {"tops", "bottoms", "one-piece"}
+
+# Temperatures (Celsius) splitting summer, mid-season and winter outfits
+WARM_FROM = 24
+COLD_BELOW = 15
+WET_WEATHER = {"rain", "snow", "storm"}
+
+# Outfit score: mean pairwise compatibility, then how well items fit the
+# requested weather and occasion
+PAIR_WEIGHT = 0.8
+CONTEXT_WEIGHT = 0.2
+# Fit of an item whose season or occasion is unknown
+UNKNOWN_FIT = 0.5
+
+
+def seasons_for(temperature):
+    if temperature is None:
+        return None
+    if temperature >= WARM_FROM:
+        return ("summer",)
+    if temperature >= COLD_BELOW:
+        return ("spring", "fall")
+    return ("winter",)
+
+
+class CompatibilityIndex:
+    """Per-process LRU of each user's item compatibility matrix.
+
+    The matrix holds ``FeatureMatrix.compatibility`` of every pair of the
+    user's most recent ``max_items`` items, whatever their categories.
+    When the wardrobe's ``itemVersion`` changes, rows of deleted items are
+    dropped and only new items are scored against the rest; a change that
+    adds or removes no item (a re-analysis) rebuilds the matrix.
+
+    Matrices live in buffers with spare capacity and are handed out as
+    ``[:n, :n]`` views. New items are written past the end of the current
+    view, so they never change what a reader of an older view sees.
+    """
+
+    def __init__(self, max_items=None, max_users=None, layout=LAYOUT):
+        self.max_items = int(max_items or os.getenv("OUTFIT_MATRIX_MAX_ITEMS", "5000"))
+        self.max_users = int(max_users or os.getenv("OUTFIT_INDEX_MAX_USERS", "200"))
+        self.layout = layout
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.updates = 0
+
+    @staticmethod
+    def _quantize(scores):
+        return np.rint(scores * SCORE_SCALE).astype(np.uint8)
+
+    def _current_ids(self, user_id, features=None, total=None):
+        """Ids the matrix should cover, in id order.
+
+        When only items newer than the cached ones were added (the count
+        adds up), just those are read.
+        """
+        with get_pool().connection() as conn:
+            if features is not None and len(features):
+                newer = [row[0] for row in conn.execute(
+                    "SELECT id FROM wardrobe WHERE user_id=? AND id>? ORDER BY id",
+                    (user_id, int(features.ids.max()))
+                )]
+                if len(features) + len(newer) == total <= self.max_items:
+                    return np.concatenate([features.ids, np.array(newer, dtype=np.int64)])
+            rows = conn.execute(
+                "SELECT id FROM wardrobe WHERE user_id=? ORDER BY id DESC LIMIT ?", (user_id, self.max_items)
+            ).fetchall()
+        return np.array(sorted(row[0] for row in rows), dtype=np.int64)
+
+    @staticmethod
+    def _allocate(size):
+        capacity = max(size, int(size * GROWTH_FACTOR))
+        return np.empty((capacity, capacity), dtype=np.uint8)
+
+    def _build(self, user_id, ids):
+        loaded, vectors = load_features(user_id, ids.tolist(), self.layout)
+        features = FeatureMatrix(loaded, vectors, self.layout)
+        buffer = self._allocate(len(features))
+        for start in range(0, len(features), BUILD_CHUNK_ROWS):
+            rows = np.arange(start, min(start + BUILD_CHUNK_ROWS, len(features)))
+            buffer[start:rows[-1] + 1, :len(features)] = self._quantize(features.compatibility(rows))
+        self.builds += 1
+        return features, buffer
+
+    def _update(self, user_id, features, buffer, ids):
+        keep = np.isin(features.ids, ids)
+        added = np.setdiff1d(ids, features.ids)
+        if keep.all() and not len(added):
+            return self._build(user_id, ids)
+        added_ids, added_vectors = load_features(user_id, added.tolist(), self.layout)
+        kept = int(keep.sum())
+        size = kept + len(added_ids)
+        if keep.all() and size <= len(buffer):
+            pass  # appended in place
+        elif keep.all():
+            grown = self._allocate(size)
+            grown[:kept, :kept] = buffer[:kept, :kept]
+            buffer = grown
+        else:
+            compacted = self._allocate(size)
+            compacted[:kept, :kept] = buffer[:len(keep), :len(keep)][np.ix_(keep, keep)]
+            buffer = compacted
+        features = FeatureMatrix(
+            np.concatenate([features.ids[keep], np.asarray(added_ids, dtype=np.int64)]),
+            np.concatenate([features.vectors[keep], added_vectors]),
+            self.layout
+        )
+        if size > kept:
+            scores = self._quantize(features.compatibility(np.arange(kept, size)))
+            buffer[kept:size, :size] = scores
+            buffer[:kept, kept:size] = scores[:, :kept].T
+        self.updates += 1
+        return features, buffer
+
+    def get(self, user_id):
+        """``(features, matrix)`` for the user's current wardrobe"""
+        stats = wardrobe_service.get_statistics(user_id)
+        item_version = stats["itemVersion"]
+        with self._lock:
+            cached = self._users.get(user_id)
+            if cached is not None and cached[0] == item_version:
+                self._users.move_to_end(user_id)
+                return cached[1], cached[2][:len(cached[1]), :len(cached[1])]
+        # Computed outside the lock; two threads may both update (writing the
+        # same rows for the same items), the last one wins
+        ids = self._current_ids(user_id, cached and cached[1], stats["totalItems"])
+        if cached is None:
+            features, buffer = self._build(user_id, ids)
+        else:
+            features, buffer = self._update(user_id, cached[1], cached[2], ids)
+        with self._lock:
+            self._users[user_id] = (item_version, features, buffer)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return features, buffer[:len(features), :len(features)]
+
+    def reset(self):
+        with self._lock:
+            self._users.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "users": len(self._users),
+                "bytes": sum(entry[2].nbytes for entry in self._users.values()),
+                "builds": self.builds,
+                "updates": self.updates,
+            }
+
+
+class OutfitGenerator:
+    """Beam search over outfit slots, scored from the compatibility matrix"""
+
+    def __init__(self, beam_width=None):
+        self.beam_width = int(beam_width or os.getenv("OUTFIT_BEAM_WIDTH", "50"))
+
+    @staticmethod
+    def _fit(features, block, wanted):
+        """Per item: the share of its values in ``wanted``, 0 if none is.
+
+        Items made for the request score 1, versatile ones (all-season, say)
+        at least UNKNOWN_FIT, like items whose value is unknown.
+        """
+        target = np.zeros(features.blocks[block].shape[1], dtype=np.float32)
+        for value in wanted:
+            position = features.layout.index[block].get(value)
+            if position is not None:
+                target[position] = 1
+        # Blocks are unit length, so squares are each value's share
+        share = (features.blocks[block] ** 2) @ target
+        fit = np.where(share > 0, np.maximum(share, UNKNOWN_FIT), 0.0)
+        return np.where(features.known[block], fit, UNKNOWN_FIT)
+
+    def _context(self, features, temperature, occasion):
+        """Each item's fit to the request, in [0, 1]; 0 rules an item out"""
+        fits = []
+        seasons = seasons_for(temperature)
+        if seasons:
+            fits.append(self._fit(features, "season", seasons))
+        if occasion:
+            fits.append(self._fit(features, "occasion", (occasion.strip().lower(),)))
+        if not fits:
+            return np.ones(len(features), dtype=np.float32)
+        return np.where(np.min(fits, axis=0) > 0, np.mean(fits, axis=0), 0.0)
+
+    def _candidates(self, features, category, context):
+        """Rows of a category the constraints allow, or all of them if none is.
+
+        Returns ``(rows, relaxed)``; better an out-of-season piece than no
+        outfit at all.
+        """
+        rows = np.flatnonzero(features.category == features.layout.index["category"][category])
+        allowed = rows[context[rows] > 0]
+        return (allowed, False) if len(allowed) else (rows, len(rows) > 0)
+
+    @staticmethod
+    def _objective(rows, pair_sum, pairs, fit_sum):
+        pieces = np.maximum((rows >= 0).sum(axis=1), 1)
+        pair_score = np.where(pairs > 0, pair_sum / np.maximum(pairs, 1), 0.0)
+        return PAIR_WEIGHT * pair_score + CONTEXT_WEIGHT * fit_sum / pieces
+
+    def _search(self, matrix, context, slots):
+        """Best ``(rows, score)`` outfits for one plan.
+
+        Beams are arrays: the rows picked per slot (-1 for a skipped
+        optional slot), the sum and number of their pair scores and the sum
+        of their context fits. Every slot expands all beams at once.
+        """
+        rows = np.zeros((1, 0), dtype=np.int64)
+        pair_sum, pairs, fit_sum = np.zeros(1), np.zeros(1, dtype=np.int64), np.zeros(1)
+        for candidates, optional in slots:
+            if not len(candidates):
+                return []
+            beams, width = len(rows), len(candidates)
+            filled = rows >= 0
+            added = np.zeros((beams, width))
+            for column in range(rows.shape[1]):
+                # -1 picks the last row; masked out just after
+                added += np.where(filled[:, column, None], matrix[np.ix_(rows[:, column], candidates)], 0)
+            parts = [(
+                np.concatenate([np.repeat(rows, width, axis=0), np.tile(candidates, beams)[:, None]], axis=1),
+                (pair_sum[:, None] + added / SCORE_SCALE).ravel(),
+                np.repeat(pairs + filled.sum(axis=1), width),
+                (fit_sum[:, None] + context[candidates]).ravel(),
+            )]
+            if optional:
+                parts.append((np.concatenate([rows, np.full((beams, 1), -1)], axis=1), pair_sum, pairs, fit_sum))
+            rows, pair_sum, pairs, fit_sum = (np.concatenate(arrays) for arrays in zip(*parts))
+            # A single piece has no pairs to judge yet, so the first slot is kept whole
+            if rows.shape[1] > 1 and len(rows) > self.beam_width:
+                best = np.argpartition(-self._objective(rows, pair_sum, pairs, fit_sum), self.beam_width)
+                keep = best[:self.beam_width]
+                rows, pair_sum, pairs, fit_sum = rows[keep], pair_sum[keep], pairs[keep], fit_sum[keep]
+        scores = self._objective(rows, pair_sum, pairs, fit_sum)
+        return [(tuple(int(row) for row in picked if row >= 0), float(score))
+                for picked, score, count in zip(rows, scores, pairs) if count]
+
+    def generate(self, features, matrix, temperature=None, weather=None, occasion=None, limit=3):
+        """Up to ``limit`` outfits as ``(rows, score)``, best first and mostly distinct"""
+        context = self._context(features, temperature, occasion)
+        wet = (weather or "").strip().lower() in WET_WEATHER
+        cold = temperature is not None and temperature < COLD_BELOW
+        warm = temperature is not None and temperature >= WARM_FROM
+        plans = []
+        for plan in PLANS:
+            slots = []
+            relaxed = False
+            for category in plan:
+                if category == "outerwear" and warm and not wet:
+                    continue
+                candidates, relaxed_slot = self._candidates(features, category, context)
+                if not len(candidates) and category not in ESSENTIAL:
+                    continue
+                relaxed = relaxed or (relaxed_slot and category in ESSENTIAL)
+                # Outerwear only when it improves the outfit, unless the weather calls for it
+                optional = category == "outerwear" and not (cold or wet)
+                slots.append((candidates, optional))
+            plans.append((slots, relaxed))
+        # A dress that suits the occasion beats a top and trousers that don't
+        if not all(relaxed for _, relaxed in plans):
+            plans = [plan for plan in plans if not plan[1]]
+        found = []
+        for slots, _ in plans:
+            found.extend(self._search(matrix, context, slots))
+
+        # Best first; ties go to the outfit of older pieces so results are stable
+        found.sort(key=lambda outfit: (-outfit[1], outfit[0]))
+        outfits = []
+        for rows, score in found:
+            # Skip outfits sharing most of their pieces with a better one
+            if any(len(set(rows) & set(chosen)) * 2 > len(rows) for chosen, _ in outfits):
+                continue
+            outfits.append((rows, score))
+            if len(outfits) == limit:
+                break
+        return outfits
+
+    @staticmethod
+    def describe(features, rows, temperature=None, weather=None, occasion=None):
+        styles = Counter(features.label(row, "style") for row in rows if features.label(row, "style"))
+        look = f"{styles.most_common(1)[0][0].capitalize()} look" if styles else "Mixed look"
+        conditions = [f"{temperature:g}°C"] if temperature is not None else []
+        if weather:
+            conditions.append(weather.strip().lower())
+        if conditions:
+            look += " for " + " and ".join(conditions)
+        if occasion:
+            look += f", suited to {occasion.strip().lower()}"
+        colors = []
+        for row in rows:
+            color = features.label(row, "color")
+            if color and color not in colors:
+                colors.append(color)
+        if len(colors) > 1:
+            look += f"; {', '.join(colors[:-1])} and {colors[-1]} work together"
+        return look
+
+
+class OutfitService:
+    def __init__(self, index=None, generator=None):
+        self.index = index or CompatibilityIndex()
+        self.generator = generator or OutfitGenerator()
+
+    def suggest_outfits(self, user_id, temperature=None, weather=None, occasion=None, limit=3):
+        """Best outfits from the user's wardrobe for the given conditions.
+
+        Each outfit has ``items`` (wardrobe items, in slot order), ``slots``
+        (category -> item id), ``score`` from 0 to 100 and a ``reason``.
+        Items that do not suit ``temperature`` or ``occasion`` are only used
+        when their slot has nothing else.
+        """
+        features, matrix = self.index.get(user_id)
+        found = self.generator.generate(features, matrix, temperature, weather, occasion, limit)
+        items = wardrobe_service.get_items(user_id, [features.ids[row] for rows, _ in found for row in rows])
+        outfits = []
+        for rows, score in found:
+            ids = [int(features.ids[row]) for row in rows]
+            if not all(item_id in items for item_id in ids):
+                continue  # deleted while we were searching
+            outfits.append({
+                "items": [items[item_id] for item_id in ids],
+                "slots": {features.layout.vocabulary["category"][features.category[row]]: item_id
+                          for row, item_id in zip(rows, ids)},
+                "score": int(round(score * 100)),
+                "reason": self.generator.describe(features, rows, temperature, weather, occasion),
+            })
+        return outfits
+
+
+outfit_service = LazyService(OutfitService)
@@ -0,0 +1,279 @@
+"""
+Sampling profiler for live requests
+A background thread samples the stacks of the request threads being
+profiled and the results are written as collapsed stacks (flamegraph.pl,
+speedscope) and speedscope JSON. Nothing runs unless ``PROFILER_ENABLED``:
+
+- On demand: a request carrying ``X-Profile: <PROFILER_TOKEN>`` (or
+  ``?profile=<token>``) is profiled on its own; the response's
+  ``X-Profile-Id`` names the files written to ``PROFILER_DIR``.
+- Aggregate: with ``PROFILER_SAMPLE_EVERY=N``, one request in N is sampled
+  into a per-process profile, rewritten every
+  ``PROFILER_AGGREGATE_FLUSH_SECONDS`` as ``aggregate-<pid>.*``.
+
+Sampling holds the GIL, so the sampler sleeps long enough after each sample
+to stay under ``PROFILER_MAX_OVERHEAD`` of one core.
+"""
+import hmac
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN", "")
+PROFILER_DIR = os.getenv("PROFILER_DIR") or os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "db", "profiles")
+)
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL_MS", "5")) / 1000
+PROFILER_MAX_OVERHEAD = float(os.getenv("PROFILER_MAX_OVERHEAD", "0.05"))
+PROFILER_SAMPLE_EVERY = int(os.getenv("PROFILER_SAMPLE_EVERY", "0"))
+PROFILER_MAX_CONCURRENT = int(os.getenv("PROFILER_MAX_CONCURRENT", "4"))
+PROFILER_AGGREGATE_FLUSH_SECONDS = float(os.getenv("PROFILER_AGGREGATE_FLUSH_SECONDS", "60"))
+
+MAX_DEPTH = 128
+SLUG = re.compile(r"[^A-Za-z0-9]+")
+
+
+def frame_name(code):
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+class StackProfile:
+    """Sampled stacks, root first, with sample counts and sampled time"""
+
+    def __init__(self, name):
+        self.name = name
+        self.stacks = {}
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def add(self, stack, seconds):
+        with self._lock:
+            entry = self.stacks.get(stack)
+            if entry is None:
+                entry = self.stacks[stack] = [0, 0.0]
+            entry[0] += 1
+            entry[1] += seconds
+            self.samples += 1
+
+    def _items(self):
+        with self._lock:
+            return [(stack, count, seconds) for stack, (count, seconds) in self.stacks.items()]
+
+    def to_collapsed(self):
+        """One ``frame;frame;frame count`` line per distinct stack"""
+        lines = sorted(f"{';'.join(stack)} {count}" for stack, count, _ in self._items())
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def to_speedscope(self):
+        frames, index, samples, weights = [], {}, [], []
+        for stack, _, seconds in self._items():
+            for name in stack:
+                if name not in index:
+                    index[name] = len(frames)
+                    frames.append({"name": name})
+            samples.append([index[name] for name in stack])
+            weights.append(round(seconds * 1000, 3))
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "style-finder-profiler",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": self.name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(sum(weights), 3),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+    def save(self, directory, stem):
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, stem)
+        for suffix, text in ((".collapsed.txt", self.to_collapsed()),
+                             (".speedscope.json", json.dumps(self.to_speedscope()))):
+            tmp = f"{base}{suffix}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, base + suffix)
+        return base
+
+
+class Sampler:
+    """One thread sampling every registered thread's stack into its profiles"""
+
+    def __init__(self, interval=None, max_overhead=None):
+        self.interval = PROFILER_INTERVAL if interval is None else interval
+        self.max_overhead = PROFILER_MAX_OVERHEAD if max_overhead is None else max_overhead
+        self._reset()
+
+    def _reset(self):
+        self._targets = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._names = {}
+
+    def register(self, thread_id, profiles):
+        with self._lock:
+            self._targets[thread_id] = tuple(profiles)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def unregister(self, thread_id):
+        with self._lock:
+            self._targets.pop(thread_id, None)
+
+    @property
+    def active(self):
+        return len(self._targets)
+
+    def _stack(self, frame):
+        codes = []
+        while frame is not None and len(codes) < MAX_DEPTH:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        names = self._names
+        stack = []
+        for code in reversed(codes):
+            name = names.get(code)
+            if name is None:
+                name = names[code] = frame_name(code)
+            stack.append(name)
+        return tuple(stack)
+
+    def sample(self, elapsed):
+        with self._lock:
+            targets = list(self._targets.items())
+        if not targets:
+            return
+        frames = sys._current_frames()
+        for thread_id, profiles in targets:
+            frame = frames.get(thread_id)
+            if frame is None:
+                continue
+            stack = self._stack(frame)
+            for profile in profiles:
+                profile.add(stack, elapsed)
+
+    def _run(self):
+        last = time.perf_counter()
+        while True:
+            if not self._targets:
+                self._wakeup.clear()
+                # Re-checked after clear() so a registration in between isn't missed
+                if not self._targets:
+                    self._wakeup.wait()
+                last = time.perf_counter() - self.interval
+            start = time.perf_counter()
+            self.sample(start - last)
+            last = start
+            cost = time.perf_counter() - start
+            # cost / (cost + pause) stays at or under max_overhead
+            pause = cost / self.max_overhead - cost if self.max_overhead > 0 else 0
+            time.sleep(max(self.interval, pause))
+
+
+class RequestProfiler:
+    """Decides which requests to profile and stores the results"""
+
+    def __init__(self, enabled=None, token=None, directory=None, sample_every=None,
+                 max_concurrent=None, flush_seconds=None, sampler=None):
+        self.enabled = PROFILER_ENABLED if enabled is None else enabled
+        self.token = PROFILER_TOKEN if token is None else token
+        self.directory = directory or PROFILER_DIR
+        self.sample_every = PROFILER_SAMPLE_EVERY if sample_every is None else sample_every
+        self.max_concurrent = PROFILER_MAX_CONCURRENT if max_concurrent is None else max_concurrent
+        self.flush_seconds = PROFILER_AGGREGATE_FLUSH_SECONDS if flush_seconds is None else flush_seconds
+        self.sampler = sampler or Sampler()
+        self.skipped = 0
+        self._reset()
+
+    def _reset(self):
+        self._counter = itertools.count(1)
+        self.aggregate = StackProfile(f"aggregate-{os.getpid()}")
+        self._flushed_at = time.monotonic()
+        self.sampler._reset()
+
+    def authorized(self, presented):
+        return bool(self.token and presented) and hmac.compare_digest(presented.encode(), self.token.encode())
+
+    def start(self, name, presented_token=None):
+        """Start sampling the calling thread; returns a handle for ``stop``, or None"""
+        if not self.enabled:
+            return None
+        on_demand = self.authorized(presented_token)
+        sampled = self.sample_every > 0 and next(self._counter) % self.sample_every == 0
+        if not on_demand and not sampled:
+            return None
+        if self.sampler.active >= self.max_concurrent:
+            self.skipped += 1
+            return None
+        profiles = [self.aggregate] if sampled else []
+        request_profile = StackProfile(name) if on_demand else None
+        if request_profile is not None:
+            profiles.append(request_profile)
+        thread_id = threading.get_ident()
+        self.sampler.register(thread_id, profiles)
+        return thread_id, request_profile
+
+    def stop(self, handle, stem=None):
+        """Stop sampling; saves an on-demand profile and returns its id"""
+        thread_id, request_profile = handle
+        self.sampler.unregister(thread_id)
+        profile_id = None
+        if request_profile is not None and stem:
+            profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{SLUG.sub('-', stem).strip('-')}"[:120]
+            request_profile.save(self.directory, profile_id)
+        if time.monotonic() - self._flushed_at >= self.flush_seconds:
+            self.flush()
+        return profile_id
+
+    def flush(self):
+        self._flushed_at = time.monotonic()
+        if self.aggregate.samples:
+            self.aggregate.save(self.directory, self.aggregate.name)
+
+
+request_profiler = RequestProfiler()
+# Sampler threads and counters don't survive a fork
+os.register_at_fork(after_in_child=request_profiler._reset)
+
+
+def instrument_app(app):
+    """Profile requests of ``app`` as configured by ``request_profiler``"""
+    from flask import g, request
+
+    if not request_profiler.enabled:
+        return
+
+    @app.before_request
+    def _start_profile():
+        presented = request.headers.get("X-Profile") or request.args.get("profile")
+        g.profile = request_profiler.start(f"{request.method} {request.path}", presented)
+
+    @app.after_request
+    def _save_profile(response):
+        handle = g.pop("profile", None)
+        if handle is not None:
+            request_id = response.headers.get("X-Request-ID", "")
+            profile_id = request_profiler.stop(handle, f"{request.method}-{request.path}-{request_id}")
+            if profile_id:
+                response.headers["X-Profile-Id"] = profile_id
+        return response
+
+    @app.teardown_request
+    def _stop_profile(exc):
+        handle = g.pop("profile", None)
+        if handle is not None:
+            request_profiler.stop(handle)
@@ -1,71 +1,75 @@
+import functools
+import os
+import re
 import urllib.parse
-import json
+
+from app.services.item_features import parse_analysis
+from app.services.lazy import LazyService
+from app.services.store_registry import store_registry
+
+# Parenthetical hints in missing-piece names ("neutral basics (black, white
+# or navy)") are for people, not store search boxes
+PIECE_HINT = re.compile(r"\s*\([^)]*\)")
+
+
+def _normal(value):
+    return " ".join(value.split()).lower() if isinstance(value, str) else ""
+
+
+def search_key(analysis):
+    """The attributes a search query is built from, normalised: type, style,
+    first color and fabric, lowercased and without empty values"""
+    analysis = parse_analysis(analysis)
+    colors = analysis.get("colors")
+    color = colors[0] if isinstance(colors, (list, tuple)) and colors else None
+    parts = (analysis.get("type") or analysis.get("clothing_type"), analysis.get("style"), color,
+             analysis.get("fabric"))
+    return tuple(part for part in map(_normal, parts) if part)
 
 
 class ShoppingService:
-    def _ensure_analysis(self, analysis):
-        if isinstance(analysis, str):
-            try:
-                return json.loads(analysis)
-            except Exception:
-                return {"type": analysis}
-        return analysis or {}
+    """Store search links for an item's analysis.
 
-    def generate_search_query(self, analysis: dict) -> str:
-        analysis = self._ensure_analysis(analysis)
-        parts = []
+    Links are memoized per normalised search key, so equal items share one
+    entry however their analysis was spelled; callers get fresh dicts.
+    """
+
+    def __init__(self, registry=None, cache_size=None):
+        self.registry = registry if registry is not None else store_registry
+        cache_size = int(cache_size or os.getenv("SHOPPING_CACHE_SIZE", "4096"))
+        self._links_for_key = functools.lru_cache(maxsize=cache_size)(self._build_links)
 
-        if analysis.get("type"):
-            parts.append(analysis["type"])
-        if analysis.get("style"):
-            parts.append(analysis["style"])
-        if analysis.get("colors") and isinstance(analysis.get("colors"), (list, tuple)):
-            parts.append(analysis["colors"][0])
-        if analysis.get("fabric"):
-            parts.append(analysis["fabric"])
+    def _ensure_analysis(self, analysis):
+        return parse_analysis(analysis)
 
-        return " ".join(parts)
+    def _build_links(self, key):
+        query = " ".join(key)
+        encoded = urllib.parse.quote(query)
+        return tuple(store.link(query, encoded) for store in self.registry)
+
+    def generate_search_query(self, analysis: dict) -> str:
+        return " ".join(search_key(analysis))
 
     def generate_shopping_links(self, analysis: dict):
-        analysis = self._ensure_analysis(analysis)
-        query = self.generate_search_query(analysis)
-        if not query:
+        key = search_key(analysis)
+        if not key:
             return []
+        return [dict(link) for link in self._links_for_key(key)]
+
+    def links_for_items(self, items):
+        """``{itemId: links}`` for wardrobe items (dicts with ``id`` and ``analysis``)"""
+        return {item["id"]: self.generate_shopping_links(item.get("analysis")) for item in items}
+
+    def links_for_pieces(self, pieces):
+        """``{piece: links}`` for missing-piece names such as a style profile's"""
+        return {piece: self.generate_shopping_links({"type": PIECE_HINT.sub("", piece)}) for piece in pieces}
+
+    def stats(self):
+        info = self._links_for_key.cache_info()
+        return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxSize": info.maxsize}
+
+    def clear_cache(self):
+        self._links_for_key.cache_clear()
 
-        encoded = urllib.parse.quote(query)
 
-        return [
-            {
-                "store": "Amazon",
-                "emoji": "📦",
-                "url": f"https://www.amazon.com/s?k={encoded}",
-                "query": query
-            },
-            {
-                "store": "Zara",
-                "emoji": "👗",
-                "url": f"https://www.zara.com/search?searchTerm={encoded}",
-                "query": query
-            },
-            {
-                "store": "H&M",
-                "emoji": "🛍️",
-                "url": f"https://www2.hm.com/en_us/search-results.html?q={encoded}",
-                "query": query
-            },
-            {
-                "store": "ASOS",
-                "emoji": "✨",
-                "url": f"https://www.asos.com/search/?q={encoded}",
-                "query": query
-            },
-            {
-                "store": "Target",
-                "emoji": "🎯",
-                "url": f"https://www.target.com/s?searchTerm={encoded}",
-                "query": query
-            }
-        ]
-
-
-shopping_service = ShoppingService()
+shopping_service = LazyService(ShoppingService)
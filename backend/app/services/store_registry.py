@@ -0,0 +1,92 @@
+"""
+Shopping store registry
+Search URL templates of the stores shopping links point to, loaded once per
+process from the built-in list or a JSON file (``SHOPPING_STORES_FILE``)
+"""
+import json
+import os
+
+from app.services.lazy import LazyService
+
+# "url" takes the URL-encoded query as {query} and, for stores with
+# "locales", the store's code for the configured locale as {locale}.
+# Stores with "locales" are only listed in those locales.
+DEFAULT_STORES = [
+    {"id": "amazon", "store": "Amazon", "emoji": "📦", "url": "https://{locale}/s?k={query}",
+     "locales": {"en_us": "www.amazon.com", "en_gb": "www.amazon.co.uk", "de_de": "www.amazon.de",
+                 "fr_fr": "www.amazon.fr"}},
+    {"id": "zara", "store": "Zara", "emoji": "👗", "url": "https://www.zara.com/search?searchTerm={query}"},
+    {"id": "hm", "store": "H&M", "emoji": "🛍️", "url": "https://www2.hm.com/{locale}/search-results.html?q={query}",
+     "locales": {"en_us": "en_us", "en_gb": "en_gb", "de_de": "de_de", "fr_fr": "fr_fr"}},
+    {"id": "asos", "store": "ASOS", "emoji": "✨", "url": "https://www.asos.com/search/?q={query}"},
+    {"id": "target", "store": "Target", "emoji": "🎯", "url": "https://www.target.com/s?searchTerm={query}",
+     "locales": {"en_us": ""}},
+]
+
+DEFAULT_LOCALE = "en_us"
+
+
+class Store:
+    """A store's search URL, split around the query so links are one concatenation"""
+
+    __slots__ = ("id", "name", "emoji", "prefix", "suffix")
+
+    def __init__(self, store_id, name, emoji, url):
+        if url.count("{query}") != 1:
+            raise ValueError(f"Store {store_id}: url must contain {{query}} exactly once")
+        self.id = store_id
+        self.name = name
+        self.emoji = emoji
+        self.prefix, self.suffix = url.split("{query}")
+
+    def link(self, query, encoded):
+        return {"store": self.name, "emoji": self.emoji, "url": self.prefix + encoded + self.suffix, "query": query}
+
+    def to_dict(self):
+        return {"id": self.id, "store": self.name, "emoji": self.emoji, "url": self.prefix + "{query}" + self.suffix}
+
+
+class StoreRegistry:
+    """Enabled stores for one locale, in display order"""
+
+    def __init__(self, stores=None, locale=None, disabled=()):
+        self.locale = (locale or DEFAULT_LOCALE).lower()
+        disabled = {store_id.strip() for store_id in disabled if store_id.strip()}
+        self.stores = []
+        for entry in DEFAULT_STORES if stores is None else stores:
+            if not entry.get("enabled", True) or entry["id"] in disabled:
+                continue
+            url = entry["url"]
+            locales = entry.get("locales")
+            if locales is not None:
+                if self.locale not in locales:
+                    continue
+                url = url.replace("{locale}", locales[self.locale])
+            self.stores.append(Store(entry["id"], entry["store"], entry.get("emoji", ""), url))
+
+    @classmethod
+    def from_env(cls):
+        path = os.getenv("SHOPPING_STORES_FILE")
+        stores = None
+        if path:
+            with open(path, encoding="utf-8") as f:
+                stores = json.load(f)
+            if isinstance(stores, dict):
+                stores = stores.get("stores", [])
+        return cls(
+            stores,
+            locale=os.getenv("SHOPPING_LOCALE"),
+            disabled=os.getenv("SHOPPING_DISABLED_STORES", "").split(",")
+        )
+
+    def __iter__(self):
+        return iter(self.stores)
+
+    def __len__(self):
+        return len(self.stores)
+
+    def to_dict(self):
+        return {"locale": self.locale, "stores": [store.to_dict() for store in self.stores]}
+
+
+store_registry = LazyService(StoreRegistry.from_env)
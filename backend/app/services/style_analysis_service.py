@@ -1,58 +1,206 @@
+from app.services.blob_store import blob_store
 from app.services.gemini_service import gemini_service
+from app.services.image_hashing import color_signature, dhash, duplicate_index
+from app.services.image_processing import image_preprocessor
+from app.services.item_similarity import similarity_index
+from app.services.lazy import LazyService
+from app.services.style_profile import profile_cache, style_profile_engine
+from app.services.tracing import span, traced_methods
 from app.services.wardrobe_service import wardrobe_service
 from datetime import datetime
+import logging
+import os
+import time
 
+logger = logging.getLogger(__name__)
+
+# Set to false to never call Gemini for profiles
+STYLE_PROFILE_ENRICH = os.getenv("STYLE_PROFILE_ENRICH", "true").lower() not in ("0", "false", "no")
+
+@traced_methods("style")
 class StyleAnalysisService:
-    def analyze_image(self, image_data, mime_type, image_info):
-        analysis = gemini_service.analyze_clothing_image(
-            image_data,
-            mime_type
-        )
+    def _find_near_duplicate(self, user_id, image_data, image_info):
+        """Return ``(item, distance)`` for the user's closest matching item.
+
+        Records the image's perceptual hash and color signature in
+        ``image_info`` so the new wardrobe item can be matched by later
+        uploads. A match must have the same colors too: the hash alone can't
+        tell a red shirt from the same shirt in blue.
+        """
+        phash = dhash(image_data)
+        if phash is None:
+            return None
+        image_info["phash"] = format(phash, "016x")
+        colors = image_info["colorSignature"] = color_signature(image_data)
+        for distance, item_id in duplicate_index.find(user_id, phash):
+            item = wardrobe_service.get_item_by_id(user_id, item_id)
+            if (item and item.get("analysis")
+                    and duplicate_index.same_colors(colors, (item.get("imageInfo") or {}).get("colorSignature"))):
+                return item, distance
+        return None
+
+    def _prepare(self, image_data, mime_type, image_info, user_id):
+        """Preprocess an upload and look for a near-duplicate of it.
+
+        Returns the bytes and MIME type to send to Gemini and the
+        ``(item, distance)`` of a duplicate, if any.
+        """
+        # Gemini gets a downsized, EXIF-free copy; the caller stores the original
+        with span("preprocess"):
+            processed = image_preprocessor.process(image_data)
+        if processed:
+            image_data = processed["data"]
+            mime_type = processed["mimeType"]
+            image_info["thumbnail"] = blob_store.put(processed["thumbnail"])
+
+        duplicate = None
+        if user_id and duplicate_index.enabled:
+            with span("dedupe"):
+                duplicate = self._find_near_duplicate(user_id, image_data, image_info)
+        return image_data, mime_type, duplicate
+
+    def _reuse_duplicate(self, duplicate, image_info):
+        item, distance = duplicate
+        image_info["duplicateOf"] = item["id"]
+        return item["analysis"], {
+            "itemId": item["id"],
+            "distance": distance,
+            "similarity": duplicate_index.similarity(distance)
+        }
+
+    def analyze_image(self, image_data, mime_type, image_info, user_id=None):
+        image_data, mime_type, duplicate = self._prepare(image_data, mime_type, image_info, user_id)
+
+        if duplicate:
+            analysis, duplicate_info = self._reuse_duplicate(duplicate, image_info)
+        else:
+            analysis = gemini_service.analyze_clothing_image(
+                image_data,
+                mime_type
+            )
+            duplicate_info = None
 
         return {
             "analysis": analysis,
             "imageInfo": image_info,
+            "duplicateOf": duplicate_info,
             "analyzedAt": datetime.now().isoformat()
         }
 
-    def generate_style_profile(self, user_id: str):
-        items = wardrobe_service.get_all_items(user_id)
+    def analyze_and_store(self, user_id, image_data, mime_type, image_info, source_job=None):
+        """Analyze an upload and add it to the user's wardrobe.
 
-        if len(items) < 3:
-            raise ValueError("Need at least 3 wardrobe items")
+        ``image_data`` is the upload's bytes, or the path of its blob when
+        ``image_info`` already carries the ``blob`` id. ``source_job`` is
+        the analysis job doing this, recorded on the item.
+        """
+        result = self.analyze_image(image_data, mime_type, image_info, user_id=user_id)
 
-        # Avoid sending raw image data to Gemini when generating profile
-        # Trim `imageInfo.data` fields to reduce payload size and prevent 413 errors
-        trimmed_items = []
-        for it in items:
-            it_copy = dict(it)
-            img = it_copy.get('image_info') or it_copy.get('imageInfo') or {}
-            if isinstance(img, dict) and 'data' in img:
-                img = dict(img)
-                img.pop('data', None)
-                it_copy['image_info'] = img
-                it_copy['imageInfo'] = img
-            trimmed_items.append(it_copy)
-
-        profile = gemini_service.generate_style_profile(trimmed_items)
+        # The row keeps only a reference; bytes are served by GET /api/wardrobe/<id>/image
+        if not image_info.get("blob"):
+            image_info["blob"] = blob_store.put(image_data)
+
+        wardrobe_item = wardrobe_service.add_item(user_id, image_info, result["analysis"], source_job=source_job)
+        return {
+            "analysis": result["analysis"],
+            "duplicateOf": result.get("duplicateOf"),
+            "wardrobeItem": wardrobe_item
+        }
+
+    def analyze_batch(self, user_id, uploads):
+        """Analyze several ``(image_data, mime_type, image_info)`` uploads at once.
+
+        As with ``analyze_and_store``, ``image_data`` may be a blob's path.
+
+        Garments go to Gemini several per request and every successful
+        upload is added to the wardrobe in one transaction. Returns one
+        result per upload, in order: ``analysis``, ``duplicateOf`` and
+        ``wardrobeItem``, or just ``error`` if that upload failed.
+        """
+        results = [None] * len(uploads)
+        pending = []
+        for index, (image_data, mime_type, image_info) in enumerate(uploads):
+            send_data, send_mime, duplicate = self._prepare(image_data, mime_type, image_info, user_id)
+            if duplicate:
+                analysis, duplicate_info = self._reuse_duplicate(duplicate, image_info)
+                results[index] = {"analysis": analysis, "duplicateOf": duplicate_info}
+            else:
+                pending.append((index, send_data, send_mime))
+
+        analyses = gemini_service.analyze_clothing_images([(data, mime) for _, data, mime in pending])
+        for (index, _, _), analysis in zip(pending, analyses):
+            if isinstance(analysis, Exception):
+                results[index] = {"error": str(analysis)}
+            else:
+                results[index] = {"analysis": analysis, "duplicateOf": None}
+
+        stored = [index for index, result in enumerate(results) if "error" not in result]
+        entries = []
+        for index in stored:
+            image_data, _, image_info = uploads[index]
+            if not image_info.get("blob"):
+                image_info["blob"] = blob_store.put(image_data)
+            entries.append((image_info, results[index]["analysis"]))
+        for index, item in zip(stored, wardrobe_service.add_items(user_id, entries)):
+            results[index]["wardrobeItem"] = item
+        return results
+
+    def generate_style_profile(self, user_id: str, enrich=None, refresh=False):
+        """Profile computed locally, with Gemini's personality text if enabled.
+
+        Gemini only writes ``stylePersonality`` and ``recommendations``;
+        when it is disabled or fails the engine's template text is used and
+        ``enriched`` is False. Profiles are cached per user until the
+        wardrobe changes meaningfully (see ``ProfileCache``); ``refresh``
+        forces a new one. ``cache`` in the result says whether the profile
+        was cached, its age and how many item changes it predates.
+        """
         stats = wardrobe_service.get_statistics(user_id)
 
+        if stats["totalItems"] < 3:
+            raise ValueError("Need at least 3 wardrobe items")
+
+        if enrich is None:
+            enrich = STYLE_PROFILE_ENRICH
+        key = (user_id, bool(enrich))
+        cached = None if refresh else profile_cache.get(key, stats)
+        if cached is not None:
+            profile, generated_at, item_changes = cached
+        else:
+            profile = style_profile_engine.build(wardrobe_service.get_profile_attributes(user_id))
+            narrative = None
+            if enrich:
+                try:
+                    narrative = gemini_service.generate_style_narrative(style_profile_engine.summary(profile))
+                except ValueError as e:
+                    logger.warning("Style profile enrichment failed, using local text: %s", e)
+            profile.update(narrative or style_profile_engine.describe(profile))
+            profile["enriched"] = narrative is not None
+            item_changes = 0
+            if enrich and narrative is None:
+                # Not cached, so the next request tries Gemini again
+                generated_at = time.time()
+            else:
+                generated_at = profile_cache.put(key, stats, profile)
+
         return {
             "profile": profile,
             "statistics": stats,
-            "generatedAt": datetime.now().isoformat()
+            "generatedAt": datetime.fromtimestamp(generated_at).isoformat(),
+            "cache": {
+                "hit": cached is not None,
+                "ageSeconds": round(profile_cache.age(generated_at), 3),
+                "itemChangesSince": item_changes
+            }
         }
-    def get_recommendations(self, user_id: str, item_id: int):
-        """Return similar item recommendations for a given item using Gemini service."""
-        items = wardrobe_service.get_all_items(user_id)
-        # find the item
-        target = None
-        for it in items:
-            if it.get('id') == item_id:
-                target = it
-                break
-        if not target:
-            return []
-        return gemini_service.find_similar_items(target, items)
-
-style_analysis_service = StyleAnalysisService()
+
+    def get_recommendations(self, user_id: str, item_id: int, limit: int = 5):
+        """Wardrobe items that go well with ``item_id``, best first.
+
+        Scored locally from the items' feature vectors (see item_similarity);
+        each entry has ``itemId``, ``matchScore`` (0-100) and ``reason``.
+        Empty if the item is not in the user's wardrobe.
+        """
+        return similarity_index.top_k(user_id, item_id, limit)
+
+style_analysis_service = LazyService(StyleAnalysisService)
@@ -0,0 +1,265 @@
+"""
+Local style-profile engine
+Computes the dominant style, color palette and missing pieces of a wardrobe
+from the stored analyses; Gemini only adds the free-text personality
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from app.services.garment_taxonomy import SECONDARY_COLOR_WEIGHT, TYPE_CATEGORIES, TYPE_CATEGORY, is_neutral
+from app.services.lazy import LazyService
+
+UNKNOWN = "unknown"
+
+# What to suggest for an empty category, by dominant style
+STYLE_ESSENTIALS = {
+    "casual": {"tops": "plain t-shirt", "bottoms": "jeans", "footwear": "sneakers", "outerwear": "denim jacket"},
+    "formal": {"tops": "dress shirt", "bottoms": "tailored trousers", "footwear": "leather shoes",
+               "outerwear": "blazer"},
+    "sporty": {"tops": "performance t-shirt", "bottoms": "joggers", "footwear": "running shoes",
+               "outerwear": "windbreaker"},
+    "elegant": {"tops": "silk blouse", "bottoms": "tailored trousers", "footwear": "loafers",
+                "outerwear": "wool coat"},
+}
+DEFAULT_STYLE = "casual"
+
+WARM_SEASONS = {"summer", "spring", "all-season"}
+COLD_SEASONS = {"winter", "fall", "autumn", "all-season"}
+
+# One category outnumbering its counterpart by this much is a gap too
+IMBALANCE_RATIO = 3
+
+
+def _labels(values):
+    """Normalised string array: lower-cased, stripped, ``unknown`` for blanks"""
+    return np.array([value.strip().lower() or UNKNOWN if isinstance(value, str) else UNKNOWN
+                     for value in values], dtype=str)
+
+
+def _counts(labels, weights=None, skip_unknown=True):
+    """``[(label, count), ...]`` most common first, ties by name.
+
+    Repeated labels (``Casual`` and ``casual`` rows) are summed.
+    """
+    if not len(labels):
+        return []
+    names, codes = np.unique(labels, return_inverse=True)
+    totals = np.bincount(codes, weights=weights, minlength=len(names))
+    if skip_unknown:
+        totals[names == UNKNOWN] = 0
+    # lexsort: last key is primary, so count descending then name ascending
+    order = np.lexsort((names, -totals))
+    return [(str(names[i]), float(totals[i])) for i in order if totals[i] > 0]
+
+
+def _with_article(piece):
+    # "jeans", "leather shoes" and "neutral basics (...)" take no article
+    if piece.endswith("s") or "(" in piece:
+        return piece
+    return f"{'an' if piece[0] in 'aeiou' else 'a'} {piece}"
+
+
+def _grouped(rows):
+    """Labels and counts of ``(value, count)`` rows"""
+    if not rows:
+        return _labels([]), None
+    values, counts = zip(*rows)
+    return _labels(values), np.asarray(counts, dtype=float)
+
+
+class StyleProfileEngine:
+    """Deterministic wardrobe profile from attribute value counts.
+
+    Input is the dict returned by ``WardrobeService.get_profile_attributes``:
+    SQLite groups each attribute on its index, and the counts are merged,
+    weighted and ranked with numpy, so even wardrobes of thousands of
+    items take milliseconds.
+    """
+
+    def __init__(self, palette_size=None, max_missing=None):
+        self.palette_size = int(palette_size or os.getenv("STYLE_PROFILE_PALETTE_SIZE", "5"))
+        self.max_missing = int(max_missing or os.getenv("STYLE_PROFILE_MAX_MISSING", "5"))
+
+    def build(self, attributes):
+        """Return the local profile: ``dominantStyle``, ``colorPalette``,
+        ``missingPieces``, ``breakdown`` (shares per attribute) and
+        ``totalItems``."""
+        total = attributes.get("totalItems", 0)
+        breakdown = {}
+        type_counts = []
+        for name, key in (("item_type", "type"), ("style", "style"), ("pattern", "pattern"),
+                          ("season", "season"), ("occasion", "occasion"), ("fabric", "fabric")):
+            counts = _counts(*_grouped(attributes.get(name, [])))
+            breakdown[key] = {label: round(count / total, 3) for label, count in counts} if total else {}
+            if name == "item_type":
+                type_counts = counts
+
+        styles = list(breakdown["style"])
+        dominant = styles[0] if styles else UNKNOWN
+
+        color_rows = attributes.get("colors", [])
+        colors = _labels([row[0] for row in color_rows])
+        weights = np.array([SECONDARY_COLOR_WEIGHT if secondary else 1.0 for _, secondary, _ in color_rows])
+        weights *= np.array([count for _, _, count in color_rows], dtype=float)
+        palette = [label for label, _ in _counts(colors, weights)[:self.palette_size]]
+
+        return {
+            "dominantStyle": dominant,
+            "colorPalette": palette,
+            "missingPieces": self.missing_pieces(type_counts, dominant, palette, breakdown["season"]),
+            "breakdown": breakdown,
+            "totalItems": total,
+        }
+
+    def missing_pieces(self, type_counts, dominant, palette, seasons):
+        """Rules-based gaps: empty or badly outnumbered categories, season
+        coverage and the lack of neutral basics"""
+        essentials = STYLE_ESSENTIALS.get(dominant, STYLE_ESSENTIALS[DEFAULT_STYLE])
+        category_names = list(TYPE_CATEGORIES)
+        codes = np.array([category_names.index(TYPE_CATEGORY[label]) if label in TYPE_CATEGORY else len(category_names)
+                          for label, _ in type_counts], dtype=int)
+        totals = np.bincount(codes, weights=[count for _, count in type_counts],
+                             minlength=len(category_names) + 1)
+        count = dict(zip(category_names, totals.tolist()))
+        # A dress stands in for a top and a bottom
+        tops = count["tops"] + count["one-piece"]
+        bottoms = count["bottoms"] + count["one-piece"]
+
+        missing = []
+        if not tops:
+            missing.append(essentials["tops"])
+        if not bottoms:
+            missing.append(essentials["bottoms"])
+        if not count["footwear"]:
+            missing.append(essentials["footwear"])
+        if not count["outerwear"]:
+            missing.append(essentials["outerwear"])
+        if bottoms and tops > IMBALANCE_RATIO * bottoms:
+            missing.append(essentials["bottoms"])
+        if tops and bottoms > IMBALANCE_RATIO * tops:
+            missing.append(essentials["tops"])
+
+        known_seasons = set(seasons)
+        if known_seasons and not known_seasons & COLD_SEASONS:
+            missing.append("warm coat")
+        if known_seasons and not known_seasons & WARM_SEASONS:
+            missing.append("lightweight summer top")
+        if palette and not any(is_neutral(color) for color in palette):
+            missing.append("neutral basics (black, white or navy)")
+
+        unique = list(dict.fromkeys(missing))
+        return unique[:self.max_missing]
+
+    def describe(self, profile):
+        """Template ``stylePersonality`` and ``recommendations`` used when
+        Gemini enrichment is off or unavailable"""
+        dominant = profile["dominantStyle"]
+        share = profile["breakdown"]["style"].get(dominant)
+        palette = profile["colorPalette"][:3]
+        if dominant == UNKNOWN:
+            personality = "Your wardrobe doesn't have a clear dominant style yet."
+        else:
+            personality = f"Your wardrobe leans {dominant} ({round(share * 100)}% of pieces)."
+        if palette:
+            listed = palette[0] if len(palette) == 1 else f"{', '.join(palette[:-1])} and {palette[-1]}"
+            personality += f" It is built around {listed}."
+
+        scope = "your wardrobe" if dominant == UNKNOWN else f"your {dominant} wardrobe"
+        recommendations = [f"Adding {_with_article(piece)} would round out {scope}."
+                           for piece in profile["missingPieces"]]
+        if len(palette) >= 2:
+            recommendations.append(f"Pair your {palette[0]} and {palette[1]} pieces for easy outfits.")
+        return {"stylePersonality": personality, "recommendations": recommendations[:3]}
+
+    @staticmethod
+    def summary(profile):
+        """Compact, rounded view of a profile for the Gemini prompt.
+
+        Shares are rounded to 5% so small wardrobe changes produce the same
+        summary, and therefore the same cached narrative.
+        """
+        def top(shares, limit=5):
+            return {label: int(round(share * 20) * 5) for label, share in list(shares.items())[:limit]}
+
+        breakdown = profile["breakdown"]
+        return {
+            "dominantStyle": profile["dominantStyle"],
+            "colorPalette": profile["colorPalette"],
+            "missingPieces": profile["missingPieces"],
+            "stylePercentages": top(breakdown["style"]),
+            "typePercentages": top(breakdown["type"], limit=8),
+            "patternPercentages": top(breakdown["pattern"]),
+            "seasonPercentages": top(breakdown["season"]),
+            "occasionPercentages": top(breakdown["occasion"]),
+        }
+
+
+class ProfileCache:
+    """Per-process LRU of generated profiles, checked against wardrobe versions.
+
+    An entry stays valid while only favorites changed, and while fewer
+    than ``refresh_items`` items were added, removed or re-analysed
+    without changing the set of garment types; the statistics returned
+    alongside it are always current. Versions live in SQLite, so changes
+    made through other gunicorn workers are seen too.
+    """
+
+    def __init__(self, refresh_items=None, max_users=None, clock=time.time):
+        self.refresh_items = int(refresh_items or os.getenv("STYLE_PROFILE_REFRESH_ITEMS", "5"))
+        self.max_users = int(max_users or os.getenv("STYLE_PROFILE_CACHE_USERS", "1000"))
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh(self, entry, stats):
+        if entry["version"] == stats["version"] or entry["itemVersion"] == stats["itemVersion"]:
+            return True
+        changes = stats["itemVersion"] - entry["itemVersion"]
+        return 0 < changes < self.refresh_items and entry["types"] == set(stats["byType"])
+
+    def get(self, key, stats):
+        """Return ``(profile, generated_at, item_changes)`` or None to regenerate"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not self._fresh(entry, stats):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["profile"], entry["generatedAt"], stats["itemVersion"] - entry["itemVersion"]
+
+    def put(self, key, stats, profile):
+        generated_at = self._clock()
+        with self._lock:
+            self._entries[key] = {
+                "profile": profile,
+                "generatedAt": generated_at,
+                "version": stats["version"],
+                "itemVersion": stats["itemVersion"],
+                "types": set(stats["byType"]),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        return generated_at
+
+    def age(self, generated_at):
+        return max(0.0, self._clock() - generated_at)
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+style_profile_engine = LazyService(StyleProfileEngine)
+profile_cache = LazyService(ProfileCache)
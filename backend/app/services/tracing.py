@@ -0,0 +1,325 @@
+"""
+Request tracing
+Spans time the phases of a request (upload, preprocessing, Gemini attempts,
+parsing, SQLite) under one trace and request id. Every response carries a
+``Server-Timing`` breakdown and ``X-Request-ID``; finished traces can be
+exported in the background to a JSONL file (``TRACE_EXPORT=jsonl``) or an
+OTLP/HTTP collector (``TRACE_EXPORT=otlp``).
+"""
+import contextvars
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import requests
+
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "").lower()
+TRACE_FILE = os.getenv("TRACE_FILE") or os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "db", "traces.jsonl")
+)
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+# Share of traces exported; Server-Timing covers every request
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1"))
+TRACE_SERVER_TIMING = os.getenv("TRACE_SERVER_TIMING", "true").lower() not in ("0", "false", "no")
+# Bounds a runaway loop's trace (e.g. a batch of thousands of queries)
+MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "1000"))
+EXPORT_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "1000"))
+EXPORT_BATCH_SIZE = 100
+
+SERVICE_NAME = "style-finder-backend"
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+NON_TOKEN = re.compile(r"[^A-Za-z0-9!#$%&'*+.^_`|~-]")
+# Client-supplied request ids are echoed back, so only plain ones are kept
+REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+_current = contextvars.ContextVar("trace_span", default=None)
+
+
+class Trace:
+    def __init__(self, trace_id=None, request_id=None, sampled=True):
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.request_id = request_id or self.trace_id
+        self.sampled = sampled
+        self.spans = []
+        self.dropped = 0
+        self.root_id = None
+
+    def server_timing(self, root):
+        """``Server-Timing`` value: the request's total and the summed time of
+        each span name, in order of first appearance"""
+        phases = {}
+        for span in self.spans:
+            if span is root or span.end is None:
+                continue
+            duration, count = phases.get(span.name, (0.0, 0))
+            phases[span.name] = (duration + span.end - span.start, count + 1)
+        entries = [f"total;dur={(time.perf_counter() - root.start) * 1000:.1f}"]
+        for name, (duration, count) in phases.items():
+            entry = f"{NON_TOKEN.sub('-', name)};dur={duration * 1000:.1f}"
+            if count > 1:
+                entry += f';desc="x{count}"'
+            entries.append(entry)
+        return ", ".join(entries)
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attributes", "start", "end", "wall_start")
+
+    def __init__(self, trace, name, parent_id=None, attributes=None):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        self.end = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self):
+        self.end = time.perf_counter()
+        trace = self.trace
+        if len(trace.spans) < MAX_SPANS:
+            trace.spans.append(self)
+        else:
+            trace.dropped += 1
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def to_dict(self):
+        return {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "requestId": self.trace.request_id,
+            "name": self.name,
+            "start": self.wall_start,
+            "durationMs": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+        }
+
+
+def current_span():
+    return _current.get()
+
+
+def current_request_id():
+    span = _current.get()
+    return span.trace.request_id if span is not None else None
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a block as a child of the current span; a no-op outside a trace"""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.attributes["error"] = type(e).__name__
+        raise
+    finally:
+        child.finish()
+        _current.reset(token)
+
+
+def traced(name):
+    """Decorator running the function in a span called ``name``"""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def traced_methods(prefix):
+    """Class decorator tracing every public method as ``<prefix>.<method>``"""
+    def decorate(cls):
+        for name, method in list(vars(cls).items()):
+            if not name.startswith("_") and callable(method) and not isinstance(method, (staticmethod, classmethod)):
+                setattr(cls, name, traced(f"{prefix}.{name}")(method))
+        return cls
+    return decorate
+
+
+def bind(fn):
+    """``fn`` running in a copy of the caller's context, so spans opened in a
+    worker thread join the caller's trace"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def start_trace(name, request_id=None, traceparent=None, **attributes):
+    """Open a trace's root span and make it current; returns ``(root, token)``"""
+    trace_id = parent_id = None
+    if request_id and not REQUEST_ID.match(request_id):
+        request_id = None
+    sampled = random.random() < TRACE_SAMPLE_RATE
+    match = TRACEPARENT.match(traceparent or "")
+    if match:
+        trace_id, parent_id, flags = match.groups()
+        sampled = sampled and int(flags, 16) & 1 == 1
+    root = Span(Trace(trace_id, request_id, sampled), name, parent_id, attributes)
+    root.trace.root_id = root.span_id
+    return root, _current.set(root)
+
+
+def end_trace(root, token):
+    root.finish()
+    _current.reset(token)
+    if root.trace.sampled:
+        exporter.submit(root.trace)
+
+
+class SpanExporter:
+    """Background export of finished traces; drops them when the queue is full"""
+
+    def __init__(self, mode=None, path=None, endpoint=None):
+        self.mode = TRACE_EXPORT if mode is None else mode
+        self.path = path or TRACE_FILE
+        self.endpoint = endpoint or TRACE_OTLP_ENDPOINT
+        self.dropped = 0
+        self.exported = 0
+        self._reset()
+
+    def _reset(self):
+        self._queue = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.mode in ("jsonl", "otlp")
+
+    def submit(self, trace):
+        if not self.enabled:
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            traces = [self._queue.get()]
+            while len(traces) < EXPORT_BATCH_SIZE:
+                try:
+                    traces.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.export(traces)
+                self.exported += len(traces)
+            except (OSError, requests.RequestException):
+                self.dropped += len(traces)
+            finally:
+                for _ in traces:
+                    self._queue.task_done()
+
+    def flush(self):
+        """Wait until every submitted trace is exported (tests and shutdown)"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def export(self, traces):
+        if self.mode == "jsonl":
+            with open(self.path, "a", encoding="utf-8") as f:
+                for trace in traces:
+                    for s in trace.spans:
+                        f.write(json.dumps(s.to_dict(), default=str) + "\n")
+        elif self.mode == "otlp":
+            requests.post(self.endpoint, json=otlp_payload(traces), timeout=2).raise_for_status()
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_payload(traces):
+    """OTLP/JSON ``ExportTraceServiceRequest`` for ``traces``"""
+    spans = []
+    for trace in traces:
+        for s in trace.spans:
+            start = int(s.wall_start * 1e9)
+            attributes = dict(s.attributes, **{"request.id": trace.request_id})
+            spans.append({
+                "traceId": trace.trace_id,
+                "spanId": s.span_id,
+                "parentSpanId": s.parent_id or "",
+                "name": s.name,
+                "kind": 2 if s.span_id == trace.root_id else 1,
+                "startTimeUnixNano": str(start),
+                "endTimeUnixNano": str(start + int(s.duration * 1e9)),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items()],
+            })
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "app.services.tracing"}, "spans": spans}],
+    }]}
+
+
+exporter = SpanExporter()
+# The export thread does not survive a fork
+os.register_at_fork(after_in_child=exporter._reset)
+
+
+def instrument_app(app):
+    """Trace every request of ``app`` and add ``Server-Timing`` and
+    ``X-Request-ID`` headers to its responses"""
+    from flask import g, request
+
+    @app.before_request
+    def _start_trace():
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        g.trace = start_trace(
+            f"{request.method} {route}",
+            request_id=request.headers.get("X-Request-ID"),
+            traceparent=request.headers.get("traceparent"),
+            **{"http.method": request.method, "http.route": route}
+        )
+
+    @app.after_request
+    def _add_trace_headers(response):
+        traced_request = g.get("trace")
+        if traced_request is not None:
+            root = traced_request[0]
+            root.set(**{"http.status_code": response.status_code})
+            response.headers["X-Request-ID"] = root.trace.request_id
+            if TRACE_SERVER_TIMING:
+                response.headers["Server-Timing"] = root.trace.server_timing(root)
+        return response
+
+    @app.teardown_request
+    def _end_trace(exc):
+        traced_request = g.pop("trace", None)
+        if traced_request is not None:
+            end_trace(*traced_request)
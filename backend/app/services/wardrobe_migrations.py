@@ -0,0 +1,221 @@
+"""
+Wardrobe schema migrations
+Versions are tracked in SQLite's ``PRAGMA user_version``
+"""
+
+# Columns generated from the analysis JSON; virtual, so they can never drift
+# from the blob and cost nothing to store apart from their indexes
+ATTRIBUTE_COLUMNS = {
+    "item_type": "NULLIF(COALESCE(json_extract(analysis, '$.type'), json_extract(analysis, '$.clothing_type')), '')",
+    "style": "json_extract(analysis, '$.style')",
+    "season": "json_extract(analysis, '$.season')",
+    "occasion": "json_extract(analysis, '$.occasion')",
+    "pattern": "json_extract(analysis, '$.pattern')",
+    "fabric": "json_extract(analysis, '$.fabric')",
+    "primary_color": "json_extract(analysis, '$.colors[0]')",
+}
+
+
+def _columns(conn):
+    return {row[1] for row in conn.execute("PRAGMA table_xinfo(wardrobe)")}
+
+
+def _create_base_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS wardrobe (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        image_info TEXT,
+        analysis TEXT,
+        favorite INTEGER DEFAULT 0,
+        added_at TEXT
+    )
+    """)
+
+
+def _add_image_blob(conn):
+    if "image_blob" not in _columns(conn):
+        conn.execute("ALTER TABLE wardrobe ADD COLUMN image_blob TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_wardrobe_image_blob ON wardrobe(image_blob)")
+
+
+def _add_attribute_columns(conn):
+    existing = _columns(conn)
+    for name, expr in ATTRIBUTE_COLUMNS.items():
+        if name not in existing:
+            # json_valid guard: legacy rows with malformed JSON must not fail reads
+            conn.execute(
+                f"ALTER TABLE wardrobe ADD COLUMN {name} TEXT GENERATED ALWAYS AS "
+                f"(CASE WHEN json_valid(analysis) THEN {expr} END) VIRTUAL"
+            )
+
+
+def _add_indexes(conn):
+    # Replaces the expression indexes created before the generated columns
+    conn.execute("DROP INDEX IF EXISTS idx_wardrobe_user_type")
+    conn.execute("DROP INDEX IF EXISTS idx_wardrobe_user_season")
+    conn.execute("DROP INDEX IF EXISTS idx_wardrobe_user_favorite_added")
+    # (user_id, added_at, id) also serves plain user_id lookups and ordering
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_wardrobe_user_added ON wardrobe(user_id, added_at, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_wardrobe_user_favorite ON wardrobe(user_id, favorite, added_at, id)")
+    for name in ("item_type", "season"):
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_wardrobe_user_{name} ON wardrobe(user_id, {name}, added_at, id)"
+        )
+    for name in ("style", "occasion", "pattern", "fabric", "primary_color"):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_wardrobe_user_{name} ON wardrobe(user_id, {name})")
+
+
+def _add_thumbnail_blob(conn):
+    if "thumb_blob" not in _columns(conn):
+        conn.execute("ALTER TABLE wardrobe ADD COLUMN thumb_blob TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_wardrobe_thumb_blob ON wardrobe(thumb_blob)")
+
+
+def _add_user_stats(conn):
+    """Per-user counters kept current by triggers, in the writing transaction.
+
+    ``version`` changes with every mutation and ``item_version`` only when
+    items are added, removed or re-analysed (not on favorite toggles), so
+    cached profiles can tell what kind of change happened. Rows are never
+    deleted, so versions keep increasing after a wardrobe is cleared.
+    """
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS wardrobe_user_stats (
+        user_id TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0,
+        item_version INTEGER NOT NULL DEFAULT 0,
+        total INTEGER NOT NULL DEFAULT 0,
+        favorites INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS wardrobe_type_counts (
+        user_id TEXT NOT NULL,
+        item_type TEXT NOT NULL,
+        cnt INTEGER NOT NULL,
+        PRIMARY KEY (user_id, item_type)
+    ) WITHOUT ROWID
+    """)
+    conn.execute("DELETE FROM wardrobe_user_stats")
+    conn.execute("DELETE FROM wardrobe_type_counts")
+    conn.execute("""
+    INSERT INTO wardrobe_user_stats (user_id, version, item_version, total, favorites)
+    SELECT user_id, 1, 1, COUNT(*), COALESCE(SUM(favorite=1), 0) FROM wardrobe GROUP BY user_id
+    """)
+    conn.execute("""
+    INSERT INTO wardrobe_type_counts (user_id, item_type, cnt)
+    SELECT user_id, COALESCE(item_type, 'unknown'), COUNT(*) FROM wardrobe GROUP BY 1, 2
+    """)
+
+    bump = """
+        INSERT INTO wardrobe_user_stats (user_id, version, item_version, total, favorites)
+        VALUES ({user}, 1, {items}, {total}, {favorites})
+        ON CONFLICT(user_id) DO UPDATE SET
+            version = version + 1,
+            item_version = item_version + {items},
+            total = total + {total},
+            favorites = favorites + {favorites};
+    """
+    add_type = """
+        INSERT INTO wardrobe_type_counts (user_id, item_type, cnt)
+        VALUES (NEW.user_id, COALESCE(NEW.item_type, 'unknown'), 1)
+        ON CONFLICT(user_id, item_type) DO UPDATE SET cnt = cnt + 1;
+    """
+    remove_type = """
+        UPDATE wardrobe_type_counts SET cnt = cnt - 1
+        WHERE user_id = OLD.user_id AND item_type = COALESCE(OLD.item_type, 'unknown');
+        DELETE FROM wardrobe_type_counts WHERE user_id = OLD.user_id AND cnt <= 0;
+    """
+    triggers = {
+        "wardrobe_stats_insert": (
+            "AFTER INSERT ON wardrobe",
+            bump.format(user="NEW.user_id", items=1, total=1, favorites="(NEW.favorite = 1)") + add_type
+        ),
+        "wardrobe_stats_delete": (
+            "AFTER DELETE ON wardrobe",
+            bump.format(user="OLD.user_id", items=1, total=-1, favorites="-(OLD.favorite = 1)") + remove_type
+        ),
+        "wardrobe_stats_favorite": (
+            "AFTER UPDATE OF favorite ON wardrobe",
+            bump.format(user="NEW.user_id", items=0, total=0,
+                        favorites="(NEW.favorite = 1) - (OLD.favorite = 1)")
+        ),
+        "wardrobe_stats_analysis": (
+            "AFTER UPDATE OF analysis ON wardrobe",
+            bump.format(user="NEW.user_id", items=1, total=0, favorites=0) + remove_type + add_type
+        ),
+    }
+    for name, (event, body) in triggers.items():
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute(f"CREATE TRIGGER {name} {event} BEGIN {body} END")
+
+
+def _add_features(conn):
+    # Imported here: the encoder needs numpy, which nothing else at this level does
+    from app.services.item_features import encode, to_blob
+
+    if "features" not in _columns(conn):
+        conn.execute("ALTER TABLE wardrobe ADD COLUMN features BLOB")
+    rows = conn.execute("SELECT id, analysis FROM wardrobe WHERE features IS NULL").fetchall()
+    conn.executemany(
+        "UPDATE wardrobe SET features=? WHERE id=?",
+        ((to_blob(encode(analysis)), item_id) for item_id, analysis in rows)
+    )
+
+
+def _add_source_job(conn):
+    # At most one item per analysis job, however often the job is retried
+    if "source_job" not in _columns(conn):
+        conn.execute("ALTER TABLE wardrobe ADD COLUMN source_job TEXT")
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_wardrobe_source_job ON wardrobe(source_job) "
+        "WHERE source_job IS NOT NULL"
+    )
+
+
+# (version, description, function). Append only; every step must also be
+# safe on databases created before versioning existed.
+MIGRATIONS = [
+    (1, "create wardrobe table", _create_base_table),
+    (2, "move images to blob store references", _add_image_blob),
+    (3, "generated analysis attribute columns", _add_attribute_columns),
+    (4, "user and attribute indexes", _add_indexes),
+    (5, "thumbnail blob references", _add_thumbnail_blob),
+    (6, "per-user versions and incremental statistics", _add_user_stats),
+    (7, "item feature vectors", _add_features),
+    (8, "analysis job that created each item", _add_source_job),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(conn, migrations=MIGRATIONS):
+    """Apply pending migrations in order and return the versions applied.
+
+    Runs under ``BEGIN IMMEDIATE`` so only one process migrates at a time;
+    the others wait on the write lock and then find nothing left to do.
+    """
+    if current_version(conn) >= migrations[-1][0]:
+        return []
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    applied = []
+    try:
+        version = current_version(conn)
+        for number, _, migrate in migrations:
+            if number <= version:
+                continue
+            migrate(conn)
+            conn.execute(f"PRAGMA user_version = {int(number)}")
+            applied.append(number)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return applied
@@ -1,37 +1,362 @@
-import sqlite3
-import os
+import atexit
+import base64
+import binascii
 import sqlite3
 import os
 import json
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from urllib.parse import quote
+
+from app.services.blob_store import blob_store
+from app.services.item_features import encode, to_blob
+from app.services.lazy import LazyService
+from app.services.metrics import registry, timed_methods
+from app.services.tracing import traced_methods
+from app.services.wardrobe_migrations import run_migrations
 
 DB_PATH = os.path.abspath(
     os.path.join(os.path.dirname(__file__), "..", "db", "wardrobe.sqlite3")
 )
 
+# Gunicorn runs 4 threads per worker, so a pool of 4 lets every thread hold a
+# connection without waiting; override with WARDROBE_DB_POOL_SIZE.
+DEFAULT_POOL_SIZE = int(os.getenv("WARDROBE_DB_POOL_SIZE", "4"))
+DEFAULT_POOL_TIMEOUT = float(os.getenv("WARDROBE_DB_POOL_TIMEOUT", "30"))
+
+# Explicit list: SELECT * would also return the generated attribute columns
+ITEM_COLUMNS = "id, user_id, image_info, analysis, favorite, added_at, image_blob, thumb_blob"
+
+# Relative to the API root; the blueprints turn it into an absolute URL
+IMAGE_URL_TEMPLATE = "/api/wardrobe/{item_id}/image?userId={user_id}"
+THUMBNAIL_URL_TEMPLATE = "/api/wardrobe/{item_id}/thumbnail?userId={user_id}"
+
+IMAGE_INFO_WITHOUT_DATA_EXPR = (
+    "(CASE WHEN json_valid(image_info) THEN json_remove(image_info, '$.data') ELSE image_info END)"
+)
+
+# list_items filter name -> generated column (see wardrobe_migrations)
+FILTER_COLUMNS = {
+    "item_type": "item_type",
+    "season": "season",
+    "style": "style",
+    "occasion": "occasion",
+}
+
+# Generated columns counted for style profiles; all are indexed with user_id
+PROFILE_COLUMNS = ("item_type", "style", "pattern", "season", "occasion", "fabric")
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Fields only returned when listed explicitly in ``fields``
+HEAVY_FIELDS = ("imageData", "imageInfo.data")
+
+
+class StorageConfig:
+    """SQLite tuning applied to every pooled connection.
+
+    Defaults favour several gunicorn processes sharing one database file:
+    WAL lets readers proceed while a writer commits, and the busy timeout
+    makes writers wait for the lock instead of failing with
+    "database is locked". Each setting can be overridden from the env.
+    """
+
+    JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+    SYNCHRONOUS_LEVELS = ("OFF", "NORMAL", "FULL", "EXTRA")
+    CHECKPOINT_MODES = ("PASSIVE", "FULL", "RESTART", "TRUNCATE")
+
+    def __init__(self, journal_mode="WAL", synchronous="NORMAL", busy_timeout_ms=5000,
+                 mmap_size=64 * 1024 * 1024, checkpoint_interval=60.0, checkpoint_mode="PASSIVE"):
+        self.journal_mode = journal_mode.upper()
+        self.synchronous = synchronous.upper()
+        self.busy_timeout_ms = int(busy_timeout_ms)
+        self.mmap_size = int(mmap_size)
+        self.checkpoint_interval = float(checkpoint_interval)
+        self.checkpoint_mode = checkpoint_mode.upper()
+        if self.journal_mode not in self.JOURNAL_MODES:
+            raise ValueError(f"Unsupported journal mode: {journal_mode}")
+        if self.synchronous not in self.SYNCHRONOUS_LEVELS:
+            raise ValueError(f"Unsupported synchronous level: {synchronous}")
+        if self.checkpoint_mode not in self.CHECKPOINT_MODES:
+            raise ValueError(f"Unsupported checkpoint mode: {checkpoint_mode}")
+        if self.busy_timeout_ms < 0 or self.mmap_size < 0:
+            raise ValueError("busy_timeout_ms and mmap_size must not be negative")
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            journal_mode=os.getenv("WARDROBE_DB_JOURNAL_MODE", "WAL"),
+            synchronous=os.getenv("WARDROBE_DB_SYNCHRONOUS", "NORMAL"),
+            busy_timeout_ms=os.getenv("WARDROBE_DB_BUSY_TIMEOUT_MS", "5000"),
+            mmap_size=os.getenv("WARDROBE_DB_MMAP_SIZE", str(64 * 1024 * 1024)),
+            checkpoint_interval=os.getenv("WARDROBE_DB_CHECKPOINT_INTERVAL", "60"),
+            checkpoint_mode=os.getenv("WARDROBE_DB_CHECKPOINT_MODE", "PASSIVE"),
+        )
+
+    def apply(self, conn):
+        """Set per-connection pragmas (journal mode is persisted in the file)."""
+        conn.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+        conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(f"PRAGMA mmap_size={self.mmap_size}")
+
+
+def ensure_schema(conn):
+    run_migrations(conn)
+
+
+def decode_data_url(value):
+    """Split ``data:<mime>;base64,<payload>`` into ``(mime, bytes)``, or None."""
+    if not isinstance(value, str) or not value.startswith("data:"):
+        return None
+    header, sep, payload = value.partition(",")
+    if not sep or not header.endswith(";base64"):
+        return None
+    try:
+        raw = base64.b64decode(payload, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return header[len("data:"):-len(";base64")], raw
+
+
+def encode_cursor(added_at, item_id):
+    raw = json.dumps([added_at, item_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        added_at, item_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(item_id, int) or not isinstance(added_at, (str, type(None))):
+            raise ValueError
+        return added_at, item_id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
 def get_db():
+    """Open a standalone connection (scripts and tests); the service uses the pool."""
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     # Ensure schema exists (safe to call every time)
     try:
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS wardrobe (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT NOT NULL,
-            image_info TEXT,
-            analysis TEXT,
-            favorite INTEGER DEFAULT 0,
-            added_at TEXT
-        );
-        """)
-        conn.commit()
+        ensure_schema(conn)
     except Exception:
         # If schema creation fails, propagate later; but don't crash here
         pass
     return conn
 
 
+class ConnectionPool:
+    """Bounded pool of long-lived SQLite connections shared between threads.
+
+    Connections are opened lazily up to ``max_size`` and handed back to the
+    pool after each use instead of being closed. The schema (the wardrobe
+    migrations unless ``schema`` is given) is ensured once, when the pool
+    is created, rather than on every request.
+    """
+
+    def __init__(self, db_path, max_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_POOL_TIMEOUT, config=None,
+                 schema=None):
+        if max_size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.config = config or StorageConfig.from_env()
+        self._last_checkpoint = time.monotonic()
+        self.checkpoints = 0
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = self._connect()
+        (schema or ensure_schema)(conn)
+        self._created = 1
+        self._idle.put_nowait(conn)
+
+    def _connect(self):
+        # Connections move between gunicorn threads, never used concurrently
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.config.busy_timeout_ms / 1000,
+            check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row
+        self.config.apply(conn)
+        return conn
+
+    def _is_healthy(self, conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        with self._lock:
+            self._created -= 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def acquire(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed")
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = None
+                with self._lock:
+                    can_create = self._created < self.max_size
+                    if can_create:
+                        self._created += 1
+                if can_create:
+                    try:
+                        return self._connect()
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise sqlite3.OperationalError(
+                        f"Timed out waiting {self.timeout}s for a database connection"
+                    )
+            if self._is_healthy(conn):
+                return conn
+            self._discard(conn)
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        if self._closed:
+            self._discard(conn)
+            return
+        self._maybe_checkpoint(conn)
+        self._idle.put_nowait(conn)
+
+    def _maybe_checkpoint(self, conn):
+        # Piggyback on connection release rather than running a timer thread,
+        # which keeps the pool fork-safe under gunicorn
+        if self.config.journal_mode != "WAL" or self.config.checkpoint_interval <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_checkpoint < self.config.checkpoint_interval:
+                return
+            self._last_checkpoint = now
+        self.checkpoint(conn)
+
+    def checkpoint(self, conn=None, mode=None):
+        """Copy WAL frames back into the database file.
+
+        Returns SQLite's ``(busy, wal_frames, checkpointed_frames)`` row, or
+        ``None`` when the checkpoint could not run.
+        """
+        mode = (mode or self.config.checkpoint_mode).upper()
+        if mode not in StorageConfig.CHECKPOINT_MODES:
+            raise ValueError(f"Unsupported checkpoint mode: {mode}")
+        if conn is None:
+            with self.connection() as pooled:
+                return self.checkpoint(pooled, mode)
+        try:
+            row = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        except sqlite3.OperationalError:
+            return None
+        self.checkpoints += 1
+        return tuple(row) if row else None
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        idle = self._idle.qsize()
+        return {
+            "size": self._created,
+            "idle": idle,
+            "inUse": self._created - idle,
+            "maxSize": self.max_size,
+            "journalMode": self.config.journal_mode,
+            "checkpoints": self.checkpoints,
+        }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, (re)creating it if ``DB_PATH`` changed.
+
+    A pool inherited through ``fork`` is dropped without closing: SQLite
+    connections must not be used across processes, and closing them in the
+    child could release locks the parent still relies on.
+    """
+    global _pool
+    pool = _pool
+    pid = os.getpid()
+    if pool is not None and pool.db_path == DB_PATH and pool.pid == pid:
+        return pool
+    with _pool_lock:
+        if _pool is not None and _pool.pid != pid:
+            _pool = None
+        if _pool is None or _pool.db_path != DB_PATH:
+            if _pool is not None:
+                _pool.close()
+            _pool = ConnectionPool(DB_PATH)
+        return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool.pid == os.getpid():
+            _pool.close()
+        _pool = None
+
+
+# Closing the last connection checkpoints and removes the WAL file
+atexit.register(close_pool)
+
+
+WARDROBE_QUERIES = registry.histogram(
+    "wardrobe_query_duration_seconds", "WardrobeService call latency by method", ("method", "status")
+)
+
+
+@timed_methods(WARDROBE_QUERIES)
+@traced_methods("wardrobe")
 class WardrobeService:
     def _parse_row(self, row):
         if not row:
@@ -50,6 +375,14 @@ class WardrobeService:
         if isinstance(img, dict):
             data["imageData"] = img.get("data")
             data["imageUrl"] = img.get("url")
+            if not data["imageUrl"] and (data.get("image_blob") or data["imageData"] or data.pop("has_inline_image", 0)):
+                data["imageUrl"] = IMAGE_URL_TEMPLATE.format(
+                    item_id=data.get("id"), user_id=quote(str(data.get("user_id")), safe="")
+                )
+            if data.get("thumb_blob"):
+                data["thumbnailUrl"] = THUMBNAIL_URL_TEMPLATE.format(
+                    item_id=data.get("id"), user_id=quote(str(data.get("user_id")), safe="")
+                )
             # Provide `imageInfo` key (camelCase) expected by tests
             data["imageInfo"] = img
 
@@ -70,95 +403,393 @@ class WardrobeService:
 
         return data
 
+    def _externalize_image(self, image_info):
+        """Move inline image bytes out of ``image_info`` into the blob store.
+
+        ``image_info`` may carry the bytes as a ``data`` URL or, when the
+        caller already stored them, a ``blob`` id. Returns the info to
+        persist (without ``data``) and the blob id, if any.
+        """
+        if not isinstance(image_info, dict):
+            return image_info, None
+        info = dict(image_info)
+        blob_id = info.pop("blob", None)
+        if blob_id is not None and not blob_store.exists(blob_id):
+            blob_id = None
+        if blob_id is None:
+            decoded = decode_data_url(info.get("data"))
+            if decoded is not None:
+                mime, raw = decoded
+                blob_id = blob_store.put(raw)
+                info.setdefault("mimetype", mime)
+        if blob_id is not None:
+            info.pop("data", None)
+        return info, blob_id
+
+    def _release_blobs(self, conn, blob_ids):
+        # Blobs are shared by identical uploads; only drop unreferenced ones
+        for blob_id in set(blob_ids):
+            if not blob_id:
+                continue
+            still_used = conn.execute(
+                "SELECT 1 FROM wardrobe WHERE image_blob=? OR thumb_blob=? LIMIT 1", (blob_id, blob_id)
+            ).fetchone()
+            if not still_used:
+                blob_store.delete(blob_id)
+
+    def referenced_blobs(self):
+        """Ids of every blob a wardrobe row points at, for any user"""
+        with get_pool().connection() as conn:
+            rows = conn.execute(
+                "SELECT image_blob, thumb_blob FROM wardrobe WHERE image_blob IS NOT NULL OR thumb_blob IS NOT NULL"
+            ).fetchall()
+        return {blob_id for row in rows for blob_id in row if blob_id}
+
     def get_all_items(self, user_id):
-        conn = get_db()
-        rows = conn.execute(
-            "SELECT * FROM wardrobe WHERE user_id=?",
-            (user_id,)
-        ).fetchall()
-        conn.close()
+        with get_pool().connection() as conn:
+            rows = conn.execute(
+                f"SELECT {ITEM_COLUMNS} FROM wardrobe WHERE user_id=?",
+                (user_id,)
+            ).fetchall()
         return [self._parse_row(row) for row in rows]
 
-    def add_item(self, user_id, image_info, analysis):
-        conn = get_db()
-        # Store JSON strings for structured data
-        image_json = json.dumps(image_info)
-        analysis_json = json.dumps(analysis)
-        cursor = conn.execute(
-            """INSERT INTO wardrobe
-               (user_id, image_info, analysis, added_at)
-               VALUES (?, ?, ?, ?)""",
-            (user_id, image_json, analysis_json, datetime.now().isoformat())
+    def list_items(self, user_id, limit=None, cursor=None, order="asc", fields=None,
+                   favorite=None, **filters):
+        """Page through a user's wardrobe in ``(added_at, id)`` order.
+
+        Filtering (``favorite`` and the attribute filters in
+        ``FILTER_COLUMNS``), ordering and dropping inline image data all
+        happen in SQL on indexed columns. ``fields`` limits the keys of each returned
+        item; image data is only included when ``imageData`` or
+        ``imageInfo.data`` is requested. Without ``limit`` and ``cursor``
+        the whole wardrobe is returned.
+
+        Returns ``(items, next_cursor)``; ``next_cursor`` is None on the
+        last page.
+        """
+        if order not in ("asc", "desc"):
+            raise ValueError("order must be 'asc' or 'desc'")
+        if limit is None and cursor is not None:
+            limit = DEFAULT_PAGE_SIZE
+        if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        fields = set(fields) if fields else None
+        with_data = bool(fields and fields.intersection(HEAVY_FIELDS))
+
+        image_column = "image_info" if with_data else (
+            f"{IMAGE_INFO_WITHOUT_DATA_EXPR} AS image_info, "
+            "(json_valid(image_info) AND COALESCE(json_extract(image_info, '$.data'), '') != '') AS has_inline_image"
         )
-        conn.commit()
-        last_id = cursor.lastrowid
-        row = conn.execute("SELECT * FROM wardrobe WHERE id=?", (last_id,)).fetchone()
-        conn.close()
-        return self._parse_row(row)
+        where = ["user_id=?"]
+        params = [user_id]
+        for name, value in filters.items():
+            if name not in FILTER_COLUMNS:
+                raise ValueError(f"Unknown filter: {name}")
+            if value is not None:
+                where.append(f"{FILTER_COLUMNS[name]}=?")
+                params.append(value)
+        if favorite is not None:
+            where.append("favorite=?")
+            params.append(1 if favorite else 0)
+        if cursor is not None:
+            where.append("(added_at, id) > (?, ?)" if order == "asc" else "(added_at, id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+        direction = "ASC" if order == "asc" else "DESC"
+        sql = (
+            f"SELECT id, user_id, {image_column}, analysis, favorite, added_at, image_blob, thumb_blob "
+            f"FROM wardrobe WHERE {' AND '.join(where)} "
+            f"ORDER BY added_at {direction}, id {direction}"
+        )
+        if limit is not None:
+            # One extra row tells whether another page exists
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+
+        with get_pool().connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["added_at"], rows[-1]["id"])
+
+        items = []
+        for row in rows:
+            item = self._parse_row(row)
+            item.pop("has_inline_image", None)
+            if not with_data:
+                item.pop("imageData", None)
+            if fields:
+                keep = fields | {"id"}
+                if "imageInfo.data" in fields:
+                    keep.add("imageInfo")
+                item = {k: v for k, v in item.items() if k in keep}
+            items.append(item)
+        return items, next_cursor
+
+    def _new_row(self, user_id, image_info, analysis, added_at, source_job=None):
+        thumb_id = None
+        if isinstance(image_info, dict) and "thumbnail" in image_info:
+            image_info = dict(image_info)
+            thumb_id = image_info.pop("thumbnail")
+            if not blob_store.exists(thumb_id):
+                thumb_id = None
+        image_info, blob_id = self._externalize_image(image_info)
+        # Store JSON strings for structured data
+        return (user_id, json.dumps(image_info), json.dumps(analysis), added_at, blob_id, thumb_id,
+                to_blob(encode(analysis)), source_job)
+
+    def add_item(self, user_id, image_info, analysis, source_job=None):
+        return self.add_items(user_id, [(image_info, analysis, source_job)])[0]
+
+    def add_items(self, user_id, entries):
+        """Insert ``(image_info, analysis)`` pairs in one transaction.
+
+        An entry may carry a third value, the id of the analysis job that
+        created it (see ``get_item_by_source_job``). Returns the new items
+        in the order given; either all rows are added or none are.
+        """
+        added_at = datetime.now().isoformat()
+        rows = [self._new_row(user_id, image_info, analysis, added_at, *source_job)
+                for image_info, analysis, *source_job in entries]
+        if not rows:
+            return []
+        with get_pool().connection() as conn:
+            ids = []
+            for row in rows:
+                cursor = conn.execute(
+                    """INSERT INTO wardrobe
+                       (user_id, image_info, analysis, added_at, image_blob, thumb_blob, features, source_job)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                    row
+                )
+                ids.append(cursor.lastrowid)
+            conn.commit()
+            placeholders = ", ".join("?" * len(ids))
+            by_id = {
+                row["id"]: row for row in conn.execute(
+                    f"SELECT {ITEM_COLUMNS} FROM wardrobe WHERE id IN ({placeholders})", ids
+                )
+            }
+        return [self._parse_row(by_id[item_id]) for item_id in ids]
+
+    def get_item_by_source_job(self, user_id, job_id):
+        """The item added by analysis job ``job_id``, or None"""
+        with get_pool().connection() as conn:
+            row = conn.execute(
+                f"SELECT {ITEM_COLUMNS} FROM wardrobe WHERE source_job=? AND user_id=?", (job_id, user_id)
+            ).fetchone()
+        return self._parse_row(row) if row else None
 
     def get_item_by_id(self, user_id, item_id):
-        conn = get_db()
-        row = conn.execute("SELECT * FROM wardrobe WHERE id=? AND user_id=?", (item_id, user_id)).fetchone()
-        conn.close()
+        with get_pool().connection() as conn:
+            row = conn.execute(f"SELECT {ITEM_COLUMNS} FROM wardrobe WHERE id=? AND user_id=?", (item_id, user_id)).fetchone()
         return self._parse_row(row)
 
+    def get_items(self, user_id, item_ids):
+        """The user's items among ``item_ids`` by id, without inline image data"""
+        item_ids = list({int(item_id) for item_id in item_ids})
+        if not item_ids:
+            return {}
+        placeholders = ", ".join("?" * len(item_ids))
+        with get_pool().connection() as conn:
+            rows = conn.execute(
+                f"""SELECT id, user_id, {IMAGE_INFO_WITHOUT_DATA_EXPR} AS image_info,
+                           (json_valid(image_info) AND COALESCE(json_extract(image_info, '$.data'), '') != '')
+                               AS has_inline_image,
+                           analysis, favorite, added_at, image_blob, thumb_blob
+                    FROM wardrobe WHERE user_id=? AND id IN ({placeholders})""",
+                [user_id] + item_ids
+            ).fetchall()
+        items = {}
+        for row in rows:
+            item = self._parse_row(row)
+            item.pop("has_inline_image", None)
+            item.pop("imageData", None)
+            items[item["id"]] = item
+        return items
+
     def toggle_favorite(self, user_id, item_id):
-        conn = get_db()
-        row = conn.execute(
-            "SELECT favorite FROM wardrobe WHERE id=? AND user_id=?",
-            (item_id, user_id)
-        ).fetchone()
+        with get_pool().connection() as conn:
+            row = conn.execute(
+                "SELECT favorite FROM wardrobe WHERE id=? AND user_id=?",
+                (item_id, user_id)
+            ).fetchone()
 
-        if not row:
-            conn.close()
-            return None
+            if not row:
+                return None
 
-        new_value = 0 if row["favorite"] else 1
-        conn.execute(
-            "UPDATE wardrobe SET favorite=? WHERE id=? AND user_id=?",
-            (new_value, item_id, user_id)
-        )
-        conn.commit()
-        # Return the full, parsed item so frontend can replace the item in state
-        updated_row = conn.execute("SELECT * FROM wardrobe WHERE id=? AND user_id=?", (item_id, user_id)).fetchone()
-        conn.close()
+            new_value = 0 if row["favorite"] else 1
+            conn.execute(
+                "UPDATE wardrobe SET favorite=? WHERE id=? AND user_id=?",
+                (new_value, item_id, user_id)
+            )
+            conn.commit()
+            # Return the full, parsed item so frontend can replace the item in state
+            updated_row = conn.execute(f"SELECT {ITEM_COLUMNS} FROM wardrobe WHERE id=? AND user_id=?", (item_id, user_id)).fetchone()
         return self._parse_row(updated_row)
 
     def clear_wardrobe(self, user_id):
-        conn = get_db()
-        conn.execute("DELETE FROM wardrobe WHERE user_id=?", (user_id,))
-        conn.commit()
-        conn.close()
+        with get_pool().connection() as conn:
+            blob_ids = []
+            for r in conn.execute(
+                """SELECT image_blob, thumb_blob FROM wardrobe
+                   WHERE user_id=? AND (image_blob IS NOT NULL OR thumb_blob IS NOT NULL)""",
+                (user_id,)
+            ):
+                blob_ids.extend((r["image_blob"], r["thumb_blob"]))
+            conn.execute("DELETE FROM wardrobe WHERE user_id=?", (user_id,))
+            conn.commit()
+            self._release_blobs(conn, blob_ids)
 
     def delete_item(self, user_id, item_id):
-        conn = get_db()
-        cursor = conn.execute("DELETE FROM wardrobe WHERE id=? AND user_id=?", (item_id, user_id))
-        conn.commit()
-        deleted = cursor.rowcount if hasattr(cursor, 'rowcount') else None
-        conn.close()
+        with get_pool().connection() as conn:
+            row = conn.execute(
+                "SELECT image_blob, thumb_blob FROM wardrobe WHERE id=? AND user_id=?", (item_id, user_id)
+            ).fetchone()
+            cursor = conn.execute("DELETE FROM wardrobe WHERE id=? AND user_id=?", (item_id, user_id))
+            conn.commit()
+            deleted = cursor.rowcount if hasattr(cursor, 'rowcount') else None
+            if deleted and row:
+                self._release_blobs(conn, [row["image_blob"], row["thumb_blob"]])
         return bool(deleted)
 
-    def get_statistics(self, user_id):
-        conn = get_db()
-        total = conn.execute("SELECT COUNT(*) as cnt FROM wardrobe WHERE user_id=?", (user_id,)).fetchone()["cnt"]
-        favorites = conn.execute("SELECT COUNT(*) as cnt FROM wardrobe WHERE user_id=? AND favorite=1", (user_id,)).fetchone()["cnt"]
-        rows = conn.execute("SELECT analysis FROM wardrobe WHERE user_id=?", (user_id,)).fetchall()
-        conn.close()
-
-        type_counts = {}
-        for r in rows:
+    def get_image(self, user_id, item_id, variant="original"):
+        """Return ``(blob_id, mimetype)`` for an item's image, or None.
+
+        ``variant`` is ``original`` or ``thumbnail``. Rows written before
+        the blob store existed are migrated on access.
+        """
+        if variant not in ("original", "thumbnail"):
+            raise ValueError(f"Unknown image variant: {variant}")
+        with get_pool().connection() as conn:
+            row = conn.execute(
+                "SELECT image_info, image_blob, thumb_blob FROM wardrobe WHERE id=? AND user_id=?",
+                (item_id, user_id)
+            ).fetchone()
+            if not row:
+                return None
+            if variant == "thumbnail":
+                # Thumbnails are always re-encoded as JPEG
+                return (row["thumb_blob"], "image/jpeg") if row["thumb_blob"] else None
             try:
-                analysis = json.loads(r["analysis"]) if isinstance(r["analysis"], str) else r["analysis"]
-                t = analysis.get("type") or analysis.get("clothing_type") or "unknown"
+                info = json.loads(row["image_info"]) if row["image_info"] else {}
             except Exception:
-                t = "unknown"
-            type_counts[t] = type_counts.get(t, 0) + 1
+                info = {}
+            blob_id = row["image_blob"]
+            if not blob_id:
+                info, blob_id = self._externalize_image(info)
+                if not blob_id:
+                    return None
+                conn.execute(
+                    "UPDATE wardrobe SET image_info=?, image_blob=? WHERE id=?",
+                    (json.dumps(info), blob_id, item_id)
+                )
+                conn.commit()
+        mimetype = info.get("mimetype") if isinstance(info, dict) else None
+        return blob_id, mimetype or "application/octet-stream"
+
+    def migrate_inline_images(self, batch_size=100):
+        """Move base64 image data of existing rows into the blob store.
+
+        Works in id order, one transaction per batch, so it can be stopped
+        and resumed. Returns the number of rows migrated.
+        """
+        migrated = 0
+        last_id = 0
+        while True:
+            with get_pool().connection() as conn:
+                rows = conn.execute(
+                    """SELECT id, image_info FROM wardrobe
+                       WHERE id > ? AND image_blob IS NULL AND image_info LIKE '%data:%'
+                       ORDER BY id LIMIT ?""",
+                    (last_id, batch_size)
+                ).fetchall()
+                if not rows:
+                    return migrated
+                for row in rows:
+                    last_id = row["id"]
+                    try:
+                        info = json.loads(row["image_info"])
+                    except Exception:
+                        continue
+                    info, blob_id = self._externalize_image(info)
+                    if blob_id:
+                        conn.execute(
+                            "UPDATE wardrobe SET image_info=?, image_blob=? WHERE id=?",
+                            (json.dumps(info), blob_id, row["id"])
+                        )
+                        migrated += 1
+                conn.commit()
+
+    def get_statistics(self, user_id):
+        """Item, favorite and per-type counts plus the wardrobe's versions.
+
+        Read from the counters the wardrobe triggers maintain (see
+        wardrobe_migrations), so the cost doesn't grow with the wardrobe.
+        ``version`` changes on every mutation, ``itemVersion`` only when
+        items are added, removed or re-analysed.
+        """
+        with get_pool().connection() as conn:
+            # One read transaction: counters and type counts from the same commit
+            conn.execute("BEGIN")
+            try:
+                totals = conn.execute(
+                    "SELECT version, item_version, total, favorites FROM wardrobe_user_stats WHERE user_id=?",
+                    (user_id,)
+                ).fetchone()
+                rows = conn.execute(
+                    "SELECT item_type, cnt FROM wardrobe_type_counts WHERE user_id=?",
+                    (user_id,)
+                ).fetchall()
+            finally:
+                conn.rollback()
 
         return {
-            "totalItems": total,
-            "favoriteCount": favorites,
-            "byType": type_counts
+            "totalItems": totals["total"] if totals else 0,
+            "favoriteCount": totals["favorites"] if totals else 0,
+            "byType": {r["item_type"]: r["cnt"] for r in rows},
+            "version": totals["version"] if totals else 0,
+            "itemVersion": totals["item_version"] if totals else 0
         }
 
+    def get_profile_attributes(self, user_id):
+        """Value counts of each analysis attribute for the user's items.
+
+        Returns ``totalItems`` plus, per attribute, ``(value, count)`` rows
+        grouped on the indexed generated columns, so SQLite counts from the
+        covering indexes. ``colors`` rows are ``(color, secondary, count)``
+        from the analysis JSON; the first color listed is an item's main one.
+        """
+        with get_pool().connection() as conn:
+            attributes = {
+                "totalItems": conn.execute(
+                    "SELECT COUNT(*) FROM wardrobe WHERE user_id=?", (user_id,)
+                ).fetchone()[0]
+            }
+            for column in PROFILE_COLUMNS:
+                attributes[column] = [tuple(row) for row in conn.execute(
+                    f"SELECT {column}, COUNT(*) FROM wardrobe WHERE user_id=? GROUP BY {column}",
+                    (user_id,)
+                )]
+            # Grouping on the whole list leaves a few distinct lists to decode
+            color_lists = conn.execute(
+                """SELECT CASE WHEN json_valid(analysis) THEN json_extract(analysis, '$.colors') END AS colors,
+                          COUNT(*)
+                   FROM wardrobe WHERE user_id=? GROUP BY colors""",
+                (user_id,)
+            ).fetchall()
+
+        attributes["colors"] = []
+        for listed, count in color_lists:
+            try:
+                colors = json.loads(listed) if isinstance(listed, str) else []
+            except ValueError:
+                colors = [listed]  # a bare string instead of a list
+            if not isinstance(colors, list):
+                colors = [colors]
+            for position, color in enumerate(c for c in colors if isinstance(c, str) and c.strip()):
+                attributes["colors"].append((color, position > 0, count))
+        return attributes
 
-wardrobe_service = WardrobeService()
+wardrobe_service = LazyService(WardrobeService)
@@ -1,6 +1,7 @@
 from .app import create_app
 
 
+# The only app built per process; `from app.app import app` returns this one
 app = create_app()
 
 
@@ -0,0 +1,35 @@
+"""
+Gunicorn settings (read by ``gunicorn -c gunicorn.conf.py``)
+The app is imported once in the master and shared copy-on-write by the
+workers. Service singletons, connection pools and background threads are
+built lazily in each worker, after the fork (see ``app.services.lazy``).
+"""
+import gc
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+loglevel = "info"
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() not in ("0", "false", "no")
+
+# Every worker schedules Gemini keys on its own, so each enforces an equal
+# share of the per-key quotas (see app.services.gemini_keys)
+os.environ.setdefault("GEMINI_KEY_PROCESSES", str(workers))
+
+# Analysis job threads start in every worker (post_fork), never in the master
+start_analysis_jobs = os.getenv("ANALYSIS_JOB_AUTOSTART", "true").lower() not in ("0", "false", "no")
+os.environ["ANALYSIS_JOB_AUTOSTART"] = "false"
+
+
+def pre_fork(server, worker):
+    # Move everything the preload created out of the collector's reach: a
+    # collection in a worker would otherwise write to (and copy) every page
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Jobs persisted before a restart resume without waiting for a client
+    if start_analysis_jobs:
+        from app.services.analysis_jobs import job_queue
+        job_queue.start()
@@ -0,0 +1,120 @@
+"""
+Throughput of /api/style/analyze/batch vs one /api/style/analyze per image
+
+Both paths run through the Flask app and the real GeminiService against a
+local stub of generateContent. The stub charges a fixed latency per
+request plus a smaller cost per image, roughly how Gemini behaves.
+
+Usage: python scripts/bench_batch_analysis.py [--images 50] [--request-ms 800] [--image-ms 60]
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Importing the app package constructs the Gemini client; no real key is needed here
+os.environ.setdefault('NODE_ENV', 'test')
+os.environ['ANALYSIS_CACHE_ENABLED'] = 'false'
+os.environ['GEMINI_KEY_RPM'] = '0'
+os.environ['PHASH_MAX_DISTANCE'] = '-1'
+
+from PIL import Image  # noqa: E402
+
+import app.services.wardrobe_service as ws  # noqa: E402
+from app import create_app  # noqa: E402
+from app.services.blob_store import blob_store  # noqa: E402
+from app.services.gemini_service import gemini_service  # noqa: E402
+
+
+class StubGemini(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    request_seconds = 0.0
+    image_seconds = 0.0
+    requests = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        images = [p for p in body["contents"][0]["parts"] if "inline_data" in p]
+        StubGemini.requests += 1
+        time.sleep(self.request_seconds + self.image_seconds * len(images))
+        if body.get("generationConfig"):
+            text = json.dumps({"items": [{"index": i, "type": "shirt"} for i in range(len(images))]})
+        else:
+            text = json.dumps({"type": "shirt"})
+        payload = json.dumps({"candidates": [{"content": {"parts": [{"text": text}]}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def photo(rnd):
+    img = Image.new("RGB", (800, 1000), tuple(rnd.randrange(256) for _ in range(3)))
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+def run(images, request_ms, image_ms, keys):
+    StubGemini.request_seconds = request_ms / 1000
+    StubGemini.image_seconds = image_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGemini)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    gemini_service.api_url = f"http://127.0.0.1:{server.server_port}/generateContent"
+    gemini_service.api_keys = [f"bench-key-{i}" for i in range(keys)]
+
+    rnd = random.Random(7)
+    photos = [photo(rnd) for _ in range(images)]
+    client = create_app().test_client()
+
+    print(f"{images} images, stub latency {request_ms:g} ms/request + {image_ms:g} ms/image, "
+          f"{keys} key(s), batch size {gemini_service.batch_size}")
+    print(f"{'path':<28}{'requests':>10}{'total':>11}{'images/s':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        ws.DB_PATH = os.path.join(tmp, "bench.sqlite3")
+        blob_store.root = os.path.join(tmp, "blobs")
+        try:
+            StubGemini.requests = 0
+            start = time.perf_counter()
+            for i, data in enumerate(photos):
+                client.post("/api/style/analyze", data={
+                    "userId": "single", "image": (io.BytesIO(data), f"{i}.jpg", "image/jpeg")
+                }, content_type="multipart/form-data")
+            elapsed = time.perf_counter() - start
+            print(f"{'one request per image':<28}{StubGemini.requests:>10}{elapsed:>10.2f}s{images / elapsed:>11.1f}")
+
+            StubGemini.requests = 0
+            start = time.perf_counter()
+            resp = client.post("/api/style/analyze/batch", data={
+                "userId": "batch",
+                "images": [(io.BytesIO(data), f"{i}.jpg", "image/jpeg") for i, data in enumerate(photos)],
+            }, content_type="multipart/form-data")
+            elapsed = time.perf_counter() - start
+            assert resp.get_json()["data"]["succeeded"] == images
+            print(f"{'batch endpoint':<28}{StubGemini.requests:>10}{elapsed:>10.2f}s{images / elapsed:>11.1f}")
+        finally:
+            ws.close_pool()
+            gemini_service.close()
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', type=int, default=50)
+    parser.add_argument('--request-ms', type=float, default=800)
+    parser.add_argument('--image-ms', type=float, default=60)
+    parser.add_argument('--keys', type=int, default=3)
+    args = parser.parse_args()
+    run(args.images, args.request_ms, args.image_ms, args.keys)
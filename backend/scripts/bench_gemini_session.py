@@ -0,0 +1,91 @@
+"""
+Per-request connections vs the pooled keep-alive Gemini session
+
+Sends the same generateContent calls through a fresh ``requests.post`` per
+call (the old behaviour) and through ``GeminiService.session`` against a
+local stub. The stub delays each new connection to stand in for the TCP and
+TLS handshakes with generativelanguage.googleapis.com.
+
+Usage: python scripts/bench_gemini_session.py [--calls 50] [--handshake-ms 60]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Importing the app package constructs the Gemini client; no real key is needed here
+os.environ.setdefault('NODE_ENV', 'test')
+
+from app.services.gemini_service import GeminiService  # noqa: E402
+
+ANSWER = json.dumps({"candidates": [{"content": {"parts": [{"text": '{"type": "shirt"}'}]}}]}).encode()
+PAYLOAD = {"contents": [{"parts": [{"text": "x" * 2000}]}]}
+
+
+class StubGemini(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; avoid Nagle/delayed-ACK stalls
+    disable_nagle_algorithm = True
+    handshake_seconds = 0.0
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        StubGemini.connections += 1
+        time.sleep(self.handshake_seconds)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(ANSWER)))
+        self.end_headers()
+        self.wfile.write(ANSWER)
+
+    def log_message(self, *args):
+        pass
+
+
+def measure(label, post, url, calls):
+    StubGemini.connections = 0
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        response = post(url, json=PAYLOAD, timeout=60)
+        response.json()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    print(f"{label:<26}{StubGemini.connections:>12}{latencies[len(latencies) // 2] * 1000:>10.1f} ms"
+          f"{latencies[int(len(latencies) * 0.95)] * 1000:>10.1f} ms")
+
+
+def run(calls, handshake_ms):
+    StubGemini.handshake_seconds = handshake_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGemini)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/generateContent?key=bench"
+    service = GeminiService()
+
+    print(f"{calls} sequential calls, simulated handshake {handshake_ms} ms")
+    print(f"{'transport':<26}{'connections':>12}{'p50':>13}{'p95':>13}")
+    try:
+        measure("requests.post per call", lambda u, **kw: requests.post(u, proxies={}, **kw), url, calls)
+        measure("pooled session", service.session.post, url, calls)
+        print(f"session stats: {service.connection_stats()}")
+    finally:
+        service.close()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=50)
+    parser.add_argument('--handshake-ms', type=float, default=60)
+    args = parser.parse_args()
+    run(args.calls, args.handshake_ms)
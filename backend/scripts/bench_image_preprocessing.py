@@ -0,0 +1,117 @@
+"""
+Bytes sent to Gemini and analysis latency with and without image preprocessing
+
+Runs the real GeminiService request path against a local stub of the
+generateContent endpoint. The stub records each request body and can
+simulate a constrained uplink so transfer time shows up in the latency.
+
+Usage: python scripts/bench_image_preprocessing.py [--images 20] [--uplink-mbps 20]
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Importing the app package constructs the Gemini client; no real key is needed here
+os.environ.setdefault('NODE_ENV', 'test')
+# Every request must reach the stub
+os.environ['ANALYSIS_CACHE_ENABLED'] = 'false'
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+from app.services.gemini_service import gemini_service  # noqa: E402
+from app.services.image_processing import ImagePreprocessor  # noqa: E402
+
+STUB_ANSWER = json.dumps({"candidates": [{"content": {"parts": [{"text": json.dumps({
+    "type": "shirt", "colors": ["blue"], "pattern": "solid", "style": "casual",
+    "fabric": "cotton", "season": "summer", "occasion": "daily"
+})}]}}]}).encode()
+
+
+class StubGemini(BaseHTTPRequestHandler):
+    body_sizes = []
+    uplink_bytes_per_sec = None
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        self.rfile.read(length)
+        StubGemini.body_sizes.append(length)
+        if self.uplink_bytes_per_sec:
+            time.sleep(length / self.uplink_bytes_per_sec)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(STUB_ANSWER)))
+        self.end_headers()
+        self.wfile.write(STUB_ANSWER)
+
+    def log_message(self, *args):
+        pass
+
+
+def phone_photo(rnd, size=(4032, 3024)):
+    """A noisy 12MP JPEG, roughly what a phone camera uploads"""
+    img = Image.effect_noise(size, 40).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x0, y0 = rnd.randrange(size[0] - 400), rnd.randrange(size[1] - 400)
+        box = [x0, y0, x0 + rnd.randrange(200, 1500), y0 + rnd.randrange(200, 1500)]
+        draw.rectangle(box, fill=tuple(rnd.randrange(256) for _ in range(3)))
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=92)
+    return buf.getvalue()
+
+
+def measure(photos, preprocessor):
+    StubGemini.body_sizes.clear()
+    latencies = []
+    for data in photos:
+        start = time.perf_counter()
+        processed = preprocessor.process(data) if preprocessor else None
+        if processed:
+            gemini_service.analyze_clothing_image(processed["data"], processed["mimeType"])
+        else:
+            gemini_service.analyze_clothing_image(data, "image/jpeg")
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "body": sum(StubGemini.body_sizes) / len(StubGemini.body_sizes),
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[int(len(latencies) * 0.95)],
+    }
+
+
+def run(images, uplink_mbps):
+    StubGemini.uplink_bytes_per_sec = uplink_mbps * 1_000_000 / 8 if uplink_mbps else None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGemini)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    gemini_service.api_url = f"http://127.0.0.1:{server.server_port}/generateContent"
+    gemini_service.api_keys = ["bench-key"]
+
+    rnd = random.Random(42)
+    photos = [phone_photo(rnd) for _ in range(images)]
+    upload = sum(map(len, photos)) / len(photos)
+    print(f"{images} synthetic 12MP photos, avg upload {upload / 1024:.0f} KiB, "
+          f"uplink {'unlimited' if not uplink_mbps else f'{uplink_mbps} Mbit/s'}")
+    print(f"{'pipeline':<22}{'request body':>16}{'p50':>12}{'p95':>12}")
+    try:
+        for label, preprocessor in (("original upload", None),
+                                    ("preprocessed 1024px", ImagePreprocessor(enabled=True))):
+            r = measure(photos, preprocessor)
+            print(f"{label:<22}{r['body'] / 1024:>12.0f} KiB{r['p50'] * 1000:>9.0f} ms{r['p95'] * 1000:>9.0f} ms")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', type=int, default=20)
+    parser.add_argument('--uplink-mbps', type=float, default=20,
+                        help='simulated upstream bandwidth to Gemini, 0 for none')
+    args = parser.parse_args()
+    run(args.images, args.uplink_mbps)
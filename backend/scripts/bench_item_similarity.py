@@ -0,0 +1,169 @@
+"""
+Matching-item latency: wardrobe prompt to Gemini vs local feature vectors
+
+"before" replays the old flow: load every item, put a summary of each in
+one prompt and wait for a stub of generateContent to score them. "after"
+is StyleAnalysisService.get_recommendations: "cold" loads the user's
+vectors from SQLite, "warm" scores against the cached matrix.
+
+Usage: python scripts/bench_item_similarity.py [--sizes 1000,5000,20000] [--gemini-ms 3000] [--repeats 50]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Importing the app package constructs the Gemini client; no real key is needed here
+os.environ.setdefault('NODE_ENV', 'test')
+os.environ['GEMINI_KEY_RPM'] = '0'
+os.environ['GEMINI_KEY_TPM'] = '0'
+os.environ['GEMINI_KEY_RPD'] = '0'
+
+import app.services.gemini_service as gs  # noqa: E402
+import app.services.wardrobe_service as ws  # noqa: E402
+from app.services.analysis_cache import AnalysisCache  # noqa: E402
+from app.services.item_similarity import similarity_index  # noqa: E402
+from app.services.style_analysis_service import style_analysis_service  # noqa: E402
+
+TYPES = ["shirt", "pants", "dress", "shoes", "jacket", "skirt", "sweater", "t-shirt", "jeans", "boots"]
+STYLES = ["casual", "casual", "formal", "sporty", "elegant"]
+SEASONS = ["summer", "winter", "spring", "fall", "all-season"]
+COLORS = ["black", "white", "navy", "red", "beige", "green", "grey", "blue"]
+PATTERNS = ["solid", "solid", "striped", "floral", "checkered"]
+
+OLD_PROMPT = """Based on this clothing item, suggest matching items from the wardrobe.
+
+Reference item:
+{item}
+
+Available wardrobe items:
+{items}
+
+Provide a JSON response with this structure:
+{{
+  "recommendations": [
+    {{
+      "itemId": "id from wardrobe",
+      "matchScore": 0-100,
+      "reason": "Why this item matches well"
+    }}
+  ]
+}}
+
+Suggest 3-5 best matching items."""
+
+ANSWER = json.dumps({"recommendations": [{"itemId": "1", "matchScore": 90, "reason": "Matches"}]})
+
+
+class StubGemini(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    seconds = 0.0
+    request_bytes = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        StubGemini.request_bytes.append(len(body))
+        time.sleep(self.seconds)
+        payload = json.dumps({"candidates": [{"content": {"parts": [{"text": ANSWER}]}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def fill(user_id, size, rnd):
+    entries = []
+    for i in range(size):
+        analysis = {
+            "type": rnd.choice(TYPES), "style": rnd.choice(STYLES), "season": rnd.choice(SEASONS),
+            "colors": rnd.sample(COLORS, rnd.choice((1, 2, 3))), "pattern": rnd.choice(PATTERNS),
+            "fabric": "cotton", "occasion": rnd.choice(("daily", "work", "party")),
+        }
+        entries.append(({"filename": f"{i}.jpg"}, analysis))
+    return [item["id"] for item in ws.wardrobe_service.add_items(user_id, entries)]
+
+
+def old_recommendations(user_id, item_id):
+    """The pre-vector flow: every item's summary in one Gemini prompt"""
+    items = ws.wardrobe_service.get_all_items(user_id)
+    target = next(item for item in items if item["id"] == item_id)
+    summary = []
+    for item in items:
+        if item["id"] != item_id:
+            analysis = gs.GeminiService._parse_analysis(item.get("analysis", {}))
+            summary.append({"id": item["id"], "type": analysis.get("type", "unknown"),
+                            "colors": analysis.get("colors", []), "style": analysis.get("style", "unknown")})
+    prompt = OLD_PROMPT.format(item=json.dumps(target["analysis"], indent=2), items=json.dumps(summary, indent=2))
+    return gs.gemini_service._generate([{"text": prompt}], "Recommendation generation failed")
+
+
+def ms(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def run(sizes, gemini_ms, repeats):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGemini)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    StubGemini.seconds = gemini_ms / 1000
+    gs.gemini_service.api_keys = ["bench-key"]
+    gs.gemini_service.api_url = f"http://127.0.0.1:{server.server_port}/generateContent"
+    rnd = random.Random(42)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        ws.DB_PATH = os.path.join(tmp, "wardrobe.sqlite3")
+        gs.analysis_cache = AnalysisCache(enabled=False)
+        for size in sizes:
+            user_id = f"user{size}"
+            ids = fill(user_id, size, rnd)
+            targets = [rnd.choice(ids) for _ in range(repeats)]
+
+            StubGemini.request_bytes = []
+            before = ms(lambda: old_recommendations(user_id, targets[0]), 3)
+            prompt_bytes = StubGemini.request_bytes[-1]
+
+            def cold():
+                similarity_index.reset()
+                style_analysis_service.get_recommendations(user_id, targets[0])
+
+            load = ms(cold, 5)
+            picks = iter(targets * 2)
+            warm = ms(lambda: style_analysis_service.get_recommendations(user_id, next(picks)), repeats)
+            matrix = similarity_index.matrix(user_id)
+            picks = iter(targets * 2)
+            score = ms(lambda: matrix.top_k(next(picks), 5), repeats)
+            rows.append((size, before, prompt_bytes, load, warm, score))
+        ws.close_pool()
+    server.shutdown()
+
+    print(f"stub Gemini latency {gemini_ms} ms; medians; top 5 matches")
+    print(f"{'items':>6}{'before':>12}{'prompt':>11}{'cold':>10}{'warm':>10}{'scoring':>11}")
+    for size, before, prompt_bytes, load, warm, score in rows:
+        print(f"{size:>6}{before:>9.1f} ms{prompt_bytes / 1024:>8.1f} KB{load:>7.1f} ms{warm:>7.2f} ms"
+              f"{score:>8.3f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default="1000,5000,20000")
+    parser.add_argument('--gemini-ms', type=float, default=3000)
+    parser.add_argument('--repeats', type=int, default=50)
+    args = parser.parse_args()
+    run([int(s) for s in args.sizes.split(",")], args.gemini_ms, args.repeats)
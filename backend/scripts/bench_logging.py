@@ -0,0 +1,107 @@
+"""
+Logging cost on request threads: print + flush vs queued JSON logging vs off
+
+Several threads (gunicorn's --threads, or the Gemini batch and hedge
+pools) each emit a few lines per simulated request, as GeminiService did
+with print. Output goes to /dev/null. For the queue, the calling side is
+timed with the writer thread paused, then the writer draining that
+backlog, then both running together until everything is written.
+
+Usage: python scripts/bench_logging.py [--threads 16] [--requests 2000] [--lines 3]
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('NODE_ENV', 'test')
+
+from app.services.logging_config import LoggingSetup, SecretMasker, logging_setup  # noqa: E402
+
+KEY = "AIzaSyExampleExampleExampleExample0000"
+
+
+def run_threads(threads, requests, emit):
+    barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        barrier.wait()
+        for i in range(requests):
+            emit(i)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in pool:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def run(threads, requests, lines):
+    # Only the setups built below write anything
+    logging_setup.stop()
+    logging.getLogger().removeHandler(logging_setup.handler)
+    devnull = open(os.devnull, "w")
+    total = threads * requests * lines
+    results = []
+
+    stdout = sys.stdout
+    sys.stdout = devnull
+
+    def printing(i):
+        for _ in range(lines):
+            print(f"⚠️ Key {KEY[:8]}...{KEY[-4:]} quota exceeded, trying next key... {i}")
+            sys.stdout.flush()
+
+    try:
+        results.append(("print + flush", run_threads(threads, requests, printing)))
+    finally:
+        sys.stdout = stdout
+
+    log = logging.getLogger("bench.logging")
+    setup = LoggingSetup()
+    root = logging.getLogger()
+
+    def logging_calls(i):
+        for _ in range(lines):
+            log.info("Gemini key over quota, trying the next one", extra={"key": KEY[-4:], "n": i})
+
+    for name, level in (("queued JSON", "INFO"), ("logging off", "WARNING")):
+        # Room for every record, so none is dropped and skipped
+        setup.configure(level=level, levels="", fmt="json", stream=devnull, masker=SecretMasker([KEY]),
+                        queue_size=total)
+        # Writer paused: the request threads' share on its own
+        setup.stop()
+        results.append((name, run_threads(threads, requests, logging_calls)))
+        if name == "queued JSON":
+            drain_start = time.perf_counter()
+            setup.start()
+            setup.stop()
+            results.append(("  writer draining it", time.perf_counter() - drain_start))
+            # Both at once, until everything is written
+            setup.start()
+            start = time.perf_counter()
+            run_threads(threads, requests, logging_calls)
+            setup.stop()
+            results.append(("  concurrently, to the end", time.perf_counter() - start))
+        root.removeHandler(setup.handler)
+    devnull.close()
+
+    print(f"{threads} threads x {requests} requests x {lines} lines = {total} records")
+    print(f"{'':28}{'total':>10}{'records/s':>12}{'us/record':>11}")
+    for name, elapsed in results:
+        print(f"{name:28}{elapsed * 1000:>7.0f} ms{total / elapsed:>12,.0f}{elapsed / total * 1e6:>11.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--lines', type=int, default=3)
+    args = parser.parse_args()
+    run(args.threads, args.requests, args.lines)
@@ -0,0 +1,107 @@
+"""
+Outfit generator latency: compatibility matrix upkeep and beam search
+
+For each wardrobe size: building the user's matrix from scratch, updating
+it after one item is added or deleted (only that row and column are
+scored), and generating outfits from the cached matrix under a few
+weather/occasion requests.
+
+Usage: python scripts/bench_outfits.py [--sizes 250,1000,3000] [--repeats 20] [--beam-width 50]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Importing the app package constructs the Gemini client; no real key is needed here
+os.environ.setdefault('NODE_ENV', 'test')
+
+import app.services.wardrobe_service as ws  # noqa: E402
+from app.services.outfit_service import CompatibilityIndex, OutfitGenerator, OutfitService  # noqa: E402
+
+TYPES = ["shirt", "t-shirt", "sweater", "blouse", "pants", "jeans", "skirt", "shorts", "sneakers", "boots",
+         "loafers", "jacket", "coat", "dress", "bag"]
+STYLES = ["casual", "casual", "formal", "sporty", "elegant"]
+SEASONS = ["summer", "winter", "spring", "fall", "all-season"]
+COLORS = ["black", "white", "navy", "red", "beige", "green", "grey", "blue"]
+PATTERNS = ["solid", "solid", "striped", "floral", "checkered"]
+REQUESTS = [
+    {"temperature": 28},
+    {"temperature": 8, "weather": "rain"},
+    {"temperature": 18, "occasion": "work"},
+    {},
+]
+
+
+def analysis(rnd):
+    return {
+        "type": rnd.choice(TYPES), "style": rnd.choice(STYLES), "season": rnd.choice(SEASONS),
+        "colors": rnd.sample(COLORS, rnd.choice((1, 2))), "pattern": rnd.choice(PATTERNS),
+        "occasion": rnd.choice(("daily", "work", "party")),
+    }
+
+
+def ms(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def run(sizes, repeats, beam_width):
+    rnd = random.Random(7)
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        ws.DB_PATH = os.path.join(tmp, "wardrobe.sqlite3")
+        for size in sizes:
+            user_id = f"user{size}"
+            ws.wardrobe_service.add_items(user_id, [({}, analysis(rnd)) for _ in range(size)])
+            service = OutfitService(CompatibilityIndex(max_items=max(sizes)), OutfitGenerator(beam_width))
+
+            def cold():
+                service.index.reset()
+                service.index.get(user_id)
+
+            build = ms(cold, max(1, repeats // 4))
+            matrix_bytes = service.index.stats()["bytes"]
+
+            def add_one():
+                item = ws.wardrobe_service.add_item(user_id, {}, analysis(rnd))
+                start = time.perf_counter()
+                service.index.get(user_id)
+                elapsed = (time.perf_counter() - start) * 1000
+                ws.wardrobe_service.delete_item(user_id, item["id"])
+                service.index.get(user_id)
+                return elapsed
+
+            updates = sorted(add_one() for _ in range(repeats))
+            update = updates[len(updates) // 2]
+
+            requests = iter(REQUESTS * repeats)
+            features, matrix = service.index.get(user_id)
+            search = ms(lambda: service.generator.generate(features, matrix, limit=3, **next(requests)), repeats)
+            requests = iter(REQUESTS * repeats)
+            suggest = ms(lambda: service.suggest_outfits(user_id, limit=3, **next(requests)), repeats)
+            rows.append((size, build, update, search, suggest, matrix_bytes))
+        ws.close_pool()
+
+    print(f"beam width {beam_width}; medians")
+    print(f"{'items':>6}{'build':>11}{'add 1':>10}{'search':>10}{'request':>11}{'matrix':>11}")
+    for size, build, update, search, suggest, matrix_bytes in rows:
+        print(f"{size:>6}{build:>8.1f} ms{update:>7.2f} ms{search:>7.2f} ms{suggest:>8.2f} ms"
+              f"{matrix_bytes / 1024:>8.0f} KB")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default="250,1000,3000")
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--beam-width', type=int, default=50)
+    args = parser.parse_args()
+    run([int(s) for s in args.sizes.split(",")], args.repeats, args.beam_width)
@@ -0,0 +1,108 @@
+"""
+Accuracy and latency of perceptual near-duplicate detection on synthetic images
+
+Each synthetic garment is transformed (resize, JPEG recompression, crop,
+brightness, combinations). True positives are transformed copies matched to
+their original; false positives are distinct garments within the threshold.
+
+Usage: python scripts/bench_phash.py [--images 200] [--index-size 10000]
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Importing the app package constructs the Gemini client; no real key is needed here
+os.environ.setdefault('NODE_ENV', 'test')
+
+from PIL import Image, ImageDraw, ImageEnhance  # noqa: E402
+
+from app.services.image_hashing import BKTree, dhash, hamming  # noqa: E402
+
+THRESHOLDS = (4, 6, 8, 10, 12)
+
+
+def garment(rnd, size=(600, 800)):
+    img = Image.new("RGB", size, tuple(rnd.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(8):
+        x0, y0 = rnd.randrange(size[0] - 60), rnd.randrange(size[1] - 60)
+        box = [x0, y0, x0 + rnd.randrange(60, 300), y0 + rnd.randrange(60, 300)]
+        fill = tuple(rnd.randrange(256) for _ in range(3))
+        (draw.ellipse if rnd.random() < 0.5 else draw.rectangle)(box, fill=fill)
+    return img
+
+
+def jpeg(img, quality):
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def crop(img, fraction):
+    w, h = img.size
+    dx, dy = int(w * fraction), int(h * fraction)
+    return img.crop((dx, dy, w - dx, h - dy))
+
+
+TRANSFORMS = {
+    "resize 50%": lambda img: jpeg(img.resize((img.width // 2, img.height // 2)), 90),
+    "jpeg q=30": lambda img: jpeg(img, 30),
+    "crop 5%": lambda img: jpeg(crop(img, 0.05), 90),
+    "brightness +15%": lambda img: jpeg(ImageEnhance.Brightness(img).enhance(1.15), 90),
+    "crop+resize+q50": lambda img: jpeg(crop(img, 0.03).resize((400, 530)), 50),
+}
+
+
+def run(images, index_size):
+    rnd = random.Random(1234)
+    originals = [garment(rnd) for _ in range(images)]
+    original_hashes = [dhash(jpeg(img, 95)) for img in originals]
+
+    distances = {name: [] for name in TRANSFORMS}
+    hash_times = []
+    for img, base in zip(originals, original_hashes):
+        for name, transform in TRANSFORMS.items():
+            data = transform(img)
+            start = time.perf_counter()
+            value = dhash(data)
+            hash_times.append(time.perf_counter() - start)
+            distances[name].append(hamming(base, value))
+
+    unrelated = [hamming(a, b) for i, a in enumerate(original_hashes) for b in original_hashes[i + 1:]]
+
+    print(f"{images} synthetic garments, {len(unrelated)} distinct pairs")
+    print(f"{'threshold':<12}" + "".join(f"{name:>18}" for name in TRANSFORMS) + f"{'false pos':>12}")
+    for t in THRESHOLDS:
+        row = "".join(f"{sum(d <= t for d in distances[name]) / images:>18.1%}" for name in TRANSFORMS)
+        print(f"<= {t:<9}{row}{sum(d <= t for d in unrelated) / len(unrelated):>12.2%}")
+
+    hash_times.sort()
+    print(f"\ndhash latency (600x800 JPEG): p50 {hash_times[len(hash_times) // 2] * 1000:.2f} ms, "
+          f"p95 {hash_times[int(len(hash_times) * 0.95)] * 1000:.2f} ms")
+
+    values = [rnd.getrandbits(64) for _ in range(index_size)]
+    tree = BKTree()
+    for i, v in enumerate(values):
+        tree.add(v, i)
+    queries = [v ^ (1 << rnd.randrange(64)) for v in rnd.sample(values, 200)]
+    start = time.perf_counter()
+    for q in queries:
+        tree.search(q, 6)
+    tree_ms = (time.perf_counter() - start) / len(queries) * 1000
+    start = time.perf_counter()
+    for q in queries:
+        [(hamming(q, v), i) for i, v in enumerate(values) if hamming(q, v) <= 6]
+    linear_ms = (time.perf_counter() - start) / len(queries) * 1000
+    print(f"lookup in {index_size} hashes (radius 6): BK-tree {tree_ms:.3f} ms, linear scan {linear_ms:.3f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', type=int, default=200)
+    parser.add_argument('--index-size', type=int, default=10000)
+    args = parser.parse_args()
+    run(args.images, args.index_size)
@@ -0,0 +1,68 @@
+"""
+Shopping link latency: memoized query builder against a cold cache
+
+Links for a batch of analyses drawn from a small attribute space, as a
+wardrobe page with ``shopping=true`` or a batch request would ask for them,
+with the link cache cleared before every batch and kept warm.
+
+Usage: python scripts/bench_shopping.py [--items 200] [--repeats 50]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('NODE_ENV', 'test')
+
+from app.services.shopping_service import ShoppingService  # noqa: E402
+
+TYPES = ["shirt", "t-shirt", "sweater", "jeans", "skirt", "sneakers", "coat", "dress"]
+STYLES = ["casual", "formal", "sporty", "elegant"]
+COLORS = ["black", "white", "navy", "red", "beige"]
+
+
+def analyses(count, rnd):
+    # Stored analyses come back as JSON text when read raw
+    return [json.dumps({"type": rnd.choice(TYPES), "style": rnd.choice(STYLES), "colors": [rnd.choice(COLORS)]})
+            for _ in range(count)]
+
+
+def ms(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def run(items, repeats):
+    batch = analyses(items, random.Random(7))
+    service = ShoppingService()
+
+    def cold():
+        service.clear_cache()
+        for analysis in batch:
+            service.generate_shopping_links(analysis)
+
+    def warm():
+        for analysis in batch:
+            service.generate_shopping_links(analysis)
+
+    cold_ms = ms(cold, repeats)
+    warm()
+    warm_ms = ms(warm, repeats)
+    print(f"{items} analyses, {len(service.registry)} stores; medians")
+    print(f"cold cache {cold_ms:.2f} ms  warm cache {warm_ms:.2f} ms  ({service.stats()['size']} distinct queries)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--items', type=int, default=200)
+    parser.add_argument('--repeats', type=int, default=50)
+    args = parser.parse_args()
+    run(args.items, args.repeats)
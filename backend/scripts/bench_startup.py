@@ -0,0 +1,128 @@
+"""
+Worker boot cost: import and first-request latency per worker
+
+Without preload every gunicorn worker imports the app itself. With
+``preload_app`` the master imports it once and forks, and each worker only
+pays for the services its first request builds. Both are reproduced here
+without gunicorn: fresh interpreters for the former, os.fork() from one
+preloaded parent for the latter (with and without gc.freeze()). Each worker
+serves GET /api/health and a wardrobe listing through the test client;
+private dirty memory is read from /proc after the first request.
+
+Usage: python scripts/bench_startup.py [--workers 4]
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BACKEND)
+os.environ.setdefault('NODE_ENV', 'test')
+os.environ.setdefault('GEMINI_API_KEY', 'bench-key')
+
+PATHS = ("/api/health", "/api/wardrobe/?userId=bench")
+
+
+def private_dirty_kb():
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Private_Dirty:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def serve_first_requests(wsgi_app, db_path):
+    """Seconds to serve PATHS once, then once more, from a fresh worker"""
+    import app.services.wardrobe_service as ws
+    ws.DB_PATH = db_path
+    client = wsgi_app.test_client()
+    start = time.perf_counter()
+    for path in PATHS:
+        assert client.get(path).status_code == 200, path
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    for path in PATHS:
+        client.get(path)
+    return first, time.perf_counter() - start
+
+
+def child(db_path):
+    """One non-preloaded worker: import the app, then serve"""
+    start = time.perf_counter()
+    import app.wsgi
+    imported = time.perf_counter() - start
+    first, warm = serve_first_requests(app.wsgi.app, db_path)
+    print(json.dumps({"import": imported, "first": first, "warm": warm, "dirty": private_dirty_kb()}))
+
+
+def cold_workers(workers, db_path):
+    results = []
+    for _ in range(workers):
+        out = subprocess.run([sys.executable, __file__, "--child", db_path], cwd=BACKEND,
+                             capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    return results
+
+
+def forked_workers(workers, db_path, wsgi_app, freeze):
+    if freeze:
+        gc.freeze()
+    results = []
+    for _ in range(workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            try:
+                first, warm = serve_first_requests(wsgi_app, db_path)
+                result = {"import": 0.0, "first": first, "warm": warm, "dirty": private_dirty_kb()}
+                os.write(write_fd, json.dumps(result).encode())
+            finally:
+                os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as f:
+            results.append(json.loads(f.read()))
+        os.waitpid(pid, 0)
+    if freeze:
+        gc.unfreeze()
+    return results
+
+
+def run(workers):
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bench_startup_"), "wardrobe.sqlite3")
+    rows = [("no preload", cold_workers(workers, db_path))]
+
+    start = time.perf_counter()
+    import app.wsgi
+    preload = time.perf_counter() - start
+    rows.append(("preload", forked_workers(workers, db_path, app.wsgi.app, freeze=False)))
+    rows.append(("preload + gc.freeze", forked_workers(workers, db_path, app.wsgi.app, freeze=True)))
+
+    print(f"{workers} workers; preloading the app in the master took {preload * 1000:.0f} ms")
+    print(f"{'median per worker':24}{'import':>10}{'1st req':>10}{'warm':>10}{'ready':>10}{'dirty':>10}")
+    for name, results in rows:
+        med = {key: statistics.median(r[key] for r in results) for key in ("import", "first", "warm")}
+        dirty = [r["dirty"] for r in results if r["dirty"] is not None]
+        dirty = f"{statistics.median(dirty) / 1024:.1f} MB" if dirty else "n/a"
+        print(f"{name:24}{med['import'] * 1000:>7.0f} ms{med['first'] * 1000:>7.1f} ms"
+              f"{med['warm'] * 1000:>7.1f} ms{(med['import'] + med['first']) * 1000:>7.0f} ms{dirty:>10}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--child', metavar='DB_PATH', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child)
+    else:
+        run(args.workers)
@@ -0,0 +1,162 @@
+"""
+Style profile latency: whole wardrobe sent to Gemini vs the local engine
+
+"before" replays the old flow: load every item, send a per-item summary to
+a stub of generateContent and wait for the whole profile. "after" is
+StyleAnalysisService.generate_style_profile: local aggregates, then a
+narrative request that is cached, so repeat views never reach Gemini.
+
+Usage: python scripts/bench_style_profile.py [--sizes 50,500,5000] [--gemini-ms 2500] [--repeats 20]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Importing the app package constructs the Gemini client; no real key is needed here
+os.environ.setdefault('NODE_ENV', 'test')
+os.environ['GEMINI_KEY_RPM'] = '0'
+os.environ['GEMINI_KEY_TPM'] = '0'
+os.environ['GEMINI_KEY_RPD'] = '0'
+
+import app.services.gemini_service as gs  # noqa: E402
+import app.services.wardrobe_service as ws  # noqa: E402
+from app.services.analysis_cache import AnalysisCache  # noqa: E402
+from app.services.style_analysis_service import style_analysis_service  # noqa: E402
+from app.services.style_profile import style_profile_engine  # noqa: E402
+
+TYPES = ["shirt", "pants", "dress", "shoes", "jacket", "skirt", "sweater", "t-shirt", "jeans", "boots"]
+STYLES = ["casual", "casual", "formal", "sporty", "elegant"]
+SEASONS = ["summer", "winter", "spring", "fall", "all-season"]
+COLORS = ["black", "white", "navy", "red", "beige", "green", "grey", "blue"]
+PATTERNS = ["solid", "solid", "striped", "floral", "checkered"]
+
+OLD_PROMPT = """Based on this wardrobe collection, create a comprehensive style profile.
+
+Wardrobe items: {items}
+
+Provide a JSON response with this structure:
+{{
+  "dominantStyle": "casual/formal/sporty/elegant/etc",
+  "colorPalette": ["color1", "color2", "color3"],
+  "stylePersonality": "A 2-3 sentence description of their style",
+  "recommendations": ["Specific recommendation 1", "Specific recommendation 2", "Specific recommendation 3"],
+  "missingPieces": ["item type 1", "item type 2"]
+}}
+
+Be specific and personalized based on the actual wardrobe items."""
+
+ANSWER = json.dumps({
+    "dominantStyle": "casual", "colorPalette": ["navy", "white"], "missingPieces": ["blazer"],
+    "stylePersonality": "Relaxed and practical.", "recommendations": ["Add a blazer"],
+})
+
+
+class StubGemini(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    seconds = 0.0
+    requests = 0
+    request_bytes = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        StubGemini.requests += 1
+        StubGemini.request_bytes.append(len(body))
+        time.sleep(self.seconds)
+        payload = json.dumps({"candidates": [{"content": {"parts": [{"text": ANSWER}]}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def fill(user_id, size, rnd):
+    entries = []
+    for i in range(size):
+        analysis = {
+            "type": rnd.choice(TYPES), "style": rnd.choice(STYLES), "season": rnd.choice(SEASONS),
+            "colors": rnd.sample(COLORS, rnd.choice((1, 2, 3))), "pattern": rnd.choice(PATTERNS),
+            "fabric": "cotton", "occasion": rnd.choice(("daily", "work", "party")),
+        }
+        entries.append(({"filename": f"{i}.jpg", "size": 123456, "mimetype": "image/jpeg"}, analysis))
+    ws.wardrobe_service.add_items(user_id, entries)
+
+
+def old_profile(user_id):
+    """The pre-engine flow: every item's summary in one Gemini prompt"""
+    items = ws.wardrobe_service.get_all_items(user_id)
+    summary = []
+    for item in items:
+        analysis = gs.GeminiService._parse_analysis(item.get("analysis", {}))
+        summary.append({"type": analysis.get("type", "unknown"), "colors": analysis.get("colors", []),
+                        "style": analysis.get("style", "unknown"), "pattern": analysis.get("pattern", "unknown")})
+    prompt = OLD_PROMPT.format(items=json.dumps(summary, indent=2))
+    return gs.gemini_service._generate([{"text": prompt}], "Profile generation failed")
+
+
+def ms(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def run(sizes, gemini_ms, repeats):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGemini)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    StubGemini.seconds = gemini_ms / 1000
+    gs.gemini_service.api_keys = ["bench-key"]
+    gs.gemini_service.api_url = f"http://127.0.0.1:{server.server_port}/generateContent"
+    rnd = random.Random(42)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        ws.DB_PATH = os.path.join(tmp, "wardrobe.sqlite3")
+        gs.analysis_cache = AnalysisCache(path=os.path.join(tmp, "cache.sqlite3"))
+        for size in sizes:
+            user_id = f"user{size}"
+            fill(user_id, size, rnd)
+
+            StubGemini.request_bytes = []
+            before = ms(lambda: old_profile(user_id), max(1, repeats // 10))
+            before_bytes = StubGemini.request_bytes[-1]
+
+            local = ms(lambda: style_profile_engine.build(ws.wardrobe_service.get_profile_attributes(user_id)), repeats)
+            StubGemini.requests, StubGemini.request_bytes = 0, []
+            first = ms(lambda: style_analysis_service.generate_style_profile(user_id), 1)
+            after_bytes = StubGemini.request_bytes[-1]
+            cached = ms(lambda: style_analysis_service.generate_style_profile(user_id), repeats)
+            rows.append((size, before, before_bytes, local, first, cached, after_bytes, StubGemini.requests,
+                         1 + repeats))
+        ws.close_pool()
+    server.shutdown()
+
+    print(f"stub Gemini latency {gemini_ms} ms; medians")
+    print(f"{'items':>6}{'before':>12}{'prompt':>10}{'local':>10}{'enriched':>12}{'cached':>10}{'prompt':>10}"
+          f"{'Gemini calls':>14}")
+    for size, before, before_bytes, local, first, cached, after_bytes, calls, views in rows:
+        print(f"{size:>6}{before:>9.1f} ms{before_bytes / 1024:>7.1f} KB{local:>7.2f} ms{first:>9.1f} ms"
+              f"{cached:>7.2f} ms{after_bytes / 1024:>7.1f} KB{calls:>8} / {views}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default="50,500,5000")
+    parser.add_argument('--gemini-ms', type=float, default=2500)
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+    run([int(s) for s in args.sizes.split(",")], args.gemini_ms, args.repeats)
@@ -0,0 +1,177 @@
+"""
+Peak server memory for concurrent large uploads to /api/style/analyze
+
+The app runs in a child process under tracemalloc, served by a threaded
+werkzeug server; a local stub stands in for Gemini. Reports the peak
+Python heap and the RSS growth while ``--concurrency`` uploads of a ~9.5MB
+JPEG are in flight, with preprocessing on (the default) and off (the raw
+upload is what goes to Gemini).
+
+Usage: python scripts/bench_upload_memory.py [--concurrency 8] [--rounds 2]
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+MB = 1024 * 1024
+
+
+class StubGemini(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    received = 0
+
+    def do_POST(self):
+        length = self.headers.get("Content-Length")
+        if length is not None:
+            remaining = int(length)
+            while remaining:
+                remaining -= len(self.rfile.read(min(remaining, 1 << 16)))
+            StubGemini.received += int(length)
+        else:
+            # Chunked transfer encoding
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                self.rfile.read(size + 2)
+                StubGemini.received += size
+                if size == 0:
+                    break
+        payload = json.dumps({"candidates": [{"content": {"parts": [{"text": '{"type": "shirt"}'}]}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(conn, env, gemini_url):
+    """Child process: run the app and answer reset/report/stop over ``conn``"""
+    os.environ.update(env)
+    sys.path.insert(0, BACKEND)
+    # Keep the app's debug prints out of the results table
+    sys.stdout = open(os.devnull, "w")
+    import logging
+    import tracemalloc
+    tracemalloc.start()
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    from werkzeug.serving import make_server
+
+    import app.services.wardrobe_service as ws
+    from app import create_app
+    from app.services.gemini_service import gemini_service
+
+    ws.DB_PATH = os.environ["BENCH_DB_PATH"]
+    gemini_service.api_url = gemini_url
+    gemini_service.api_keys = ["bench-key"]
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    conn.send(server.server_port)
+    rss_mark = 0
+    while True:
+        command = conn.recv()
+        if command == "reset":
+            tracemalloc.reset_peak()
+            rss_mark = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            conn.send(None)
+        elif command == "report":
+            current, peak = tracemalloc.get_traced_memory()
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            conn.send({"peak": peak, "current": current, "rss_growth": (rss - rss_mark) * 1024})
+        else:
+            server.shutdown()
+            return
+
+
+def big_jpeg(limit=int(9.5 * MB)):
+    from PIL import Image
+    rnd = random.Random(3)
+    side = 2850
+    while True:
+        img = Image.frombytes("RGB", (side, side), rnd.randbytes(side * side * 3))
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=95)
+        if buf.tell() <= limit:
+            return buf.getvalue()
+        side -= 100
+
+
+def measure(label, data, concurrency, rounds, env, gemini_url):
+    ctx = multiprocessing.get_context("spawn")
+    parent, child = ctx.Pipe()
+    proc = ctx.Process(target=serve, args=(child, env, gemini_url))
+    proc.start()
+    port = parent.recv()
+    url = f"http://127.0.0.1:{port}/api/style/analyze"
+
+    def upload(i):
+        resp = requests.post(url, data={"userId": f"user{i}"},
+                             files={"image": ("big.jpg", data, "image/jpeg")}, timeout=120)
+        assert resp.status_code == 200, resp.text[:200]
+
+    upload(-1)  # warm-up: imports, DB schema, connection pools
+    parent.send("reset")
+    parent.recv()
+    StubGemini.received = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        threads = [threading.Thread(target=upload, args=(i,)) for i in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    elapsed = time.perf_counter() - start
+    parent.send("report")
+    stats = parent.recv()
+    parent.send("stop")
+    proc.join()
+    sent = StubGemini.received / (concurrency * rounds)
+    print(f"{label:<22}{stats['peak'] / MB:>10.1f} MB{stats['peak'] / concurrency / MB:>12.1f} MB"
+          f"{stats['rss_growth'] / MB:>12.1f} MB{sent / MB:>12.2f} MB{elapsed:>9.1f}s")
+
+
+def run(concurrency, rounds):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGemini)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    gemini_url = f"http://127.0.0.1:{server.server_port}/generateContent"
+    data = big_jpeg()
+
+    print(f"{concurrency} concurrent uploads x {rounds} rounds, {len(data) / MB:.1f} MB JPEG each")
+    print(f"{'mode':<22}{'heap peak':>13}{'per upload':>15}{'RSS growth':>15}{'to Gemini':>15}{'time':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        base = {
+            "NODE_ENV": "test",
+            "WARDROBE_BLOB_DIR": os.path.join(tmp, "blobs"),
+            "ANALYSIS_CACHE_ENABLED": "false",
+            "ANALYSIS_JOBS_PATH": os.path.join(tmp, "jobs.sqlite3"),
+            "PHASH_MAX_DISTANCE": "-1",
+            "GEMINI_KEY_RPM": "0",
+            "GEMINI_HTTP_POOL_SIZE": str(concurrency),
+        }
+        for label, extra in (("preprocessed", {"IMAGE_PREPROCESS_ENABLED": "true"}),
+                             ("raw to Gemini", {"IMAGE_PREPROCESS_ENABLED": "false"})):
+            env = dict(base, BENCH_DB_PATH=os.path.join(tmp, f"{label[:3]}.sqlite3"), **extra)
+            measure(label, data, concurrency, rounds, env, gemini_url)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=2)
+    args = parser.parse_args()
+    run(args.concurrency, args.rounds)
@@ -0,0 +1,82 @@
+"""
+Benchmark WardrobeService throughput with per-request connections vs the pool
+
+Usage: python scripts/bench_wardrobe_db.py [--ops 2000] [--items 50]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Importing the app package constructs the Gemini client; no real key is needed here
+os.environ.setdefault('NODE_ENV', 'test')
+
+import app.services.wardrobe_service as ws  # noqa: E402
+
+
+class PerRequestConnections:
+    """Reproduces the old get_db(): connect + CREATE TABLE + commit + close per call"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    @contextmanager
+    def connection(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        ws.ensure_schema(conn)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+def ops_per_sec(fn, ops):
+    start = time.perf_counter()
+    for _ in range(ops):
+        fn()
+    return ops / (time.perf_counter() - start)
+
+
+def run(ops, items):
+    service = ws.WardrobeService()
+    image_info = {"filename": "bench.jpg", "size": 1024, "mimetype": "image/jpeg"}
+    analysis = {"type": "shirt", "colors": ["blue"], "style": "casual"}
+    results = {}
+
+    for label, factory in (("per-request", PerRequestConnections), ("pooled", None)):
+        with tempfile.TemporaryDirectory() as tmp:
+            ws.DB_PATH = os.path.join(tmp, "bench.sqlite3")
+            ws.close_pool()
+            pool = factory(ws.DB_PATH) if factory else ws.get_pool()
+            original_get_pool = ws.get_pool
+            ws.get_pool = lambda: pool
+            try:
+                for _ in range(items):
+                    service.add_item("bench_user", image_info, analysis)
+                results[label] = {
+                    "add_item": ops_per_sec(lambda: service.add_item("bench_user_add", image_info, analysis), ops),
+                    "get_all_items": ops_per_sec(lambda: service.get_all_items("bench_user"), ops),
+                }
+            finally:
+                ws.get_pool = original_get_pool
+                ws.close_pool()
+
+    print(f"{'operation':<16}{'per-request':>16}{'pooled':>16}{'speedup':>10}")
+    for op in ("get_all_items", "add_item"):
+        before = results["per-request"][op]
+        after = results["pooled"][op]
+        print(f"{op:<16}{before:>12.0f} o/s{after:>12.0f} o/s{after / before:>9.1f}x")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--ops', type=int, default=2000)
+    parser.add_argument('--items', type=int, default=50, help='items in the listed wardrobe')
+    args = parser.parse_args()
+    run(args.ops, args.items)
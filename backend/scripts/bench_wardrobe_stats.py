@@ -0,0 +1,117 @@
+"""
+Benchmark statistics and type filtering before/after the attribute-column migration
+
+Builds a legacy (unversioned) wardrobe database, measures the old Python-side
+JSON parsing, runs the migrations, then measures the SQL aggregate path.
+
+Usage: python scripts/bench_wardrobe_stats.py [--rows 100000] [--users 1000] [--samples 200]
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Importing the app package constructs the Gemini client; no real key is needed here
+os.environ.setdefault('NODE_ENV', 'test')
+
+import app.services.wardrobe_service as ws  # noqa: E402
+from app.services.wardrobe_migrations import run_migrations  # noqa: E402
+
+TYPES = ["shirt", "pants", "dress", "shoes", "jacket", "skirt", "sweater", "accessory"]
+STYLES = ["casual", "formal", "sporty", "elegant"]
+SEASONS = ["summer", "winter", "spring", "fall", "all-season"]
+COLORS = ["black", "white", "navy", "red", "beige", "green", "grey"]
+
+
+def build_legacy_db(path, rows, users):
+    conn = sqlite3.connect(path)
+    conn.execute("""
+    CREATE TABLE wardrobe (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        image_info TEXT,
+        analysis TEXT,
+        favorite INTEGER DEFAULT 0,
+        added_at TEXT
+    )""")
+    rnd = random.Random(42)
+
+    def make(i):
+        analysis = {
+            "type": rnd.choice(TYPES), "style": rnd.choice(STYLES), "season": rnd.choice(SEASONS),
+            "colors": rnd.sample(COLORS, 2), "pattern": "solid", "fabric": "cotton", "occasion": "daily",
+        }
+        return (f"user{i % users}", json.dumps({"filename": f"{i}.jpg"}), json.dumps(analysis),
+                int(rnd.random() < 0.2), f"2024-01-01T00:00:{i:09d}")
+
+    conn.executemany(
+        "INSERT INTO wardrobe (user_id, image_info, analysis, favorite, added_at) VALUES (?, ?, ?, ?, ?)",
+        (make(i) for i in range(rows))
+    )
+    conn.commit()
+    return conn
+
+
+def legacy_statistics(conn, user_id):
+    """The pre-migration get_statistics: COUNTs plus json.loads of every analysis"""
+    conn.execute("SELECT COUNT(*) FROM wardrobe WHERE user_id=?", (user_id,)).fetchone()
+    conn.execute("SELECT COUNT(*) FROM wardrobe WHERE user_id=? AND favorite=1", (user_id,)).fetchone()
+    counts = {}
+    for (analysis,) in conn.execute("SELECT analysis FROM wardrobe WHERE user_id=?", (user_id,)):
+        t = json.loads(analysis).get("type") or "unknown"
+        counts[t] = counts.get(t, 0) + 1
+    return counts
+
+
+def legacy_type_filter(conn, user_id, item_type):
+    rows = conn.execute("SELECT * FROM wardrobe WHERE user_id=?", (user_id,)).fetchall()
+    return [r for r in rows if json.loads(r[3]).get("type") == item_type]
+
+
+def timed(fn, users):
+    start = time.perf_counter()
+    for u in users:
+        fn(u)
+    return (time.perf_counter() - start) / len(users) * 1000
+
+
+def run(rows, users, samples):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "stats.sqlite3")
+        conn = build_legacy_db(path, rows, users)
+        sample = [f"user{u}" for u in random.Random(7).sample(range(users), min(samples, users))]
+
+        before_stats = timed(lambda u: legacy_statistics(conn, u), sample)
+        before_filter = timed(lambda u: legacy_type_filter(conn, u, "shirt"), sample)
+
+        start = time.perf_counter()
+        run_migrations(conn)
+        migration_s = time.perf_counter() - start
+        conn.close()
+
+        ws.DB_PATH = path
+        service = ws.WardrobeService()
+        after_stats = timed(service.get_statistics, sample)
+        after_filter = timed(lambda u: service.list_items(u, item_type="shirt", fields=["analysis"]), sample)
+        ws.close_pool()
+
+    print(f"{rows} rows, {users} users, {len(sample)} sampled users")
+    print(f"migration: {migration_s:.2f}s")
+    print(f"{'operation':<20}{'before':>12}{'after':>12}{'speedup':>10}")
+    for label, before, after in (("get_statistics", before_stats, after_stats),
+                                 ("filter type=shirt", before_filter, after_filter)):
+        print(f"{label:<20}{before:>9.3f} ms{after:>9.3f} ms{before / after:>9.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--samples', type=int, default=200)
+    args = parser.parse_args()
+    run(args.rows, args.users, args.samples)
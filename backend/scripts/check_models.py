@@ -15,10 +15,11 @@ load_dotenv()
 api_key = os.getenv('GEMINI_API_KEY')
 
 # List all available models
-url = f'https://generativelanguage.googleapis.com/v1beta/models?key={api_key}'
+# The key goes in a header so that error messages (which include the URL) don't print it
+url = 'https://generativelanguage.googleapis.com/v1beta/models'
 
 try:
-    response = requests.get(url, verify=False, timeout=30)
+    response = requests.get(url, headers={'x-goog-api-key': api_key}, verify=False, timeout=30)
     
     if response.status_code == 200:
         data = response.json()
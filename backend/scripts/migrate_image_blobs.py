@@ -0,0 +1,41 @@
+"""
+Move inline base64 images of existing wardrobe rows into the blob store
+
+With --sweep, also delete blobs nothing refers to any more: uploads whose
+analysis or insert failed, and their thumbnails. Blobs written in the last
+--min-age-hours are kept, as their requests may still be running.
+
+Usage: python scripts/migrate_image_blobs.py [--batch-size 100] [--sweep [--min-age-hours 24]]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Importing the app package constructs the Gemini client; no real key is needed here
+os.environ.setdefault('NODE_ENV', 'test')
+
+from app.services.analysis_jobs import job_queue  # noqa: E402
+from app.services.blob_store import blob_store  # noqa: E402
+from app.services.wardrobe_service import DB_PATH, wardrobe_service  # noqa: E402
+
+
+def sweep(min_age_hours):
+    """Delete unreferenced blobs older than ``min_age_hours``; returns how many"""
+    # Queued jobs point at uploads that have no wardrobe row yet
+    referenced = wardrobe_service.referenced_blobs() | job_queue.referenced_blobs()
+    return blob_store.sweep(referenced, min_age=min_age_hours * 3600)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--sweep', action='store_true', help='delete blobs no row or pending job refers to')
+    parser.add_argument('--min-age-hours', type=float, default=24)
+    args = parser.parse_args()
+    print(f"Migrating inline images in {DB_PATH}")
+    migrated = wardrobe_service.migrate_inline_images(batch_size=args.batch_size)
+    print(f"✅ Moved {migrated} image(s) to the blob store")
+    if args.sweep:
+        removed = sweep(args.min_age_hours)
+        print(f"✅ Deleted {removed} unreferenced blob(s) from {blob_store.root}")
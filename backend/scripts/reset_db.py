@@ -1,21 +1,16 @@
 import os
 import sqlite3
+import sys
 from pathlib import Path
 
-HERE = Path(__file__).resolve().parents[1] / 'app' / 'db'
-DB_PATH = HERE / 'wardrobe.sqlite3'
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+# Importing the app package constructs the Gemini client; no real key is needed here
+os.environ.setdefault('NODE_ENV', 'test')
 
-SCHEMA_SQL = '''
-CREATE TABLE IF NOT EXISTS items (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    name TEXT,
-    imageData TEXT,
-    imageUrl TEXT,
-    imageInfo TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
-'''
+from app.services.wardrobe_migrations import LATEST_VERSION, run_migrations  # noqa: E402
 
+HERE = Path(__file__).resolve().parents[1] / 'app' / 'db'
+DB_PATH = HERE / 'wardrobe.sqlite3'
 
 def recreate_db():
     HERE.mkdir(parents=True, exist_ok=True)
@@ -26,10 +21,8 @@ def recreate_db():
         print(f"No existing DB found at {DB_PATH}; creating new one")
     conn = sqlite3.connect(DB_PATH)
     try:
-        c = conn.cursor()
-        c.executescript(SCHEMA_SQL)
-        conn.commit()
-        print(f"Created database and schema at: {DB_PATH}")
+        run_migrations(conn)
+        print(f"Created database and schema (version {LATEST_VERSION}) at: {DB_PATH}")
     finally:
         conn.close()
 
@@ -3,6 +3,9 @@ Test configuration for pytest
 """
 import os
 import sys
+import threading
+from http.server import ThreadingHTTPServer
+
 import pytest
 
 # Add backend to path
@@ -29,3 +32,52 @@ def client(app):
 def runner(app):
     """Create test CLI runner"""
     return app.test_cli_runner()
+
+@pytest.fixture
+def stub_server():
+    """Start a local stand-in for the Gemini API
+
+    Call with the module's request handler and the attributes that handler
+    keeps on the server; every server is stopped after the test.
+    """
+    servers = []
+
+    def start(handler, **state):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.daemon_threads = True
+        server.lock = threading.Lock()
+        for name, value in state.items():
+            setattr(server, name, value)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture
+def gemini_service(monkeypatch):
+    """Build a GeminiService that talks to a stub server, without the analysis cache
+
+    Call with the server, the keys to use and any attributes to override;
+    every service is closed after the test.
+    """
+    import app.services.gemini_service as gs
+    from app.services.analysis_cache import AnalysisCache
+    monkeypatch.setattr(gs, "analysis_cache", AnalysisCache(enabled=False))
+    services = []
+
+    def build(stub, keys=("k1",), **overrides):
+        service = gs.GeminiService()
+        service.api_keys = list(keys)
+        service.api_url = f"http://127.0.0.1:{stub.server_port}/generateContent"
+        for name, value in overrides.items():
+            setattr(service, name, value)
+        services.append(service)
+        return service
+
+    yield build
+    for service in services:
+        service.close()
@@ -0,0 +1,179 @@
+import base64
+import io
+import json
+from http.server import BaseHTTPRequestHandler
+from pathlib import Path
+
+import pytest
+
+import app.services.gemini_service as gs
+import app.services.style_analysis_service as sas
+import app.services.wardrobe_service as ws
+from app.services.blob_store import blob_store
+
+# Uploads have to sniff as images; payloads follow a JPEG marker
+JPEG_MAGIC = b"\xff\xd8\xff\xe0"
+
+
+class BatchStub(BaseHTTPRequestHandler):
+    """Answers with one analysis per inline image, typed after the image bytes"""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        images = [base64.b64decode(p["inline_data"]["data"]).decode()
+                  for p in body["contents"][0]["parts"] if "inline_data" in p]
+        with self.server.lock:
+            self.server.batches.append((len(images), body.get("generationConfig")))
+        if body.get("generationConfig"):
+            items = [{"index": i, "type": name} for i, name in enumerate(images) if name not in self.server.skip]
+            text = json.dumps({"items": items})
+        else:
+            text = json.dumps({"type": images[0]})
+        payload = json.dumps({"candidates": [{"content": {"parts": [{"text": text}]}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(stub_server):
+    return stub_server(BatchStub, batches=[], skip=set())
+
+
+@pytest.fixture
+def service(stub, gemini_service, monkeypatch):
+    monkeypatch.setenv("GEMINI_KEY_RPM", "0")
+    return gemini_service(stub, keys=["k1", "k2"], batch_size=4)
+
+
+def test_images_are_packed_into_batches(service, stub):
+    images = [(f"garment{i}".encode(), "image/jpeg") for i in range(10)]
+    results = service.analyze_clothing_images(images)
+    assert [r["type"] for r in results] == [f"garment{i}" for i in range(10)]
+    assert all(r["clothing_type"] == r["type"] for r in results)
+    assert sorted(size for size, _ in stub.batches) == [2, 4, 4]
+    config = stub.batches[0][1]
+    assert config["responseMimeType"] == "application/json"
+    assert config["responseSchema"]["properties"]["items"]["items"]["required"] == ["index", "type"]
+
+
+def test_images_missing_from_the_answer_are_retried_alone(service, stub):
+    stub.skip = {"garment2"}
+    results = service.analyze_clothing_images([(f"garment{i}".encode(), "image/png") for i in range(4)])
+    assert [r["type"] for r in results] == ["garment0", "garment1", "garment2", "garment3"]
+    assert sorted(size for size, _ in stub.batches) == [1, 4]
+
+
+def test_failed_images_are_reported_in_place(service, stub, monkeypatch):
+    monkeypatch.setattr(service, "_analyze_chunk", lambda images: [{"type": "x"}, None])
+    monkeypatch.setattr(service, "analyze_clothing_image",
+                        lambda data, mime: (_ for _ in ()).throw(ValueError("Image analysis failed: nope")))
+    results = service.analyze_clothing_images([(b"a", "image/jpeg"), (b"b", "image/jpeg")])
+    assert results[0] == {"type": "x"}
+    assert isinstance(results[1], ValueError)
+
+
+
+def test_unavailable_gemini_fails_the_chunk_without_per_image_calls(service, stub, monkeypatch):
+    from app.services.gemini_resilience import GeminiUnavailableError
+    singles = []
+    monkeypatch.setattr(service, "_analyze_chunk",
+                        lambda images: (_ for _ in ()).throw(GeminiUnavailableError("over quota", 30)))
+    monkeypatch.setattr(service, "analyze_clothing_image", lambda data, mime: singles.append(data))
+    results = service.analyze_clothing_images([(f"g{i}".encode(), "image/jpeg") for i in range(6)])
+    assert all(isinstance(r, GeminiUnavailableError) for r in results)
+    assert singles == []
+
+
+def test_batches_share_one_pool_per_process(service, stub):
+    service.analyze_clothing_images([(f"g{i}".encode(), "image/jpeg") for i in range(6)])
+    pool = service.batch_pool
+    service.analyze_clothing_images([(f"h{i}".encode(), "image/jpeg") for i in range(6)])
+    assert service.batch_pool is pool
+
+@pytest.fixture
+def isolated(monkeypatch, tmp_path):
+    monkeypatch.setattr(ws, "DB_PATH", str(tmp_path / "batch.sqlite3"))
+    monkeypatch.setattr(blob_store, "root", str(tmp_path / "blobs"))
+    yield
+    ws.close_pool()
+
+
+def test_add_items_is_one_transaction(isolated):
+    items = ws.wardrobe_service.add_items("u", [({"filename": f"{i}.jpg"}, {"type": "shirt"}) for i in range(3)])
+    assert [i["imageInfo"]["filename"] for i in items] == ["0.jpg", "1.jpg", "2.jpg"]
+    assert ws.wardrobe_service.add_items("u", []) == []
+
+    with ws.get_pool().connection() as conn:
+        conn.execute("""CREATE TRIGGER no_pants BEFORE INSERT ON wardrobe
+                        WHEN json_extract(NEW.analysis, '$.type') = 'pants'
+                        BEGIN SELECT RAISE(ABORT, 'no pants'); END""")
+        conn.commit()
+    with pytest.raises(Exception, match="no pants"):
+        ws.wardrobe_service.add_items("u", [({}, {"type": "shirt"}), ({}, {"type": "pants"})])
+    assert len(ws.wardrobe_service.get_all_items("u")) == 3
+
+
+def upload(client, names, user_id="batch_user"):
+    return client.post("/api/style/analyze/batch", data={
+        "userId": user_id,
+        "images": [(io.BytesIO(JPEG_MAGIC + name.encode()), f"{name}.jpg", "image/jpeg") for name in names],
+    }, content_type="multipart/form-data")
+
+
+def test_batch_endpoint_stores_successes_in_one_insert(isolated, client, monkeypatch):
+    def fake_batch(images):
+        names = [Path(path).read_bytes().removeprefix(JPEG_MAGIC).decode() for path, _ in images]
+        return [ValueError("Image analysis failed: blurry") if name == "bad" else {"type": name}
+                for name in names]
+
+    inserts = []
+    real_add_items = ws.wardrobe_service.add_items
+    monkeypatch.setattr(gs.gemini_service, "analyze_clothing_images", fake_batch)
+    monkeypatch.setattr(ws.wardrobe_service, "add_items",
+                        lambda user_id, entries: inserts.append(len(entries)) or real_add_items(user_id, entries))
+
+    resp = upload(client, ["shirt", "bad", "dress"])
+    assert resp.status_code == 200
+    data = resp.get_json()["data"]
+    assert (data["succeeded"], data["failed"]) == (2, 1)
+    items = data["items"]
+    assert [i["success"] for i in items] == [True, False, True]
+    assert items[1]["error"] == "Image analysis failed: blurry"
+    assert items[2]["wardrobeItem"]["analysis"] == {"type": "dress"}
+    assert items[2]["wardrobeItem"]["imageUrl"].startswith("http://localhost/")
+    assert inserts == [2]
+    assert blob_store.read(items[0]["wardrobeItem"]["image_blob"]) == JPEG_MAGIC + b"shirt"
+
+
+def test_batch_endpoint_validation(isolated, client, monkeypatch):
+    assert client.post("/api/style/analyze/batch", data={"userId": "u"},
+                       content_type="multipart/form-data").status_code == 400
+    assert upload(client, ["a"], user_id="").status_code == 401
+    # Rejected before anything is analyzed
+    monkeypatch.setattr(sas, "gemini_service", None)
+    import app.api.style_analysis as api
+    monkeypatch.setattr(api, "BATCH_MAX_IMAGES", 2)
+    assert upload(client, ["a", "b", "c"]).status_code == 400
+
+
+def test_batch_rejects_non_images_per_file(isolated, client, monkeypatch):
+    sent = []
+    monkeypatch.setattr(gs.gemini_service, "analyze_clothing_images",
+                        lambda images: sent.extend(images) or [{"type": "shirt"} for _ in images])
+    resp = client.post("/api/style/analyze/batch", data={
+        "userId": "batch_user",
+        "images": [(io.BytesIO(b"plain text"), "notes.jpg", "image/jpeg"),
+                   (io.BytesIO(JPEG_MAGIC + b"shirt"), "shirt.jpg", "image/jpeg")],
+    }, content_type="multipart/form-data")
+    items = resp.get_json()["data"]["items"]
+    assert items[0]["error"].startswith("Unsupported image type")
+    assert items[1]["success"]
+    assert len(sent) == 1
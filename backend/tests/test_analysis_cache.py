@@ -0,0 +1,131 @@
+import pytest
+
+from app.services.analysis_cache import AnalysisCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AnalysisCache(str(tmp_path / "cache.sqlite3"), max_entries=100, max_bytes=10**6,
+                         ttl_seconds=3600, enabled=True)
+
+
+def test_key_depends_on_image_and_parts():
+    key = AnalysisCache.make_key(b"img", "image/jpeg", "model", "prompt")
+    assert key == AnalysisCache.make_key(b"img", "image/jpeg", "model", "prompt")
+    assert key != AnalysisCache.make_key(b"img2", "image/jpeg", "model", "prompt")
+    assert key != AnalysisCache.make_key(b"img", "image/jpeg", "model", "prompt v2")
+
+
+def test_miss_then_hit(cache):
+    assert cache.get("k") is None
+    cache.set("k", {"type": "shirt"})
+    assert cache.get("k") == {"type": "shirt"}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+    assert stats["hitRate"] == 0.5
+
+
+def test_persists_across_instances(cache):
+    cache.set("k", {"type": "dress"})
+    again = AnalysisCache(cache.path, enabled=True)
+    assert again.get("k") == {"type": "dress"}
+
+
+def test_ttl_expiry(cache, monkeypatch):
+    import app.services.analysis_cache as ac
+    cache.set("k", {"type": "shirt"})
+    now = ac.time.time()
+    monkeypatch.setattr(ac.time, "time", lambda: now + 7200)
+    assert cache.get("k") is None
+    assert cache.evictions == 1
+
+
+def test_lru_eviction_by_entry_count(tmp_path, monkeypatch):
+    import app.services.analysis_cache as ac
+    clock = iter(range(1000))
+    monkeypatch.setattr(ac.time, "time", lambda: next(clock))
+    cache = AnalysisCache(str(tmp_path / "lru.sqlite3"), max_entries=2, ttl_seconds=0, touch_seconds=0,
+                          enabled=True)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")  # b is now least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_hits_only_write_back_stale_access_times(cache, monkeypatch):
+    import app.services.analysis_cache as ac
+    now = ac.time.time()
+    monkeypatch.setattr(ac.time, "time", lambda: now)
+    cache.set("k", 1)
+
+    def accessed_at():
+        with cache._get_pool().connection() as conn:
+            return conn.execute("SELECT accessed_at FROM analysis_cache WHERE key='k'").fetchone()[0]
+
+    monkeypatch.setattr(ac.time, "time", lambda: now + 30)
+    assert cache.get("k") == 1
+    assert accessed_at() == now
+    monkeypatch.setattr(ac.time, "time", lambda: now + 90)
+    assert cache.get("k") == 1
+    assert accessed_at() == now + 90
+
+
+def test_size_cap(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "size.sqlite3"), max_bytes=50, ttl_seconds=0, enabled=True)
+    cache.set("a", "x" * 30)
+    cache.set("b", "y" * 30)
+    assert cache.stats()["entries"] == 1
+    assert cache.get("b") == "y" * 30
+
+
+def test_disabled_cache_is_inert(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "off.sqlite3"), enabled=False)
+    cache.set("k", 1)
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] is None
+
+
+def test_broken_store_behaves_like_a_miss(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "cache.sqlite3"), enabled=True)
+    cache.set("k", 1)
+    with cache._get_pool().connection() as conn:
+        conn.execute("DROP TABLE analysis_cache")
+        conn.commit()
+    assert cache.get("k") is None
+    cache.set("k", 1)
+    assert cache.errors == 2
+
+
+def test_gemini_reuses_cached_analysis(cache, monkeypatch):
+    import app.services.gemini_service as gs
+    monkeypatch.setattr(gs, "analysis_cache", cache)
+    service = gs.GeminiService()
+    service.api_keys = ["k1"]
+    calls = []
+
+    class FakeResp:
+        status_code = 200
+
+        def json(self):
+            return {"candidates": [{"content": {"parts": [{"text": '```json\n{"type": "shirt"}\n```'}]}}]}
+
+    def fake_post(*a, **kw):
+        calls.append(1)
+        return FakeResp()
+
+    monkeypatch.setattr(service.session, "post", fake_post)
+    first = service.analyze_clothing_image(b"same-bytes", "image/jpeg")
+    second = service.analyze_clothing_image(b"same-bytes", "image/jpeg")
+    assert first == second == {"type": "shirt", "clothing_type": "shirt"}
+    assert len(calls) == 1
+    service.analyze_clothing_image(b"other-bytes", "image/jpeg")
+    assert len(calls) == 2
+
+
+def test_cache_stats_endpoint(client):
+    resp = client.get("/api/style/cache/stats")
+    assert resp.status_code == 200
+    assert {"hits", "misses", "hitRate"} <= set(resp.get_json()["data"])
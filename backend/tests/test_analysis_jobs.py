@@ -0,0 +1,286 @@
+import io
+import json
+import threading
+import time
+
+import pytest
+
+import app.services.wardrobe_service as ws
+from app.services.analysis_jobs import AnalysisJobQueue, job_queue
+from app.services.blob_store import blob_store
+from app.services.gemini_resilience import GeminiUnavailableError
+from app.services.style_analysis_service import style_analysis_service
+
+# Uploads have to sniff as images; payloads follow a JPEG marker
+JPEG_MAGIC = b"\xff\xd8\xff\xe0"
+
+
+@pytest.fixture
+def isolated(monkeypatch, tmp_path):
+    monkeypatch.setattr(ws, "DB_PATH", str(tmp_path / "jobs_wardrobe.sqlite3"))
+    monkeypatch.setattr(blob_store, "root", str(tmp_path / "blobs"))
+    monkeypatch.setattr(job_queue, "path", str(tmp_path / "jobs.sqlite3"))
+    # Tests drive the queue with run_next() instead of background threads
+    monkeypatch.setattr(job_queue, "workers", 0)
+    calls = []
+
+    def fake_analyze(image_path, mime_type, image_info, user_id=None):
+        # Uploads arrive as the path of their blob, not as bytes
+        with open(image_path, "rb") as f:
+            image_data = f.read().removeprefix(JPEG_MAGIC)
+        calls.append(image_data)
+        if image_data == b"broken":
+            raise ValueError("Image analysis failed: boom")
+        if image_data == b"overloaded":
+            raise GeminiUnavailableError("Image analysis failed: 503", retry_in=None)
+        return {"analysis": {"type": "shirt"}, "imageInfo": image_info, "duplicateOf": None}
+
+    monkeypatch.setattr(style_analysis_service, "analyze_image", fake_analyze)
+    yield calls
+    ws.close_pool()
+
+
+def submit(client, data=b"fakeimage", user_id="job_user", **extra):
+    return client.post("/api/style/analyze?async=1", data={
+        "userId": user_id, "image": (io.BytesIO(JPEG_MAGIC + data), "a.jpg", "image/jpeg"), **extra
+    }, content_type="multipart/form-data")
+
+
+def test_async_analyze_returns_202_and_completes(isolated, client):
+    resp = submit(client)
+    assert resp.status_code == 202
+    job = resp.get_json()["data"]
+    assert job["status"] == "queued"
+    assert resp.headers["Location"] == job["statusUrl"]
+    assert isolated == []
+
+    assert job_queue.run_next()
+    done = client.get(f"/api/style/jobs/{job['id']}?userId=job_user").get_json()["data"]
+    assert done["status"] == "done"
+    item = done["result"]["wardrobeItem"]
+    assert done["result"]["analysis"] == {"type": "shirt"}
+    assert item["imageUrl"].startswith("http://localhost/api/wardrobe/")
+    assert blob_store.read(item["image_blob"]) == JPEG_MAGIC + b"fakeimage"
+    assert ws.wardrobe_service.get_item_by_id("job_user", item["id"]) is not None
+    assert not job_queue.run_next()
+
+
+def test_prefer_header_and_sync_default(isolated, client):
+    resp = client.post("/api/style/analyze", data={
+        "userId": "job_user", "image": (io.BytesIO(JPEG_MAGIC + b"img"), "a.jpg", "image/jpeg")
+    }, content_type="multipart/form-data", headers={"Prefer": "respond-async"})
+    assert resp.status_code == 202
+    resp = client.post("/api/style/analyze", data={
+        "userId": "job_user", "image": (io.BytesIO(JPEG_MAGIC + b"img"), "a.jpg", "image/jpeg")
+    }, content_type="multipart/form-data")
+    assert resp.status_code == 200
+    assert resp.get_json()["data"]["wardrobeItem"]["analysis"] == {"type": "shirt"}
+
+
+def test_failed_job_reports_error(isolated, client):
+    job = submit(client, b"broken").get_json()["data"]
+    job_queue.run_next()
+    failed = client.get(f"/api/style/jobs/{job['id']}?userId=job_user").get_json()["data"]
+    assert failed["status"] == "failed"
+    assert "boom" in failed["error"]
+    assert ws.wardrobe_service.get_all_items("job_user") == []
+
+
+def test_jobs_are_private_to_their_user(isolated, client):
+    job = submit(client).get_json()["data"]
+    assert client.get(f"/api/style/jobs/{job['id']}?userId=someone_else").status_code == 404
+    assert client.get(f"/api/style/jobs/{job['id']}").status_code == 401
+    assert client.get("/api/style/jobs/missing?userId=job_user").status_code == 404
+
+
+def test_jobs_survive_restart(isolated, client):
+    job = submit(client).get_json()["data"]
+    restarted = AnalysisJobQueue(path=job_queue.path, workers=0)
+    assert restarted.run_next()
+    assert restarted.get(job["id"])["status"] == "done"
+
+
+def test_expired_lease_is_retried_then_failed(isolated, client):
+    queue = AnalysisJobQueue(path=job_queue.path, workers=0, lease_seconds=-1, max_attempts=2)
+    job = submit(client).get_json()["data"]
+    # Two workers "die" after claiming: the lease is already expired
+    assert queue.claim()["attempts"] == 1
+    assert queue.claim()["attempts"] == 2
+    assert queue.claim() is None
+    failed = queue.get(job["id"])
+    assert failed["status"] == "failed"
+    assert "Worker stopped" in failed["error"]
+
+
+def test_claims_are_exclusive(isolated, client):
+    for _ in range(3):
+        submit(client)
+    other = AnalysisJobQueue(path=job_queue.path, workers=0)
+    claimed = [job_queue.claim(), other.claim(), job_queue.claim(), other.claim()]
+    assert len({job["id"] for job in claimed[:3]}) == 3
+    assert claimed[3] is None
+
+
+def test_events_stream_until_finished(isolated, client):
+    job = submit(client).get_json()["data"]
+    job_queue.run_next()
+    resp = client.get(f"/api/style/jobs/{job['id']}/events?userId=job_user")
+    assert resp.mimetype == "text/event-stream"
+    events = [e for e in resp.get_data(as_text=True).split("\n\n") if e]
+    assert len(events) == 2
+    assert events[0] == "retry: 1000"
+    name, data = events[1].split("\n")
+    assert name == "event: status"
+    assert json.loads(data[len("data: "):])["status"] == "done"
+
+
+def test_event_streams_are_capped_and_short(isolated, client, monkeypatch):
+    import app.api.style_analysis as api
+    monkeypatch.setattr(api, "JOB_EVENTS_TIMEOUT", 0.2)
+    monkeypatch.setattr(api, "JOB_EVENTS_POLL_INTERVAL", 0.05)
+    monkeypatch.setattr(api, "_event_streams", threading.BoundedSemaphore(1))
+    job = submit(client).get_json()["data"]
+    url = f"/api/style/jobs/{job['id']}/events?userId=job_user"
+
+    open_stream = client.get(url, buffered=False)
+    busy = client.get(url)
+    assert busy.status_code == 503
+    assert busy.headers["Retry-After"] == "2"
+    assert busy.get_json()["statusUrl"] == job["statusUrl"]
+
+    # Still queued when the stream times out; closing it frees the slot
+    assert open_stream.get_data(as_text=True).endswith("event: timeout\ndata: {}\n\n")
+    open_stream.close()
+    assert client.get(url).status_code == 200
+
+
+def test_unfinished_jobs_tell_clients_when_to_poll(isolated, client):
+    resp = submit(client)
+    assert resp.headers["Retry-After"] == "2"
+    job = resp.get_json()["data"]
+    status = client.get(f"/api/style/jobs/{job['id']}?userId=job_user")
+    assert status.headers["Retry-After"] == "2"
+    job_queue.run_next()
+    assert "Retry-After" not in client.get(f"/api/style/jobs/{job['id']}?userId=job_user").headers
+
+
+def test_background_workers_drain_queue(isolated, client, monkeypatch):
+    monkeypatch.setattr(job_queue, "workers", 2)
+    monkeypatch.setattr(job_queue, "poll_interval", 0.05)
+    try:
+        jobs = [submit(client, f"img-{i}".encode()).get_json()["data"] for i in range(4)]
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and job_queue.stats()["done"] < 4:
+            time.sleep(0.02)
+        assert job_queue.stats()["done"] == 4
+        assert sorted(isolated) == sorted(f"img-{i}".encode() for i in range(4))
+        assert all(job_queue.get(j["id"])["status"] == "done" for j in jobs)
+    finally:
+        job_queue.stop()
+
+
+def test_prune_removes_old_finished_jobs(isolated, client):
+    job = submit(client).get_json()["data"]
+    job_queue.run_next()
+    queue = AnalysisJobQueue(path=job_queue.path, workers=0, retention_seconds=1e-9)
+    time.sleep(0.01)
+    assert queue.prune() == 1
+    assert queue.get(job["id"]) is None
+
+
+def test_unavailable_gemini_is_retried_later_then_failed(isolated, client):
+    queue = AnalysisJobQueue(path=job_queue.path, workers=0, max_attempts=2, retry_delay=60)
+    job = submit(client, b"overloaded").get_json()["data"]
+    assert queue.run_next()
+    requeued = queue.get(job["id"])
+    assert requeued["status"] == "queued"
+    assert "503" in requeued["error"]
+    # Not runnable again until the retry delay has passed
+    assert not queue.run_next()
+
+    queue.retry_delay = 0
+    with queue._get_pool().connection() as conn:
+        conn.execute("UPDATE analysis_jobs SET lease_until=? WHERE id=?", (time.time(), job["id"]))
+        conn.commit()
+    assert queue.run_next()
+    failed = queue.get(job["id"])
+    assert failed["status"] == "failed"
+    assert failed["attempts"] == 2
+    assert len(isolated) == 2
+
+
+def test_pending_jobs_keep_their_uploads(isolated, client):
+    waiting = submit(client, b"waiting").get_json()["data"]
+    finished = submit(client, b"finished").get_json()["data"]
+    queue = AnalysisJobQueue(path=job_queue.path, workers=0)
+    with queue._get_pool().connection() as conn:
+        conn.execute("UPDATE analysis_jobs SET status='failed' WHERE id=?", (finished["id"],))
+        conn.commit()
+        info = conn.execute("SELECT image_info FROM analysis_jobs WHERE id=?", (waiting["id"],)).fetchone()[0]
+    assert queue.referenced_blobs() == {json.loads(info)["blob"]}
+
+
+def test_prune_runs_once_per_interval(isolated, client, monkeypatch):
+    queue = AnalysisJobQueue(path=job_queue.path, workers=0, prune_interval=3600)
+    calls = []
+    monkeypatch.setattr(queue, "prune", lambda: calls.append(1) or 0)
+    for _ in range(3):
+        queue.maybe_prune()
+    assert len(calls) == 1
+    queue.prune_interval = 0
+    queue.maybe_prune()
+    assert len(calls) == 2
+
+
+def test_create_app_resumes_jobs(monkeypatch):
+    from app.app import create_app
+    started = []
+    monkeypatch.setattr(job_queue, "start", lambda: started.append(1))
+    monkeypatch.setenv("ANALYSIS_JOB_AUTOSTART", "false")
+    create_app()
+    assert started == []
+    monkeypatch.setenv("ANALYSIS_JOB_AUTOSTART", "true")
+    create_app()
+    assert started == [1]
+
+
+def test_rerun_after_a_crash_does_not_add_the_item_twice(isolated, client, monkeypatch):
+    job = submit(client).get_json()["data"]
+    queue = AnalysisJobQueue(path=job_queue.path, workers=0)
+    # The worker dies after the insert, before marking the job done
+    with monkeypatch.context() as m:
+        m.setattr(queue, "_finish", lambda *args, **kwargs: None)
+        assert queue.run_next()
+    # ... and its lease runs out
+    with queue._get_pool().connection() as conn:
+        conn.execute("UPDATE analysis_jobs SET lease_until=0 WHERE id=?", (job["id"],))
+        conn.commit()
+    assert queue.run_next()
+    done = queue.get(job["id"])
+    assert done["status"] == "done"
+    items = ws.wardrobe_service.get_all_items("job_user")
+    assert len(items) == 1
+    assert done["result"]["wardrobeItem"]["id"] == items[0]["id"]
+    assert len(isolated) == 1
+
+
+def test_worker_survives_unexpected_errors(isolated, monkeypatch, caplog):
+    queue = AnalysisJobQueue(path=job_queue.path, workers=1, poll_interval=0.01)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("unexpected")
+        return False
+
+    monkeypatch.setattr(queue, "run_next", flaky)
+    queue.start()
+    try:
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and len(calls) < 3:
+            time.sleep(0.01)
+    finally:
+        queue.stop()
+    assert len(calls) >= 3
+    assert "Analysis job queue error" in caplog.text
@@ -1,9 +1,10 @@
-def test_debug_print_and_env(monkeypatch, capsys):
+def test_missing_api_key_is_logged(monkeypatch, caplog):
     import app.app as app_module
-    monkeypatch.setenv('GEMINI_API_KEY', 'testkey')
-    app_module.debug_print('test123')
-    captured = capsys.readouterr()
-    assert 'test123' in captured.out
+    for name in ("GEMINI_API_KEYS", "GEMINI_API_KEY", "GEMINI_API_KEY_2", "GEMINI_API_KEY_3"):
+        monkeypatch.delenv(name, raising=False)
+    app_module.create_app()
+    assert "No Gemini API key found" in caplog.text
+    assert not hasattr(app_module, "debug_print")
 def test_main_block(monkeypatch):
     import sys
     import importlib
@@ -0,0 +1,85 @@
+import hashlib
+import io
+import os
+import time
+
+import pytest
+
+from app.services.blob_store import BlobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(str(tmp_path / "blobs"))
+
+
+def test_put_returns_sha256_and_shards_by_prefix(store):
+    digest = store.put(b"hello")
+    assert digest == hashlib.sha256(b"hello").hexdigest()
+    assert store.path(digest).endswith(os.path.join(digest[:2], digest[2:4], digest))
+    assert store.read(digest) == b"hello"
+    assert store.size(digest) == 5
+
+
+def test_put_from_file_object(store):
+    data = os.urandom(200 * 1024)
+    digest = store.put(io.BytesIO(data))
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert store.read(digest) == data
+
+
+def test_identical_content_is_stored_once(store):
+    assert store.put(b"same") == store.put(b"same")
+    leftovers = [n for n in os.listdir(store.root) if n.startswith(".tmp-")]
+    assert leftovers == []
+
+
+def test_failed_write_leaves_no_temp_file(store):
+    class Broken:
+        def read(self, n):
+            raise IOError("disk gone")
+    with pytest.raises(IOError):
+        store.put(Broken())
+    assert [n for n in os.listdir(store.root) if n.startswith(".tmp-")] == []
+
+
+def test_delete_and_exists(store):
+    digest = store.put(b"bye")
+    assert store.exists(digest)
+    assert store.delete(digest) is True
+    assert not store.exists(digest)
+    assert store.delete(digest) is False
+
+
+def test_invalid_digest_rejected(store):
+    with pytest.raises(ValueError):
+        store.path("../../etc/passwd")
+    assert store.exists("nope") is False
+
+
+def age(store, digest, seconds):
+    old = time.time() - seconds
+    os.utime(store.path(digest), (old, old))
+
+
+def test_sweep_removes_old_unreferenced_blobs(store):
+    kept, orphan, recent = store.put(b"kept"), store.put(b"orphan"), store.put(b"recent")
+    age(store, kept, 7200)
+    age(store, orphan, 7200)
+    stale_tmp = os.path.join(store.root, ".tmp-interrupted")
+    with open(stale_tmp, "wb") as f:
+        f.write(b"partial")
+    os.utime(stale_tmp, (time.time() - 7200,) * 2)
+
+    assert store.sweep({kept}, min_age=3600) == 2
+    assert store.exists(kept) and store.exists(recent)
+    assert not store.exists(orphan)
+    assert not os.path.exists(stale_tmp)
+
+
+def test_storing_existing_content_again_protects_it_from_sweep(store):
+    digest = store.put(b"again")
+    age(store, digest, 7200)
+    assert store.put(b"again") == digest
+    assert store.sweep(set(), min_age=3600) == 0
+    assert store.exists(digest)
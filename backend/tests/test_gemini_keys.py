@@ -0,0 +1,245 @@
+import io
+import json
+import threading
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+import app.services.gemini_service as gs
+from app.services.analysis_cache import AnalysisCache
+from app.services.gemini_keys import KeyScheduler, load_api_keys, parse_retry_after
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def scheduler(clock, keys=("a", "b"), **limits):
+    limits = {"rpm": 2, "tpm": 0, "rpd": 0, "default_cooldown": 30, **limits}
+    return KeyScheduler(list(keys), clock=clock, wall_clock=lambda: 1_700_000_000 + clock.now, **limits)
+
+
+def test_load_api_keys_merges_list_and_legacy_vars(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEYS", "k1, k2,,k3")
+    monkeypatch.setenv("GEMINI_API_KEY", "k2")
+    monkeypatch.setenv("GEMINI_API_KEY_2", "k4")
+    monkeypatch.setenv("GEMINI_API_KEY_3", "")
+    assert load_api_keys() == ["k1", "k2", "k3", "k4"]
+
+
+def test_spreads_load_and_respects_rpm(clock):
+    s = scheduler(clock)
+    picked = [s.acquire() for _ in range(4)]
+    assert sorted(picked) == ["a", "a", "b", "b"]
+    assert s.acquire() is None
+    assert s.next_available_in() == pytest.approx(30)
+    clock.now += 30
+    assert s.acquire() in ("a", "b")
+
+
+def test_prefers_keys_without_requests_in_flight(clock):
+    s = scheduler(clock, rpm=100)
+    first = s.acquire()
+    assert s.acquire() != first
+    s.release(first, 200)
+    # Release frees the slot: the released key now ties on in-flight count
+    assert s.stats()[0]["inFlight"] + s.stats()[1]["inFlight"] == 1
+
+
+def test_token_budget_uses_actual_usage(clock):
+    s = scheduler(clock, keys=("a",), rpm=0, tpm=1000)
+    key = s.acquire(tokens=600)
+    assert s.acquire(tokens=600) is None
+    s.release(key, 200, estimated_tokens=600, used_tokens=100)
+    assert s.acquire(tokens=600) == "a"
+
+
+def test_daily_limit(clock):
+    s = scheduler(clock, keys=("a",), rpm=0, rpd=2)
+    assert s.acquire() and s.acquire()
+    assert s.acquire() is None
+    assert s.stats()[0]["rpdUtilization"] == 1
+    clock.now += 24 * 3600
+    assert s.acquire() == "a"
+
+
+def test_quotas_are_shared_between_processes(clock, monkeypatch):
+    # Four workers each get a quarter of every key's quota
+    monkeypatch.setenv("GEMINI_KEY_PROCESSES", "4")
+    s = scheduler(clock, keys=("a",), rpm=8, rpd=12)
+    assert [s.acquire() for _ in range(3)] == ["a", "a", None]
+    assert s.next_available_in() == pytest.approx(30)
+    clock.now += 30
+    assert s.acquire() == "a"
+    assert s.stats()[0]["rpdUtilization"] == 1
+    assert s.acquire() is None
+
+
+def test_429_cooldown(clock):
+    s = scheduler(clock, rpm=100)
+    key = s.acquire(exclude={"b"})
+    s.release(key, 429, retry_after=10)
+    assert [s.acquire() for _ in range(3)] == ["b", "b", "b"]
+    assert s.acquire(exclude={"b"}) is None
+    clock.now += 10
+    assert s.acquire(exclude={"b"}) == "a"
+    unknown = s.acquire(exclude={"b"})
+    s.release(unknown, 429)
+    assert s.stats()[0]["cooldownSeconds"] == 30
+    assert s.stats()[0]["throttled"] == 2
+
+
+def test_per_day_429_waits_for_reset(clock):
+    s = scheduler(clock, keys=("a",), rpm=0, rpd=100)
+    s.release(s.acquire(), 429, retry_after=5, per_day=True)
+    assert s.next_available_in() == pytest.approx(s.seconds_until_daily_reset())
+
+
+def test_parse_retry_after():
+    body = {"error": {"code": 429, "details": [
+        {"@type": "type.googleapis.com/google.rpc.QuotaFailure",
+         "violations": [{"quotaId": "GenerateRequestsPerDayPerProjectPerModel-FreeTier"}]},
+        {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "37s"},
+    ]}}
+    assert parse_retry_after({}, body) == (37.0, True)
+    assert parse_retry_after({"Retry-After": "12"}, body)[0] == 12.0
+    assert parse_retry_after({}, None) == (None, False)
+    assert parse_retry_after({"Retry-After": "soon"}, "not json") == (None, False)
+
+
+def test_concurrent_acquire_never_exceeds_budget(clock):
+    s = scheduler(clock, keys=("a", "b", "c"), rpm=5)
+    results = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(10):
+            key = s.acquire()
+            with lock:
+                results.append(key)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    granted = [k for k in results if k]
+    assert len(granted) == 15
+    assert all(granted.count(k) == 5 for k in "abc")
+
+
+class QuotaStub(BaseHTTPRequestHandler):
+    """Allows ``limits[key]`` requests per key, then answers 429 with RetryInfo"""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        key = self.headers["x-goog-api-key"]
+        server = self.server
+        with server.lock:
+            server.seen.append(key)
+            allowed = server.used.get(key, 0) < server.limits.get(key, 0)
+            if allowed:
+                server.used[key] = server.used.get(key, 0) + 1
+        if allowed:
+            body = {"candidates": [{"content": {"parts": [{"text": '{"type": "shirt"}'}]}}],
+                    "usageMetadata": {"totalTokenCount": 300}}
+            status = 200
+        else:
+            body = {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED", "details": [
+                {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "120s"}]}}
+            status = 429
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(stub_server):
+    return stub_server(QuotaStub, limits={"key-a": 1, "key-b": 3}, used={}, seen=[])
+
+
+def test_service_routes_around_exhausted_keys(stub, gemini_service, monkeypatch):
+    monkeypatch.setenv("GEMINI_KEY_RPM", "100")
+    service = gemini_service(stub, keys=["key-a", "key-b"])
+    for i in range(4):
+        assert service.analyze_clothing_image(f"img-{i}".encode(), "image/jpeg")["type"] == "shirt"
+    # key-a is hit once more after its quota, then benched for its retryDelay
+    assert stub.seen.count("key-a") == 2
+    with pytest.raises(ValueError, match="All API keys exhausted"):
+        service.analyze_clothing_image(b"img-5", "image/jpeg")
+    # Both keys cooling down: no request is sent at all
+    sent = len(stub.seen)
+    with pytest.raises(ValueError, match="over quota"):
+        service.analyze_clothing_image(b"img-6", "image/jpeg")
+    assert len(stub.seen) == sent
+    stats = {s["key"]: s for s in service.key_stats()}
+    # Keys are named by their position in the list, never by their value
+    assert stats["1"]["throttled"] == 1
+    assert stats["1"]["cooldownSeconds"] > 100
+    assert all(s["inFlight"] == 0 for s in stats.values())
+
+
+def test_key_stats_endpoint(client):
+    resp = client.get("/api/style/gemini/keys")
+    assert resp.status_code == 200
+    assert isinstance(resp.get_json()["data"], list)
+
+
+def test_next_available_in_accounts_for_token_budget(clock):
+    s = scheduler(clock, keys=("a",), rpm=0, tpm=600)
+    assert s.acquire(tokens=500) == "a"
+    assert s.acquire(tokens=300) is None
+    # 200 more tokens at 600/minute
+    assert s.next_available_in(300) == pytest.approx(20)
+    clock.now += 20
+    assert s.acquire(tokens=300) == "a"
+
+
+def test_exhausted_keys_fail_fast_with_retry_hint(monkeypatch):
+    from app.services.gemini_resilience import GeminiUnavailableError
+    monkeypatch.setattr(gs, "analysis_cache", AnalysisCache(enabled=False))
+    service = gs.GeminiService()
+    service.key_scheduler = KeyScheduler(["k1"], rpm=1, tpm=0, rpd=0)
+    service.key_scheduler.acquire()
+    sleeps = []
+    service._sleep = sleeps.append
+    monkeypatch.setattr(service.session, "post", lambda *a, **kw: pytest.fail("no key should be used"))
+    with pytest.raises(GeminiUnavailableError, match="over quota") as raised:
+        service.analyze_clothing_image(b"img", "image/jpeg")
+    # The caller's thread doesn't wait for the bucket to refill
+    assert sleeps == []
+    assert raised.value.retry_in == pytest.approx(60, abs=1)
+
+
+def test_analyze_answers_503_with_retry_after_when_keys_are_exhausted(client, monkeypatch, tmp_path):
+    from app.services.blob_store import blob_store
+    from app.services.gemini_resilience import GeminiUnavailableError
+    from app.services.style_analysis_service import style_analysis_service
+    monkeypatch.setattr(blob_store, "root", str(tmp_path / "blobs"))
+
+    def exhausted(*args, **kwargs):
+        raise GeminiUnavailableError("All API keys exhausted: every key is over quota", 42.3)
+
+    monkeypatch.setattr(style_analysis_service, "analyze_and_store", exhausted)
+    resp = client.post("/api/style/analyze", data={
+        "userId": "u", "image": (io.BytesIO(b"\xff\xd8\xff\xe0img"), "a.jpg", "image/jpeg")
+    }, content_type="multipart/form-data")
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "42"
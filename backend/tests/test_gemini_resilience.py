@@ -0,0 +1,207 @@
+import json
+import time
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+import app.services.gemini_service as gs
+from app.services.gemini_resilience import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+ANSWER = {"candidates": [{"content": {"parts": [{"text": '{"type": "shirt"}'}]}}]}
+
+
+class FaultStub(BaseHTTPRequestHandler):
+    """Replays ``server.script`` one fault per request: ok, 500, 400, 429,
+    drop (close without answering) or a float (delay in seconds, then ok)"""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        with self.server.lock:
+            fault = self.server.script.pop(0) if self.server.script else "ok"
+            self.server.seen.append(self.headers["x-goog-api-key"])
+        if fault == "drop":
+            self.close_connection = True
+            self.connection.close()
+            return
+        if isinstance(fault, float):
+            time.sleep(fault)
+            fault = "ok"
+        status = {"ok": 200, "500": 500, "400": 400, "429": 429}[fault]
+        payload = json.dumps(ANSWER if status == 200 else {"error": {"code": status}}).encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(stub_server):
+    return stub_server(FaultStub, script=[], seen=[])
+
+
+@pytest.fixture
+def service(stub, gemini_service, monkeypatch):
+    monkeypatch.setenv("GEMINI_KEY_RPM", "0")
+    service = gemini_service(stub, keys=["key-a", "key-b"])
+    service.retry_policy = RetryPolicy(max_attempts=4, deadline=5, attempt_timeout=2, backoff_base=0.01,
+                                       backoff_cap=0.05, hedge_delay=0)
+    service.circuit_breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    service.sleeps = []
+    service._sleep = lambda seconds: service.sleeps.append(seconds)
+    return service
+
+
+def analyze(service, n=0):
+    return service.analyze_clothing_image(f"img-{n}".encode(), "image/jpeg")
+
+
+def test_backoff_is_jittered_and_capped():
+    policy = RetryPolicy(backoff_base=1, backoff_cap=4)
+    delays = [policy.backoff(retry) for retry in range(6) for _ in range(50)]
+    assert all(0 <= d <= 4 for d in delays)
+    assert len(set(delays)) > 100
+
+
+def test_server_errors_are_retried_with_backoff(service, stub):
+    stub.script = ["500", "drop", "ok"]
+    assert analyze(service)["type"] == "shirt"
+    assert len(stub.seen) == 3
+    assert len(service.sleeps) == 2
+    assert all(0 <= s <= 0.05 for s in service.sleeps)
+    assert service.circuit_breaker.state == "closed"
+
+
+def test_client_errors_are_not_retried(service, stub):
+    stub.script = ["400", "ok"]
+    with pytest.raises(ValueError, match="status 400"):
+        analyze(service)
+    assert len(stub.seen) == 1
+
+
+def test_deadline_bounds_the_whole_request(service, stub):
+    service.retry_policy.deadline = 0.6
+    service.retry_policy.attempt_timeout = 0.25
+    stub.script = [1.0] * 10
+    start = time.monotonic()
+    with pytest.raises(ValueError, match="deadline"):
+        analyze(service)
+    assert time.monotonic() - start < 1.2
+    assert len(stub.seen) <= 3
+
+
+def test_circuit_opens_fails_fast_and_recovers(service, stub, client, monkeypatch):
+    clock = [1000.0]
+    service.circuit_breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=lambda: clock[0])
+    monkeypatch.setattr(gs, "gemini_service", service)
+    stub.script = ["500"] * 10
+    # The third failure opens the breaker, which also stops the fourth attempt
+    with pytest.raises(ValueError, match="circuit breaker is open"):
+        analyze(service)
+    assert len(stub.seen) == 3
+    assert service.circuit_breaker.state == "open"
+    sent = len(stub.seen)
+    with pytest.raises(ValueError, match="circuit breaker is open"):
+        analyze(service, 1)
+    assert len(stub.seen) == sent
+    health = client.get("/api/health").get_json()
+    assert health["status"] == "ok"
+    assert health["gemini"]["circuit"]["state"] == "open"
+    assert health["gemini"]["circuit"]["rejected"] == 2
+
+    clock[0] += 30
+    stub.script = []
+    assert analyze(service, 2)["type"] == "shirt"
+    assert service.circuit_breaker.state == "closed"
+
+
+def test_half_open_allows_a_single_probe():
+    clock = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: clock[0])
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    clock[0] = 10
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock[0] = 20
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_probe_that_raises_does_not_leave_the_breaker_stuck(service, stub, monkeypatch):
+    clock = [1000.0]
+    service.circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=lambda: clock[0])
+    service.circuit_breaker.record_failure()
+    clock[0] += 30
+
+    def broken_post(*args, **kwargs):
+        raise ValueError("could not encode the image")
+
+    with monkeypatch.context() as m:
+        m.setattr(service.session, "post", broken_post)
+        with pytest.raises(ValueError, match="could not encode"):
+            analyze(service)
+    # Neither a success nor an outage: still half-open, and the next call probes
+    assert service.circuit_breaker.state == "half_open"
+    assert analyze(service, 1)["type"] == "shirt"
+    assert service.circuit_breaker.state == "closed"
+
+
+def test_released_probe_lets_the_next_call_probe():
+    clock = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: clock[0])
+    breaker.record_failure()
+    clock[0] = 10
+    assert breaker.before_call() is True
+    breaker.release_probe()
+    assert breaker.before_call() is True
+    breaker.record_success()
+    breaker.release_probe()
+    assert breaker.before_call() is False
+    assert breaker.state == "closed"
+
+
+def test_slow_attempt_is_hedged_on_another_key(service, stub):
+    service.retry_policy.hedge_delay = 0.1
+    stub.script = [1.5, "ok"]
+    start = time.monotonic()
+    assert analyze(service)["type"] == "shirt"
+    assert time.monotonic() - start < 1.0
+    assert service.hedges == 1
+    assert sorted(stub.seen) == ["key-a", "key-b"]
+    # The slow loser still settles its key in the background
+    deadline = time.monotonic() + 3
+    while time.monotonic() < deadline and any(k["inFlight"] for k in service.key_stats()):
+        time.sleep(0.05)
+    assert all(k["inFlight"] == 0 for k in service.key_stats())
+
+
+def test_attempts_are_recorded_per_key_and_status(service, stub):
+    stub.script = ["429", "ok"]
+    requests_metric, calls_metric = gs.GEMINI_REQUESTS, gs.GEMINI_CALLS
+    before = (requests_metric.value("analyze_image", "1", 429)
+              + requests_metric.value("analyze_image", "2", 429),
+              calls_metric.value("analyze_image", "ok"))
+    assert analyze(service)["type"] == "shirt"
+    throttled = (requests_metric.value("analyze_image", "1", 429)
+                 + requests_metric.value("analyze_image", "2", 429))
+    assert throttled == before[0] + 1
+    assert calls_metric.value("analyze_image", "ok") == before[1] + 1
+    # /api/metrics is public: keys appear as their number, not even masked
+    rendered = gs.registry.render()
+    assert 'key="1"' in rendered
+    assert "key-a" not in rendered and "key-b" not in rendered
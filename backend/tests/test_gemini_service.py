@@ -1,5 +1,6 @@
 import pytest
 from unittest.mock import patch, MagicMock
+from app.services.gemini_resilience import GeminiUnavailableError
 from app.services.gemini_service import GeminiService
 
 def test_init_no_api_key(monkeypatch):
@@ -19,46 +20,99 @@ def test_get_next_api_key_no_keys():
 def test_analyze_clothing_image_all_keys_exhausted(monkeypatch):
     service = GeminiService()
     service.api_keys = ['k1', 'k2']
-    service.current_key_index = 0
-    monkeypatch.setattr(service, '_get_next_api_key', lambda: 'badkey')
-    monkeypatch.setattr('requests.post', lambda *a, **kw: MagicMock(status_code=429, text='quota'))
-    with pytest.raises(ValueError):
+    monkeypatch.setattr(service, '_get_next_api_key', lambda *a, **kw: 'badkey')
+    monkeypatch.setattr(service.session, 'post', lambda *a, **kw: MagicMock(status_code=429, text='quota'))
+    # Still a ValueError, but one the job queue knows to retry later
+    with pytest.raises(GeminiUnavailableError):
         service.analyze_clothing_image(b'data', 'image/jpeg')
 
 def test_analyze_clothing_image_json_decode(monkeypatch):
     service = GeminiService()
     service.api_keys = ['k1']
-    monkeypatch.setattr(service, '_get_next_api_key', lambda: 'k1')
+    monkeypatch.setattr(service, '_get_next_api_key', lambda *a, **kw: 'k1')
     class FakeResp:
         status_code = 200
         def json(self):
             return {'candidates': [{'content': {'parts': [{'text': 'not json'}]}}]}
-    monkeypatch.setattr('requests.post', lambda *a, **kw: FakeResp())
+    monkeypatch.setattr(service.session, 'post', lambda *a, **kw: FakeResp())
     with pytest.raises(ValueError):
         service.analyze_clothing_image(b'data', 'image/jpeg')
 
-def test_generate_style_profile_all_keys_exhausted(monkeypatch):
+def test_generate_style_narrative_all_keys_exhausted(monkeypatch):
     service = GeminiService()
     service.api_keys = ['k1', 'k2']
-    monkeypatch.setattr(service, '_get_next_api_key', lambda: 'badkey')
-    monkeypatch.setattr('requests.post', lambda *a, **kw: MagicMock(status_code=429, text='quota'))
+    monkeypatch.setattr(service, '_get_next_api_key', lambda *a, **kw: 'badkey')
+    monkeypatch.setattr(service.session, 'post', lambda *a, **kw: MagicMock(status_code=429, text='quota'))
     with pytest.raises(ValueError):
-        service.generate_style_profile([{'analysis': '{}'}])
+        service.generate_style_narrative({'dominantStyle': 'casual'})
 
-def test_find_similar_items_json_decode(monkeypatch):
+def test_style_narrative_json_decode(monkeypatch):
     service = GeminiService()
-    service.api_key = 'k1'
+    service.api_keys = ['k1']
     class FakeResp:
         status_code = 200
         def json(self):
             return {'candidates': [{'content': {'parts': [{'text': 'not json'}]}}]}
-    monkeypatch.setattr('requests.post', lambda *a, **kw: FakeResp())
+    monkeypatch.setattr(service.session, 'post', lambda *a, **kw: FakeResp())
     with pytest.raises(ValueError):
-        service.find_similar_items({'id': 1, 'analysis': '{}'}, [{'id': 1, 'analysis': '{}'}])
+        service.generate_style_narrative({'dominantStyle': 'casual'})
 from app.services.gemini_service import gemini_service
 
 def test_gemini_service_methods():
     # בדיקה שהשירות קיים ויש לו את כל הפונקציות (mock בלבד)
     assert hasattr(gemini_service, "analyze_clothing_image")
-    assert hasattr(gemini_service, "generate_style_profile")
-    assert hasattr(gemini_service, "find_similar_items")
+    assert hasattr(gemini_service, "generate_style_narrative")
+    assert not hasattr(gemini_service, "find_similar_items")
+
+
+def _answer(text):
+    class FakeResp:
+        status_code = 200
+        def json(self):
+            return {'candidates': [{'content': {'parts': [{'text': text}]}}]}
+    return FakeResp()
+
+def test_style_narrative_uses_key_scheduler(monkeypatch):
+    import app.services.gemini_service as gs
+    from app.services.analysis_cache import AnalysisCache
+    monkeypatch.setattr(gs, "analysis_cache", AnalysisCache(enabled=False))
+    service = GeminiService()
+    service.api_keys = ['k1', 'k2']
+    sent = []
+    def fake_post(url, **kw):
+        sent.append((url, kw['headers']['x-goog-api-key']))
+        return _answer('```json\n{"stylePersonality": "Bold.", "recommendations": ["Add boots", ""]}\n```')
+    monkeypatch.setattr(service.session, 'post', fake_post)
+    narrative = service.generate_style_narrative({'dominantStyle': 'streetwear'})
+    # Empty recommendations are dropped
+    assert narrative == {'stylePersonality': 'Bold.', 'recommendations': ['Add boots']}
+    # The key travels in a header: request URLs show up in error messages
+    assert sent[0][1] in ('k1', 'k2') and 'key=' not in sent[0][0]
+    assert not hasattr(service, 'api_key')
+
+def test_pipeline_validates_answers(monkeypatch):
+    service = GeminiService()
+    service.api_keys = ['k1']
+    monkeypatch.setattr(service.session, 'post', lambda *a, **kw: _answer('["not", "an", "object"]'))
+    with pytest.raises(ValueError, match='Profile generation failed'):
+        service.generate_style_narrative({'dominantStyle': 'casual'})
+    monkeypatch.setattr(service.session, 'post', lambda *a, **kw: _answer('{"colors": ["red"]}'))
+    with pytest.raises(ValueError, match='missing required "type"'):
+        service._generate([{'text': 'x'}], 'Image analysis failed', validate=service._validate_clothing)
+
+def test_connection_errors_do_not_leak_the_key(monkeypatch, caplog):
+    import socket
+    service = GeminiService()
+    service.api_keys = ['AIzaSECRETKEY1234567890']
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    # Nothing listens there: every attempt is refused
+    service.api_url = f'http://127.0.0.1:{port}/v1beta/x'
+    service._sleep = lambda seconds: None
+    with caplog.at_level('WARNING'):
+        with pytest.raises(ValueError) as raised:
+            service.analyze_clothing_image(b'data', 'image/jpeg')
+    assert 'Max retries exceeded' in str(raised.value)
+    assert 'SECRET' not in str(raised.value)
+    assert 'SECRET' not in caplog.text
@@ -0,0 +1,66 @@
+import json
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+ANSWER = json.dumps({"candidates": [{"content": {"parts": [{"text": '{"type": "shirt"}'}]}}]}).encode()
+
+
+class KeepAliveStub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests += 1
+        self.server.clients.add(self.client_address)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(ANSWER)))
+        self.end_headers()
+        self.wfile.write(ANSWER)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(stub_server):
+    return stub_server(KeepAliveStub, requests=0, clients=set())
+
+
+@pytest.fixture
+def service(stub, gemini_service):
+    return gemini_service(stub)
+
+
+def test_requests_reuse_one_connection(service, stub):
+    for i in range(10):
+        assert service.analyze_clothing_image(f"img-{i}".encode(), "image/jpeg")["type"] == "shirt"
+    # One TCP handshake on the server side for all ten calls
+    assert stub.requests == 10
+    assert len(stub.clients) == 1
+    stats = service.connection_stats()
+    assert (stats["requests"], stats["connections"], stats["reused"]) == (10, 1, 9)
+    assert stats["reuseRatio"] == pytest.approx(0.9)
+
+
+def test_environment_proxies_are_ignored(service, stub, monkeypatch):
+    monkeypatch.setenv("HTTP_PROXY", "http://127.0.0.1:9")
+    monkeypatch.setenv("http_proxy", "http://127.0.0.1:9")
+    service.analyze_clothing_image(b"img", "image/jpeg")
+    assert stub.requests == 1
+
+
+def test_session_is_recreated_after_fork(service):
+    first = service.session
+    assert service.session is first
+    service._session_pid = -1
+    assert service.session is not first
+    assert service.connection_stats()["requests"] == 0
+
+
+def test_connection_stats_endpoint(client):
+    resp = client.get("/api/style/gemini/stats")
+    assert resp.status_code == 200
+    assert {"requests", "connections", "reused", "reuseRatio"} <= set(resp.get_json()["data"])
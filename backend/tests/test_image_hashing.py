@@ -0,0 +1,193 @@
+import io
+import random
+
+import pytest
+from PIL import Image, ImageDraw, ImageOps
+
+import app.services.wardrobe_service as ws
+from app.services.blob_store import blob_store
+from app.services.image_hashing import BKTree, DuplicateIndex, color_signature, dhash, hamming
+
+
+def garment(seed, size=(320, 400)):
+    rnd = random.Random(seed)
+    img = Image.new("RGB", size, tuple(rnd.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(6):
+        x0, y0 = rnd.randrange(size[0] - 40), rnd.randrange(size[1] - 40)
+        box = [x0, y0, x0 + rnd.randrange(40, 200), y0 + rnd.randrange(40, 200)]
+        draw.rectangle(box, fill=tuple(rnd.randrange(256) for _ in range(3)))
+    return img
+
+
+def encode(img, fmt="PNG", **kwargs):
+    buf = io.BytesIO()
+    img.save(buf, fmt, **kwargs)
+    return buf.getvalue()
+
+
+def test_dhash_is_stable_under_resize_and_recompression():
+    img = garment(1)
+    original = dhash(encode(img))
+    resized = dhash(encode(img.resize((160, 200))))
+    jpeg = dhash(encode(img, "JPEG", quality=40))
+    assert hamming(original, resized) <= 6
+    assert hamming(original, jpeg) <= 6
+
+
+def test_dhash_separates_different_images():
+    assert hamming(dhash(encode(garment(1))), dhash(encode(garment(2)))) > 10
+
+
+def test_dhash_rejects_non_images():
+    assert dhash(b"fakeimage") is None
+
+
+def test_bktree_matches_brute_force():
+    rnd = random.Random(3)
+    values = [rnd.getrandbits(64) for _ in range(500)]
+    tree = BKTree()
+    for i, v in enumerate(values):
+        tree.add(v, i)
+    query = values[10] ^ 0b10110
+    expected = sorted((hamming(query, v), i) for i, v in enumerate(values) if hamming(query, v) <= 12)
+    assert sorted(tree.search(query, 12)) == expected
+    assert tree.search(query, 3)[0] == (3, 10)
+    assert BKTree().search(query, 5) == []
+
+
+def test_bktree_keeps_identical_hashes():
+    tree = BKTree()
+    tree.add(42, "a")
+    tree.add(42, "b")
+    assert tree.search(42, 0) == [(0, "a"), (0, "b")]
+    assert tree.size == 2
+
+
+def test_bktree_remove_keeps_other_items_reachable():
+    tree = BKTree()
+    for i, value in enumerate([0, 1, 3, 7, 15]):
+        tree.add(value, i)
+    assert tree.remove(1)
+    assert not tree.remove(1)
+    assert [item for _, item in tree.search(0, 64)] == [0, 2, 3, 4]
+    assert tree.size == 4
+
+
+@pytest.fixture
+def isolated(monkeypatch, tmp_path):
+    monkeypatch.setattr(ws, "DB_PATH", str(tmp_path / "dupes.sqlite3"))
+    monkeypatch.setattr(blob_store, "root", str(tmp_path / "blobs"))
+    import app.services.style_analysis_service as sas
+    index = DuplicateIndex(max_distance=6)
+    monkeypatch.setattr(sas, "duplicate_index", index)
+    yield index
+    ws.close_pool()
+
+
+def test_index_sees_items_added_later(isolated):
+    service = ws.WardrobeService()
+    phash = dhash(encode(garment(5)))
+    assert isolated.find("u", phash) == []
+    item = service.add_item("u", {"phash": format(phash, "016x")}, {"type": "shirt"})
+    assert isolated.find("u", phash) == [(0, item["id"])]
+    assert isolated.find("someone_else", phash) == []
+
+
+def test_disabled_index():
+    assert DuplicateIndex(max_distance=-1).find("u", 1) == []
+
+
+def test_near_duplicate_upload_reuses_analysis(isolated, client, monkeypatch):
+    import app.services.gemini_service as gs
+    calls = []
+
+    def fake_analyze(data, mime):
+        calls.append(1)
+        return {"type": "shirt", "colors": ["red"]}
+
+    monkeypatch.setattr(gs.gemini_service, "analyze_clothing_image", fake_analyze)
+    img = garment(9)
+
+    def upload(data):
+        return client.post("/api/style/analyze", data={
+            "userId": "dup_user", "image": (io.BytesIO(data), "g.jpg", "image/jpeg")
+        }, content_type="multipart/form-data").get_json()["data"]
+
+    first = upload(encode(img, "JPEG", quality=90))
+    second = upload(encode(img.resize((200, 250)), "JPEG", quality=50))
+    assert len(calls) == 1
+    assert first["duplicateOf"] is None
+    assert second["duplicateOf"]["itemId"] == first["wardrobeItem"]["id"]
+    assert second["analysis"] == first["analysis"]
+    assert second["wardrobeItem"]["imageInfo"]["duplicateOf"] == first["wardrobeItem"]["id"]
+
+    upload(encode(garment(10), "JPEG"))
+    assert len(calls) == 2
+
+
+def test_same_cut_in_another_color_is_not_a_duplicate(isolated, client, monkeypatch):
+    import app.services.gemini_service as gs
+    colors = iter([["red"], ["blue"]])
+    monkeypatch.setattr(gs.gemini_service, "analyze_clothing_image",
+                        lambda data, mime: {"type": "shirt", "colors": next(colors)})
+    shape = ImageOps.grayscale(garment(12))
+    red = encode(ImageOps.colorize(shape, (0, 0, 0), (255, 80, 80)), "JPEG")
+    blue = encode(ImageOps.colorize(shape, (0, 0, 0), (80, 110, 255)), "JPEG")
+    # Indistinguishable to the grayscale hash
+    assert hamming(dhash(red), dhash(blue)) <= isolated.max_distance
+    assert not isolated.same_colors(color_signature(red), color_signature(blue))
+
+    def upload(data):
+        return client.post("/api/style/analyze", data={
+            "userId": "color_user", "image": (io.BytesIO(data), "g.jpg", "image/jpeg")
+        }, content_type="multipart/form-data").get_json()["data"]
+
+    upload(red)
+    second = upload(blue)
+    assert second["duplicateOf"] is None
+    assert second["analysis"]["colors"] == ["blue"]
+
+
+def test_items_without_color_signature_are_not_reused(isolated):
+    data = encode(garment(13))
+    assert isolated.same_colors(color_signature(data), color_signature(data))
+    assert not isolated.same_colors(color_signature(data), None)
+
+
+def test_deleted_match_falls_back_to_gemini(isolated, monkeypatch):
+    import app.services.gemini_service as gs
+    from app.services.style_analysis_service import StyleAnalysisService
+    monkeypatch.setattr(gs.gemini_service, "analyze_clothing_image", lambda d, m: {"type": "new"})
+    data = encode(garment(11))
+    service = ws.WardrobeService()
+    item = service.add_item("u", {"phash": format(dhash(data), "016x")}, {"type": "old"})
+    service.delete_item("u", item["id"])
+    result = StyleAnalysisService().analyze_image(data, "image/png", {}, user_id="u")
+    assert result["analysis"] == {"type": "new"}
+    assert result["duplicateOf"] is None
+
+
+def test_deleted_items_are_dropped_from_the_tree(isolated):
+    service = ws.WardrobeService()
+    phash = dhash(encode(garment(5)))
+    item = service.add_item("u", {"phash": format(phash, "016x")}, {"type": "shirt"})
+    assert isolated.find("u", phash) == [(0, item["id"])]
+    service.delete_item("u", item["id"])
+    assert isolated.find("u", phash) == []
+    assert isolated._users["u"][0].size == 0
+
+
+def test_queries_run_outside_the_index_lock(isolated, monkeypatch):
+    import app.services.image_hashing as ih
+    service = ws.WardrobeService()
+    phash = dhash(encode(garment(6)))
+    service.add_item("u", {"phash": format(phash, "016x")}, {"type": "shirt"})
+
+    class CheckedPool:
+        def connection(self):
+            assert not isolated._lock.locked()
+            return ws.get_pool().connection()
+
+    monkeypatch.setattr(ih, "get_pool", CheckedPool)
+    assert len(isolated.find("u", phash)) == 1
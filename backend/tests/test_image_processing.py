@@ -0,0 +1,111 @@
+import io
+
+import pytest
+from PIL import Image
+
+import app.services.wardrobe_service as ws
+from app.services.blob_store import blob_store
+from app.services.image_processing import ImagePreprocessor
+
+EXIF_ORIENTATION = 0x0112
+EXIF_GPS_IFD = 0x8825
+
+
+def photo(size=(4000, 3000), mode="RGB", orientation=None, fmt="JPEG"):
+    img = Image.new(mode, size, (200, 30, 30) if mode == "RGB" else (200, 30, 30, 0))
+    img.paste((30, 30, 200) if mode == "RGB" else (30, 30, 200, 255), (0, 0, size[0] // 4, size[1]))
+    buf = io.BytesIO()
+    exif = Image.Exif()
+    if orientation:
+        exif[EXIF_ORIENTATION] = orientation
+    exif[0x010F] = "CameraMaker"
+    img.save(buf, fmt, exif=exif.tobytes()) if fmt == "JPEG" else img.save(buf, fmt)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def pre():
+    return ImagePreprocessor(max_edge=1024, quality=80, thumbnail_edge=128, enabled=True)
+
+
+def test_downsizes_and_reencodes_as_jpeg(pre):
+    data = photo()
+    out = pre.process(data)
+    assert out["mimeType"] == "image/jpeg"
+    assert (out["width"], out["height"]) == (1024, 768)
+    assert out["bytes"] < out["originalBytes"]
+    with Image.open(io.BytesIO(out["thumbnail"])) as thumb:
+        assert max(thumb.size) == 128
+
+
+def test_strips_exif_and_applies_orientation(pre):
+    out = pre.process(photo(size=(800, 400), orientation=6))
+    with Image.open(io.BytesIO(out["data"])) as img:
+        assert img.size == (400, 800)
+        assert len(img.getexif()) == 0
+
+
+def test_small_images_are_not_upscaled(pre):
+    out = pre.process(photo(size=(300, 200)))
+    assert (out["width"], out["height"]) == (300, 200)
+
+
+def test_transparent_png_is_flattened(pre):
+    out = pre.process(photo(size=(64, 64), mode="RGBA", fmt="PNG"))
+    with Image.open(io.BytesIO(out["data"])) as img:
+        assert img.mode == "RGB"
+        assert img.getpixel((60, 60)) == pytest.approx((255, 255, 255), abs=3)
+
+
+def test_undecodable_or_disabled(pre):
+    assert pre.process(b"fakeimage") is None
+    assert ImagePreprocessor(enabled=False).process(photo(size=(10, 10))) is None
+
+
+@pytest.fixture
+def isolated(monkeypatch, tmp_path):
+    monkeypatch.setattr(ws, "DB_PATH", str(tmp_path / "proc.sqlite3"))
+    monkeypatch.setattr(blob_store, "root", str(tmp_path / "blobs"))
+    yield
+    ws.close_pool()
+
+
+def test_analyze_sends_processed_image_and_stores_original(isolated, client, monkeypatch):
+    import app.services.gemini_service as gs
+    import app.services.style_analysis_service as sas
+    monkeypatch.setattr(sas, "image_preprocessor", ImagePreprocessor(max_edge=512, enabled=True))
+    sent = {}
+
+    def fake_analyze(data, mime):
+        sent["data"], sent["mime"] = data, mime
+        return {"type": "shirt"}
+
+    monkeypatch.setattr(gs.gemini_service, "analyze_clothing_image", fake_analyze)
+    original = photo(size=(2000, 1500), orientation=3)
+    item = client.post("/api/style/analyze", data={
+        "userId": "proc_user", "image": (io.BytesIO(original), "big.jpg", "image/jpeg")
+    }, content_type="multipart/form-data").get_json()["data"]["wardrobeItem"]
+
+    assert sent["mime"] == "image/jpeg"
+    with Image.open(io.BytesIO(sent["data"])) as img:
+        assert max(img.size) == 512
+        assert len(img.getexif()) == 0
+    assert blob_store.read(item["image_blob"]) == original
+    assert item["imageInfo"]["size"] == len(original)
+    assert item["thumbnailUrl"].endswith(f"/api/wardrobe/{item['id']}/thumbnail?userId=proc_user")
+
+    resp = client.get(f"/api/wardrobe/{item['id']}/thumbnail?userId=proc_user")
+    assert resp.status_code == 200
+    assert resp.mimetype == "image/jpeg"
+
+    client.delete(f"/api/wardrobe/{item['id']}?userId=proc_user")
+    assert not blob_store.exists(item["thumb_blob"])
+
+
+def test_clients_cannot_set_thumbnail(isolated, client):
+    digest = blob_store.put(b"someone's thumbnail")
+    item = client.post("/api/wardrobe/", json={
+        "userId": "u", "imageInfo": {"thumbnail": digest}, "analysis": {}
+    }).get_json()["data"]
+    assert item["thumb_blob"] is None
+    assert client.get(f"/api/wardrobe/{item['id']}/thumbnail?userId=u").status_code == 404
@@ -0,0 +1,95 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+import app.services.wardrobe_service as ws
+from app.services.item_features import LAYOUT, encode, from_blob, to_blob
+from app.services.item_similarity import FeatureMatrix, similarity_index
+from app.services.wardrobe_migrations import run_migrations
+
+
+@pytest.fixture
+def isolated(monkeypatch, tmp_path):
+    monkeypatch.setattr(ws, "DB_PATH", str(tmp_path / "similar_wardrobe.sqlite3"))
+    similarity_index.reset()
+    yield
+    similarity_index.reset()
+    ws.close_pool()
+
+
+def add(user_id, *analyses):
+    return ws.wardrobe_service.add_items(user_id, [({}, a) for a in analyses])
+
+
+def test_blocks_are_unit_length_and_round_trip():
+    vector = encode('{"type": "Jeans", "colors": ["Gray", "red"], "style": "casual", "season": "all-season"}')
+    for name, block in LAYOUT.slices.items():
+        norm = np.linalg.norm(vector[block])
+        assert norm == pytest.approx(1.0 if name not in ("pattern", "fabric", "occasion") else 0.0, abs=1e-6)
+    assert (vector[LAYOUT.slices["season"]] > 0).all()
+    assert np.array_equal(from_blob(to_blob(vector)), vector)
+    assert from_blob(b"\0" * 8) is None
+    # Unparseable analyses are taken as a type name
+    category = encode("mystery garment")[LAYOUT.slices["category"]]
+    assert category[LAYOUT.index["category"]["other"]] == 1
+
+
+def test_complementary_pieces_rank_first():
+    analyses = [
+        {"type": "shirt", "style": "casual", "colors": ["navy"], "pattern": "solid", "season": "summer"},
+        {"type": "jeans", "style": "casual", "colors": ["blue"], "pattern": "solid", "season": "summer"},
+        {"type": "shirt", "style": "casual", "colors": ["navy"], "pattern": "solid", "season": "summer"},
+        {"type": "heels", "style": "elegant", "colors": ["red"], "pattern": "floral", "season": "winter"},
+        {"type": "sneakers", "style": "casual", "colors": ["white"], "season": "summer"},
+    ]
+    matrix = FeatureMatrix([10, 11, 12, 13, 14], [encode(a) for a in analyses])
+    ranked = matrix.top_k(10, 4)
+    # A second navy shirt is the closest look-alike but completes nothing
+    assert [item_id for item_id, _, _ in ranked] == [11, 14, 13, 12]
+    assert all(0 <= score <= 1 for _, score, _ in ranked)
+    assert matrix.reason(0, 1) == "Jeans completes an outfit with the shirt; same casual style; " \
+                                   "neutral colors go with anything; both work in summer"
+    assert matrix.top_k(99, 3) == []
+
+
+def test_index_follows_wardrobe_changes(isolated):
+    shirt, pants = add("u", {"type": "shirt", "style": "formal"}, {"type": "trousers", "style": "formal"})
+    assert [m["itemId"] for m in similarity_index.top_k("u", shirt["id"])] == [pants["id"]]
+    boots, = add("u", {"type": "boots", "style": "formal"})
+    assert {m["itemId"] for m in similarity_index.top_k("u", shirt["id"])} == {pants["id"], boots["id"]}
+    ws.wardrobe_service.delete_item("u", pants["id"])
+    assert [m["itemId"] for m in similarity_index.top_k("u", shirt["id"])] == [boots["id"]]
+    assert similarity_index.top_k("other", shirt["id"]) == []
+
+
+def test_migration_backfills_and_stale_vectors_are_reencoded(tmp_path, isolated):
+    path = tmp_path / "legacy.sqlite3"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE wardrobe (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, "
+                 "image_info TEXT, analysis TEXT, favorite INTEGER DEFAULT 0, added_at TEXT)")
+    conn.execute("INSERT INTO wardrobe (user_id, analysis) VALUES ('u', '{\"type\": \"coat\"}')")
+    conn.commit()
+    run_migrations(conn)
+    blob = conn.execute("SELECT features FROM wardrobe").fetchone()[0]
+    assert np.array_equal(from_blob(blob), encode({"type": "coat"}))
+    conn.close()
+
+    shirt, coat = add("u", {"type": "shirt"}, {"type": "coat"})
+    with ws.get_pool().connection() as db:
+        db.execute("UPDATE wardrobe SET features=? WHERE id=?", (b"\0" * 8, coat["id"]))
+        db.commit()
+    matrix = similarity_index.matrix("u")
+    assert np.array_equal(matrix.vectors[matrix.position[coat["id"]]], encode({"type": "coat"}))
+
+
+def test_similar_endpoint(isolated, client):
+    shirt, jeans = add("u", {"type": "shirt", "style": "casual"}, {"type": "jeans", "style": "casual"})
+    resp = client.get(f"/api/style/items/{shirt['id']}/similar?userId=u&limit=3")
+    assert resp.status_code == 200
+    data = resp.get_json()["data"]
+    assert data[0]["itemId"] == jeans["id"]
+    assert 0 <= data[0]["matchScore"] <= 100 and data[0]["reason"]
+    assert client.get(f"/api/style/items/{shirt['id']}/similar").status_code == 401
+    assert client.get(f"/api/style/items/{shirt['id']}/similar?userId=v").status_code == 404
+    assert client.get(f"/api/style/items/{shirt['id']}/similar?userId=u&limit=0").status_code == 400
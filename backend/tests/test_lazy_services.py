@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+import threading
+
+from app.services.lazy import LazyService
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+class Counter:
+    instances = 0
+
+    def __init__(self):
+        Counter.instances += 1
+        self.value = 1
+
+    def __len__(self):
+        return self.value
+
+
+def test_builds_once_on_first_use_and_forwards():
+    Counter.instances = 0
+    service = LazyService(Counter)
+    assert not service.built and Counter.instances == 0 and "not built" in repr(service)
+
+    threads = [threading.Thread(target=lambda: service.value) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert Counter.instances == 1 and service.built
+
+    service.value = 3
+    assert service._lazy_instance.value == 3 and len(service) == 3
+    del service.value
+    assert not hasattr(service._lazy_instance, "value")
+
+
+def test_importing_the_app_builds_no_services():
+    code = (
+        "import app.wsgi, app.app\n"
+        "from app.services import gemini_service, wardrobe_service, style_analysis_service\n"
+        "assert app.app.app is app.wsgi.app\n"
+        "print(gemini_service.gemini_service.built, wardrobe_service.wardrobe_service.built,\n"
+        "      style_analysis_service.style_analysis_service.built)\n"
+    )
+    env = dict(os.environ, NODE_ENV="test")
+    out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    assert out.split() == ["False", "False", "False"]
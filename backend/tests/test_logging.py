@@ -0,0 +1,88 @@
+import io
+import json
+import logging
+import time
+
+import pytest
+
+from app.services import tracing
+from app.services.logging_config import (
+    DebugRateLimiter, LoggingSetup, NonBlockingQueueHandler, SecretMasker, parse_levels
+)
+
+GOOGLE_KEY = "AIza" + "x" * 35
+
+
+@pytest.fixture
+def captured():
+    root = logging.getLogger()
+    level = root.level
+    setup = LoggingSetup()
+    stream = io.StringIO()
+    setup.configure(level="INFO", levels="tests.noisy=ERROR", fmt="json", stream=stream,
+                    masker=SecretMasker(["profiler-token-123"]))
+
+    def lines():
+        setup.flush()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    yield lines
+    setup.stop()
+    root.removeHandler(setup.handler)
+    root.setLevel(level)
+    logging.getLogger("tests.noisy").setLevel(logging.NOTSET)
+
+
+def test_json_lines_with_request_id_and_masking(captured):
+    log = logging.getLogger("tests.logging")
+    root, token = tracing.start_trace("GET /x", request_id="req-42")
+    try:
+        log.info("calling %s", f"https://gemini/generate?key={GOOGLE_KEY}&alt=json", extra={"key": "k...1"})
+    finally:
+        tracing.end_trace(root, token)
+    log.warning("token profiler-token-123 and %s", GOOGLE_KEY)
+    logging.getLogger("tests.noisy").warning("filtered by its own level")
+    log.debug("below the root level")
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        log.exception("failed")
+
+    first, second, third = captured()
+    assert first["level"] == "INFO" and first["logger"] == "tests.logging"
+    assert first["msg"] == "calling https://gemini/generate?key=***&alt=json"
+    assert first["request_id"] == "req-42" and first["key"] == "k...1"
+    assert second["msg"] == "token *** and ***" and "request_id" not in second
+    assert third["msg"] == "failed" and "ValueError: boom" in third["exc"]
+
+
+def test_debug_records_are_rate_limited_per_call_site():
+    limiter = DebugRateLimiter(rate=2, sample_every=1)
+
+    def record(site, level=logging.DEBUG):
+        return logging.LogRecord("x", level, "file.py", 1, f"message {site}", (), None)
+
+    assert [limiter.filter(record(1)) for _ in range(5)] == [True, True, False, False, False]
+    assert limiter.filter(record(2))
+    assert limiter.filter(record(1, logging.INFO))
+    time.sleep(0.6)
+    allowed = record(1)
+    assert limiter.filter(allowed) and allowed.suppressed == 3
+
+    sampled = DebugRateLimiter(rate=0, sample_every=3)
+    assert [sampled.filter(record(1)) for _ in range(6)] == [True, False, False, True, False, False]
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = NonBlockingQueueHandler(1)
+    for _ in range(3):
+        handler.emit(logging.LogRecord("x", logging.INFO, "f.py", 1, "msg %s", ({"a": 1},), None))
+    assert handler.dropped == 2
+    record, span = handler.queue.get_nowait()
+    assert record.getMessage() == "msg {'a': 1}" and span is None
+
+
+def test_parse_levels():
+    assert parse_levels("app.services.gemini_service=debug, werkzeug=WARNING,bad,") == {
+        "app.services.gemini_service": "DEBUG", "werkzeug": "WARNING"
+    }
@@ -0,0 +1,94 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import app.services.wardrobe_service as ws
+from app.services.metrics import Registry, bucket_index, bucket_value, quantile
+
+
+@pytest.fixture
+def isolated(monkeypatch, tmp_path):
+    monkeypatch.setattr(ws, "DB_PATH", str(tmp_path / "metrics_wardrobe.sqlite3"))
+    yield
+    ws.close_pool()
+
+
+def test_buckets_keep_relative_precision():
+    for value in (3e-5, 0.0042, 0.25, 1, 17.3, 4000):
+        assert abs(bucket_value(bucket_index(value)) - value) / value < 0.035
+
+    buckets = {}
+    for ms in range(1, 1001):
+        index = bucket_index(ms / 1000)
+        buckets[index] = buckets.get(index, 0) + 1
+    assert quantile(buckets, 1000, 0.95) == pytest.approx(0.95, rel=0.035)
+    assert quantile(buckets, 1000, 0.5) == pytest.approx(0.5, rel=0.035)
+
+
+def test_render_prometheus_text():
+    registry = Registry(directory="")
+    requests = registry.counter("jobs_total", "Jobs run", ("queue",))
+    latency = registry.histogram("job_seconds", "Job latency", ("queue",), buckets=(0.01, 0.1))
+    requests.inc('a"b')
+    requests.inc('a"b', amount=2)
+    for value in (0.005, 0.05, 0.5):
+        latency.observe(value, "q")
+
+    text = registry.render()
+    assert '# TYPE jobs_total counter\njobs_total{queue="a\\"b"} 3\n' in text
+    assert 'job_seconds_bucket{queue="q",le="0.01"} 1\n' in text
+    assert 'job_seconds_bucket{queue="q",le="0.1"} 2\n' in text
+    assert 'job_seconds_bucket{queue="q",le="+Inf"} 3\n' in text
+    assert 'job_seconds_count{queue="q"} 3\n' in text
+    assert 'job_seconds_quantile{queue="q",quantile="0.5"} ' in text
+
+    with pytest.raises(ValueError):
+        requests.inc()
+    with pytest.raises(ValueError):
+        registry.gauge("jobs_total", "Clash")
+
+
+def test_workers_are_merged(tmp_path):
+    registry = Registry(directory=str(tmp_path))
+    registry.counter("jobs_total", "Jobs run").inc()
+    registry.gauge("busy", "Busy workers").set(1)
+    registry.histogram("job_seconds", "Job latency").observe(0.2)
+
+    # A worker that has exited: its counters still count, its gauges don't
+    dead = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                          capture_output=True, text=True).stdout.strip()
+    live = os.getppid()
+    for pid in (int(dead), live):
+        other = Registry(directory="")
+        other.counter("jobs_total", "Jobs run").inc(amount=10)
+        other.gauge("busy", "Busy workers").set(1)
+        other.histogram("job_seconds", "Job latency").observe(2.0)
+        with open(tmp_path / f"metrics-{pid}.json", "w") as f:
+            json.dump({"pid": pid, "metrics": other.snapshot()}, f)
+
+    merged = registry.collect()
+    assert merged["jobs_total"]["samples"][()] == 21
+    assert merged["busy"]["samples"][()] == 2
+    assert merged["job_seconds"]["samples"][()]["count"] == 3
+
+    registry.flush()
+    assert json.loads((tmp_path / f"metrics-{os.getpid()}.json").read_text())["metrics"]["jobs_total"]
+
+
+def test_metrics_endpoint_covers_routes_and_queries(isolated, client):
+    ws.wardrobe_service.add_item("u", {}, {"type": "shirt"})
+    assert client.get("/api/wardrobe/?userId=u").status_code == 200
+    assert client.get("/api/wardrobe/?userId=u&limit=x").status_code == 400
+
+    resp = client.get("/api/metrics")
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/plain"
+    text = resp.get_data(as_text=True)
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/wardrobe/",status="200"}' in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/wardrobe/",status="400"}' in text
+    assert 'wardrobe_query_duration_seconds_count{method="list_items",status="ok"}' in text
+    assert 'wardrobe_query_duration_seconds_count{method="add_item",status="ok"}' in text
+    assert "# TYPE gemini_request_duration_seconds histogram" in text
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+import app.services.wardrobe_service as ws
+from app.services.item_features import encode
+from app.services.item_similarity import FeatureMatrix
+from app.services.outfit_service import CompatibilityIndex, OutfitGenerator, outfit_service
+
+WARDROBE = [
+    {"type": "t-shirt", "style": "casual", "colors": ["white"], "season": "summer", "occasion": "daily"},
+    {"type": "sweater", "style": "casual", "colors": ["grey"], "season": "winter", "occasion": "daily"},
+    {"type": "shirt", "style": "formal", "colors": ["blue"], "season": "all-season", "occasion": "work"},
+    {"type": "shorts", "style": "casual", "colors": ["beige"], "season": "summer", "occasion": "daily"},
+    {"type": "jeans", "style": "casual", "colors": ["blue"], "season": "all-season", "occasion": "daily"},
+    {"type": "trousers", "style": "formal", "colors": ["black"], "season": "all-season", "occasion": "work"},
+    {"type": "sneakers", "style": "casual", "colors": ["white"], "season": "all-season", "occasion": "daily"},
+    {"type": "loafers", "style": "formal", "colors": ["brown"], "season": "all-season", "occasion": "work"},
+    {"type": "coat", "style": "classic", "colors": ["navy"], "season": "winter"},
+    {"type": "dress", "style": "elegant", "colors": ["red"], "pattern": "floral", "season": "summer",
+     "occasion": "party"},
+]
+
+
+@pytest.fixture
+def isolated(monkeypatch, tmp_path):
+    monkeypatch.setattr(ws, "DB_PATH", str(tmp_path / "outfit_wardrobe.sqlite3"))
+    outfit_service.index.reset()
+    yield
+    outfit_service.index.reset()
+    ws.close_pool()
+
+
+def build(analyses):
+    features = FeatureMatrix(range(len(analyses)), [encode(a) for a in analyses])
+    matrix = np.rint(features.compatibility(np.arange(len(features))) * 255).astype(np.uint8)
+    return features, matrix
+
+
+def types(features, rows):
+    return [features.label(row, "type") for row in rows]
+
+
+def test_weather_decides_the_layers():
+    features, matrix = build(WARDROBE)
+    generator = OutfitGenerator(beam_width=20)
+
+    (summer, score), = generator.generate(features, matrix, temperature=28, limit=1)
+    assert types(features, summer) == ["t-shirt", "shorts", "sneakers"]
+    assert 0 < score <= 1
+
+    (winter, _), = generator.generate(features, matrix, temperature=5, limit=1)
+    assert types(features, winter)[0] == "sweater" and types(features, winter)[-1] == "coat"
+
+    (rainy_summer, _), = generator.generate(features, matrix, temperature=28, weather="Rain", limit=1)
+    assert types(features, rainy_summer)[-1] == "coat"
+
+
+def test_occasion_and_distinct_outfits():
+    features, matrix = build(WARDROBE)
+    generator = OutfitGenerator(beam_width=20)
+    (work, _), = generator.generate(features, matrix, occasion="work", limit=1)
+    assert types(features, work)[:3] == ["shirt", "trousers", "loafers"]
+
+    (party, _), = generator.generate(features, matrix, occasion="party", temperature=26, limit=1)
+    # No top suits a party, so the dress plan wins
+    assert types(features, party)[0] == "dress" and len(party) == 2
+
+    outfits = generator.generate(features, matrix, limit=5)
+    assert len(outfits) > 1
+    for i, (rows, _) in enumerate(outfits):
+        for other, _ in outfits[:i]:
+            assert len(set(rows) & set(other)) * 2 <= len(rows)
+    assert [score for _, score in outfits] == sorted((score for _, score in outfits), reverse=True)
+
+
+def test_no_outfit_without_required_pieces():
+    features, matrix = build([{"type": "sneakers"}, {"type": "coat"}])
+    assert OutfitGenerator().generate(features, matrix) == []
+
+
+def test_matrix_is_updated_incrementally(isolated):
+    index = CompatibilityIndex()
+    items = ws.wardrobe_service.add_items("u", [({}, a) for a in WARDROBE[:6]])
+    index.get("u")
+    ws.wardrobe_service.add_items("u", [({}, a) for a in WARDROBE[6:]])
+    ws.wardrobe_service.delete_item("u", items[1]["id"])
+    features, matrix = index.get("u")
+    assert index.stats()["builds"] == 1 and index.stats()["updates"] == 1
+    assert items[1]["id"] not in features.position
+
+    fresh = CompatibilityIndex()
+    fresh_features, fresh_matrix = fresh.get("u")
+    order = [fresh_features.position[int(item_id)] for item_id in features.ids]
+    assert np.array_equal(matrix, fresh_matrix[np.ix_(order, order)])
+    assert np.shares_memory(index.get("u")[1], matrix)
+
+
+def test_outfits_endpoint(isolated, client):
+    ws.wardrobe_service.add_items("u", [({"filename": f"{i}.jpg"}, a) for i, a in enumerate(WARDROBE)])
+    resp = client.get("/api/style/outfits?userId=u&temperature=28&limit=2")
+    assert resp.status_code == 200
+    outfits = resp.get_json()["data"]
+    assert len(outfits) == 2
+    first = outfits[0]
+    assert [item["analysis"]["type"] for item in first["items"]] == ["t-shirt", "shorts", "sneakers"]
+    assert first["slots"]["tops"] == first["items"][0]["id"]
+    assert first["reason"].startswith("Casual look for 28°C")
+    assert 0 < first["score"] <= 100
+
+    assert client.get("/api/style/outfits").status_code == 401
+    assert client.get("/api/style/outfits?userId=u&temperature=warm").status_code == 400
+    assert client.get("/api/style/outfits?userId=u&limit=11").status_code == 400
+    assert client.get("/api/style/outfits?userId=nobody").get_json()["data"] == []
@@ -0,0 +1,98 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import app.services.profiler as profiler
+import app.services.wardrobe_service as ws
+from app.services.profiler import RequestProfiler, Sampler, StackProfile
+
+
+def busy_loop(seconds):
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += sum(range(200))
+    return total
+
+
+@pytest.fixture
+def fast_profiler(tmp_path):
+    return RequestProfiler(enabled=True, token="s3cret", directory=str(tmp_path), sample_every=0,
+                           sampler=Sampler(interval=0.001, max_overhead=0.5))
+
+
+def test_stack_profile_formats():
+    profile = StackProfile("GET /x")
+    profile.add(("main", "handler", "query"), 0.002)
+    profile.add(("main", "handler", "query"), 0.003)
+    profile.add(("main", "render"), 0.001)
+    assert profile.to_collapsed() == "main;handler;query 2\nmain;render 1\n"
+
+    speedscope = profile.to_speedscope()
+    frames = [frame["name"] for frame in speedscope["shared"]["frames"]]
+    sampled = speedscope["profiles"][0]
+    assert frames == ["main", "handler", "query", "render"]
+    assert sampled["samples"] == [[0, 1, 2], [0, 3]]
+    assert sampled["weights"] == [5.0, 1.0] and sampled["endValue"] == 6.0
+
+
+def test_on_demand_profile_needs_the_token(fast_profiler, tmp_path):
+    assert fast_profiler.start("GET /x") is None
+    assert fast_profiler.start("GET /x", "wrong") is None
+
+    handle = fast_profiler.start("GET /x", "s3cret")
+    busy_loop(0.1)
+    profile_id = fast_profiler.stop(handle, "GET /x req-1")
+    assert profile_id.endswith("GET-x-req-1")
+    collapsed = (tmp_path / f"{profile_id}.collapsed.txt").read_text()
+    assert "busy_loop (test_profiler.py:" in collapsed
+    speedscope = json.loads((tmp_path / f"{profile_id}.speedscope.json").read_text())
+    assert 50 < speedscope["profiles"][0]["endValue"] < 500
+    assert fast_profiler.sampler.active == 0
+
+    assert RequestProfiler(enabled=False, token="s3cret").start("GET /x", "s3cret") is None
+
+
+def test_aggregate_samples_one_request_in_n(tmp_path):
+    sampler = Sampler(interval=0.001, max_overhead=0.5)
+    aggregate = RequestProfiler(enabled=True, token="", directory=str(tmp_path), sample_every=2,
+                                flush_seconds=0, sampler=sampler)
+    handles = []
+    for _ in range(4):
+        handle = aggregate.start("GET /x")
+        handles.append(handle)
+        if handle is not None:
+            busy_loop(0.03)
+            assert aggregate.stop(handle) is None
+    assert [h is not None for h in handles] == [False, True, False, True]
+    assert aggregate.aggregate.samples > 0
+    assert os.path.exists(tmp_path / f"aggregate-{os.getpid()}.collapsed.txt")
+
+
+def test_overhead_is_bounded():
+    # Without the bound, a 0.1ms interval would take ~2000 samples in 0.2s
+    sampler = Sampler(interval=0.0001, max_overhead=0.01)
+    profile = StackProfile("x")
+    sampler.register(threading.get_ident(), [profile])
+    busy_loop(0.2)
+    sampler.unregister(threading.get_ident())
+    assert 0 < profile.samples < 500
+
+
+def test_profiled_request(monkeypatch, tmp_path, fast_profiler):
+    monkeypatch.setattr(ws, "DB_PATH", str(tmp_path / "profile_wardrobe.sqlite3"))
+    monkeypatch.setattr(profiler, "request_profiler", fast_profiler)
+    from app import create_app
+    client = create_app().test_client()
+    try:
+        resp = client.get("/api/wardrobe/?userId=u", headers={"X-Profile": "s3cret", "X-Request-ID": "p1"})
+        assert resp.status_code == 200
+        profile_id = resp.headers["X-Profile-Id"]
+        assert profile_id.endswith("GET-api-wardrobe-p1")
+        assert (tmp_path / f"{profile_id}.speedscope.json").exists()
+        assert "X-Profile-Id" not in client.get("/api/wardrobe/?userId=u").headers
+    finally:
+        ws.close_pool()
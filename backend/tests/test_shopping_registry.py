@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+import app.services.wardrobe_service as ws
+from app.services.shopping_service import ShoppingService, search_key
+from app.services.store_registry import StoreRegistry
+
+
+@pytest.fixture
+def isolated(monkeypatch, tmp_path):
+    monkeypatch.setattr(ws, "DB_PATH", str(tmp_path / "shopping_wardrobe.sqlite3"))
+    yield
+    ws.close_pool()
+
+
+def test_registry_locale_and_disabled_stores():
+    us = StoreRegistry()
+    assert [store.id for store in us] == ["amazon", "zara", "hm", "asos", "target"]
+
+    uk = StoreRegistry(locale="en_GB", disabled=["zara", " "])
+    assert [store.id for store in uk] == ["amazon", "hm", "asos"]
+    amazon, hm = uk.stores[0], uk.stores[1]
+    assert amazon.to_dict()["url"] == "https://www.amazon.co.uk/s?k={query}"
+    assert hm.link("red dress", "red%20dress")["url"] == "https://www2.hm.com/en_gb/search-results.html?q=red%20dress"
+
+    with pytest.raises(ValueError):
+        StoreRegistry([{"id": "bad", "store": "Bad", "url": "https://example.com/"}])
+
+
+def test_registry_from_file(monkeypatch, tmp_path):
+    path = tmp_path / "stores.json"
+    path.write_text(json.dumps({"stores": [
+        {"id": "shop", "store": "Shop", "emoji": "🛒", "url": "https://shop.example/?q={query}"},
+        {"id": "off", "store": "Off", "url": "https://off.example/?q={query}", "enabled": False},
+    ]}))
+    monkeypatch.setenv("SHOPPING_STORES_FILE", str(path))
+    registry = StoreRegistry.from_env()
+    assert registry.to_dict()["stores"] == [
+        {"id": "shop", "store": "Shop", "emoji": "🛒", "url": "https://shop.example/?q={query}"}
+    ]
+
+
+def test_links_are_memoized_by_normalised_key():
+    service = ShoppingService(StoreRegistry())
+    assert search_key('{"type": " Shirt ", "style": "Casual", "colors": ["Light  Blue"]}') == (
+        "shirt", "casual", "light blue")
+
+    first = service.generate_shopping_links({"type": "shirt", "style": "casual", "colors": ["light blue"]})
+    first[0]["url"] = "changed"
+    second = service.generate_shopping_links('{"type": "Shirt", "style": "CASUAL", "colors": ["light blue"]}')
+    assert second[0] == {"store": "Amazon", "emoji": "📦", "url": "https://www.amazon.com/s?k=shirt%20casual%20light%20blue",
+                         "query": "shirt casual light blue"}
+    assert service.stats()["misses"] == 1 and service.stats()["hits"] == 1
+
+    assert service.links_for_pieces(["neutral basics (black, white or navy)"])[
+        "neutral basics (black, white or navy)"][0]["query"] == "neutral basics"
+
+
+def test_batch_endpoint(isolated, client):
+    items = ws.wardrobe_service.add_items("u", [
+        ({}, {"type": "jeans", "colors": ["blue"]}),
+        ({}, {"type": "coat", "style": "classic"}),
+    ])
+    resp = client.post("/api/shopping/recommendations/batch", json={
+        "userId": "u", "itemIds": [items[0]["id"], items[1]["id"], 999999], "missingPieces": ["warm coat"]
+    })
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert set(data["items"]) == {str(items[0]["id"]), str(items[1]["id"])}
+    assert data["items"][str(items[0]["id"])][0]["query"] == "jeans blue"
+    assert data["missingPieces"]["warm coat"][0]["query"] == "warm coat"
+
+    post = client.post
+    assert post("/api/shopping/recommendations/batch", json={"itemIds": [items[0]["id"]]}).status_code == 401
+    assert post("/api/shopping/recommendations/batch", json={}).status_code == 400
+    assert post("/api/shopping/recommendations/batch", json={"userId": "u", "itemIds": ["x"]}).status_code == 400
+    assert post("/api/shopping/recommendations/batch", json={"missingPieces": ["a"] * 201}).status_code == 400
+
+
+def test_wardrobe_list_embeds_links(isolated, client):
+    ws.wardrobe_service.add_items("u", [({}, {"type": "skirt", "pattern": "floral"})])
+    (item,) = client.get("/api/wardrobe/?userId=u&shopping=true&fields=favorite").get_json()["data"]
+    assert set(item) == {"id", "favorite", "shoppingLinks"}
+    assert item["shoppingLinks"][0]["query"] == "skirt"
+
+    (item,) = client.get("/api/wardrobe/?userId=u").get_json()["data"]
+    assert "shoppingLinks" not in item
+
+    stores = client.get("/api/shopping/stores").get_json()
+    assert stores["data"]["locale"] == "en_us" and len(stores["data"]["stores"]) == 5
@@ -10,7 +10,7 @@ def test_generate_profile_error(monkeypatch):
     client = app.test_client()
     # Patch service to raise error
     import app.services.style_analysis_service as sas
-    monkeypatch.setattr(sas.style_analysis_service, 'generate_style_profile', lambda user_id: (_ for _ in ()).throw(Exception('fail')))
+    monkeypatch.setattr(sas.style_analysis_service, 'generate_style_profile', lambda user_id, **kw: (_ for _ in ()).throw(Exception('fail')))
     resp = client.post('/api/style/profile', json={'userId': 'u'})
     assert resp.status_code == 400
     assert not resp.json['success']
@@ -18,7 +18,7 @@ def test_generate_profile_error(monkeypatch):
 import app.services.wardrobe_service as ws
 def test_generate_profile_too_few_items(monkeypatch, client):
     # מחזיר פחות מ-3 פריטים
-    monkeypatch.setattr(ws.wardrobe_service, "get_all_items", lambda user_id: [{"id": 1}])
+    monkeypatch.setattr(ws.wardrobe_service, "get_statistics", lambda user_id: {"totalItems": 1})
     resp = client.post("/api/style/profile", json={"userId": "user_test"})
     assert resp.status_code == 400 or resp.status_code == 500
     data = resp.get_json()
@@ -58,8 +58,8 @@ import app.services.wardrobe_service as ws
 def test_analyze_image_success(monkeypatch, client):
     # מוקים
     monkeypatch.setattr(gs.gemini_service, "analyze_clothing_image", lambda data, mime: {"type": "shirt", "colors": ["blue"]})
-    monkeypatch.setattr(ws.wardrobe_service, "add_item", lambda user_id, image_info, analysis: {"id": 1, "imageInfo": image_info, "analysis": analysis, "favorite": False, "addedAt": "now"})
-    img = (io.BytesIO(b"fakeimage"), "test.jpg")
+    monkeypatch.setattr(ws.wardrobe_service, "add_item", lambda user_id, image_info, analysis, source_job=None: {"id": 1, "imageInfo": image_info, "analysis": analysis, "favorite": False, "addedAt": "now"})
+    img = (io.BytesIO(b"\xff\xd8\xfffakeimage"), "test.jpg")
     data = {"userId": "user_test"}
     resp = client.post("/api/style/analyze", data={"userId": "user_test", "image": img}, content_type="multipart/form-data")
     assert resp.status_code == 200
@@ -1,16 +1,21 @@
+def _matrix(ids):
+    from app.services.item_features import encode
+    from app.services.item_similarity import FeatureMatrix
+    return FeatureMatrix(ids, [encode({"type": "shirt"}) for _ in ids])
+
 def test_get_recommendations_not_found_item():
     from unittest.mock import patch
     from app.services.style_analysis_service import StyleAnalysisService
     service = StyleAnalysisService()
-    items = [{'id': 1}, {'id': 2}]
-    with patch('app.services.wardrobe_service.wardrobe_service.get_all_items', return_value=items):
+    with patch('app.services.item_similarity.similarity_index.matrix',
+               return_value=_matrix([1, 2])):
         result = service.get_recommendations('user', 999)
         assert result == []
 def test_get_recommendations_no_items():
     from unittest.mock import patch
     from app.services.style_analysis_service import StyleAnalysisService
     service = StyleAnalysisService()
-    with patch('app.services.wardrobe_service.wardrobe_service.get_all_items', return_value=[]):
+    with patch('app.services.item_similarity.similarity_index.matrix', return_value=_matrix([])):
         result = service.get_recommendations('user', 1)
         assert result == []
 import pytest
@@ -20,7 +25,8 @@ from app.services.style_analysis_service import StyleAnalysisService
 def test_generate_style_profile_too_few_items_raises():
     service = StyleAnalysisService()
     # Patch wardrobe_service.get_all_items to return <3 items
-    with patch('app.services.wardrobe_service.wardrobe_service.get_all_items', return_value=[{'id': 1}]):
+    with patch('app.services.wardrobe_service.wardrobe_service.get_statistics',
+               return_value={'totalItems': 1}):
         with pytest.raises(ValueError):
             service.generate_style_profile('user')
 
@@ -36,28 +42,27 @@ from app.services.style_analysis_service import StyleAnalysisService
 class DummyGemini:
     def analyze_clothing_image(self, image_data, mime_type):
         return {"type": "shirt", "colors": ["blue"]}
-    def generate_style_profile(self, items):
-        return {"summary": "profile"}
-    def find_similar_items(self, target, items):
-        return [target]
+    def generate_style_narrative(self, summary):
+        return {"stylePersonality": "profile", "recommendations": []}
 
 class DummyWardrobe:
     def __init__(self, items=None):
         self._items = items or []
     def get_all_items(self, user_id):
         return self._items
+    def get_profile_attributes(self, user_id):
+        return {"totalItems": len(self._items), "item_type": [(item.get("type"), 1) for item in self._items]}
     def get_statistics(self, user_id):
-        return {"count": len(self._items)}
+        return {"totalItems": len(self._items), "byType": {}, "version": 1, "itemVersion": 1}
 
-def test_analyze_image():
+def test_analyze_image(monkeypatch):
     service = StyleAnalysisService()
     # החלפת שירותים ב-dummy
     service.gemini_service = DummyGemini()
     service.wardrobe_service = DummyWardrobe()
     # monkeypatch
-    import app.services.style_analysis_service as sas
-    sas.gemini_service = DummyGemini()
-    sas.wardrobe_service = DummyWardrobe()
+    monkeypatch.setattr("app.services.style_analysis_service.gemini_service", DummyGemini())
+    monkeypatch.setattr("app.services.style_analysis_service.wardrobe_service", DummyWardrobe())
     out = service.analyze_image(b"img", "image/jpeg", {"filename": "a.jpg"})
     assert "analysis" in out
     assert "imageInfo" in out
@@ -82,22 +87,21 @@ def test_generate_style_profile_too_few_items(monkeypatch):
     with pytest.raises(ValueError):
         service.generate_style_profile("user1")
 
+class DummyIndex:
+    def __init__(self, matches):
+        self.matches = matches
+    def top_k(self, user_id, item_id, k=5):
+        return self.matches.get(item_id, [])[:k]
+
 def test_get_recommendations_found(monkeypatch):
     service = StyleAnalysisService()
-    items = [{"id": 1}, {"id": 2}]
-    dummy_wardrobe = DummyWardrobe(items)
-    dummy_gemini = DummyGemini()
-    monkeypatch.setattr("app.services.style_analysis_service.wardrobe_service", dummy_wardrobe)
-    monkeypatch.setattr("app.services.style_analysis_service.gemini_service", dummy_gemini)
-    recs = service.get_recommendations("user1", 1)
-    assert recs == [items[0]]
+    matches = {1: [{"itemId": 2, "matchScore": 90, "reason": "r"}, {"itemId": 3, "matchScore": 80, "reason": "r"}]}
+    monkeypatch.setattr("app.services.style_analysis_service.similarity_index", DummyIndex(matches))
+    recs = service.get_recommendations("user1", 1, limit=1)
+    assert recs == matches[1][:1]
 
 def test_get_recommendations_not_found(monkeypatch):
     service = StyleAnalysisService()
-    items = [{"id": 1}]
-    dummy_wardrobe = DummyWardrobe(items)
-    dummy_gemini = DummyGemini()
-    monkeypatch.setattr("app.services.style_analysis_service.wardrobe_service", dummy_wardrobe)
-    monkeypatch.setattr("app.services.style_analysis_service.gemini_service", dummy_gemini)
+    monkeypatch.setattr("app.services.style_analysis_service.similarity_index", DummyIndex({}))
     recs = service.get_recommendations("user1", 999)
     assert recs == []
\ No newline at end of file
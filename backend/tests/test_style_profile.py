@@ -0,0 +1,210 @@
+import pytest
+
+import app.services.style_analysis_service as sas
+import app.services.wardrobe_service as ws
+from app.services.style_profile import ProfileCache, StyleProfileEngine, profile_cache
+
+
+def add(user_id, *analyses):
+    ws.wardrobe_service.add_items(user_id, [({"filename": f"{i}.jpg"}, a) for i, a in enumerate(analyses)])
+
+
+@pytest.fixture
+def isolated(monkeypatch, tmp_path):
+    monkeypatch.setattr(ws, "DB_PATH", str(tmp_path / "profile_wardrobe.sqlite3"))
+    profile_cache.reset()
+    yield
+    profile_cache.reset()
+    ws.close_pool()
+
+
+@pytest.fixture
+def engine():
+    return StyleProfileEngine(palette_size=3, max_missing=5)
+
+
+def test_attributes_are_counted_by_sqlite(isolated):
+    add("u",
+        {"type": "Shirt", "style": "casual", "colors": ["Navy", "white"]},
+        {"type": "shirt", "style": "Casual ", "colors": ["navy"]},
+        {"clothing_type": "pants", "style": "formal", "colors": "black"})
+    attributes = ws.wardrobe_service.get_profile_attributes("u")
+    assert attributes["totalItems"] == 3
+    assert sorted(attributes["item_type"]) == [("Shirt", 1), ("pants", 1), ("shirt", 1)]
+    assert sorted(attributes["colors"]) == [("Navy", False, 1), ("black", False, 1), ("navy", False, 1),
+                                            ("white", True, 1)]
+    assert ws.wardrobe_service.get_profile_attributes("nobody")["totalItems"] == 0
+
+
+def test_profile_merges_labels_and_weights_colors(engine):
+    profile = engine.build({
+        "totalItems": 4,
+        "item_type": [("shirt", 2), ("Pants", 1), (None, 1)],
+        "style": [("Casual", 2), ("casual", 1), ("formal", 1)],
+        # red is the main color once and a secondary color twice: 1 + 2 * 0.5
+        "colors": [("navy", False, 3), ("red", False, 1), ("red", True, 2), ("white", True, 1)],
+    })
+    assert profile["dominantStyle"] == "casual"
+    assert profile["breakdown"]["style"] == {"casual": 0.75, "formal": 0.25}
+    assert profile["breakdown"]["type"] == {"shirt": 0.5, "pants": 0.25}
+    assert profile["colorPalette"] == ["navy", "red", "white"]
+    assert profile["totalItems"] == 4
+
+
+def test_missing_pieces_follow_the_dominant_style(engine):
+    profile = engine.build({
+        "totalItems": 5,
+        "item_type": [("shirt", 4), ("trousers", 1)],
+        "style": [("formal", 5)],
+        "season": [("summer", 5)],
+        "colors": [("red", False, 5)],
+    })
+    assert profile["missingPieces"] == [
+        "leather shoes", "blazer", "tailored trousers", "warm coat", "neutral basics (black, white or navy)"
+    ]
+
+
+def test_profile_and_feature_vectors_agree_on_the_taxonomy(engine):
+    from app.services.item_features import LAYOUT, encode
+    profile = engine.build({
+        "totalItems": 4,
+        "item_type": [("shirt", 2), ("scarf", 1), ("jeans", 1)],
+        "style": [("casual", 4)],
+        "colors": [("charcoal", False, 3), ("red", False, 1)],
+    })
+    assert "neutral basics (black, white or navy)" not in profile["missingPieces"]
+
+    vector = encode({"type": "scarf", "colors": ["charcoal"]})
+    category = vector[LAYOUT.slices["category"]]
+    assert category[LAYOUT.index["category"]["accessories"]] == 1
+    assert (vector[LAYOUT.slices["color"]] @ LAYOUT.neutral_mask) == pytest.approx(1)
+
+
+def test_a_complete_wardrobe_has_no_gaps(engine):
+    profile = engine.build({
+        "totalItems": 5,
+        "item_type": [("dress", 1), ("t-shirt", 1), ("jeans", 1), ("sneakers", 1), ("coat", 1)],
+        "style": [("casual", 5)],
+        "season": [("all-season", 5)],
+        "colors": [("black", False, 5)],
+    })
+    assert profile["missingPieces"] == []
+
+
+def test_template_text_and_summary(engine):
+    profile = engine.build({
+        "totalItems": 3,
+        "item_type": [("shirt", 3)],
+        "style": [("casual", 2), ("sporty", 1)],
+        "colors": [("blue", False, 2), ("black", False, 1)],
+    })
+    text = engine.describe(profile)
+    assert text["stylePersonality"] == "Your wardrobe leans casual (67% of pieces). It is built around blue and black."
+    assert text["recommendations"][0] == "Adding jeans would round out your casual wardrobe."
+    assert "Adding a denim jacket would round out your casual wardrobe." in text["recommendations"]
+    summary = engine.summary(profile)
+    assert summary["stylePercentages"] == {"casual": 65, "sporty": 35}
+    assert "breakdown" not in summary
+
+
+class FakeGemini:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.summaries = []
+
+    def generate_style_narrative(self, summary):
+        self.summaries.append(summary)
+        if self.fail:
+            raise ValueError("Profile generation failed: quota")
+        return {"stylePersonality": "Relaxed.", "recommendations": ["Add a blazer"]}
+
+
+@pytest.mark.parametrize("fail", [False, True])
+def test_service_enriches_only_the_free_text(isolated, monkeypatch, fail):
+    gemini = FakeGemini(fail=fail)
+    monkeypatch.setattr(sas, "gemini_service", gemini)
+    add("u", *({"type": t, "style": "casual", "colors": ["navy"]} for t in ("shirt", "jeans", "sneakers")))
+    profile = sas.style_analysis_service.generate_style_profile("u")["profile"]
+    assert profile["dominantStyle"] == "casual"
+    assert profile["colorPalette"] == ["navy"]
+    assert gemini.summaries[0]["dominantStyle"] == "casual"
+    assert profile["enriched"] is not fail
+    if fail:
+        assert profile["stylePersonality"].startswith("Your wardrobe leans casual")
+    else:
+        assert profile["stylePersonality"] == "Relaxed."
+
+
+def test_profile_endpoint_without_enrichment(isolated, monkeypatch, client):
+    gemini = FakeGemini()
+    monkeypatch.setattr(sas, "gemini_service", gemini)
+    add("u", *({"type": "shirt", "style": "sporty"} for _ in range(3)))
+    resp = client.post("/api/style/profile", json={"userId": "u", "enrich": False})
+    assert resp.status_code == 200
+    data = resp.get_json()["data"]
+    assert data["profile"]["dominantStyle"] == "sporty"
+    assert data["profile"]["enriched"] is False
+    assert data["statistics"]["totalItems"] == 3
+    assert gemini.summaries == []
+
+
+def test_statistics_follow_every_mutation(isolated):
+    service = ws.wardrobe_service
+    shirt, pants = service.add_items("u", [({}, {"type": "shirt"}), ({}, {"type": "pants"})])
+    stats = service.get_statistics("u")
+    assert (stats["totalItems"], stats["byType"], stats["version"], stats["itemVersion"]) == \
+        (2, {"shirt": 1, "pants": 1}, 2, 2)
+
+    service.toggle_favorite("u", shirt["id"])
+    stats = service.get_statistics("u")
+    # Favorites bump the version but not the item version
+    assert (stats["favoriteCount"], stats["version"], stats["itemVersion"]) == (1, 3, 2)
+
+    service.delete_item("u", shirt["id"])
+    stats = service.get_statistics("u")
+    assert (stats["totalItems"], stats["favoriteCount"], stats["byType"]) == (1, 0, {"pants": 1})
+
+    service.clear_wardrobe("u")
+    stats = service.get_statistics("u")
+    assert (stats["totalItems"], stats["byType"], stats["version"]) == (0, {}, 5)
+
+
+def test_cached_profile_until_meaningful_change(isolated, monkeypatch):
+    gemini = FakeGemini()
+    monkeypatch.setattr(sas, "gemini_service", gemini)
+    items = ws.wardrobe_service.add_items("u", [({}, {"type": t, "style": "casual"}) for t in ("shirt", "jeans", "shirt")])
+    service = sas.style_analysis_service
+
+    first = service.generate_style_profile("u")
+    assert (first["cache"]["hit"], first["cache"]["itemChangesSince"]) == (False, 0)
+    assert first["cache"]["ageSeconds"] < 1
+
+    ws.wardrobe_service.toggle_favorite("u", items[0]["id"])
+    add("u", {"type": "shirt", "style": "formal"})
+    again = service.generate_style_profile("u")
+    # Same garment types and one new item: the profile is reused, statistics are current
+    assert again["cache"]["hit"] is True
+    assert again["cache"]["itemChangesSince"] == 1
+    assert again["statistics"]["totalItems"] == 4
+    assert again["profile"] == first["profile"]
+
+    add("u", {"type": "boots", "style": "casual"})
+    assert service.generate_style_profile("u")["cache"]["hit"] is False
+    assert service.generate_style_profile("u", refresh=True)["cache"]["hit"] is False
+    assert len(gemini.summaries) == 3
+
+
+def test_profile_cache_thresholds():
+    now = [1000.0]
+    cache = ProfileCache(refresh_items=3, max_users=1, clock=lambda: now[0])
+    stats = {"version": 5, "itemVersion": 4, "byType": {"shirt": 3}}
+    cache.put("u", stats, {"dominantStyle": "casual"})
+    now[0] += 30
+    assert cache.get("u", dict(stats, version=9))[1:] == (1000.0, 0)
+    assert cache.get("u", dict(stats, version=9, itemVersion=6))[2] == 2
+    assert cache.get("u", dict(stats, version=9, itemVersion=7)) is None
+    assert cache.get("u", dict(stats, version=6, itemVersion=5, byType={"shirt": 3, "hat": 1})) is None
+    assert cache.age(1000.0) == 30
+    cache.put("v", stats, {})
+    assert cache.get("u", stats) is None
+    assert cache.stats() == {"entries": 1, "hits": 2, "misses": 3}
@@ -0,0 +1,110 @@
+import io
+import json
+import threading
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+import app.services.gemini_service as gs
+import app.services.tracing as tracing
+import app.services.wardrobe_service as ws
+from app.services.analysis_cache import AnalysisCache
+from app.services.blob_store import blob_store
+from app.services.gemini_keys import KeyScheduler
+
+ANSWER = {"candidates": [{"content": {"parts": [{"text": '{"type": "shirt", "colors": ["blue"]}'}]}}]}
+
+
+class GeminiStub(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        payload = json.dumps(ANSWER).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def gemini(stub_server, monkeypatch):
+    server = stub_server(GeminiStub)
+    monkeypatch.setattr(gs, "analysis_cache", AnalysisCache(enabled=False))
+    monkeypatch.setattr(gs.gemini_service, "api_url", f"http://127.0.0.1:{server.server_port}/generateContent")
+    monkeypatch.setattr(gs.gemini_service, "key_scheduler", KeyScheduler(["trace-key-1"]))
+
+
+@pytest.fixture
+def isolated(monkeypatch, tmp_path):
+    monkeypatch.setattr(ws, "DB_PATH", str(tmp_path / "trace_wardrobe.sqlite3"))
+    monkeypatch.setattr(blob_store, "root", str(tmp_path / "blobs"))
+    exporter = tracing.SpanExporter(mode="jsonl", path=str(tmp_path / "traces.jsonl"))
+    monkeypatch.setattr(tracing, "exporter", exporter)
+    yield exporter
+    ws.close_pool()
+
+
+def timings(header):
+    return {entry.split(";")[0]: entry for entry in header.split(", ")}
+
+
+def test_server_timing_and_request_id(isolated, client):
+    resp = client.get("/api/wardrobe/?userId=u", headers={"X-Request-ID": "abc-123"})
+    assert resp.headers["X-Request-ID"] == "abc-123"
+    phases = timings(resp.headers["Server-Timing"])
+    assert phases["total"].startswith("total;dur=")
+    assert "wardrobe.list_items" in phases
+
+    resp = client.get("/api/wardrobe/?userId=u", headers={"X-Request-ID": "bad\tid"})
+    assert resp.headers["X-Request-ID"] != "bad\tid"
+
+    parent = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+    client.get("/api/wardrobe/?userId=u", headers={"traceparent": parent, "X-Request-ID": "with-parent"})
+    isolated.flush()
+    spans = [json.loads(line) for line in open(isolated.path)]
+    root = next(s for s in spans if s["requestId"] == "with-parent" and s["name"] == "GET /api/wardrobe/")
+    assert root["traceId"] == "0af7651916cd43dd8448eb211c80319c"
+    assert root["parentSpanId"] == "b7ad6b7169203331"
+
+
+def test_analyze_request_is_traced_end_to_end(isolated, gemini, client):
+    resp = client.post("/api/style/analyze", data={
+        "userId": "u", "image": (io.BytesIO(b"\xff\xd8\xffnot really a jpeg"), "shirt.jpg", "image/jpeg")
+    }, content_type="multipart/form-data", headers={"X-Request-ID": "analyze-1"})
+    assert resp.status_code == 200
+    phases = timings(resp.headers["Server-Timing"])
+    for phase in ("upload", "preprocess", "gemini.encode", "gemini.attempt", "gemini.send", "gemini.parse",
+                  "wardrobe.add_item", "style.analyze_and_store"):
+        assert phase in phases
+
+    isolated.flush()
+    spans = {s["name"]: s for s in map(json.loads, open(isolated.path)) if s["requestId"] == "analyze-1"}
+    assert {s["traceId"] for s in spans.values()} == {spans["POST /api/style/analyze"]["traceId"]}
+    assert spans["wardrobe.add_item"]["parentSpanId"] == spans["style.analyze_and_store"]["spanId"]
+    assert spans["gemini.attempt"]["parentSpanId"] == spans["gemini.send"]["spanId"]
+    assert spans["gemini.attempt"]["attributes"] == {"key": "1", "status": 200}
+
+
+def test_spans_follow_work_into_threads():
+    root, token = tracing.start_trace("batch")
+    try:
+        def work():
+            with tracing.span("in-thread"):
+                pass
+        thread = threading.Thread(target=tracing.bind(work))
+        thread.start()
+        thread.join()
+        with tracing.span("outside"):
+            pass
+    finally:
+        tracing.end_trace(root, token)
+    assert [s.name for s in root.trace.spans] == ["in-thread", "outside", "batch"]
+    assert all(s.parent_id == root.span_id for s in root.trace.spans[:2])
+    assert tracing.current_span() is None
+
+    payload = tracing.otlp_payload([root.trace])
+    otlp_spans = payload["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [s["kind"] for s in otlp_spans] == [1, 1, 2]
@@ -0,0 +1,151 @@
+import base64
+import io
+import json
+import os
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+from PIL import Image
+
+import app.services.wardrobe_service as ws
+from app.services.analysis_cache import AnalysisCache
+from app.services.blob_store import blob_store
+from app.services.gemini_payload import Base64File, JSONStream, encode_image
+from app.services.image_processing import ImagePreprocessor, sniff_mime_type
+from app.services.style_analysis_service import style_analysis_service
+
+
+def jpeg(size=(300, 200)):
+    buf = io.BytesIO()
+    Image.new("RGB", size, (120, 40, 40)).save(buf, "JPEG")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def image_file(tmp_path):
+    path = tmp_path / "photo.bin"
+    # Not a multiple of 3 or of the encode chunk, so padding is exercised
+    path.write_bytes(bytes(range(256)) * 700 + b"xy")
+    return path
+
+
+def test_json_stream_matches_in_memory_encoding(image_file):
+    data = image_file.read_bytes()
+    payload = {"contents": [{"parts": [{"text": "prompt \"quoted\""},
+                                       {"inline_data": {"mime_type": "image/jpeg", "data": Base64File(str(image_file))}}]}]}
+    expected = json.dumps({"contents": [{"parts": [{"text": "prompt \"quoted\""},
+                                                   {"inline_data": {"mime_type": "image/jpeg",
+                                                                    "data": base64.b64encode(data).decode()}}]}]}).encode()
+    body = JSONStream(payload)
+    assert len(body) == len(expected)
+    chunks = iter(lambda: body.read(8192), b"")
+    assert b"".join(chunks) == expected
+    assert b"".join(JSONStream(payload)) == expected
+
+
+def test_json_stream_is_only_used_for_files():
+    assert encode_image(b"abc") == "YWJj"
+    assert not JSONStream.needed({"parts": [{"inline_data": {"data": "YWJj"}}]})
+
+
+def test_cache_key_is_the_same_for_a_path_and_its_bytes(image_file):
+    data = image_file.read_bytes()
+    assert AnalysisCache.make_key(str(image_file), "image/jpeg") == AnalysisCache.make_key(data, "image/jpeg")
+
+
+def test_preprocessor_reads_paths(tmp_path):
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(jpeg((2000, 1000)))
+    out = ImagePreprocessor(max_edge=500, enabled=True).process(str(path))
+    assert (out["width"], out["height"]) == (500, 250)
+    assert out["originalBytes"] == path.stat().st_size
+
+
+def test_sniff_mime_type():
+    assert sniff_mime_type(jpeg()[:16]) == "image/jpeg"
+    assert sniff_mime_type(b"\x89PNG\r\n\x1a\n\0\0") == "image/png"
+    assert sniff_mime_type(b"RIFF\0\0\0\0WEBPVP8 ") == "image/webp"
+    assert sniff_mime_type(b"fakeimage") is None
+
+
+class EchoStub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.server.headers.append(dict(self.headers))
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        data = base64.b64decode(body["contents"][0]["parts"][1]["inline_data"]["data"])
+        self.server.images.append(data)
+        text = json.dumps({"type": f"{len(data)} bytes"})
+        payload = json.dumps({"candidates": [{"content": {"parts": [{"text": text}]}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(stub_server):
+    return stub_server(EchoStub, headers=[], images=[])
+
+
+def test_images_on_disk_are_streamed_to_gemini(stub, gemini_service, image_file):
+    result = gemini_service(stub).analyze_clothing_image(str(image_file), "image/jpeg")
+    assert result["type"] == f"{image_file.stat().st_size} bytes"
+    assert stub.images == [image_file.read_bytes()]
+    assert "Transfer-Encoding" not in stub.headers[0]
+    assert stub.headers[0]["Content-Type"] == "application/json"
+
+
+@pytest.fixture
+def isolated(monkeypatch, tmp_path):
+    monkeypatch.setattr(ws, "DB_PATH", str(tmp_path / "stream_wardrobe.sqlite3"))
+    monkeypatch.setattr(blob_store, "root", str(tmp_path / "blobs"))
+    calls = []
+
+    def fake_analyze(image_path, mime_type, image_info, user_id=None):
+        calls.append((image_path, mime_type))
+        return {"analysis": {"type": "shirt"}, "imageInfo": image_info, "duplicateOf": None}
+
+    monkeypatch.setattr(style_analysis_service, "analyze_image", fake_analyze)
+    yield calls
+    ws.close_pool()
+
+
+def test_upload_is_stored_and_analyzed_from_disk(isolated, client):
+    data = jpeg()
+    resp = client.post("/api/style/analyze", data={
+        "userId": "stream_user", "image": (io.BytesIO(data), "a.jpg", "application/octet-stream")
+    }, content_type="multipart/form-data")
+    assert resp.status_code == 200
+    item = resp.get_json()["data"]["wardrobeItem"]
+    assert blob_store.read(item["image_blob"]) == data
+    assert item["image_info"]["size"] == len(data)
+    # The sniffed type replaces the browser's generic one
+    assert item["image_info"]["mimetype"] == "image/jpeg"
+    assert isolated == [(blob_store.path(item["image_blob"]), "image/jpeg")]
+
+
+def test_empty_upload_is_rejected(isolated, client):
+    resp = client.post("/api/style/analyze", data={
+        "userId": "stream_user", "image": (io.BytesIO(b""), "a.jpg", "image/jpeg")
+    }, content_type="multipart/form-data")
+    assert resp.status_code == 400
+    assert resp.get_json()["error"] == "Empty image"
+    assert isolated == []
+
+
+def test_non_image_upload_is_rejected_before_it_is_stored(isolated, client):
+    # Whatever the browser claims, bytes that aren't an image are refused
+    resp = client.post("/api/style/analyze", data={
+        "userId": "stream_user", "image": (io.BytesIO(b"<html>not a photo</html>"), "a.jpg", "image/jpeg")
+    }, content_type="multipart/form-data")
+    assert resp.status_code == 400
+    assert resp.get_json()["error"].startswith("Unsupported image type")
+    assert isolated == []
+    assert not os.path.exists(blob_store.root)
@@ -0,0 +1,132 @@
+import base64
+import io
+import json
+
+import pytest
+
+import app.services.wardrobe_service as ws
+from app.services.blob_store import blob_store
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+DATA_URL = "data:image/png;base64," + base64.b64encode(PNG_BYTES).decode()
+
+
+@pytest.fixture
+def isolated(monkeypatch, tmp_path):
+    monkeypatch.setattr(ws, "DB_PATH", str(tmp_path / "images.sqlite3"))
+    monkeypatch.setattr(blob_store, "root", str(tmp_path / "blobs"))
+    yield ws.WardrobeService()
+    ws.close_pool()
+
+
+def test_add_item_moves_data_url_to_blob_store(isolated):
+    item = isolated.add_item("img_user", {"filename": "a.png", "data": DATA_URL}, {"type": "shirt"})
+    assert item["imageData"] is None
+    assert "data" not in item["imageInfo"]
+    assert item["imageInfo"]["mimetype"] == "image/png"
+    assert item["imageUrl"] == f"/api/wardrobe/{item['id']}/image?userId=img_user"
+    assert blob_store.read(item["image_blob"]) == PNG_BYTES
+    with ws.get_pool().connection() as conn:
+        stored = conn.execute("SELECT image_info FROM wardrobe WHERE id=?", (item["id"],)).fetchone()[0]
+    assert "base64" not in stored
+
+
+def test_shared_blob_deleted_only_when_unreferenced(isolated):
+    first = isolated.add_item("u1", {"data": DATA_URL}, {})
+    second = isolated.add_item("u2", {"data": DATA_URL}, {})
+    assert first["image_blob"] == second["image_blob"]
+    isolated.delete_item("u1", first["id"])
+    assert blob_store.exists(first["image_blob"])
+    isolated.clear_wardrobe("u2")
+    assert not blob_store.exists(first["image_blob"])
+
+
+def test_referenced_blobs_cover_images_and_thumbnails(isolated):
+    thumb = blob_store.put(b"thumb")
+    item = isolated.add_item("u1", {"data": DATA_URL, "thumbnail": thumb}, {})
+    orphan = blob_store.put(b"upload whose analysis failed")
+    referenced = isolated.referenced_blobs()
+    assert referenced == {item["image_blob"], thumb}
+    assert blob_store.sweep(referenced, min_age=0) == 1
+    assert not blob_store.exists(orphan)
+    assert blob_store.read(item["image_blob"]) == PNG_BYTES
+
+
+def test_migrate_inline_images(isolated):
+    with ws.get_pool().connection() as conn:
+        conn.execute(
+            "INSERT INTO wardrobe (user_id, image_info, analysis, added_at) VALUES (?, ?, ?, ?)",
+            ("legacy", json.dumps({"filename": "old.png", "mimetype": "image/png", "data": DATA_URL}), "{}", "now")
+        )
+        conn.execute(
+            "INSERT INTO wardrobe (user_id, image_info, analysis, added_at) VALUES (?, ?, ?, ?)",
+            ("legacy", json.dumps({"filename": "none.png"}), "{}", "now")
+        )
+        conn.commit()
+    assert isolated.migrate_inline_images(batch_size=1) == 1
+    assert isolated.migrate_inline_images() == 0
+    items = isolated.get_all_items("legacy")
+    migrated = [i for i in items if i["image_blob"]]
+    assert len(migrated) == 1
+    assert migrated[0]["imageInfo"] == {"filename": "old.png", "mimetype": "image/png"}
+
+
+def test_get_image_migrates_legacy_row_on_access(isolated):
+    with ws.get_pool().connection() as conn:
+        cur = conn.execute(
+            "INSERT INTO wardrobe (user_id, image_info, analysis, added_at) VALUES (?, ?, ?, ?)",
+            ("legacy2", json.dumps({"data": DATA_URL}), "{}", "now")
+        )
+        conn.commit()
+    blob_id, mimetype = isolated.get_image("legacy2", cur.lastrowid)
+    assert mimetype == "image/png"
+    assert isolated.get_item_by_id("legacy2", cur.lastrowid)["image_blob"] == blob_id
+    assert isolated.get_image("someone_else", cur.lastrowid) is None
+
+
+def test_image_endpoint_etag_and_range(isolated, client):
+    item = client.post("/api/wardrobe/", json={
+        "userId": "http_user", "imageInfo": {"filename": "a.png", "data": DATA_URL}, "analysis": {}
+    }).get_json()["data"]
+    assert item["imageUrl"].startswith("http://localhost/api/wardrobe/")
+
+    resp = client.get(f"/api/wardrobe/{item['id']}/image?userId=http_user")
+    assert resp.status_code == 200
+    assert resp.data == PNG_BYTES
+    assert resp.mimetype == "image/png"
+    etag = resp.headers["ETag"]
+    assert item["image_blob"] in etag
+
+    resp = client.get(f"/api/wardrobe/{item['id']}/image?userId=http_user", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+
+    resp = client.get(f"/api/wardrobe/{item['id']}/image?userId=http_user", headers={"Range": "bytes=0-7"})
+    assert resp.status_code == 206
+    assert resp.data == PNG_BYTES[:8]
+
+
+def test_image_endpoint_errors(isolated, client):
+    assert client.get("/api/wardrobe/1/image").status_code == 401
+    assert client.get("/api/wardrobe/999/image?userId=nobody").status_code == 404
+    item = isolated.add_item("gone_user", {"data": DATA_URL}, {})
+    blob_store.delete(item["image_blob"])
+    assert client.get(f"/api/wardrobe/{item['id']}/image?userId=gone_user").status_code == 404
+
+
+def test_client_cannot_reference_foreign_blob(isolated, client):
+    other = isolated.add_item("owner", {"data": DATA_URL}, {})
+    resp = client.post("/api/wardrobe/", json={
+        "userId": "thief", "imageInfo": {"blob": other["image_blob"]}, "analysis": {}
+    })
+    assert resp.get_json()["data"]["image_blob"] is None
+
+
+def test_analyze_stores_upload_as_blob(isolated, client, monkeypatch):
+    import app.services.gemini_service as gs
+    monkeypatch.setattr(gs.gemini_service, "analyze_clothing_image", lambda data, mime: {"type": "shirt"})
+    resp = client.post("/api/style/analyze", data={
+        "userId": "analyze_user", "image": (io.BytesIO(PNG_BYTES), "a.png", "image/png")
+    }, content_type="multipart/form-data")
+    item = resp.get_json()["data"]["wardrobeItem"]
+    assert item["imageData"] is None
+    assert blob_store.read(item["image_blob"]) == PNG_BYTES
@@ -0,0 +1,122 @@
+import base64
+
+import pytest
+
+import app.services.wardrobe_service as ws
+from app.services.blob_store import blob_store
+
+DATA_URL = "data:image/png;base64," + base64.b64encode(b"pixels").decode()
+
+
+@pytest.fixture
+def service(monkeypatch, tmp_path):
+    monkeypatch.setattr(ws, "DB_PATH", str(tmp_path / "listing.sqlite3"))
+    monkeypatch.setattr(blob_store, "root", str(tmp_path / "blobs"))
+    service = ws.WardrobeService()
+    for i, (t, season) in enumerate([("shirt", "summer"), ("pants", "winter"), ("shirt", "winter"),
+                                     ("dress", "summer"), ("shirt", "all-season")]):
+        item = service.add_item("lister", {"filename": f"{i}.jpg"}, {"type": t, "season": season})
+        if i % 2 == 0:
+            service.toggle_favorite("lister", item["id"])
+    yield service
+    ws.close_pool()
+
+
+def test_keyset_pagination_walks_all_items(service):
+    seen = []
+    items, cursor = service.list_items("lister", limit=2)
+    seen += items
+    while cursor:
+        items, cursor = service.list_items("lister", limit=2, cursor=cursor)
+        seen += items
+    assert [i["id"] for i in seen] == sorted(i["id"] for i in service.get_all_items("lister"))
+
+
+def test_descending_order(service):
+    items, cursor = service.list_items("lister", limit=3, order="desc")
+    more, _ = service.list_items("lister", limit=3, order="desc", cursor=cursor)
+    ids = [i["id"] for i in items + more]
+    assert ids == sorted(ids, reverse=True)
+    assert len(ids) == 5
+
+
+def test_filters(service):
+    shirts, _ = service.list_items("lister", item_type="shirt")
+    assert len(shirts) == 3
+    winter, _ = service.list_items("lister", season="winter")
+    assert {i["analysis"]["type"] for i in winter} == {"pants", "shirt"}
+    favorites, _ = service.list_items("lister", favorite=True, item_type="shirt")
+    assert len(favorites) == 3
+    assert service.list_items("lister", favorite=False, item_type="shirt")[0] == []
+    with pytest.raises(ValueError):
+        service.list_items("lister", colour="red")
+
+
+def test_projection_omits_image_data_unless_requested(service):
+    with ws.get_pool().connection() as conn:
+        conn.execute(
+            "INSERT INTO wardrobe (user_id, image_info, analysis, added_at) VALUES (?, ?, ?, ?)",
+            ("inline", '{"filename": "x.png", "data": "%s"}' % DATA_URL, "{}", "2024-01-01")
+        )
+        conn.commit()
+    item = service.list_items("inline")[0][0]
+    assert "imageData" not in item
+    assert item["imageInfo"] == {"filename": "x.png"}
+    assert item["imageUrl"].startswith("/api/wardrobe/")
+
+    slim = service.list_items("inline", fields=["analysis"])[0][0]
+    assert set(slim) == {"id", "analysis"}
+
+    full = service.list_items("inline", fields=["imageData", "imageInfo.data"])[0][0]
+    assert full["imageData"] == DATA_URL
+    assert full["imageInfo"]["data"] == DATA_URL
+
+
+def test_malformed_analysis_does_not_break_filters(service):
+    with ws.get_pool().connection() as conn:
+        conn.execute(
+            "INSERT INTO wardrobe (user_id, image_info, analysis, added_at) VALUES (?, ?, ?, ?)",
+            ("lister", "{}", "{bad json}", "9999")
+        )
+        conn.commit()
+    assert len(service.list_items("lister", item_type="shirt")[0]) == 3
+    assert len(service.list_items("lister")[0]) == 6
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"limit": 0}, {"limit": ws.MAX_PAGE_SIZE + 1}, {"order": "sideways"}, {"cursor": "!!!"}, {"cursor": "WzEsMl0"},
+])
+def test_invalid_arguments(service, kwargs):
+    with pytest.raises(ValueError):
+        service.list_items("lister", **kwargs)
+
+
+def test_filters_use_indexes(service):
+    with ws.get_pool().connection() as conn:
+        plan = " ".join(r[3] for r in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM wardrobe WHERE user_id=? AND item_type=? "
+            "ORDER BY added_at, id", ("lister", "shirt")
+        ))
+    assert "idx_wardrobe_user_item_type" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_listing_api(service, client):
+    resp = client.get("/api/wardrobe/?userId=lister&limit=2&fields=analysis,favorite")
+    body = resp.get_json()
+    assert resp.status_code == 200
+    assert len(body["data"]) == 2
+    assert set(body["data"][0]) == {"id", "analysis", "favorite"}
+    resp = client.get(f"/api/wardrobe/?userId=lister&limit=10&cursor={body['nextCursor']}")
+    assert len(resp.get_json()["data"]) == 3
+    assert resp.get_json()["nextCursor"] is None
+
+    resp = client.get("/api/wardrobe/?userId=lister&type=shirt&favorite=false")
+    assert resp.get_json()["data"] == []
+
+
+@pytest.mark.parametrize("query", ["limit=abc", "limit=0", "favorite=maybe", "cursor=bogus", "order=up"])
+def test_listing_api_rejects_bad_params(service, client, query):
+    resp = client.get(f"/api/wardrobe/?userId=lister&{query}")
+    assert resp.status_code == 400
+    assert resp.get_json()["success"] is False
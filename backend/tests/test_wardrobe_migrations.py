@@ -0,0 +1,99 @@
+import json
+import sqlite3
+
+import pytest
+
+import app.services.wardrobe_service as ws
+from app.services.wardrobe_migrations import LATEST_VERSION, current_version, run_migrations
+
+
+def _legacy_db(path):
+    """Database as created by the original get_db(), with no version set"""
+    conn = sqlite3.connect(path)
+    conn.execute("""
+    CREATE TABLE wardrobe (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        image_info TEXT,
+        analysis TEXT,
+        favorite INTEGER DEFAULT 0,
+        added_at TEXT
+    )""")
+    rows = [
+        ("legacy", "{}", json.dumps({"type": "shirt", "colors": ["navy", "white"], "style": "casual"}), 1, "1"),
+        ("legacy", "{}", json.dumps({"clothing_type": "pants", "season": "winter"}), 0, "2"),
+        ("legacy", "{}", "{bad json}", 0, "3"),
+        ("legacy", "{}", json.dumps({"type": ""}), 0, "4"),
+    ]
+    conn.executemany(
+        "INSERT INTO wardrobe (user_id, image_info, analysis, favorite, added_at) VALUES (?, ?, ?, ?, ?)", rows
+    )
+    conn.commit()
+    return conn
+
+
+def test_fresh_database_reaches_latest_version(tmp_path):
+    conn = sqlite3.connect(tmp_path / "fresh.sqlite3")
+    assert run_migrations(conn) == list(range(1, LATEST_VERSION + 1))
+    assert current_version(conn) == LATEST_VERSION
+    assert run_migrations(conn) == []
+
+
+def test_legacy_database_is_migrated(tmp_path):
+    conn = _legacy_db(tmp_path / "legacy.sqlite3")
+    run_migrations(conn)
+    rows = conn.execute(
+        "SELECT item_type, style, season, primary_color FROM wardrobe ORDER BY id"
+    ).fetchall()
+    assert rows == [
+        ("shirt", "casual", None, "navy"),
+        ("pants", None, "winter", None),
+        (None, None, None, None),
+        (None, None, None, None),
+    ]
+    indexes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    assert {"idx_wardrobe_user_added", "idx_wardrobe_user_favorite", "idx_wardrobe_user_item_type"} <= indexes
+
+
+def test_databases_from_before_versioning_are_upgraded_in_place(tmp_path):
+    conn = _legacy_db(tmp_path / "unversioned.sqlite3")
+    conn.execute("ALTER TABLE wardrobe ADD COLUMN image_blob TEXT")
+    conn.execute(
+        "CREATE INDEX idx_wardrobe_user_type ON wardrobe(user_id, "
+        "(CASE WHEN json_valid(analysis) THEN json_extract(analysis, '$.type') END), added_at, id)"
+    )
+    conn.commit()
+    run_migrations(conn)
+    assert current_version(conn) == LATEST_VERSION
+    names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    assert "idx_wardrobe_user_type" not in names
+
+
+def test_failed_migration_rolls_back(tmp_path):
+    conn = sqlite3.connect(tmp_path / "broken.sqlite3")
+
+    def boom(c):
+        c.execute("CREATE TABLE half_done (x)")
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        run_migrations(conn, [(1, "ok", lambda c: c.execute("CREATE TABLE first (x)")), (2, "bad", boom)])
+    assert current_version(conn) == 0
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name IN ('first', 'half_done')").fetchall() == []
+
+
+def test_statistics_are_aggregated_in_sql(monkeypatch, tmp_path):
+    _legacy_db(str(tmp_path / "stats.sqlite3")).close()
+    monkeypatch.setattr(ws, "DB_PATH", str(tmp_path / "stats.sqlite3"))
+    stats = ws.WardrobeService().get_statistics("legacy")
+    # Backfilled by the statistics migration
+    assert stats == {"totalItems": 4, "favoriteCount": 1, "byType": {"shirt": 1, "pants": 1, "unknown": 2},
+                     "version": 1, "itemVersion": 1}
+    with ws.get_pool().connection() as conn:
+        plan = " ".join(r[3] for r in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT item_type, COUNT(*) FROM wardrobe WHERE user_id=? GROUP BY item_type",
+            ("legacy",)
+        ))
+    assert "idx_wardrobe_user_item_type" in plan
+    assert "TEMP B-TREE" not in plan
+    ws.close_pool()
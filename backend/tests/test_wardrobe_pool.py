@@ -0,0 +1,93 @@
+import sqlite3
+import threading
+
+import pytest
+
+import app.services.wardrobe_service as ws
+from app.services.wardrobe_service import ConnectionPool, WardrobeService
+
+
+@pytest.fixture
+def pool(tmp_path):
+    p = ConnectionPool(str(tmp_path / "pool.sqlite3"), max_size=2, timeout=0.2)
+    yield p
+    p.close()
+
+
+def test_schema_created_once(pool):
+    with pool.connection() as conn:
+        row = conn.execute("SELECT name FROM sqlite_master WHERE name='wardrobe'").fetchone()
+    assert row is not None
+
+
+def test_connection_is_reused(pool):
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert first is second
+    assert pool.stats()["size"] == 1
+
+
+def test_pool_is_bounded(pool):
+    a = pool.acquire()
+    b = pool.acquire()
+    assert a is not b
+    with pytest.raises(sqlite3.OperationalError):
+        pool.acquire()
+    pool.release(a)
+    assert pool.acquire() is a
+    pool.release(a)
+    pool.release(b)
+
+
+def test_waiting_thread_gets_released_connection(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "wait.sqlite3"), max_size=1, timeout=2)
+    conn = pool.acquire()
+    got = []
+    t = threading.Thread(target=lambda: got.append(pool.acquire()))
+    t.start()
+    pool.release(conn)
+    t.join(2)
+    assert got == [conn]
+    pool.close()
+
+
+def test_unhealthy_connection_is_replaced(pool):
+    with pool.connection() as conn:
+        pass
+    conn.close()
+    with pool.connection() as fresh:
+        assert fresh is not conn
+        assert fresh.execute("SELECT 1").fetchone()[0] == 1
+
+
+def test_uncommitted_work_is_rolled_back_on_release(pool):
+    with pool.connection() as conn:
+        conn.execute("INSERT INTO wardrobe (user_id) VALUES ('u')")
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM wardrobe").fetchone()[0] == 0
+
+
+def test_closed_pool_rejects_acquire(pool):
+    pool.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        pool.acquire()
+
+
+def test_invalid_pool_size(tmp_path):
+    with pytest.raises(ValueError):
+        ConnectionPool(str(tmp_path / "x.sqlite3"), max_size=0)
+
+
+def test_get_pool_follows_db_path(monkeypatch, tmp_path):
+    original = ws.get_pool()
+    monkeypatch.setattr(ws, "DB_PATH", str(tmp_path / "other.sqlite3"))
+    other = ws.get_pool()
+    assert other is not original
+    assert other.db_path == ws.DB_PATH
+    service = WardrobeService()
+    item = service.add_item("pool_user", {"filename": "a.jpg"}, {"type": "shirt"})
+    assert service.get_item_by_id("pool_user", item["id"])["id"] == item["id"]
+    monkeypatch.undo()
+    ws.close_pool()
@@ -0,0 +1,111 @@
+import multiprocessing
+import sqlite3
+
+import pytest
+
+from app.services.wardrobe_service import ConnectionPool, StorageConfig
+
+
+def _mixed_workload(db_path, worker, rounds):
+    """Runs in a separate process, like a gunicorn worker sharing the file"""
+    import app.services.wardrobe_service as ws
+    ws.DB_PATH = db_path
+    service = ws.WardrobeService()
+    user_id = f"load_user_{worker}"
+    errors = []
+    for i in range(rounds):
+        try:
+            item = service.add_item(user_id, {"filename": f"{i}.jpg"}, {"type": "shirt"})
+            service.toggle_favorite(user_id, item["id"])
+            service.get_all_items(user_id)
+            service.get_statistics(user_id)
+        except sqlite3.OperationalError as e:
+            errors.append(str(e))
+    ws.close_pool()
+    return errors
+
+
+def test_storage_config_defaults():
+    config = StorageConfig()
+    assert config.journal_mode == "WAL"
+    assert config.synchronous == "NORMAL"
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"journal_mode": "bogus"},
+    {"synchronous": "sometimes"},
+    {"checkpoint_mode": "never"},
+    {"busy_timeout_ms": -1},
+])
+def test_storage_config_rejects_invalid_values(kwargs):
+    with pytest.raises(ValueError):
+        StorageConfig(**kwargs)
+
+
+def test_storage_config_from_env(monkeypatch):
+    monkeypatch.setenv("WARDROBE_DB_SYNCHRONOUS", "full")
+    monkeypatch.setenv("WARDROBE_DB_MMAP_SIZE", "0")
+    config = StorageConfig.from_env()
+    assert config.synchronous == "FULL"
+    assert config.mmap_size == 0
+
+
+def test_pool_connections_use_configured_pragmas(tmp_path):
+    config = StorageConfig(synchronous="FULL", busy_timeout_ms=1234, mmap_size=0)
+    pool = ConnectionPool(str(tmp_path / "wal.sqlite3"), config=config)
+    with pool.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 2
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 1234
+    pool.close()
+
+
+def test_checkpoint_runs_after_interval(tmp_path):
+    config = StorageConfig(checkpoint_interval=0.0001)
+    pool = ConnectionPool(str(tmp_path / "ckpt.sqlite3"), config=config)
+    with pool.connection() as conn:
+        conn.execute("INSERT INTO wardrobe (user_id) VALUES ('u')")
+        conn.commit()
+    assert pool.checkpoints >= 1
+    busy, _, _ = pool.checkpoint(mode="truncate")
+    assert busy == 0
+    with pytest.raises(ValueError):
+        pool.checkpoint(mode="later")
+    pool.close()
+
+
+def test_checkpoint_disabled_without_wal(tmp_path):
+    config = StorageConfig(journal_mode="DELETE", checkpoint_interval=0.0001)
+    pool = ConnectionPool(str(tmp_path / "rollback.sqlite3"), config=config)
+    with pool.connection():
+        pass
+    assert pool.checkpoints == 0
+    pool.close()
+
+
+def test_multiprocess_read_write_mix_has_no_lock_errors(tmp_path):
+    db_path = str(tmp_path / "load.sqlite3")
+    ConnectionPool(db_path).close()
+    ctx = multiprocessing.get_context("fork")
+    with ctx.Pool(4) as procs:
+        results = procs.starmap(_mixed_workload, [(db_path, w, 25) for w in range(4)])
+    assert [e for errors in results for e in errors] == []
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM wardrobe").fetchone()[0] == 100
+    assert conn.execute("SELECT COUNT(*) FROM wardrobe WHERE favorite=1").fetchone()[0] == 100
+    conn.close()
+
+
+def test_forked_child_gets_its_own_pool(monkeypatch, tmp_path):
+    import app.services.wardrobe_service as ws
+    monkeypatch.setattr(ws, "DB_PATH", str(tmp_path / "fork.sqlite3"))
+    parent_pool = ws.get_pool()
+    monkeypatch.setattr(parent_pool, "pid", -1)
+    child_pool = ws.get_pool()
+    assert child_pool is not parent_pool
+    assert not parent_pool._closed
+    monkeypatch.setattr(parent_pool, "pid", child_pool.pid)
+    parent_pool.close()
+    monkeypatch.undo()
+    ws.close_pool()